@@ -14,6 +14,270 @@ PERPLEXITY_API_KEY = os.environ.get("PERPLEXITY_API_KEY", "")
 PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
 PERPLEXITY_MODEL = "sonar-pro"  # Use Sonar Pro for detailed research
 
+# LLM Backend Configuration
+# 'live' calls the Anthropic and Perplexity APIs; 'fake' serves deterministic local
+# responses (no API keys needed) for offline runs and tests/load_benchmark.py
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "live").lower()
+# Fake backend: per-profile latency is lognormal around the median (seconds) with
+# the given sigma; output sizes (chars) vary +/-25% and are capped by max_tokens
+FAKE_LLM_CONFIG = {
+    "seed": int(os.environ.get("FAKE_LLM_SEED", "42")),
+    "time_scale": float(os.environ.get("FAKE_LLM_TIME_SCALE", "1.0")),  # multiplies every simulated latency
+    "latency": {
+        "claude": {
+            "median": float(os.environ.get("FAKE_LLM_CLAUDE_LATENCY_MEDIAN", "20.0")),
+            "sigma": float(os.environ.get("FAKE_LLM_CLAUDE_LATENCY_SIGMA", "0.35")),
+        },
+        "insight": {
+            "median": float(os.environ.get("FAKE_LLM_INSIGHT_LATENCY_MEDIAN", "1.0")),
+            "sigma": float(os.environ.get("FAKE_LLM_INSIGHT_LATENCY_SIGMA", "0.3")),
+        },
+        "perplexity": {
+            "median": float(os.environ.get("FAKE_LLM_PERPLEXITY_LATENCY_MEDIAN", "30.0")),
+            "sigma": float(os.environ.get("FAKE_LLM_PERPLEXITY_LATENCY_SIGMA", "0.4")),
+        },
+    },
+    "output_chars": {
+        "claude": int(os.environ.get("FAKE_LLM_CLAUDE_OUTPUT_CHARS", "8000")),
+        "insight": int(os.environ.get("FAKE_LLM_INSIGHT_OUTPUT_CHARS", "120")),
+        "perplexity": int(os.environ.get("FAKE_LLM_PERPLEXITY_OUTPUT_CHARS", "12000")),
+    },
+    # Fraction of requests failing with HTTP 529 overloaded_error / a request timeout
+    "overload_rate": float(os.environ.get("FAKE_LLM_OVERLOAD_RATE", "0.0")),
+    "timeout_rate": float(os.environ.get("FAKE_LLM_TIMEOUT_RATE", "0.0")),
+    "stream_chunks": int(os.environ.get("FAKE_LLM_STREAM_CHUNKS", "40")),
+}
+
+# Pipeline Execution Configuration
+# Steps whose declared inputs are ready run concurrently, bounded by this worker count
+PIPELINE_MAX_PARALLEL_STEPS = int(os.environ.get("PIPELINE_MAX_PARALLEL_STEPS", "2"))
+# Run streamed pipelines on a shared asyncio event loop with the async LLM clients
+ASYNC_PIPELINE_ENABLED = os.environ.get("ASYNC_PIPELINE_ENABLED", "true").lower() == "true"
+# Worker threads of the 'io' executor: blocking side work such as async pipeline completion bookkeeping and TTL sweeps
+ASYNC_PIPELINE_BACKGROUND_WORKERS = int(os.environ.get("ASYNC_PIPELINE_BACKGROUND_WORKERS", "8"))
+PIPELINE_HEARTBEAT_INTERVAL_SECONDS = float(os.environ.get("PIPELINE_HEARTBEAT_INTERVAL_SECONDS", "15"))
+
+# Insight Extraction Configuration
+# At most this many insight requests run at once on the 'insight' executor, each merging pending steps
+INSIGHT_EXTRACTION_WORKERS = int(os.environ.get("INSIGHT_EXTRACTION_WORKERS", "4"))
+INSIGHT_BATCH_MAX_ITEMS = int(os.environ.get("INSIGHT_BATCH_MAX_ITEMS", "6"))
+INSIGHT_BATCH_MAX_CHARS = int(os.environ.get("INSIGHT_BATCH_MAX_CHARS", "120000"))
+INSIGHT_BATCH_WINDOW_SECONDS = float(os.environ.get("INSIGHT_BATCH_WINDOW_SECONDS", "0.3"))
+# When false, only steps of the same pipeline run share an extraction request
+INSIGHT_BATCH_ACROSS_REQUESTS = os.environ.get("INSIGHT_BATCH_ACROSS_REQUESTS", "true").lower() == "true"
+# Read verbatim insights (step 3 headline, step 8 first question, step 9 thesis) from the markdown before asking the LLM
+LOCAL_INSIGHT_EXTRACTION_ENABLED = os.environ.get("LOCAL_INSIGHT_EXTRACTION_ENABLED", "true").lower() == "true"
+
+# LLM Rate Limiting Configuration
+# Process-wide admission control per provider/model: requests and tokens per minute
+# plus an adaptive (AIMD) concurrency limit that backs off on 429/529 responses
+RATE_LIMITER_ENABLED = os.environ.get("RATE_LIMITER_ENABLED", "true").lower() == "true"
+LLM_RATE_LIMIT_DEFAULTS = {"rpm": 1000, "tpm": 2000000, "max_concurrency": 32}
+# Keyed by "provider:model"; omitted values fall back to LLM_RATE_LIMIT_DEFAULTS
+LLM_RATE_LIMITS = {
+    f"anthropic:{CLAUDE_MODEL}": {
+        "rpm": int(os.environ.get("CLAUDE_RPM_LIMIT", "1000")),
+        "tpm": int(os.environ.get("CLAUDE_TPM_LIMIT", "2000000")),
+        "max_concurrency": int(os.environ.get("CLAUDE_MAX_CONCURRENCY", "32")),
+    },
+    "anthropic:claude-3-5-haiku-20241022": {
+        "rpm": int(os.environ.get("INSIGHT_RPM_LIMIT", "1000")),
+        "tpm": int(os.environ.get("INSIGHT_TPM_LIMIT", "2000000")),
+        "max_concurrency": int(os.environ.get("INSIGHT_MAX_CONCURRENCY", "16")),
+    },
+    f"perplexity:{PERPLEXITY_MODEL}": {
+        "rpm": int(os.environ.get("PERPLEXITY_RPM_LIMIT", "50")),
+        "tpm": None,
+        "max_concurrency": int(os.environ.get("PERPLEXITY_MAX_CONCURRENCY", "16")),
+    },
+}
+LLM_ADMISSION_TIMEOUT_SECONDS = float(os.environ.get("LLM_ADMISSION_TIMEOUT_SECONDS", "120"))
+AIMD_ADDITIVE_INCREASE = float(os.environ.get("AIMD_ADDITIVE_INCREASE", "1.0"))  # ~+1 slot per limit's worth of successes
+AIMD_DECREASE_FACTOR = float(os.environ.get("AIMD_DECREASE_FACTOR", "0.5"))
+AIMD_DECREASE_COOLDOWN_SECONDS = float(os.environ.get("AIMD_DECREASE_COOLDOWN_SECONDS", "2.0"))
+
+# LLM Retry Configuration
+# One retry policy per call type: decorrelated-jitter backoff between base and max
+# delay, server retry-after honored, each attempt and the whole call bounded in time
+LLM_RETRY_POLICIES = {
+    "claude": {
+        "max_attempts": int(os.environ.get("CLAUDE_RETRY_MAX_ATTEMPTS", "3")),
+        "base_delay": float(os.environ.get("CLAUDE_RETRY_BASE_DELAY_SECONDS", "2.0")),
+        "max_delay": float(os.environ.get("CLAUDE_RETRY_MAX_DELAY_SECONDS", "20.0")),
+        "attempt_timeout": float(os.environ.get("CLAUDE_ATTEMPT_TIMEOUT_SECONDS", "270")),
+        "total_timeout": float(os.environ.get("CLAUDE_TOTAL_TIMEOUT_SECONDS", "600")),
+    },
+    "insight": {
+        "max_attempts": int(os.environ.get("INSIGHT_RETRY_MAX_ATTEMPTS", "3")),
+        "base_delay": float(os.environ.get("INSIGHT_RETRY_BASE_DELAY_SECONDS", "1.0")),
+        "max_delay": float(os.environ.get("INSIGHT_RETRY_MAX_DELAY_SECONDS", "6.0")),
+        "attempt_timeout": float(os.environ.get("INSIGHT_ATTEMPT_TIMEOUT_SECONDS", "30")),
+        "total_timeout": float(os.environ.get("INSIGHT_TOTAL_TIMEOUT_SECONDS", "60")),
+    },
+    "perplexity": {
+        "max_attempts": int(os.environ.get("PERPLEXITY_RETRY_MAX_ATTEMPTS", "3")),
+        "base_delay": float(os.environ.get("PERPLEXITY_RETRY_BASE_DELAY_SECONDS", "2.0")),
+        "max_delay": float(os.environ.get("PERPLEXITY_RETRY_MAX_DELAY_SECONDS", "20.0")),
+        "attempt_timeout": float(os.environ.get("PERPLEXITY_ATTEMPT_TIMEOUT_SECONDS", "180")),
+        "total_timeout": float(os.environ.get("PERPLEXITY_TOTAL_TIMEOUT_SECONDS", "420")),
+    },
+}
+# A retry-after longer than this is treated as "provider unavailable" and not waited for
+RETRY_MAX_RETRY_AFTER_SECONDS = float(os.environ.get("RETRY_MAX_RETRY_AFTER_SECONDS", "60"))
+# Per-provider circuit breaker: consecutive provider-side failures before failing fast
+CIRCUIT_BREAKER_ENABLED = os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+
+# LLM Pricing Configuration
+# USD per million tokens (plus any per-request fee) used for the cost_estimate telemetry
+# of step outputs and insights; cache_read/cache_write default to the input price
+LLM_PRICING = {
+    CLAUDE_MODEL: {
+        "input": float(os.environ.get("CLAUDE_PRICE_INPUT", "3.00")),
+        "output": float(os.environ.get("CLAUDE_PRICE_OUTPUT", "15.00")),
+        "cache_write": float(os.environ.get("CLAUDE_PRICE_CACHE_WRITE", "3.75")),
+        "cache_read": float(os.environ.get("CLAUDE_PRICE_CACHE_READ", "0.30")),
+    },
+    "claude-3-5-haiku-20241022": {
+        "input": float(os.environ.get("INSIGHT_PRICE_INPUT", "0.80")),
+        "output": float(os.environ.get("INSIGHT_PRICE_OUTPUT", "4.00")),
+        "cache_write": float(os.environ.get("INSIGHT_PRICE_CACHE_WRITE", "1.00")),
+        "cache_read": float(os.environ.get("INSIGHT_PRICE_CACHE_READ", "0.08")),
+    },
+    PERPLEXITY_MODEL: {
+        "input": float(os.environ.get("PERPLEXITY_PRICE_INPUT", "3.00")),
+        "output": float(os.environ.get("PERPLEXITY_PRICE_OUTPUT", "15.00")),
+        "per_request": float(os.environ.get("PERPLEXITY_PRICE_PER_REQUEST", "0.006")),
+    },
+}
+
+# Claude Streaming Configuration
+# Text deltas are coalesced and forwarded as 'partial_output' progress events
+CLAUDE_STREAMING_ENABLED = os.environ.get("CLAUDE_STREAMING_ENABLED", "true").lower() == "true"
+STREAM_FLUSH_EVERY_TOKENS = int(os.environ.get("STREAM_FLUSH_EVERY_TOKENS", "40"))
+STREAM_FLUSH_INTERVAL_SECONDS = float(os.environ.get("STREAM_FLUSH_INTERVAL_SECONDS", "0.25"))
+
+# Anthropic Prompt Caching Configuration
+# Shared step context (see shared_context_keys) and the step's system prompt are sent
+# as cache-marked system blocks, so steps after the first read the shared prefix from cache
+PROMPT_CACHING_ENABLED = os.environ.get("PROMPT_CACHING_ENABLED", "true").lower() == "true"
+# Heading each shared context document is sent under
+SHARED_CONTEXT_LABELS = {
+    "market_research": "Market Research Analysis",
+    "problem_validation": "Problem Validation Insights",
+}
+
+# LLM Result Cache Configuration
+# Successful Claude/Perplexity results keyed by a hash of model, prompts and sampling params
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DB_PATH = os.environ.get("LLM_CACHE_DB_PATH", "data/llm_cache.db")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+LLM_CACHE_DEFAULT_TTL_SECONDS = int(os.environ.get("LLM_CACHE_DEFAULT_TTL_SECONDS", str(7 * 24 * 60 * 60)))  # 7 days
+# Per-step overrides; live web research (step 1) goes stale much sooner than drafting steps
+LLM_CACHE_STEP_TTL_SECONDS = {
+    1: 24 * 60 * 60,
+}
+# Hits batch their last_accessed updates; flushed once this many are pending or this many seconds pass
+LLM_CACHE_TOUCH_BATCH_SIZE = int(os.environ.get("LLM_CACHE_TOUCH_BATCH_SIZE", "100"))
+LLM_CACHE_TOUCH_FLUSH_SECONDS = float(os.environ.get("LLM_CACHE_TOUCH_FLUSH_SECONDS", "5"))
+# Eviction frees this share of the budget beyond the overflow, so it runs once per batch of stores
+LLM_CACHE_EVICT_HEADROOM = float(os.environ.get("LLM_CACHE_EVICT_HEADROOM", "0.05"))
+
+# Raw LLM Output Cache Configuration
+# In-memory per-request step outputs and insights served by the debug and insight endpoints
+RAW_OUTPUT_CACHE_TTL_SECONDS = int(os.environ.get("RAW_OUTPUT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))  # 24 hours
+# Step outputs are stored zlib-compressed; the budget counts resident (compressed) bytes
+RAW_OUTPUT_CACHE_MAX_BYTES = int(os.environ.get("RAW_OUTPUT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RAW_OUTPUT_CACHE_COMPRESSION_LEVEL = int(os.environ.get("RAW_OUTPUT_CACHE_COMPRESSION_LEVEL", "6"))
+# Upper bound on how long /api/insights may hold a request open waiting for new insights (?wait=)
+INSIGHT_WAIT_MAX_SECONDS = float(os.environ.get("INSIGHT_WAIT_MAX_SECONDS", "25"))
+
+# Reporting Database Configuration
+DATABASE_SYNCHRONOUS = os.environ.get("DATABASE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable under WAL except on power loss
+DATABASE_CACHE_SIZE_KB = int(os.environ.get("DATABASE_CACHE_SIZE_KB", "16384"))
+DATABASE_BUSY_TIMEOUT_MS = int(os.environ.get("DATABASE_BUSY_TIMEOUT_MS", "5000"))
+DATABASE_SESSION_MEMO_SIZE = int(os.environ.get("DATABASE_SESSION_MEMO_SIZE", "10000"))
+# FTS5 full-text index over ideas and step outputs behind reporting search; tokenizer and
+# prefix index changes take effect after `python -m utils.database_service --rebuild-search-index`
+REPORTING_SEARCH_TOKENIZER = os.environ.get("REPORTING_SEARCH_TOKENIZER", "porter unicode61 remove_diacritics 2")
+# Prefix lengths indexed so search-as-you-type prefixes don't merge thousands of term lists
+REPORTING_SEARCH_PREFIX_INDEX = os.environ.get("REPORTING_SEARCH_PREFIX_INDEX", "2 3")
+REPORTING_SEARCH_SNIPPET_TOKENS = int(os.environ.get("REPORTING_SEARCH_SNIPPET_TOKENS", "16"))
+# bm25 ranking costs time per match; broader searches are ordered newest first instead
+REPORTING_SEARCH_MAX_RANKED_MATCHES = int(os.environ.get("REPORTING_SEARCH_MAX_RANKED_MATCHES", "5000"))
+# Write-behind queue for step output, insight and checkpoint dual-writes
+DB_WRITE_BEHIND_ENABLED = os.environ.get("DB_WRITE_BEHIND_ENABLED", "true").lower() == "true"
+DB_WRITE_QUEUE_MAX_SIZE = int(os.environ.get("DB_WRITE_QUEUE_MAX_SIZE", "10000"))
+DB_WRITE_BATCH_SIZE = int(os.environ.get("DB_WRITE_BATCH_SIZE", "200"))
+DB_WRITE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("DB_WRITE_FLUSH_INTERVAL_SECONDS", "0.2"))
+# How long a producer may block on a full queue before the record is dropped
+DB_WRITE_ENQUEUE_TIMEOUT_SECONDS = float(os.environ.get("DB_WRITE_ENQUEUE_TIMEOUT_SECONDS", "0.5"))
+
+# Metrics Configuration
+# In-process metrics registry served in Prometheus text format at /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+# Histogram bucket upper bounds in seconds
+METRICS_LLM_LATENCY_BUCKETS = [0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300]
+METRICS_SSE_FIRST_EVENT_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+METRICS_SSE_STREAM_BUCKETS = [5, 15, 30, 60, 120, 180, 300, 450, 600, 900]
+METRICS_DB_WRITE_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+
+# Tracing Configuration
+# Request-scoped spans (trace id = request_id), served as a waterfall at /api/debug/trace/<request_id>
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+# JSONL file every finished span is appended to; empty keeps traces in memory only
+TRACE_SINK_PATH = os.environ.get("TRACE_SINK_PATH", "data/traces.jsonl")
+TRACE_MAX_TRACES = int(os.environ.get("TRACE_MAX_TRACES", "200"))  # recent traces kept in memory
+TRACE_MAX_SPANS_PER_TRACE = int(os.environ.get("TRACE_MAX_SPANS_PER_TRACE", "2000"))
+
+# Progress Stream Resumption Configuration
+# Every pipeline event gets an SSE id and its serialized frame is kept in a bounded
+# per-run ring buffer; GET /api/process_stream/<request_id> with Last-Event-ID replays
+# the frames a dropped connection missed before attaching live
+SSE_EVENT_BUFFER_MAX_EVENTS = int(os.environ.get("SSE_EVENT_BUFFER_MAX_EVENTS", "2000"))
+SSE_EVENT_BUFFER_MAX_BYTES = int(os.environ.get("SSE_EVENT_BUFFER_MAX_BYTES", str(4 * 1024 * 1024)))
+# Finished runs stay resumable this long (bounded by count) so a late reconnect still gets the final result
+SSE_RESUME_RETENTION_SECONDS = float(os.environ.get("SSE_RESUME_RETENTION_SECONDS", "600"))
+SSE_RESUME_MAX_FINISHED_RUNS = int(os.environ.get("SSE_RESUME_MAX_FINISHED_RUNS", "100"))
+# A running streamed pipeline holds a lease on its processing_sessions row, renewed on the
+# timer wheel; /api/resume_stream only claims a session whose lease has lapsed, so a resume
+# landing on any worker process cannot start a second run while the first is alive
+PIPELINE_LEASE_TTL_SECONDS = float(os.environ.get("PIPELINE_LEASE_TTL_SECONDS", "60"))
+PIPELINE_LEASE_RENEW_INTERVAL_SECONDS = float(os.environ.get("PIPELINE_LEASE_RENEW_INTERVAL_SECONDS", "15"))
+
+# Completion State Store Configuration
+# Pipeline completion states served by /api/check-completion. 'sqlite' (WAL) is shared by
+# every worker process on the host; 'memory' only works with a single worker
+# The in-flight run registry stays per process: live stream reconnects (Last-Event-ID replay)
+# and single-flight coalescing of identical ideas only happen on the worker that owns the run,
+# so multi-worker deployments need sticky routing for them. A reconnect that lands elsewhere
+# falls back to this store (final result, or 409 + check_completion while still processing)
+COMPLETION_STORE_BACKEND = os.environ.get("COMPLETION_STORE_BACKEND", "sqlite")
+COMPLETION_STORE_DB_PATH = os.environ.get("COMPLETION_STORE_DB_PATH", "data/completion_states.db")
+COMPLETION_STATE_TTL_SECONDS = int(os.environ.get("COMPLETION_STATE_TTL_SECONDS", "3600"))  # 1 hour
+# Periodic janitor (background timer wheel) deleting expired states through the expires_at index, a batch at a time
+COMPLETION_STORE_JANITOR_INTERVAL_SECONDS = float(os.environ.get("COMPLETION_STORE_JANITOR_INTERVAL_SECONDS", "60"))
+COMPLETION_STORE_JANITOR_BATCH_SIZE = int(os.environ.get("COMPLETION_STORE_JANITOR_BATCH_SIZE", "500"))
+COMPLETION_STORE_COMPRESSION_LEVEL = int(os.environ.get("COMPLETION_STORE_COMPRESSION_LEVEL", "6"))
+
+# Background Execution Configuration
+# One timer wheel thread runs every delayed and periodic callback (heartbeats, activity
+# messages, TTL sweeps); ticks are the scheduling resolution
+BACKGROUND_TIMER_TICK_SECONDS = float(os.environ.get("BACKGROUND_TIMER_TICK_SECONDS", "0.05"))
+BACKGROUND_TIMER_WHEEL_SLOTS = int(os.environ.get("BACKGROUND_TIMER_WHEEL_SLOTS", "512"))
+# Pipelines run concurrently on the threaded engine; further runs wait in the queue
+PIPELINE_EXECUTOR_WORKERS = int(os.environ.get("PIPELINE_EXECUTOR_WORKERS", "32"))
+PIPELINE_EXECUTOR_MAX_QUEUE = int(os.environ.get("PIPELINE_EXECUTOR_MAX_QUEUE", "256"))
+# Named bounded executors: worker threads and the most tasks that may wait for a worker
+BACKGROUND_EXECUTORS = {
+    'pipeline': {'workers': PIPELINE_EXECUTOR_WORKERS, 'max_queue': PIPELINE_EXECUTOR_MAX_QUEUE},
+    'step': {'workers': PIPELINE_EXECUTOR_WORKERS * PIPELINE_MAX_PARALLEL_STEPS, 'max_queue': PIPELINE_EXECUTOR_MAX_QUEUE * PIPELINE_MAX_PARALLEL_STEPS},
+    'insight': {'workers': INSIGHT_EXTRACTION_WORKERS, 'max_queue': int(os.environ.get("INSIGHT_EXECUTOR_MAX_QUEUE", "1000"))},
+    'io': {'workers': ASYNC_PIPELINE_BACKGROUND_WORKERS, 'max_queue': int(os.environ.get("IO_EXECUTOR_MAX_QUEUE", "1000"))},
+}
+
 # Product Analysis Step (Step 0) Configuration
 PRODUCT_ANALYSIS_STEP = {
     "id": 0,
@@ -57,12 +321,21 @@ Provide an improved analysis using the same three-section format."""
 }
 
 # Define the steps in the Working Backwards process with Market Research Integration
+# Each step declares its data flow for the step scheduler:
+#   input_key    - output passed to the step handler as its primary input text
+#   context_keys - additional outputs passed to the handler via step_data
+#   output_key   - name under which this step's output is published to later steps
+#   shared_context_keys - context outputs sent ahead of the system prompt, in this
+#                  order, as a prompt-cached prefix shared by every step that uses it
 WORKING_BACKWARDS_STEPS = [
     {
         "id": 1,
         "name": "Market Research & Analysis",
         "persona": "Expert Market Research Analyst",
         "description": "Conducting comprehensive market research and competitive analysis using real-time web data.",
+        "input_key": "product_idea",
+        "context_keys": [],
+        "output_key": "market_research",
         "system_prompt": """You are an Expert Market Research Analyst with 15+ years of experience. Your task is to conduct comprehensive market research for the given product concept using current web data. Focus on:
 
 1. MARKET SIZE & OPPORTUNITY: Current market size, growth rate, and future projections
@@ -130,6 +403,10 @@ Focus on current, factual information with specific data points and provide sour
         "name": "Problem Validation Research",
         "persona": "Senior User Researcher - Problem Discovery Specialist",
         "description": "Validate problem severity and solution appetite with target customers",
+        "input_key": "product_idea",
+        "context_keys": ["market_research"],
+        "output_key": "problem_validation",
+        "shared_context_keys": ["market_research"],
         "system_prompt": """You are a Principal User Researcher specialized in problem discovery. You are ab exoert at applying proven frameworks to validate whether problems deserve solutions.
 
 CORE FRAMEWORKS:
@@ -164,8 +441,6 @@ FORMATTING REQUIREMENTS:
         "user_prompt": """Original Product Idea:
 {product_idea}
 
-Market Context:
-{market_research}
 Conduct problem discovery research with 10 target customers.
 
 ## Required Output Structure:
@@ -208,6 +483,10 @@ List the 5-7 key questions you asked participants to understand their problem sp
         "name": "Drafting Press Release",
         "persona": "Principal Product Manager",
         "description": "Create initial press release from customer perspective using Amazon methodology",
+        "input_key": "product_idea",
+        "context_keys": ["market_research", "problem_validation"],
+        "output_key": "press_release_draft",
+        "shared_context_keys": ["market_research", "problem_validation"],
         "system_prompt": """You are a Principal Product Manager with 10+ years experience launching major products. You've written dozens of press releases that have reached CEO review. You're elite at translating customer research into compelling product narratives.
 
 CORE APPROACH:
@@ -257,16 +536,6 @@ FORMATTING REQUIREMENTS (maintain all Amazon PR methodology above):
 {product_idea}
 ---
 
-Market Research Analysis:
----
-{market_research}
----
-
-Problem Validation Insights:
----
-{problem_validation}
----
-
 Using the original product idea, market research, and problem validation insights, write an internal press release following Amazon's Working Backwards methodology.
 
 CRITICAL REQUIREMENTS:
@@ -286,6 +555,10 @@ Remember: Think big on the problem space, be crisp on the solution."""
         "name": "Refining Press Release",
         "persona": "VP Product",
         "description": "Refine press release for executive review quality",
+        "input_key": "press_release_draft",
+        "context_keys": ["market_research", "problem_validation"],
+        "output_key": "refined_press_release",
+        "shared_context_keys": ["market_research", "problem_validation"],
         "system_prompt": """You are a VP of Product at Amazon with extensive leadership experience. You've refined hundreds of press releases for S-Team review and know what passes CEO scrutiny. You make surgical edits that sharpen clarity and strategic positioning.
 
     METHODOLOGY:
@@ -324,21 +597,11 @@ Remember: Think big on the problem space, be crisp on the solution."""
     
     """,
         
-        "user_prompt": """Market Research Analysis:
-    ---
-    {market_research}
-    ---
-
-    Original Press Release Draft:
+        "user_prompt": """Original Press Release Draft:
     ---
     {press_release_draft}
     ---
 
-    Problem Validation Insights:
-    ---
-    {problem_validation}
-    ---
-
     Review the press release through a VP lens, making targeted refinements where the market research and problem validation understanding can naturally strengthen the narrative.
 
     ## Key Refinements Made
@@ -372,6 +635,10 @@ Remember: Think big on the problem space, be crisp on the solution."""
         "name": "Drafting Internal FAQ",
         "persona": "VP Business Lead & Principal Engineer Personas",
         "description": "Address internal strategic and technical challenges",
+        "input_key": "refined_press_release",
+        "context_keys": ["market_research", "problem_validation"],
+        "output_key": "internal_faq",
+        "shared_context_keys": ["market_research", "problem_validation"],
         "system_prompt": """You embody TWO senior Amazon leaders responsible for providing key inputs to a PRFAQ document:
 
 VP BUSINESS LEAD (Strategic Business Leadership):
@@ -423,21 +690,11 @@ FORMATTING REQUIREMENTS (maintain technical rigor and business analysis above):
 - Start directly with questions
 - Use consistent Q/A structure throughout
 - No introductory or concluding meta-text""",
-        "user_prompt": """Market Research Analysis:
----
-{market_research}
----
-
-Press Release:
+        "user_prompt": """Press Release:
 ---
 {press_release}
 ---
 
-Problem Validation Context:
----
-{problem_validation_summary}
----
-
 Analyze the press release, market research, and problem validation context above, and use your expertise to provide precise, data-driven answers to each of the following strategic questions:
 
 **PRODUCT OVERVIEW**
@@ -486,6 +743,10 @@ CRITICAL: Question and answer text MUST be on the SAME line as their labels. NO
         "name": "Concept Validation Research",
         "persona": "Senior User Research Lead & Target Customer Panel",
         "description": "Simulate user research with diverse customer personas",
+        "input_key": "refined_press_release",
+        "context_keys": ["market_research", "problem_validation"],
+        "output_key": "concept_validation",
+        "shared_context_keys": ["market_research"],
         "system_prompt": """You are a Senior User Research Lead at Amazon with 15+ years conducting customer discovery. You're known for uncovering hidden insights that make or break products. Your research has prevented countless failed launches and refined billion-dollar products.
 
 YOUR METHODOLOGY TOOLKIT:
@@ -557,11 +818,6 @@ Remember: Great user research often kills good ideas to make room for great ones
 {press_release}
 ---
 
-Market Research Context:
----
-{market_research}
----
-
 Problem Validation Context:
 ---
 {problem_validation_summary}
@@ -610,6 +866,9 @@ A: [Synthesize the 3-4 most impactful learnings that directly influenced the fin
         "name": "Solution Refinement",
         "persona": "Principal Product Manager - Customer Insights Integration",
         "description": "Refine solution based on concept validation feedback",
+        "input_key": "refined_press_release",
+        "context_keys": ["concept_validation", "internal_faq"],
+        "output_key": "solution_refined_press_release",
         "system_prompt": """You are a Principal PM who excels at translating user research into precise product improvements. You make surgical edits that improve product-market fit while maintaining the exact press release structure.
 
     METHODOLOGY:
@@ -686,6 +945,9 @@ A: [Synthesize the 3-4 most impactful learnings that directly influenced the fin
         "name": "Drafting External FAQ",
         "persona": "Customer Success Lead",
         "description": "Create customer-facing FAQ based on real validation feedback",
+        "input_key": "solution_refined_press_release",
+        "context_keys": ["concept_validation"],
+        "output_key": "external_faq",
         "system_prompt": """You are a Customer Success Lead who has reviewed all user research. Create an FAQ that preemptively addresses real concerns and questions that emerged from concept testing.
 
 Your FAQs should:
@@ -730,6 +992,10 @@ CRITICAL FORMATTING:
         "name": "Synthesizing PRFAQ Document",
         "persona": "Senior Editor/Writer",
         "description": "Combine all elements into cohesive PRFAQ document",
+        "input_key": "solution_refined_press_release",
+        "context_keys": ["market_research", "problem_validation", "internal_faq", "concept_validation", "external_faq"],
+        "output_key": "prfaq",
+        "shared_context_keys": ["market_research"],
         "system_prompt": """You are an expert Editor/Writer who has prepared documents for Amazon's S-Team review. You perform a final editorial polish on PRFAQs that makes them compelling while preserving all content and claims.
 
     EDITORIAL METHODOLOGY:
@@ -779,11 +1045,6 @@ CRITICAL FORMATTING:
         
         "user_prompt": """Combined inputs from all previous steps:
 
-    Market Research Analysis:
-    ---
-    {market_research}
-    ---
-
     Refined Press Release:
     ---
     {refined_press_release}
@@ -854,6 +1115,9 @@ CRITICAL FORMATTING:
    "name": "Hypothesis-Driven Validation Plan",
    "persona": "Head of Product Validation & Research",
    "description": "Design hypothesis-driven validation plan using proven frameworks",
+   "input_key": "prfaq",
+   "context_keys": [],
+   "output_key": "mlp_plan",
    "system_prompt": """You are a Head of Product Validation Research who is an expert in hypothesis-driven product validation. You've launched 50+ products and saved companies millions by killing bad ideas early through systematic validation.
 
    YOUR EXPERTISE:
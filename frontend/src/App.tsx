@@ -455,13 +455,48 @@ function App() {
         throw new Error("Response body is missing.");
       }
 
-      const reader = response.body.getReader();
+      let reader = response.body.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
+      // Resumable stream state: the server tags events with ids and replays missed ones on reconnect
+      let streamRequestId: string | null = null;
+      let lastEventId: string | null = null;
+      let streamEnded = false;
+      let reconnectAttempts = 0;
+      const MAX_RECONNECT_ATTEMPTS = 5;
 
       // eslint-disable-next-line no-constant-condition
       while (true) { // Loop to read stream
-        const { done, value } = await reader.read();
+        let readResult: ReadableStreamReadResult<Uint8Array>;
+        try {
+          readResult = await reader.read();
+        } catch (readError) {
+          logToStorage('warn', '📡 Stream read failed', { error: String(readError), lastEventId });
+          readResult = { done: true, value: undefined };
+        }
+        const { done, value } = readResult;
+        if (done && !streamEnded && streamRequestId && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
+          // Connection dropped mid-run: reattach and replay only the events after lastEventId
+          reconnectAttempts += 1;
+          await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** (reconnectAttempts - 1), 8000)));
+          logToStorage('warn', '🔌 STREAM DROPPED - RECONNECTING', { requestId: streamRequestId, lastEventId, attempt: reconnectAttempts });
+          try {
+            const resumed = await fetch(`/api/process_stream/${streamRequestId}`, {
+              headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+            });
+            if (resumed.ok && resumed.body) {
+              reader = resumed.body.getReader();
+              buffer = '';
+              logToStorage('info', '🔌 STREAM RESUMED', { requestId: streamRequestId, lastEventId });
+              continue;
+            }
+            logToStorage('error', 'Stream reconnect rejected', { status: resumed.status });
+            reconnectAttempts = MAX_RECONNECT_ATTEMPTS;
+          } catch (reconnectError) {
+            logToStorage('warn', 'Stream reconnect failed', { error: String(reconnectError) });
+            continue;
+          }
+        }
         if (done) {
           // Check if processing wasn't marked complete by a final SSE event
           if (isProcessing) {
@@ -502,11 +537,16 @@ function App() {
         buffer = lines.pop() || ''; // Keep the last partial line in buffer
 
         for (const line of lines) {
+          if (line.startsWith('id: ')) {
+            lastEventId = line.substring(4).trim();
+            continue;
+          }
           if (line.startsWith('data: ')) {
             try {
               const eventData = JSON.parse(line.substring(5));
 
               if (eventData.request_id) {
+                streamRequestId = eventData.request_id;
                 // Always update to main workflow request ID (may differ from analysis ID)
                 if (currentRequestId !== eventData.request_id) {
                   logToStorage('info', '🔄 REQUEST ID UPDATED', { 
@@ -529,6 +569,12 @@ function App() {
                 continue; // Don't process as regular progress update
               }
 
+              // Events missed during a disconnect were no longer buffered server-side
+              if (eventData.type === 'replay_gap') {
+                logToStorage('warn', '⚠️ STREAM REPLAY GAP', { missedEvents: eventData.missed_events, requestId: eventData.request_id });
+                continue;
+              }
+
               // Handle heartbeat messages (just log, don't show to user)
               if (eventData.type === 'heartbeat') {
                 logToStorage('info', '💓 Backend thread heartbeat', { 
@@ -539,7 +585,18 @@ function App() {
                 continue; // Don't process as regular progress update
               }
 
+              // Handle streamed partial output (live preview of the step being generated)
+              if (eventData.type === 'partial_output') {
+                setStepsData(prev => prev.map(s => 
+                  s.id === eventData.step && s.status !== 'completed'
+                    ? { ...s, output: eventData.offset === 0 ? eventData.delta : (s.output || '') + eventData.delta }
+                    : s
+                ));
+                continue; // Don't process as regular progress update
+              }
+
               if (eventData.error) {
+                streamEnded = true;
                 const errorDataLog = {
                   step: eventData.step,
                   error: eventData.error,
@@ -770,6 +827,7 @@ function App() {
               }
 
               if (eventData.complete && eventData.result) {
+                streamEnded = true;
                 setCurrentStepText('Evaluation Complete! All steps processed.');
                 setFinalPrfaq(eventData.result.prfaq || 'Not available');
                 setFinalMlpPlan(eventData.result.mlp_plan || 'Not available');
@@ -904,10 +962,15 @@ function App() {
         stepName: processingStep.name 
       });
       
+               // Version of the last state seen; unchanged states come back as 304 with no body
+               let lastSeenVersion: number | null = null;
                const pollCompletion = async () => {
          try {
-           const response = await fetch(`/api/check-completion/${currentRequestId}`);
+           const versionParam = lastSeenVersion !== null ? `?since_version=${lastSeenVersion}` : '';
+           const response = await fetch(`/api/check-completion/${currentRequestId}${versionParam}`);
+           if (response.status === 304) return false; // Unchanged - continue polling
            const data = await response.json();
+           if (typeof data.version === 'number') lastSeenVersion = data.version;
            
            if (data.found && data.status === 'processing') {
              // Still processing - just log for monitoring
@@ -1170,7 +1233,10 @@ function App() {
     try {
       logToStorage('info', '🔍 FETCHING LATE INSIGHTS', { requestId: currentRequestId });
       
-      const response = await fetch(`/api/insights?request_id=${currentRequestId}`);
+      // Long-poll while insights are missing: the server answers as soon as a new one is stored
+      const knownInsights = stepsData.filter(step => step.keyInsight).length;
+      const waitQuery = knownInsights < stepsData.length ? `&wait=10&have=${knownInsights}` : '';
+      const response = await fetch(`/api/insights?request_id=${currentRequestId}${waitQuery}`);
       const data = await response.json();
       
       if (data.success && data.insights && Object.keys(data.insights).length > 0) {
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import threading
+import time
+from config import PIPELINE_HEARTBEAT_INTERVAL_SECONDS
+from utils.raw_output_cache import get_insights
+from utils import tracing
+from utils.background import get_background_service
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPipelineEngine:
+    """
+    Runs Working Backwards pipelines on one shared asyncio event loop.
+
+    Step handlers on LLMProcessor stay the contract: the engine runs them with
+    a context that defers LLM calls, awaits the returned DeferredLLMCall on the
+    async Anthropic/Perplexity clients and hands the provider result back to the
+    handler for post-processing. A pipeline waiting on an LLM therefore costs a
+    coroutine rather than a thread; heartbeats and activity timers are loop
+    callbacks. Step post-processing and completion bookkeeping block, so they
+    run on the background service's bounded 'io' executor shared by all
+    pipelines; insight extraction goes to the processor's InsightBatcher like
+    it does for threaded runs.
+    """
+
+    def __init__(self, llm_processor, background_executor=None):
+        self.llm_processor = llm_processor
+        self.background_executor = background_executor or get_background_service().executor('io')
+        self._loop = None
+        self._loop_thread = None
+        self._start_lock = threading.Lock()
+        self._active_pipelines = 0
+
+    @property
+    def active_pipelines(self):
+        return self._active_pipelines
+
+    def _ensure_loop(self):
+        """Start the event loop thread on first use"""
+        with self._start_lock:
+            if self._loop is not None and self._loop_thread.is_alive():
+                return self._loop
+
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            self._loop_thread = threading.Thread(target=run_loop, name="pipeline-event-loop", daemon=True)
+            self._loop_thread.start()
+            started.wait()
+            self._loop = loop
+            logger.info("Async pipeline event loop started")
+            return loop
+
+    def submit(self, product_idea, context, on_done=None, heartbeat_interval=PIPELINE_HEARTBEAT_INTERVAL_SECONDS, checkpoints=None):
+        """
+        Schedule a pipeline run on the event loop.
+
+        Args:
+            product_idea: The product idea to process
+            context: PipelineContext for this run (progress callback, request_id)
+            on_done: Optional callable(future) run on the background executor once
+                the pipeline finishes, so blocking bookkeeping stays off the loop
+            heartbeat_interval: Seconds between heartbeat events, or None to disable
+            checkpoints: Optional dict of step_id to output restored from an earlier run
+
+        Returns:
+            concurrent.futures.Future resolving to the process_all_steps result dict
+        """
+        loop = self._ensure_loop()
+        context.defer_llm_calls = True
+        context.background_executor = self.background_executor
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.process_all_steps(product_idea, context, heartbeat_interval=heartbeat_interval, checkpoints=checkpoints),
+            loop
+        )
+        if on_done:
+            future.add_done_callback(lambda f: self._run_on_done(on_done, f))
+        return future
+
+    def _run_on_done(self, on_done, future):
+        """Hand a finished pipeline to on_done on the background executor"""
+        try:
+            self.background_executor.submit(on_done, future)
+        except RuntimeError as e:
+            # Completion must still be recorded, so fall back to running it here
+            logger.error(f"Background executor rejected pipeline completion, running inline: {e}")
+            on_done(future)
+
+    async def process_all_steps(self, product_idea, context, heartbeat_interval=None, checkpoints=None):
+        """
+        Async counterpart of LLMProcessor.process_all_steps.
+
+        Args:
+            product_idea: The product idea to process
+            context: PipelineContext with defer_llm_calls enabled
+            heartbeat_interval: Seconds between heartbeat events, or None to disable
+            checkpoints: Optional dict of step_id to output restored from an earlier run
+
+        Returns:
+            Dictionary containing results from all steps or error information
+        """
+        processor = self.llm_processor
+        request_id = context.request_id
+        heartbeat_task = None
+        self._active_pipelines += 1
+
+        with tracing.start_span('pipeline', trace_id=request_id, engine='async', resumed=bool(checkpoints)) as span:
+            try:
+                if heartbeat_interval:
+                    heartbeat_task = asyncio.ensure_future(self._heartbeat(context, heartbeat_interval))
+
+                processor._announce_pipeline_start(product_idea, context)
+                completed_steps = processor._restore_checkpoints(checkpoints, context)
+
+                async def execute_step(step_id, input_text, step_data):
+                    with tracing.start_span('step', step=step_id) as step_span:
+                        return processor._trace_step_result(step_span, await self.execute_step(step_id, input_text, step_data, context))
+
+                # Step tasks inherit the pipeline span through their copied context
+                outputs, failure = await processor.step_scheduler.arun(
+                    product_idea,
+                    execute_step,
+                    on_step_start=lambda step_id: processor._announce_step_start(step_id, context),
+                    request_id=request_id,
+                    completed_steps=completed_steps
+                )
+
+                if failure:
+                    return processor._trace_step_result(span, processor._report_pipeline_failure(failure, context))
+
+                logger.info(f"[{request_id or 'NO_REQ_ID'}] Step 10 completed, waiting for insight extraction...")
+                with tracing.start_span('wait_for_step_10_insight'):
+                    await self._wait_for_step_10_insight(request_id, timeout_seconds=2, context=context)
+
+                return processor._build_pipeline_results(outputs, context)
+
+            except Exception as e:
+                span.record_error(e)
+                return processor._report_pipeline_exception(e, context)
+
+            finally:
+                self._active_pipelines -= 1
+                if heartbeat_task:
+                    heartbeat_task.cancel()
+
+    async def execute_step(self, step_id, input_text, step_data, context):
+        """Run one step handler, awaiting its deferred LLM call if it returned one"""
+        result = self.llm_processor.generate_step_response(step_id, input_text, step_data, context=context)
+
+        deferred = result.get("deferred_call") if isinstance(result, dict) else None
+        if deferred is None:
+            # Validation errors and other early returns come back synchronously
+            return result
+
+        if deferred.provider == "perplexity":
+            provider_result = await self.llm_processor.perplexity_processor.aconduct_initial_market_research(**deferred.request_kwargs)
+        else:
+            provider_result = await self.llm_processor.claude_processor.agenerate_response(**deferred.request_kwargs)
+
+        # Post-processing formats output, checkpoints it and queues DB writes, all of which may block
+        return await self.background_executor.arun(deferred.complete, provider_result)
+
+    async def _heartbeat(self, context, interval):
+        while True:
+            context.emit({
+                'type': 'heartbeat',
+                'timestamp': time.time(),
+                'request_id': context.request_id
+            })
+            await asyncio.sleep(interval)
+
+    async def _wait_for_step_10_insight(self, request_id, timeout_seconds=5, context=None):
+        """Wait for the run's step 10 insight future with timeout, without blocking the loop"""
+        if not request_id:
+            logger.warning("No request_id provided for step 10 insight wait")
+            return False
+
+        start_time = time.time()
+        logger.info(f"[{request_id}] Waiting for step 10 insight extraction (timeout: {timeout_seconds}s)...")
+
+        try:
+            future = context.get_insight_future(10) if context else None
+            if future is not None:
+                # asyncio.wait leaves the extraction running if the timeout wins
+                wrapped = asyncio.wrap_future(future)
+                await asyncio.wait({wrapped}, timeout=timeout_seconds)
+                found = wrapped.done() and not wrapped.cancelled() and wrapped.exception() is None and bool(wrapped.result())
+            else:
+                found = 10 in get_insights(request_id)
+        except Exception as e:
+            logger.error(f"[{request_id}] Error waiting for step 10 insight: {e}")
+            return False
+
+        elapsed = time.time() - start_time
+        if found:
+            logger.info(f"[{request_id}] Step 10 insight ready after {elapsed:.1f}s")
+            return True
+        logger.warning(f"[{request_id}] Step 10 insight not available after {elapsed:.1f}s - will rely on late retrieval")
+        return False
@@ -1,15 +1,27 @@
 import logging
-import anthropic
+import asyncio
+import threading
 import httpx
 import os
-from config import ANTHROPIC_API_KEY, CLAUDE_MODEL
+from config import ANTHROPIC_API_KEY, CLAUDE_MODEL, CLAUDE_STREAMING_ENABLED, STREAM_FLUSH_EVERY_TOKENS, STREAM_FLUSH_INTERVAL_SECONDS, PROMPT_CACHING_ENABLED
 import time
 
 # Import store_raw_llm_output from the new utility location
 from utils.raw_output_cache import store_raw_llm_output
+from utils.llm_result_cache import get_llm_cache
+from utils.rate_limiter import get_rate_limiter, estimate_tokens, usage_tokens, PRIORITY_STEP
+from utils.retry_policy import get_retry_policy, get_circuit_breaker
+from utils.llm_telemetry import CallTelemetry
+from utils.metrics import observe_llm_call
+from utils import tracing
+from utils.llm_backends import get_llm_backend
+from utils.background import get_background_service
 
 logger = logging.getLogger(__name__)
 
+# Anthropic allows at most four cache breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
 def format_response_summary(text: str, max_length: int = 150) -> str:
     """Format LLM response for clean logging"""
     if not text:
@@ -34,12 +46,17 @@ class ClaudeProcessor:
             # Development: Current settings
             timeout_config = httpx.Timeout(180.0)  # 3 minute HTTP timeout
             
-        self.client = anthropic.Anthropic(
-            api_key=ANTHROPIC_API_KEY,
-            timeout=timeout_config
-        )
+        # Clients come from the configured LLM backend (live API or local fake);
+        # SDK retries are disabled: the 'claude' retry policy owns every retry decision
+        backend = get_llm_backend()
+        self.client = backend.anthropic_client(timeout=timeout_config)
+        # Async client used by the asyncio pipeline engine (see agenerate_response)
+        self.async_client = backend.async_anthropic_client(timeout=timeout_config)
+        self.requires_api_key = backend.requires_api_keys
         self.model = CLAUDE_MODEL
-        logger.info(f"ClaudeProcessor initialized with model: {self.model}")
+        self.usage_totals = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cache_write_tokens': 0, 'cache_read_tokens': 0, 'cost_estimate': 0.0}
+        self.usage_lock = threading.Lock()
+        logger.info(f"ClaudeProcessor initialized with model: {self.model} (prompt caching: {PROMPT_CACHING_ENABLED})")
         
         # Step-specific activity messages for enhanced progress tracking
         self.step_activity_messages = {
@@ -100,7 +117,9 @@ class ClaudeProcessor:
             ]
         }
         
-        if not ANTHROPIC_API_KEY:
+        if not self.requires_api_key:
+            logger.info(f"ClaudeProcessor using the '{backend.name}' LLM backend; ANTHROPIC_API_KEY is not needed")
+        elif not ANTHROPIC_API_KEY:
             logger.error("ANTHROPIC_API_KEY is not set. Claude functionality will not work.")
         else:
             logger.info("ANTHROPIC_API_KEY is properly configured")
@@ -138,7 +157,388 @@ class ClaudeProcessor:
         # Cap at 97% to ensure we never exceed 99% with safety margins
         return min(base_progress + step_increment, 97)
     
-    def generate_response(self, system_prompt, user_prompt, progress_callback=None, step_id=None, request_id=None, step_info=None):
+    def _make_safe_callback(self, progress_callback, log_prefix):
+        """Protected progress callback wrapper"""
+        def safe_callback(update):
+            if progress_callback:
+                try:
+                    progress_callback(update)
+                except Exception as e:
+                    logger.error(f"{log_prefix} Progress callback failed: {e}")
+                    # Don't re-raise to avoid killing the calling thread
+        return safe_callback
+    
+    def _report_not_configured(self, safe_callback, step_id, request_id, log_prefix):
+        error_msg = "Claude API client not initialized. Please set ANTHROPIC_API_KEY in Replit Secrets."
+        logger.error(f"{log_prefix} {error_msg}")
+        safe_callback({
+            "step": step_id,
+            "status": "error",
+            "message": "Claude API not configured",
+            "error": error_msg
+        })
+        safe_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'❌ Step {step_id} failed: API not configured',
+            'request_id': request_id
+        })
+        return {"error": error_msg}
+    
+    def _start_activity_messages(self, safe_callback, step_id, schedule):
+        """
+        Send the first team-dynamics message and schedule the rest.
+        
+        Args:
+            safe_callback: Protected progress callback
+            step_id: Step ID whose messages are sent
+            schedule: Callable(delay_seconds, fn) that runs fn after the delay
+        """
+        # Get messages for this step
+        messages = self.step_activity_messages.get(step_id, ["Processing..."])
+        
+        # Send initial message
+        if isinstance(messages, list) and len(messages) > 0:
+            safe_callback({
+                "step": step_id,
+                "status": "processing",
+                "message": messages[0],
+                "progress": self._calculate_step_progress(step_id)
+            })
+            
+            # Set up message progression for team dynamics
+            for i, msg in enumerate(messages[1:], 1):
+                delay = i * 2.0
+                progress_increment = self._calculate_step_progress(step_id, i)
+                schedule(delay, lambda m=msg, p=progress_increment, sid=step_id: safe_callback({
+                    "step": sid,
+                    "status": "processing", 
+                    "message": m,
+                    "progress": p
+                }))
+    
+    def _log_request_start(self, safe_callback, system_prompt, user_prompt, shared_context, step_id, request_id, log_prefix):
+        # Enhanced diagnostic logging for payload analysis
+        shared_size = sum(map(len, shared_context))
+        total_prompt_size = len(system_prompt) + len(user_prompt) + shared_size
+        is_production = os.environ.get('FLASK_DEPLOYMENT_MODE') == 'production'
+        
+        # Backend logs
+        logger.info(f"{log_prefix} Step {step_id} payload size: {total_prompt_size} chars (shared context: {shared_size}, system: {len(system_prompt)}, user: {len(user_prompt)})")
+        logger.info(f"{log_prefix} Step {step_id} production mode: {is_production}")
+        logger.info(f"{log_prefix} Calling Claude API with model: {self.model}")
+        logger.debug(f"{log_prefix} System prompt length: {len(system_prompt)}")
+        logger.debug(f"{log_prefix} User prompt length: {len(user_prompt)}")
+        
+        # Frontend console diagnostic info
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'📊 Step {step_id} payload: {total_prompt_size} chars (production: {is_production})',
+            'request_id': request_id
+        })
+        
+        # Send API call start log
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'🔄 Step {step_id} calling Claude API (model: {self.model})',
+            'request_id': request_id
+        })
+    
+    def _build_request_params(self, system_prompt, user_prompt, shared_context):
+        """
+        Build Messages API parameters with the most widely shared text first.
+        
+        The system is sent as blocks: each shared context document (identical
+        for every step that uses it), then the step's own system prompt. With
+        PROMPT_CACHING_ENABLED each block ends in a cache breakpoint, so a step
+        reads whatever prefix an earlier step (or an earlier run of the same
+        step) already wrote, and only the step-specific tail is processed anew.
+        """
+        system_blocks = [{"type": "text", "text": document} for document in shared_context]
+        system_blocks.append({"type": "text", "text": system_prompt})
+        if PROMPT_CACHING_ENABLED:
+            for block in system_blocks[-MAX_CACHE_BREAKPOINTS:]:
+                block["cache_control"] = {"type": "ephemeral"}
+        return dict(
+            model=self.model,
+            max_tokens=8192,
+            temperature=0.3,
+            top_p=0.95,
+            system=system_blocks,
+            messages=[
+                {"role": "user", "content": user_prompt}
+            ]
+        )
+    
+    def _record_usage(self, telemetry, step_id, request_id, log_prefix):
+        """Log a call's token usage, including prompt cache reads and writes, and cost, and add them to the totals"""
+        usage = telemetry.usage
+        logger.info(f"{log_prefix} Step {step_id} tokens: input {usage['input_tokens']}, output {usage['output_tokens']}, "
+                    f"cache read {usage['cache_read_tokens']}, cache write {usage['cache_write_tokens']}, "
+                    f"attempts {telemetry.attempts}, est. cost ${telemetry.cost or 0:.4f}")
+        with self.usage_lock:
+            self.usage_totals['calls'] += 1
+            for field, count in usage.items():
+                self.usage_totals[field] += count
+            self.usage_totals['cost_estimate'] += telemetry.cost or 0.0
+        return dict(usage)
+    
+    def get_usage_stats(self):
+        """Token totals across all Claude calls; cache_hit_ratio is the share of prompt tokens read from cache"""
+        with self.usage_lock:
+            stats = dict(self.usage_totals)
+        prompt_tokens = stats['input_tokens'] + stats['cache_write_tokens'] + stats['cache_read_tokens']
+        stats['cache_hit_ratio'] = round(stats['cache_read_tokens'] / prompt_tokens, 3) if prompt_tokens else 0.0
+        stats['cost_estimate'] = round(stats['cost_estimate'], 4)
+        stats['prompt_caching_enabled'] = PROMPT_CACHING_ENABLED
+        return stats
+    
+    def _log_attempt_start(self, safe_callback, client, step_id, request_id, attempt, log_prefix):
+        # Comprehensive HTTP diagnostic logging
+        logger.info(f"{log_prefix} Step {step_id} attempt {attempt + 1}: HTTP request starting")
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'🔗 Step {step_id} HTTP request starting (attempt {attempt + 1})',
+            'request_id': request_id
+        })
+        
+        # Safe client configuration logging
+        try:
+            timeout_info = str(getattr(client, '_timeout', 'unknown'))
+            logger.info(f"{log_prefix} Step {step_id} client timeout: {timeout_info}")
+        except Exception:
+            logger.info(f"{log_prefix} Step {step_id} client timeout: unable to determine")
+    
+    def _log_attempt_success(self, safe_callback, step_id, request_id, attempt, request_duration, log_prefix):
+        logger.info(f"{log_prefix} Step {step_id} attempt {attempt + 1}: HTTP request completed in {request_duration:.2f}s")
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'✅ Step {step_id} HTTP request completed ({request_duration:.2f}s)',
+            'request_id': request_id
+        })
+    
+    def _handle_attempt_failure(self, e, delay, retry, safe_callback, step_id, request_id, request_duration, log_prefix):
+        """
+        Log a failed HTTP attempt and the retry policy's decision.
+        
+        Args:
+            e: The exception the attempt raised
+            delay: Seconds until the next attempt, or None when the error is raised
+            retry: RetryState of the call, already updated with this failure
+        """
+        error_type = type(e).__name__
+        error_msg = str(e)
+        error_class = retry.last_error_class.name
+        
+        # Comprehensive error logging
+        logger.error(f"{log_prefix} Step {step_id} attempt {retry.attempt}: HTTP request failed after {request_duration:.2f}s")
+        logger.error(f"{log_prefix} Step {step_id} error type: {error_type} ({error_class})")
+        logger.error(f"{log_prefix} Step {step_id} error message: {error_msg}")
+        
+        safe_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'❌ Step {step_id} HTTP error: {error_type} after {request_duration:.2f}s',
+            'request_id': request_id
+        })
+        
+        if delay is not None:
+            logger.warning(f"{log_prefix} Step {step_id} retry {retry.attempt}/{retry.max_attempts} after {delay:.1f}s ({error_class}): {error_msg}")
+            safe_callback({
+                'type': 'log',
+                'level': 'warn',
+                'message': f'⚠️ Step {step_id} retrying in {delay:.1f}s (attempt {retry.attempt}/{retry.max_attempts}): {error_type}',
+                'request_id': request_id
+            })
+    
+    def _begin_retry(self, step_id):
+        """Retry state for one step call; the complex later steps get one extra attempt"""
+        policy = get_retry_policy('claude')
+        max_attempts = policy.max_attempts if (step_id or 0) >= 7 else max(1, policy.max_attempts - 1)
+        return policy.begin(get_circuit_breaker('anthropic'), max_attempts=max_attempts)
+    
+    def _finalize_response(self, response, telemetry, safe_callback, step_id, request_id, step_info, log_prefix):
+        """Validate the API response, store the raw output with the call's telemetry and report completion"""
+        api_duration = telemetry.finish().duration_seconds
+        tracing.set_attributes(**telemetry.to_record())
+        observe_llm_call('anthropic', 'step', step_id, telemetry)
+        if not response or not response.content or not response.content[0].text:
+            logger.error(f"{log_prefix} Invalid response from Claude API")
+            safe_callback({
+                'type': 'log',
+                'level': 'error',
+                'message': f'❌ Step {step_id} received invalid Claude API response',
+                'request_id': request_id
+            })
+            return {"error": "Invalid response from Claude API"}
+        
+        output = response.content[0].text
+        logger.info(f"{log_prefix} Claude response: {format_response_summary(output)}")
+
+        # Enhanced diagnostic logging for response analysis
+        logger.info(f"{log_prefix} Step {step_id} API response time: {api_duration:.2f}s, response size: {len(output)} chars")
+
+        # Send API completion log with timing
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'✅ Step {step_id} Claude API completed in {api_duration:.1f}s ({len(output)} chars)',
+            'request_id': request_id
+        })
+
+        # Store raw output if request_id is provided
+        if request_id and step_info:
+            logger.debug(f"{log_prefix} PRE-CACHE RAW OUTPUT for {step_info} (len: {len(output)}): '{output[:500]}...'" ) # Log first 500 chars
+            try:
+                store_raw_llm_output(request_id, step_info, output, telemetry=telemetry.to_record())
+            except Exception as e_store:
+                logger.error(f"{log_prefix} Failed to store raw LLM output for step {step_info}: {e_store}")
+        
+        # Critical validation logging for response quality
+        if len(output.strip()) < 100:
+            logger.warning(f"{log_prefix} Claude response seems unusually short: {len(output)} chars")
+            safe_callback({
+                'type': 'log',
+                'level': 'warn',
+                'message': f'⚠️ Step {step_id} response unusually short ({len(output)} chars)',
+                'request_id': request_id
+            })
+        else:
+            logger.info(f"{log_prefix} Claude response appears to be of appropriate length")
+        
+        # Send completion update via progress callback
+        safe_callback({
+            "step": step_id,
+            "status": "completed",
+            "message": f"Step {step_id} completed successfully",
+            "progress": self._calculate_step_progress(step_id, 7),
+            "output": output
+        })
+        
+        logger.info(f"{log_prefix} Claude API call completed successfully")
+        return {"output": output, "usage": self._record_usage(telemetry, step_id, request_id, log_prefix)}
+    
+    def _serve_cached_response(self, cache_key, use_cache, safe_callback, step_id, request_id, step_info, log_prefix):
+        """
+        Return a cached result for identical request parameters, reporting it like a fresh completion.
+        
+        Returns:
+            The cached result dict, or None on a miss or when the cache is bypassed
+        """
+        cache = get_llm_cache()
+        if not use_cache:
+            cache.record_bypass()
+            logger.info(f"{log_prefix} Step {step_id} bypassing LLM result cache")
+            return None
+        
+        cached = cache.get(cache_key)
+        if not cached or not cached.get('output'):
+            return None
+        
+        output = cached['output']
+        tracing.set_attributes(cache_hit=True)
+        # Served without an API request: no attempts, tokens or cost
+        telemetry = CallTelemetry(self.model)
+        telemetry.cost = 0.0
+        logger.info(f"{log_prefix} Step {step_id} served from LLM result cache ({len(output)} chars)")
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'⚡ Step {step_id} served from cache ({len(output)} chars)',
+            'request_id': request_id
+        })
+        
+        if request_id and step_info:
+            try:
+                store_raw_llm_output(request_id, step_info, output, telemetry=telemetry.to_record())
+            except Exception as e_store:
+                logger.error(f"{log_prefix} Failed to store raw LLM output for {step_info}: {e_store}")
+        
+        safe_callback({
+            "step": step_id,
+            "status": "completed",
+            "message": f"Step {step_id} completed successfully",
+            "progress": self._calculate_step_progress(step_id, 7),
+            "output": output
+        })
+        return {"output": output}
+    
+    def _report_failure(self, e, api_duration, partial, safe_callback, step_id, request_id, log_prefix):
+        error_msg = f"Claude API error: {str(e)}"
+        tracing.current_span().fail(error_msg)
+        logger.error(f"{log_prefix} API call failed | Model: {self.model}, Error: {type(e).__name__}: {str(e)}")
+        logger.exception("Full error traceback:")
+        
+        error_update = {
+            "step": step_id,
+            "status": "error",
+            "message": f"Step {step_id} failed: {str(e)}",
+            "error": error_msg
+        }
+        # Streamed chunks are only joined here, once, when the text is actually needed
+        partial_text = ''.join(partial['chunks'])
+        if partial_text:
+            # Keep whatever was streamed before the failure
+            logger.warning(f"{log_prefix} Step {step_id} keeping {len(partial_text)} chars of partial output after failure")
+            error_update['partial_output'] = partial_text
+        safe_callback(error_update)
+        
+        safe_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'💥 Step {step_id} Claude API failed after {api_duration:.1f}s: {type(e).__name__}: {str(e)}',
+            'request_id': request_id
+        })
+        
+        if partial_text:
+            return {"error": error_msg, "partial_output": partial_text}
+        return {"error": error_msg}
+    
+    def _stream_message(self, request_params, safe_callback, step_id, request_id, partial, retry, timeout):
+        """
+        Call the Messages streaming API and forward coalesced text deltas.
+        
+        Deltas are flushed as 'partial_output' progress events every
+        STREAM_FLUSH_EVERY_TOKENS text events or STREAM_FLUSH_INTERVAL_SECONDS,
+        whichever comes first. Text received so far is kept in partial['chunks']
+        so it survives a failure mid-stream.
+        
+        Args:
+            request_params: Keyword arguments for messages.stream()
+            safe_callback: Protected progress callback
+            step_id: Step ID for the emitted events
+            request_id: Request ID for the emitted events
+            partial: Dict whose 'chunks' list accumulates the streamed output
+                and 'length' tracks its total length
+            retry: RetryState whose attempt deadline bounds the whole stream
+            timeout: HTTP timeout of this attempt in seconds
+            
+        Returns:
+            The final Message object assembled by the SDK
+        """
+        forwarder = PartialOutputForwarder(safe_callback, step_id, request_id, partial)
+        with self.client.messages.stream(**request_params, timeout=timeout) as stream:
+            for text in stream.text_stream:
+                forwarder.add(text)
+                retry.check_attempt_deadline()
+            forwarder.flush()
+            return stream.get_final_message()
+    
+    async def _astream_message(self, request_params, safe_callback, step_id, request_id, partial, timeout):
+        """Async counterpart of _stream_message using the AsyncAnthropic client; the caller bounds it with asyncio.wait_for"""
+        forwarder = PartialOutputForwarder(safe_callback, step_id, request_id, partial)
+        async with self.async_client.messages.stream(**request_params, timeout=timeout) as stream:
+            async for text in stream.text_stream:
+                forwarder.add(text)
+            forwarder.flush()
+            return await stream.get_final_message()
+    
+    @tracing.traced('llm.anthropic')
+    def generate_response(self, system_prompt, user_prompt, progress_callback=None, shared_context=None, step_id=None, request_id=None, step_info=None, stream=None, use_cache=True, priority=PRIORITY_STEP):
         """
         Generate a response from Claude API
         
@@ -146,24 +546,35 @@ class ClaudeProcessor:
             system_prompt: The system prompt for Claude
             user_prompt: The user prompt for Claude
             progress_callback: Optional callback for progress updates
+            shared_context: Optional list of context documents shared between steps
+                (e.g. market research); sent ahead of system_prompt as a cacheable prefix
             step_id: Optional step ID for progress tracking
             request_id: Optional request ID for caching raw output
             step_info: Optional string describing the step for caching (e.g., "step_1_MarketResearch")
+            stream: Stream text deltas to progress_callback as 'partial_output' events;
+                defaults to CLAUDE_STREAMING_ENABLED when a progress_callback is given
+            use_cache: Serve an identical earlier request from the LLM result cache;
+                pass False to force a fresh call (its result still refreshes the cache)
+            priority: Rate limiter admission class (utils.rate_limiter PRIORITY_*);
+                every attempt, including retries, waits for admission
+            
+        Retries follow the 'claude' policy in utils.retry_policy; while the
+        anthropic circuit breaker is open the call fails immediately.
             
         Returns:
-            Dict containing response or error information
+            Dict containing response or error information. A fresh response
+            carries 'usage' with input, output and cache read/write token counts.
+            On failure after streaming started, 'partial_output' holds the text
+            received so far.
         """
         log_prefix = f"[{request_id or 'NO_REQ_ID'}]" if request_id else f"[Step {step_id or 'N/A'}]"
+        tracing.set_attributes(step=step_id, model=self.model, priority=priority)
         logger.info(f"{log_prefix} Starting Claude API call for step {step_id}")
         
-        # Protected progress callback wrapper
-        def safe_callback(update):
-            if progress_callback:
-                try:
-                    progress_callback(update)
-                except Exception as e:
-                    logger.error(f"{log_prefix} Progress callback failed: {e}")
-                    # Don't re-raise to avoid killing the calling thread
+        if stream is None:
+            stream = CLAUDE_STREAMING_ENABLED and progress_callback is not None
+        partial = {'chunks': [], 'length': 0}
+        safe_callback = self._make_safe_callback(progress_callback, log_prefix)
         
         # Send step start log
         safe_callback({
@@ -173,242 +584,207 @@ class ClaudeProcessor:
             'request_id': request_id
         })
         
+        shared_context = shared_context or []
+        request_params = self._build_request_params(system_prompt, user_prompt, shared_context)
+        cache_key = get_llm_cache().make_key('claude', request_params)
+        cached = self._serve_cached_response(cache_key, use_cache, safe_callback, step_id, request_id, step_info, log_prefix)
+        if cached:
+            return cached
+        
         # Check if client was properly initialized
         if not self.client:
-            error_msg = "Claude API client not initialized. Please set ANTHROPIC_API_KEY in Replit Secrets."
-            logger.error(f"{log_prefix} {error_msg}")
-            safe_callback({
-                "step": step_id,
-                "status": "error",
-                "message": "Claude API not configured",
-                "error": error_msg
-            })
-            safe_callback({
-                'type': 'log',
-                'level': 'error',
-                'message': f'❌ Step {step_id} failed: API not configured',
-                'request_id': request_id
-            })
-            return {"error": error_msg}
+            return self._report_not_configured(safe_callback, step_id, request_id, log_prefix)
         
+        api_start_time = time.time()
         try:
-            # Get messages for this step
-            messages = self.step_activity_messages.get(step_id, ["Processing..."])
-            
-            # Send initial message
-            if isinstance(messages, list) and len(messages) > 0:
-                safe_callback({
-                    "step": step_id,
-                    "status": "processing",
-                    "message": messages[0],
-                    "progress": self._calculate_step_progress(step_id)
-                })
-                
-                # Set up message progression for team dynamics
-                if len(messages) > 1:
-                    import threading
-                    for i, msg in enumerate(messages[1:], 1):
-                        delay = i * 2.0
-                        progress_increment = self._calculate_step_progress(step_id, i)
-                        threading.Timer(delay, lambda m=msg, p=progress_increment, sid=step_id: safe_callback({
-                            "step": sid,
-                            "status": "processing", 
-                            "message": m,
-                            "progress": p
-                        })).start()
-            
-            # Enhanced diagnostic logging for payload analysis
-            total_prompt_size = len(system_prompt) + len(user_prompt)
-            is_production = os.environ.get('FLASK_DEPLOYMENT_MODE') == 'production'
-            
-            # Backend logs
-            logger.info(f"{log_prefix} Step {step_id} payload size: {total_prompt_size} chars (system: {len(system_prompt)}, user: {len(user_prompt)})")
-            logger.info(f"{log_prefix} Step {step_id} production mode: {is_production}")
-            logger.info(f"{log_prefix} Calling Claude API with model: {self.model}")
-            logger.debug(f"{log_prefix} System prompt length: {len(system_prompt)}")
-            logger.debug(f"{log_prefix} User prompt length: {len(user_prompt)}")
-            
-            # Frontend console diagnostic info
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': f'📊 Step {step_id} payload: {total_prompt_size} chars (production: {is_production})',
-                'request_id': request_id
-            })
-            
-            # Send API call start log with timing
+            self._start_activity_messages(
+                safe_callback, step_id,
+                schedule=lambda delay, fn: get_background_service().timers.schedule(delay, fn, owner=request_id)
+            )
+            self._log_request_start(safe_callback, system_prompt, user_prompt, shared_context, step_id, request_id, log_prefix)
             api_start_time = time.time()
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': f'🔄 Step {step_id} calling Claude API (model: {self.model})',
-                'request_id': request_id
-            })
+            telemetry = CallTelemetry(self.model)
             
-            # Universal retry logic for production resilience
-            max_retries = 3 if step_id >= 7 else 2  # Extra retries for complex later steps
-            retry_delays = [2.0, 5.0, 10.0]  # Progressive backoff
+            # Unified retry policy: typed error classification, jittered backoff, deadlines, circuit breaker
+            retry = self._begin_retry(step_id)
+            limiter = get_rate_limiter('anthropic', self.model)
+            estimated_tokens = estimate_tokens(len(system_prompt) + len(user_prompt) + sum(map(len, shared_context)), request_params['max_tokens'])
             
             response = None
-            for attempt in range(max_retries):
+            while True:
+                request_start = time.time()
+                ticket = None
                 try:
-                    # Comprehensive HTTP diagnostic logging
+                    retry.start_attempt()
+                    ticket = limiter.acquire(priority, estimated_tokens)
                     request_start = time.time()
-                    logger.info(f"{log_prefix} Step {step_id} attempt {attempt + 1}: HTTP request starting")
-                    safe_callback({
-                        'type': 'log',
-                        'level': 'info',
-                        'message': f'🔗 Step {step_id} HTTP request starting (attempt {attempt + 1})',
-                        'request_id': request_id
-                    })
-                    
-                    # Safe client configuration logging
-                    try:
-                        timeout_info = str(getattr(self.client, '_timeout', 'unknown'))
-                        logger.info(f"{log_prefix} Step {step_id} client timeout: {timeout_info}")
-                    except Exception:
-                        logger.info(f"{log_prefix} Step {step_id} client timeout: unable to determine")
-                    
-                    response = self.client.messages.create(
-                        model=self.model,
-                        max_tokens=8192,
-                        temperature=0.3,
-                        top_p=0.95,
-                        system=system_prompt,
-                        messages=[
-                            {"role": "user", "content": user_prompt}
-                        ]
-                    )
-                    
-                    request_duration = time.time() - request_start
-                    logger.info(f"{log_prefix} Step {step_id} attempt {attempt + 1}: HTTP request completed in {request_duration:.2f}s")
-                    safe_callback({
-                        'type': 'log',
-                        'level': 'info',
-                        'message': f'✅ Step {step_id} HTTP request completed ({request_duration:.2f}s)',
-                        'request_id': request_id
-                    })
+                    attempt_timeout = retry.attempt_timeout()
+                    self._log_attempt_start(safe_callback, self.client, step_id, request_id, retry.attempt - 1, log_prefix)
+                    if stream:
+                        response = self._stream_message(request_params, safe_callback, step_id, request_id, partial, retry, attempt_timeout)
+                    else:
+                        response = self.client.messages.create(**request_params, timeout=attempt_timeout)
+                    ticket.release(tokens_used=usage_tokens(response))
+                    retry.succeeded()
+                    telemetry.record_response(response)
+                    self._log_attempt_success(safe_callback, step_id, request_id, retry.attempt - 1, time.time() - request_start, log_prefix)
                     
                     # Success - exit retry loop
                     break
                     
                 except Exception as e:
-                    request_duration = time.time() - request_start
-                    error_type = type(e).__name__
-                    error_msg = str(e)
-                    
-                    # Comprehensive error logging
-                    logger.error(f"{log_prefix} Step {step_id} attempt {attempt + 1}: HTTP request failed after {request_duration:.2f}s")
-                    logger.error(f"{log_prefix} Step {step_id} error type: {error_type}")
-                    logger.error(f"{log_prefix} Step {step_id} error message: {error_msg}")
-                    
-                    safe_callback({
-                        'type': 'log',
-                        'level': 'error',
-                        'message': f'❌ Step {step_id} HTTP error: {error_type} after {request_duration:.2f}s',
-                        'request_id': request_id
-                    })
-                    
-                    # Check for retryable errors (rate limits, timeouts, overloaded)
-                    is_retryable_error = (
-                        'rate' in error_msg.lower() or 
-                        'overloaded' in error_msg.lower() or
-                        'timeout' in error_msg.lower() or
-                        '529' in error_msg or
-                        'connection' in error_msg.lower()
-                    )
-                    
-                    if is_retryable_error and attempt < max_retries - 1:
-                        delay = retry_delays[attempt]
-                        logger.warning(f"{log_prefix} Step {step_id} retry {attempt + 1}/{max_retries} after {delay}s: {error_msg}")
-                        safe_callback({
-                            'type': 'log',
-                            'level': 'warn',
-                            'message': f'⚠️ Step {step_id} retrying in {delay}s (attempt {attempt + 1}/{max_retries}): {error_type}',
-                            'request_id': request_id
-                        })
-                        time.sleep(delay)
-                        continue
-                    else:
+                    delay = retry.failed(e)
+                    if ticket:
+                        ticket.release(overloaded=retry.last_error_class.overload)
+                    self._handle_attempt_failure(e, delay, retry, safe_callback, step_id, request_id, time.time() - request_start, log_prefix)
+                    if delay is None:
                         # Re-raise for existing error handling
                         raise
+                    time.sleep(delay)
             
-            api_duration = time.time() - api_start_time
+            telemetry.attempts = retry.attempt
+            result = self._finalize_response(response, telemetry, safe_callback, step_id, request_id, step_info, log_prefix)
+            if 'output' in result:
+                get_llm_cache().put(cache_key, {"output": result["output"]}, provider='claude', step_id=step_id)
+            return result
             
-            if not response or not response.content or not response.content[0].text:
-                logger.error(f"{log_prefix} Invalid response from Claude API")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step {step_id} received invalid Claude API response',
-                    'request_id': request_id
-                })
-                return {"error": "Invalid response from Claude API"}
-            
-            output = response.content[0].text
-            logger.info(f"{log_prefix} Claude response: {format_response_summary(output)}")
-
-            # Enhanced diagnostic logging for response analysis
-            logger.info(f"{log_prefix} Step {step_id} API response time: {api_duration:.2f}s, response size: {len(output)} chars")
-
-            # Send API completion log with timing
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': f'✅ Step {step_id} Claude API completed in {api_duration:.1f}s ({len(output)} chars)',
-                'request_id': request_id
-            })
-
-            # Store raw output if request_id is provided
-            if request_id and step_info:
-                logger.debug(f"{log_prefix} PRE-CACHE RAW OUTPUT for {step_info} (len: {len(output)}): '{output[:500]}...'" ) # Log first 500 chars
-                try:
-                    store_raw_llm_output(request_id, step_info, output)
-                except Exception as e_store:
-                    logger.error(f"{log_prefix} Failed to store raw LLM output for step {step_info}: {e_store}")
+        except Exception as e:
+            return self._report_failure(e, time.time() - api_start_time, partial, safe_callback, step_id, request_id, log_prefix)
+    
+    @tracing.traced('llm.anthropic')
+    async def agenerate_response(self, system_prompt, user_prompt, progress_callback=None, shared_context=None, step_id=None, request_id=None, step_info=None, stream=None, use_cache=True, priority=PRIORITY_STEP):
+        """
+        Async counterpart of generate_response for the asyncio pipeline engine.
+        
+        Uses the AsyncAnthropic client, asyncio.sleep for retry backoff,
+        asyncio.wait_for for the per-attempt deadline and the running event
+        loop (instead of the background timer wheel) for activity messages.
+        Arguments, progress events and the returned dict are identical to
+        generate_response.
+        """
+        log_prefix = f"[{request_id or 'NO_REQ_ID'}]" if request_id else f"[Step {step_id or 'N/A'}]"
+        tracing.set_attributes(step=step_id, model=self.model, priority=priority)
+        logger.info(f"{log_prefix} Starting async Claude API call for step {step_id}")
+        
+        if stream is None:
+            stream = CLAUDE_STREAMING_ENABLED and progress_callback is not None
+        partial = {'chunks': [], 'length': 0}
+        safe_callback = self._make_safe_callback(progress_callback, log_prefix)
+        
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'🎯 Step {step_id} starting Claude API call',
+            'request_id': request_id
+        })
+        
+        shared_context = shared_context or []
+        request_params = self._build_request_params(system_prompt, user_prompt, shared_context)
+        cache_key = get_llm_cache().make_key('claude', request_params)
+        # SQLite lookups and the raw output store block, so they run on the shared 'io' executor
+        io_executor = get_background_service().executor('io')
+        cached = await io_executor.arun(self._serve_cached_response, cache_key, use_cache, safe_callback, step_id, request_id, step_info, log_prefix)
+        if cached:
+            return cached
+        
+        if not self.async_client:
+            return self._report_not_configured(safe_callback, step_id, request_id, log_prefix)
+        
+        loop = asyncio.get_running_loop()
+        activity_timers = []
+        api_start_time = time.time()
+        try:
+            self._start_activity_messages(
+                safe_callback, step_id,
+                schedule=lambda delay, fn: activity_timers.append(loop.call_later(delay, fn))
+            )
+            self._log_request_start(safe_callback, system_prompt, user_prompt, shared_context, step_id, request_id, log_prefix)
+            api_start_time = time.time()
+            telemetry = CallTelemetry(self.model)
             
-            # Critical validation logging for response quality
-            if len(output.strip()) < 100:
-                logger.warning(f"{log_prefix} Claude response seems unusually short: {len(output)} chars")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'warn',
-                    'message': f'⚠️ Step {step_id} response unusually short ({len(output)} chars)',
-                    'request_id': request_id
-                })
-            else:
-                logger.info(f"{log_prefix} Claude response appears to be of appropriate length")
+            retry = self._begin_retry(step_id)
+            limiter = get_rate_limiter('anthropic', self.model)
+            estimated_tokens = estimate_tokens(len(system_prompt) + len(user_prompt) + sum(map(len, shared_context)), request_params['max_tokens'])
             
-            # Send completion update via progress callback
-            safe_callback({
-                "step": step_id,
-                "status": "completed",
-                "message": f"Step {step_id} completed successfully",
-                "progress": self._calculate_step_progress(step_id, 7),
-                "output": output
-            })
+            response = None
+            while True:
+                request_start = time.time()
+                ticket = None
+                try:
+                    retry.start_attempt()
+                    ticket = await limiter.aacquire(priority, estimated_tokens)
+                    request_start = time.time()
+                    attempt_timeout = retry.attempt_timeout()
+                    self._log_attempt_start(safe_callback, self.async_client, step_id, request_id, retry.attempt - 1, log_prefix)
+                    if stream:
+                        call = self._astream_message(request_params, safe_callback, step_id, request_id, partial, attempt_timeout)
+                    else:
+                        call = self.async_client.messages.create(**request_params, timeout=attempt_timeout)
+                    response = await asyncio.wait_for(call, attempt_timeout)
+                    ticket.release(tokens_used=usage_tokens(response))
+                    retry.succeeded()
+                    telemetry.record_response(response)
+                    self._log_attempt_success(safe_callback, step_id, request_id, retry.attempt - 1, time.time() - request_start, log_prefix)
+                    break
+                    
+                except asyncio.CancelledError:
+                    if ticket:
+                        ticket.release()
+                    raise
+                except Exception as e:
+                    delay = retry.failed(e)
+                    if ticket:
+                        ticket.release(overloaded=retry.last_error_class.overload)
+                    self._handle_attempt_failure(e, delay, retry, safe_callback, step_id, request_id, time.time() - request_start, log_prefix)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
             
-            logger.info(f"{log_prefix} Claude API call completed successfully")
-            return {"output": output}
+            telemetry.attempts = retry.attempt
+            # Storing the raw output compresses it and queues a DB write, so it stays off the loop too
+            result = await io_executor.arun(self._finalize_response, response, telemetry, safe_callback, step_id, request_id, step_info, log_prefix)
+            if 'output' in result:
+                await io_executor.arun(get_llm_cache().put, cache_key, {"output": result["output"]}, 'claude', step_id)
+            return result
             
         except Exception as e:
-            api_duration = time.time() - api_start_time if 'api_start_time' in locals() else 0
-            error_msg = f"Claude API error: {str(e)}"
-            logger.error(f"{log_prefix} API call failed | Model: {self.model}, Error: {type(e).__name__}: {str(e)}")
-            logger.exception("Full error traceback:")
-            
-            safe_callback({
-                "step": step_id,
-                "status": "error",
-                "message": f"Step {step_id} failed: {str(e)}",
-                "error": error_msg
-            })
-            
-            safe_callback({
-                'type': 'log',
-                'level': 'error',
-                'message': f'💥 Step {step_id} Claude API failed after {api_duration:.1f}s: {type(e).__name__}: {str(e)}',
-                'request_id': request_id
-            })
-            
-            return {"error": error_msg} 
\ No newline at end of file
+            return self._report_failure(e, time.time() - api_start_time, partial, safe_callback, step_id, request_id, log_prefix)
+
+
+class PartialOutputForwarder:
+    """Coalesces streamed text deltas into 'partial_output' progress events"""
+    
+    def __init__(self, safe_callback, step_id, request_id, partial):
+        self.safe_callback = safe_callback
+        self.step_id = step_id
+        self.request_id = request_id
+        self.partial = partial
+        # A retry restarts the output, so the first flush of each attempt carries offset 0
+        self.partial['chunks'] = []
+        self.partial['length'] = 0
+        self.pending = []
+        self.pending_tokens = 0
+        self.last_flush = time.time()
+    
+    def add(self, text):
+        self.partial['chunks'].append(text)
+        self.partial['length'] += len(text)
+        self.pending.append(text)
+        self.pending_tokens += 1
+        if self.pending_tokens >= STREAM_FLUSH_EVERY_TOKENS or time.time() - self.last_flush >= STREAM_FLUSH_INTERVAL_SECONDS:
+            self.flush()
+    
+    def flush(self):
+        if not self.pending:
+            return
+        delta = ''.join(self.pending)
+        self.safe_callback({
+            'type': 'partial_output',
+            'step': self.step_id,
+            'delta': delta,
+            'offset': self.partial['length'] - len(delta),
+            'request_id': self.request_id
+        })
+        self.pending = []
+        self.pending_tokens = 0
+        self.last_flush = time.time()
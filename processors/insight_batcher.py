@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from utils import tracing
+from utils.background import get_background_service
+from config import (
+    INSIGHT_EXTRACTION_WORKERS, INSIGHT_BATCH_MAX_ITEMS, INSIGHT_BATCH_MAX_CHARS,
+    INSIGHT_BATCH_WINDOW_SECONDS, INSIGHT_BATCH_ACROSS_REQUESTS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class InsightJob:
+    """One step's pending insight extraction"""
+
+    def __init__(self, request_id, step_id, prompt, label, deliver=None, trace_parent=None):
+        self.request_id = request_id
+        self.step_id = step_id
+        self.prompt = prompt  # complete single-call prompt for this step
+        self.label = label
+        self.deliver = deliver  # callable(insight, telemetry) run once the insight is known
+        self.telemetry = None  # CallTelemetry share of the request(s) that produced the insight
+        self.trace_parent = trace_parent  # span of the step that queued the job
+        self.future = Future()
+        self.submitted_at = time.time()
+
+
+class InsightBatcher:
+    """
+    Merges pending insight jobs into batched requests run on the shared 'insight' executor.
+
+    Jobs wait up to INSIGHT_BATCH_WINDOW_SECONDS for company (a timer on the
+    background timer wheel ends the wait); the oldest job plus any other pending
+    jobs that fit in INSIGHT_BATCH_MAX_ITEMS and INSIGHT_BATCH_MAX_CHARS are then
+    handed to extract_batch in one call. When across_requests is False only jobs
+    of the same pipeline run share a batch. At most `workers` batches run at
+    once: a burst simply makes batches fuller.
+    """
+
+    def __init__(self, extract_batch, workers=INSIGHT_EXTRACTION_WORKERS, max_items=INSIGHT_BATCH_MAX_ITEMS,
+                 max_chars=INSIGHT_BATCH_MAX_CHARS, window_seconds=INSIGHT_BATCH_WINDOW_SECONDS,
+                 across_requests=INSIGHT_BATCH_ACROSS_REQUESTS, executor=None, timers=None):
+        """
+        Args:
+            extract_batch: callable(list of InsightJob) returning one insight (or None) per job, in order;
+                it may set each job's telemetry, which is handed to the job's deliver callable
+            workers: Maximum batches in flight at once
+            max_items: Maximum jobs merged into one request
+            max_chars: Maximum combined prompt length of a merged request
+            window_seconds: How long the oldest job waits for others to batch with
+            across_requests: Whether jobs from different pipeline runs may share a request
+            executor: Executor batches run on (defaults to the background service's 'insight' executor)
+            timers: TimerWheel for the batching window (defaults to the background service's)
+        """
+        self.extract_batch = extract_batch
+        self.workers = max(1, workers)
+        self.max_items = max(1, max_items)
+        self.max_chars = max_chars
+        self.window_seconds = window_seconds
+        self.across_requests = across_requests
+        self.executor = executor
+        self.timers = timers
+        self.pending = []
+        self.in_flight = 0
+        self.window_timer = None
+        self.condition = threading.Condition()
+        self.stats = {'jobs': 0, 'batches': 0, 'merged_batches': 0, 'failed_batches': 0}
+
+    def submit(self, job):
+        """Queue a job; returns its Future, resolved with the job's insight (or None)"""
+        with self.condition:
+            self.pending.append(job)
+            self.stats['jobs'] += 1
+        self._dispatch()
+        return job.future
+
+    def _ensure_background(self):
+        if self.executor is None or self.timers is None:
+            service = get_background_service()
+            self.executor = self.executor or service.executor('insight')
+            self.timers = self.timers or service.timers
+
+    def _compatible(self, first, job):
+        return self.across_requests or job.request_id == first.request_id
+
+    def _batch_is_full(self, first):
+        return sum(1 for job in self.pending if self._compatible(first, job)) >= self.max_items
+
+    def _take_batch(self):
+        """Remove the oldest job and the compatible jobs that fit alongside it"""
+        first = self.pending[0]
+        batch = [first]
+        chars = len(first.prompt)
+        for job in self.pending[1:]:
+            if len(batch) >= self.max_items:
+                break
+            if not self._compatible(first, job) or chars + len(job.prompt) > self.max_chars:
+                continue
+            batch.append(job)
+            chars += len(job.prompt)
+        taken = set(map(id, batch))
+        self.pending = [job for job in self.pending if id(job) not in taken]
+        return batch
+
+    def _dispatch(self):
+        """
+        Start a batch for every job that is ready while fewer than `workers` are in flight.
+
+        Runs on submit, when the window timer fires and when a batch finishes. If
+        the oldest job is still inside its window, a timer is armed to come back then.
+        """
+        self._ensure_background()
+        batches = []
+        with self.condition:
+            while self.pending and self.in_flight < self.workers:
+                first = self.pending[0]
+                remaining = first.submitted_at + self.window_seconds - time.time()
+                if remaining > 0 and not self._batch_is_full(first):
+                    # Give other steps a moment to join the oldest job's batch
+                    if self.window_timer is None or not self.window_timer.active:
+                        self.window_timer = self.timers.schedule(remaining, self._dispatch)
+                    break
+                batch = self._take_batch()
+                self.in_flight += 1
+                self.stats['batches'] += 1
+                if len(batch) > 1:
+                    self.stats['merged_batches'] += 1
+                batches.append(batch)
+
+        for batch in batches:
+            try:
+                self.executor.submit(self._run_batch, batch)
+            except RuntimeError as e:
+                logger.error(f"Insight batch of {len(batch)} jobs could not be scheduled: {e}")
+                with self.condition:
+                    self.in_flight -= 1
+                    self.stats['failed_batches'] += 1
+                for job in batch:
+                    job.future.set_result(None)
+
+    def _run_batch(self, batch):
+        try:
+            self._process(batch)
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+            self._dispatch()
+
+    def _process(self, batch):
+        batch_start = time.time()
+        # The request's spans attach to the oldest job's trace; every job records its own span below
+        with tracing.start_span('insight.batch', parent=batch[0].trace_parent, jobs=len(batch),
+                                steps=[job.step_id for job in batch]) as span:
+            try:
+                insights = self.extract_batch(batch)
+            except Exception as e:
+                logger.error(f"Insight batch of {len(batch)} jobs failed: {e}", exc_info=True)
+                span.record_error(e)
+                with self.condition:
+                    self.stats['failed_batches'] += 1
+                insights = []
+        insights = list(insights) + [None] * (len(batch) - len(insights))
+
+        for job, insight in zip(batch, insights):
+            if job.deliver:
+                try:
+                    job.deliver(insight, job.telemetry)
+                except Exception as e:
+                    logger.error(f"[{job.request_id or 'NO_REQ_ID'}] Delivering step {job.step_id} insight failed: {e}", exc_info=True)
+            attributes = job.telemetry.to_record() if job.telemetry else {}
+            attributes.update(step=job.step_id, batch_size=len(batch), queued_ms=round((batch_start - job.submitted_at) * 1000, 3))
+            tracing.record_span('insight', job.submitted_at, parent=job.trace_parent,
+                                status='ok' if insight else 'error', error=None if insight else 'No insight produced',
+                                **attributes)
+            job.future.set_result(insight)
+
+    def get_stats(self):
+        """Job and batch counters; jobs / batches is the average batch size"""
+        with self.condition:
+            stats = dict(self.stats)
+            stats['pending'] = len(self.pending)
+            stats['in_flight'] = self.in_flight
+        stats['workers'] = self.workers
+        stats['max_items'] = self.max_items
+        stats['across_requests'] = self.across_requests
+        return stats
@@ -0,0 +1,94 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Longest text accepted as a structurally extracted insight; anything longer
+# means the markdown did not have the expected shape
+MAX_LOCAL_INSIGHT_LENGTH = 300
+
+_BOLD_LINE = re.compile(r'^\s*(?:#{1,6}\s*)?\*\*(?P<text>[^*\n]+?)\*\*\s*$')
+_HEADING_LINE = re.compile(r'^\s*#{1,6}\s+(?P<text>.+?)\s*#*\s*$')
+_QUESTION = re.compile(r'\*\*\s*Question\s*:?\s*\*\*\s*:?\s*(?P<text>[^\n]+)', re.IGNORECASE)
+_PRESS_RELEASE_HEADING = re.compile(r'^\s*#{1,6}\s*\**\s*Press Release\s*\**\s*:?\s*$', re.IGNORECASE | re.MULTILINE)
+_SECTION_LABEL = re.compile(r'^[\w\s&/-]+:$')
+_NEXT_HEADING = re.compile(r'^\s*#{1,6}\s', re.MULTILINE)
+
+
+def _clean(text):
+    """Strip markdown emphasis and surrounding quotes/whitespace from an extracted line"""
+    text = re.sub(r'[*_`]+', '', text or '').strip()
+    text = text.strip('"').strip("'").strip()
+    if not text or len(text) > MAX_LOCAL_INSIGHT_LENGTH:
+        return None
+    return text
+
+
+def _first_bold_line(markdown):
+    """Return the first line that is entirely bold (optionally a bold heading), skipping section labels"""
+    for line in markdown.splitlines():
+        match = _BOLD_LINE.match(line)
+        if not match:
+            continue
+        text = match.group('text').strip()
+        if _SECTION_LABEL.match(text):
+            continue
+        return _clean(text)
+    return None
+
+
+def extract_headline(markdown):
+    """Press release headline: the first bold line, or the first heading when nothing is bold"""
+    headline = _first_bold_line(markdown)
+    if headline:
+        return headline
+    for line in markdown.splitlines():
+        match = _HEADING_LINE.match(line)
+        if match:
+            return _clean(match.group('text'))
+    return None
+
+
+def extract_first_question(markdown):
+    """Text of the first **Question:** entry, repeated as written"""
+    match = _QUESTION.search(markdown)
+    return _clean(match.group('text')) if match else None
+
+
+def extract_press_release_thesis(markdown):
+    """Bold headline of the document's Press Release section, which carries its core value proposition"""
+    section = _PRESS_RELEASE_HEADING.search(markdown)
+    if not section:
+        return None
+    body = markdown[section.end():]
+    next_heading = _NEXT_HEADING.search(body)
+    return _first_bold_line(body[:next_heading.start()] if next_heading else body)
+
+
+# Steps whose insight is a verbatim piece of the output's structure
+LOCAL_INSIGHT_EXTRACTORS = {
+    3: extract_headline,
+    8: extract_first_question,
+    9: extract_press_release_thesis,
+}
+
+
+def extract_local_insight(step_id, output):
+    """
+    Answer a step's insight straight from its markdown when the structure allows it.
+
+    Args:
+        step_id: The step whose output is being summarized
+        output: The step's markdown output
+
+    Returns:
+        The insight text, or None when the step has no local extractor or parsing failed
+    """
+    extractor = LOCAL_INSIGHT_EXTRACTORS.get(step_id)
+    if not extractor or not output:
+        return None
+    try:
+        return extractor(output)
+    except Exception as e:
+        logger.warning(f"Local insight extraction for step {step_id} failed: {e}")
+        return None
@@ -1,10 +1,22 @@
 import logging
-import threading
-from config import ANTHROPIC_API_KEY, WORKING_BACKWARDS_STEPS, CLAUDE_MODEL, PERPLEXITY_API_KEY, GEMINI_API_KEY, GEMINI_FLASH_MODEL, PRODUCT_ANALYSIS_STEP
+import json
+import time
+from concurrent.futures import Future, wait as wait_for_futures
+from config import ANTHROPIC_API_KEY, WORKING_BACKWARDS_STEPS, CLAUDE_MODEL, PERPLEXITY_API_KEY, GEMINI_API_KEY, GEMINI_FLASH_MODEL, PRODUCT_ANALYSIS_STEP, PIPELINE_MAX_PARALLEL_STEPS, LOCAL_INSIGHT_EXTRACTION_ENABLED, SHARED_CONTEXT_LABELS
 from processors.perplexity_processor import PerplexityProcessor
 from processors.claude_processor import ClaudeProcessor
-from utils.raw_output_cache import store_insight, get_insights
-import anthropic
+from processors.step_graph import StepGraphScheduler
+from processors.pipeline_context import PipelineContext, DeferredLLMCall
+from processors.insight_batcher import InsightBatcher, InsightJob
+from processors.insight_extractors import extract_local_insight, LOCAL_INSIGHT_EXTRACTORS
+from utils.raw_output_cache import store_insight, wait_for_insights
+from utils.rate_limiter import get_rate_limiter, estimate_tokens, usage_tokens, PRIORITY_STEP, PRIORITY_INSIGHT
+from utils.retry_policy import get_retry_policy, get_circuit_breaker
+from utils.llm_telemetry import CallTelemetry
+from utils.metrics import observe_llm_call
+from utils import tracing
+from utils.llm_backends import get_llm_backend
+from utils.background import get_background_service
 import google.generativeai as genai
 
 # Get logger for this module
@@ -13,15 +25,32 @@ logger = logging.getLogger(__name__)
 # Configure Google Generative AI with API key
 # genai.configure(api_key=ANTHROPIC_API_KEY)
 
+# Display names used in progress logs and the final results payload
+PIPELINE_STEP_LABELS = {
+    1: 'Market Research & Analysis',
+    2: 'Problem Validation Research',
+    3: 'Draft Press Release',
+    4: 'Refined Press Release',
+    5: 'Internal FAQ',
+    6: 'Concept Validation Research',
+    7: 'Solution Refinement',
+    8: 'External FAQ',
+    9: 'PRFAQ Document',
+    10: 'MLP Plan'
+}
+
 class LLMProcessor:
     def __init__(self):
         self.model = CLAUDE_MODEL
         self.steps = WORKING_BACKWARDS_STEPS
-        self.step_outputs = {}
         self.perplexity_processor = PerplexityProcessor()
         self.claude_processor = ClaudeProcessor()
+        self.step_scheduler = StepGraphScheduler(self.steps, max_workers=PIPELINE_MAX_PARALLEL_STEPS,
+                                                 executor=get_background_service().executor('step'))
+        self.insight_batcher = InsightBatcher(self._extract_insight_batch)
         logger.info(f"LLMProcessor initialized with model: {self.model}")
         logger.info(f"Number of steps configured: {len(self.steps)}")
+        logger.info(f"Step scheduler dependencies: {self.step_scheduler.graph} (max parallel steps: {PIPELINE_MAX_PARALLEL_STEPS})")
         
         # Check if API key is set
         if not ANTHROPIC_API_KEY:
@@ -48,10 +77,11 @@ class LLMProcessor:
         # Initialize isolated Claude client specifically for insights only
         self.insight_claude_client = None
         self.insight_claude_model = "claude-3-5-haiku-20241022"
-        if ANTHROPIC_API_KEY:
-            logger.info("ANTHROPIC_API_KEY found, attempting to initialize isolated Claude client for insights.")
+        backend = get_llm_backend()
+        if ANTHROPIC_API_KEY or not backend.requires_api_keys:
+            logger.info(f"Initializing isolated Claude client for insights on the '{backend.name}' LLM backend.")
             try:
-                self.insight_claude_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+                self.insight_claude_client = backend.anthropic_client(profile='insight')  # the 'insight' retry policy owns retries
                 logger.info(f"Isolated Claude client initialized successfully for insight extraction: {self.insight_claude_model}")
                 logger.info("Insight extraction will use isolated Claude client (separate from main processing)")
             except Exception as e:
@@ -60,7 +90,7 @@ class LLMProcessor:
         else:
             logger.warning("ANTHROPIC_API_KEY not set - isolated Claude insight extraction will not work.")
             
-    def generate_step_response(self, step_id, input_text, step_data=None, progress_callback=None, request_id=None):
+    def generate_step_response(self, step_id, input_text, step_data=None, progress_callback=None, request_id=None, context=None, use_cache=True, priority=PRIORITY_STEP):
         """
         Generate a response from the LLM for a specific step in the Working Backwards process.
         
@@ -70,10 +100,21 @@ class LLMProcessor:
             step_data: Additional data needed for multi-input steps
             progress_callback: Optional callback function to report progress
             request_id: Optional request ID for logging and caching raw output
+            context: Optional PipelineContext of the run this step belongs to;
+                when omitted a standalone context is built from the other arguments
+            use_cache: For standalone calls, whether the LLM result cache may serve
+                this step (a passed-in context carries its own setting)
+            priority: For standalone calls, the rate limiter admission class
             
         Returns:
             The generated response from the LLM
         """
+        if context is None:
+            context = PipelineContext(request_id=request_id, progress_callback=progress_callback, step_data=step_data, use_cache=use_cache, priority=priority)
+        else:
+            context = context.for_step(step_data)
+            request_id = context.request_id
+        
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Starting step {step_id}")
         logger.debug(f"[{request_id or 'NO_REQ_ID'}] Input text length: {len(input_text) if input_text else 0}")
         logger.debug(f"[{request_id or 'NO_REQ_ID'}] Step data provided: {step_data is not None}")
@@ -82,34 +123,34 @@ class LLMProcessor:
             # Handle different step types based on their requirements
             if step_id == 1:
                 # Initial market research step
-                return self._handle_initial_market_research(input_text, progress_callback, request_id)
+                return self._handle_initial_market_research(input_text, context)
             elif step_id == 2:
                 # Problem validation research
-                return self._handle_problem_validation_research(input_text, step_data, progress_callback, request_id)
+                return self._handle_problem_validation_research(input_text, context)
             elif step_id == 3:
                 # Press release drafting with market research AND problem validation
-                return self._handle_press_release_with_research_and_validation(input_text, step_data, progress_callback, request_id)
+                return self._handle_press_release_with_research_and_validation(input_text, context)
             elif step_id == 4:
                 # Press release refinement (existing handler works)
-                return self._handle_press_release_refinement(input_text, step_data, progress_callback, request_id)
+                return self._handle_press_release_refinement(input_text, context)
             elif step_id == 5:
                 # Internal FAQ (existing handler works with adjusted ID)
-                return self._handle_step_with_market_research(step_id, input_text, step_data, progress_callback, request_id)
+                return self._handle_step_with_market_research(step_id, input_text, context)
             elif step_id == 6:
                 # Concept validation research
-                return self._handle_concept_validation_research(input_text, step_data, progress_callback, request_id)
+                return self._handle_concept_validation_research(input_text, context)
             elif step_id == 7:
                 # Solution refinement
-                return self._handle_solution_refinement(input_text, step_data, progress_callback, request_id)
+                return self._handle_solution_refinement(input_text, context)
             elif step_id == 8:
                 # External FAQ (now based on research)
-                return self._handle_external_faq_from_research(input_text, step_data, progress_callback, request_id)
+                return self._handle_external_faq_from_research(input_text, context)
             elif step_id == 9:
                 # PRFAQ synthesis
-                return self._handle_prfaq_synthesis_enhanced(input_text, step_data, progress_callback, request_id)
+                return self._handle_prfaq_synthesis_enhanced(input_text, context)
             elif step_id == 10:
                 # MLP Plan
-                return self._handle_mlp_with_research_context(input_text, step_data, progress_callback, request_id)
+                return self._handle_mlp_with_research_context(input_text, context)
             else:
                 logger.error(f"[{request_id or 'NO_REQ_ID'}] Unknown step ID: {step_id}")
                 return {"error": f"Unknown step ID: {step_id}"}
@@ -123,8 +164,9 @@ class LLMProcessor:
                 "step": step_id
             }
 
-    def _handle_initial_market_research(self, product_idea, progress_callback=None, request_id=None):
+    def _handle_initial_market_research(self, product_idea, context):
         """Handle initial market research step using Perplexity"""
+        request_id = context.request_id
         step_id_for_log = 1
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling initial market research step ({step_id_for_log})")
         
@@ -135,37 +177,52 @@ class LLMProcessor:
             return {"error": "Market research step configuration not found"}
         
         # Use Perplexity processor for market research
-        result = self.perplexity_processor.conduct_initial_market_research(
+        request_kwargs = dict(
             product_idea=product_idea,
             system_prompt=research_step["system_prompt"],
             user_prompt=research_step["user_prompt"],
-            progress_callback=progress_callback,
+            progress_callback=context.emit,
             request_id=request_id,
-            step_info=f"step_{step_id_for_log}_{research_step.get('name', 'MarketResearch')}"
+            step_info=f"step_{step_id_for_log}_{research_step.get('name', 'MarketResearch')}",
+            use_cache=context.use_cache,
+            priority=context.priority
         )
         
+        if context.defer_llm_calls:
+            return {"deferred_call": DeferredLLMCall(
+                "perplexity",
+                request_kwargs,
+                complete=lambda result: self._complete_market_research(product_idea, result, context)
+            )}
+        
+        result = self.perplexity_processor.conduct_initial_market_research(**request_kwargs)
+        return self._complete_market_research(product_idea, result, context)
+
+    def _complete_market_research(self, product_idea, result, context):
+        """Record the Perplexity research result for step 1 and start its insight extraction"""
+        request_id = context.request_id
+        step_id_for_log = 1
+        
         # Store Step 1 output and trigger insight extraction (if successful)
         if "error" not in result and result.get("output"):
             output = result["output"]
             logger.info(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log} response received - length: {len(output)} characters")
             
             # Store complete step data for recovery (both input and output)
-            self.step_outputs[step_id_for_log] = {
-                'input': product_idea[:1000] if product_idea else None,  # Store first 1000 chars of input
-                'output': output,
-                'status': 'completed'
-            }
+            context.record_step_output(step_id_for_log, product_idea, output)
             
             # Trigger insight extraction in background thread (same as other steps)
             logger.debug(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Triggering insight extraction for market research")
-            self._trigger_insight_extraction(step_id_for_log, output, progress_callback, request_id)
+            self._trigger_insight_extraction(step_id_for_log, output, context)
         else:
             logger.warning(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Skipping insight extraction due to error or missing output")
         
         return result
 
-    def _handle_problem_validation_research(self, product_idea, step_data, progress_callback=None, request_id=None):
+    def _handle_problem_validation_research(self, product_idea, context):
         """Handle problem validation research step"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 2
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling problem validation research ({step_id_for_log})")
         
@@ -174,16 +231,15 @@ class LLMProcessor:
             logger.error(f"[{request_id or 'NO_REQ_ID'}] Problem validation step configuration not found")
             return {"error": "Problem validation step configuration not found"}
         
-        # Format prompt with product idea and market research
-        formatted_prompt = step["user_prompt"].format(
-            product_idea=product_idea,
-            market_research=step_data.get('market_research', '')
-        )
+        # Market research travels in the shared context prefix (see _shared_context)
+        formatted_prompt = step["user_prompt"].format(product_idea=product_idea)
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_press_release_with_research_and_validation(self, product_idea, step_data, progress_callback=None, request_id=None):
+    def _handle_press_release_with_research_and_validation(self, product_idea, context):
         """Handle press release drafting with BOTH market research and problem validation"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 3
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling press release with research and validation ({step_id_for_log})")
         
@@ -192,17 +248,15 @@ class LLMProcessor:
             logger.error(f"[{request_id or 'NO_REQ_ID'}] Press release step configuration not found")
             return {"error": "Press release step configuration not found"}
         
-        # Format prompt with product idea, market research, AND problem validation
-        formatted_prompt = step["user_prompt"].format(
-            product_idea=product_idea,
-            market_research=step_data.get('market_research', ''),
-            problem_validation=step_data.get('problem_validation', '')
-        )
+        # Market research and problem validation travel in the shared context prefix
+        formatted_prompt = step["user_prompt"].format(product_idea=product_idea)
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_press_release_refinement(self, input_text, step_data, progress_callback=None, request_id=None):
+    def _handle_press_release_refinement(self, input_text, context):
         """Handle press release refinement step (special case)"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 4
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling press release refinement step ({step_id_for_log})")
         
@@ -224,17 +278,15 @@ class LLMProcessor:
         input_length = len(input_text) if input_text else 0
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Market research data available ({market_research_length} chars), press release draft ({input_length} chars)")
         
-        # Format prompt with press_release_draft and market_research (step 4 specific format)
-        formatted_prompt = step["user_prompt"].format(
-            press_release_draft=input_text,
-            market_research=step_data['market_research'],
-            problem_validation=step_data['problem_validation']
-        )
+        # Market research and problem validation travel in the shared context prefix
+        formatted_prompt = step["user_prompt"].format(press_release_draft=input_text)
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_step_with_market_research(self, step_id, input_text, step_data, progress_callback=None, request_id=None):
+    def _handle_step_with_market_research(self, step_id, input_text, context):
         """Handle steps that need both input text and market research context"""
+        request_id = context.request_id
+        step_data = context.step_data
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling step {step_id} with market research")
         
         step = next((s for s in self.steps if s["id"] == step_id), None)
@@ -257,11 +309,9 @@ class LLMProcessor:
         
         # Format prompt with correct parameter names based on step
         if step_id in [5, 6]:
-            formatted_prompt = step["user_prompt"].format(
-                press_release=input_text,
-                market_research=step_data['market_research'],
-                problem_validation_summary=step_data.get('problem_validation', '')
-            )
+            # Market research travels in the shared context prefix; for step 5 so does the full
+            # problem validation output, sent as a context document rather than a trimmed summary
+            formatted_prompt = step["user_prompt"].format(press_release=input_text)
         else:
             logger.warning(f"[{request_id or 'NO_REQ_ID'}] _handle_step_with_market_research called for unexpected step_id: {step_id}")
             formatted_prompt = step["user_prompt"].format(
@@ -269,10 +319,12 @@ class LLMProcessor:
                 market_research=step_data['market_research']
             )
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id, context)
 
-    def _handle_prfaq_synthesis(self, input_text, step_data, progress_callback=None, request_id=None):
+    def _handle_prfaq_synthesis(self, input_text, context):
         """Handle PRFAQ synthesis step with all previous outputs"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 9
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling PRFAQ synthesis (old version?) with research ({step_id_for_log})")
         
@@ -299,16 +351,16 @@ class LLMProcessor:
                    f"internal_faq ({len(internal_faq)} chars)")
         
         formatted_prompt = step["user_prompt"].format(
-            market_research=market_research,
             refined_press_release=refined_press_release,
             external_faq=external_faq,
             internal_faq=internal_faq
         )
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_standard_step(self, step_id, input_text, progress_callback=None, request_id=None):
+    def _handle_standard_step(self, step_id, input_text, context):
         """Handle standard steps that only need single input"""
+        request_id = context.request_id
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling standard step {step_id}")
         
         step = next((s for s in self.steps if s["id"] == step_id), None)
@@ -317,10 +369,12 @@ class LLMProcessor:
             return {"error": f"Step {step_id} configuration not found"}
         
         formatted_prompt = step["user_prompt"].format(input=input_text)
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id, context)
 
-    def _handle_concept_validation_research(self, press_release, step_data, progress_callback=None, request_id=None):
+    def _handle_concept_validation_research(self, press_release, context):
         """Handle concept validation research step"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 6
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling concept validation research ({step_id_for_log})")
         
@@ -335,14 +389,15 @@ class LLMProcessor:
         
         formatted_prompt = step["user_prompt"].format(
             press_release=press_release,
-            market_research=step_data.get('market_research', ''),
             problem_validation_summary=problem_validation_summary
         )
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_solution_refinement(self, press_release, step_data, progress_callback=None, request_id=None):
+    def _handle_solution_refinement(self, press_release, context):
         """Handle solution refinement based on concept validation"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 7
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling solution refinement ({step_id_for_log})")
         
@@ -357,10 +412,12 @@ class LLMProcessor:
             internal_faq=step_data.get('internal_faq', '')
         )
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_external_faq_from_research(self, press_release, step_data, progress_callback=None, request_id=None):
+    def _handle_external_faq_from_research(self, press_release, context):
         """Create external FAQ based on concept validation findings"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 8
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling external FAQ from research ({step_id_for_log})")
         
@@ -392,7 +449,7 @@ class LLMProcessor:
             )
             
             logger.info(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Calling Claude API for External FAQ generation")
-            result = self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+            result = self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
             
             if "error" in result:
                 logger.error(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Claude API call failed: {result['error']}")
@@ -405,8 +462,10 @@ class LLMProcessor:
             logger.exception(f"[{request_id or 'NO_REQ_ID'}] Step {step_id_for_log}: Unexpected error during External FAQ generation")
             return {"error": f"Step {step_id_for_log} failed: {str(e)}"}
 
-    def _handle_prfaq_synthesis_enhanced(self, input_text, step_data, progress_callback=None, request_id=None):
+    def _handle_prfaq_synthesis_enhanced(self, input_text, context):
         """Enhanced PRFAQ synthesis with user research insights"""
+        request_id = context.request_id
+        step_data = context.step_data
         step_id_for_log = 9
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling enhanced PRFAQ synthesis ({step_id_for_log})")
         
@@ -424,17 +483,17 @@ Concept Validation Key Findings:
 """
         
         formatted_prompt = step["user_prompt"].format(
-            market_research=step_data.get('market_research', ''),
             refined_press_release=input_text,
             external_faq=step_data.get('external_faq', ''),
             internal_faq=step_data.get('internal_faq', ''),
             user_research_insights=user_research_insights
         )
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _handle_mlp_with_research_context(self, input_text, step_data, progress_callback=None, request_id=None):
+    def _handle_mlp_with_research_context(self, input_text, context):
         """Handle MLP plan with research context for prioritization"""
+        request_id = context.request_id
         step_id_for_log = 10
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Handling MLP plan with research context ({step_id_for_log})")
         
@@ -445,26 +504,61 @@ Concept Validation Key Findings:
         
         formatted_prompt = step["user_prompt"].format(input=input_text)
         
-        return self._call_claude_api(step, formatted_prompt, progress_callback, step_id_for_log, request_id)
+        return self._call_claude_api(step, formatted_prompt, step_id_for_log, context)
 
-    def _call_claude_api(self, step, formatted_prompt, progress_callback, step_id, request_id=None):
+    def _call_claude_api(self, step, formatted_prompt, step_id, context):
         """Shared Claude API call logic for all Claude-based steps"""
+        request_id = context.request_id
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Calling Claude API for step {step_id}")
         step_name_for_info = step.get("name", f"UnknownStep{step_id}")
         
         system_prompt = step["system_prompt"]
+        shared_context = self._shared_context(step, context.step_data)
         logger.debug(f"[{request_id or 'NO_REQ_ID'}] System prompt length: {len(system_prompt)}")
         logger.debug(f"[{request_id or 'NO_REQ_ID'}] User prompt length: {len(formatted_prompt)}")
+        logger.debug(f"[{request_id or 'NO_REQ_ID'}] Shared context: {len(shared_context)} documents, {sum(map(len, shared_context))} chars")
         
-        result = self.claude_processor.generate_response(
+        request_kwargs = dict(
             system_prompt=system_prompt,
             user_prompt=formatted_prompt,
-            progress_callback=progress_callback,
+            shared_context=shared_context,
+            progress_callback=context.emit,
             step_id=step_id,
             request_id=request_id,
-            step_info=f"step_{step_id}_{step_name_for_info}"
+            step_info=f"step_{step_id}_{step_name_for_info}",
+            use_cache=context.use_cache,
+            priority=context.priority
         )
         
+        if context.defer_llm_calls:
+            return {"deferred_call": DeferredLLMCall(
+                "claude",
+                request_kwargs,
+                complete=lambda result: self._complete_claude_step(step, formatted_prompt, step_id, result, context)
+            )}
+        
+        result = self.claude_processor.generate_response(**request_kwargs)
+        return self._complete_claude_step(step, formatted_prompt, step_id, result, context)
+
+    @staticmethod
+    def _shared_context(step, step_data):
+        """
+        Format the step's shared_context_keys outputs as documents for the cacheable prompt prefix.
+        
+        Every step sharing a document sends identical text in the same position,
+        so the prefix cached by the first of them is read by the rest.
+        """
+        documents = []
+        for key in step.get("shared_context_keys", []):
+            text = (step_data or {}).get(key)
+            if text:
+                documents.append(f"{SHARED_CONTEXT_LABELS.get(key, key)}:\n---\n{text}\n---")
+        return documents
+
+    def _complete_claude_step(self, step, formatted_prompt, step_id, result, context):
+        """Post-process a Claude step result, record it and start its insight extraction"""
+        request_id = context.request_id
+        
         if "error" in result:
             return result
         
@@ -505,14 +599,10 @@ Concept Validation Key Findings:
                 output = original_output
         
         # Store complete step data for recovery (both input and output)
-        self.step_outputs[step_id] = {
-            'input': formatted_prompt[:1000] if formatted_prompt else None,  # Store first 1000 chars of input
-            'output': output,
-            'status': 'completed'
-        }
+        context.record_step_output(step_id, formatted_prompt, output)
         
         # NEW: Fire-and-forget insight extraction
-        self._trigger_insight_extraction(step_id, output, progress_callback, request_id)
+        self._trigger_insight_extraction(step_id, output, context)
         
         return {
             "output": output,
@@ -521,7 +611,7 @@ Concept Validation Key Findings:
             "description": step["description"]
         }
 
-    def process_all_steps(self, product_idea, progress_callback=None, request_id=None):
+    def process_all_steps(self, product_idea, progress_callback=None, request_id=None, context=None, checkpoints=None):
         """
         Process a product idea through all steps of the Working Backwards methodology.
         
@@ -529,290 +619,175 @@ Concept Validation Key Findings:
             product_idea: The product idea to process
             progress_callback: Optional callback function to report progress
             request_id: Optional request ID for logging and caching raw output
+            context: Optional PipelineContext for this run; pass one in to read
+                the recorded step outputs after processing finishes
+            checkpoints: Optional dict of step_id to output from an earlier run of
+                the same request; those steps are restored instead of re-executed
             
         Returns:
             Dictionary containing results from all steps or error information
         """
+        if context is None:
+            context = PipelineContext(request_id=request_id, progress_callback=progress_callback)
+        request_id = context.request_id
+        
+        self._announce_pipeline_start(product_idea, context)
+        
+        with tracing.start_span('pipeline', trace_id=request_id, engine='threads', resumed=bool(checkpoints)) as span:
+            try:
+                completed_steps = self._restore_checkpoints(checkpoints, context)
+                
+                def execute_step(step_id, input_text, step_data):
+                    with tracing.start_span('step', step=step_id) as step_span:
+                        return self._trace_step_result(step_span, self.generate_step_response(step_id, input_text, step_data, context=context))
+                
+                # Independent steps (e.g. 5 and 6) run concurrently once their inputs are ready
+                outputs, failure = self.step_scheduler.run(
+                    product_idea,
+                    execute_step,
+                    on_step_start=lambda step_id: self._announce_step_start(step_id, context),
+                    request_id=request_id,
+                    completed_steps=completed_steps
+                )
+                
+                if failure:
+                    return self._trace_step_result(span, self._report_pipeline_failure(failure, context))
+                
+                # Wait for step 10 insight extraction before completion
+                logger.info(f"[{request_id or 'NO_REQ_ID'}] Step 10 completed, waiting for insight extraction...")
+                with tracing.start_span('wait_for_step_10_insight'):
+                    self._wait_for_step_10_insight(request_id, timeout_seconds=2, context=context)
+                
+                return self._build_pipeline_results(outputs, context)
+                
+            except Exception as e:
+                span.record_error(e)
+                return self._report_pipeline_exception(e, context)
+    
+    @staticmethod
+    def _trace_step_result(span, result):
+        """Mark a trace span failed when the step or pipeline returned an error dict; returns result"""
+        if isinstance(result, dict) and 'error' in result:
+            span.fail(str(result['error']))
+        return result
+
+    def _announce_pipeline_start(self, product_idea, context):
+        """Log and emit the start of a pipeline run"""
+        request_id = context.request_id
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Starting complete Working Backwards process with enhanced research")
         logger.info(f"[{request_id or 'NO_REQ_ID'}] Product idea: {product_idea[:100]}...")
         
-        # Protected progress callback wrapper
-        def safe_callback(update):
-            if progress_callback:
-                try:
-                    progress_callback(update)
-                except Exception as e:
-                    logger.error(f"[{request_id or 'NO_REQ_ID'}] Progress callback failed in process_all_steps: {e}")
-                    # Don't re-raise to avoid killing the processing thread
+        # Send workflow start log
+        context.emit({
+            'type': 'log',
+            'level': 'info',
+            'message': '🚀 Starting 10-step Working Backwards process',
+            'request_id': request_id
+        })
+
+    def _restore_checkpoints(self, checkpoints, context):
+        """
+        Seed a run with step outputs checkpointed by an earlier attempt.
         
-        try:
-            self.step_outputs = {}
-            
-            # Send workflow start log
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '🚀 Starting 10-step Working Backwards process',
-                'request_id': request_id
-            })
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 1: Market Research & Analysis ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 1/10: Market Research & Analysis',
-                'request_id': request_id
-            })
-            step1_result = self.generate_step_response(1, product_idea, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step1_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 1 failed: {step1_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 1 failed: {step1_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step1_result['error'], 'step': 1}
-            
-            market_research = step1_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 2: Problem Validation Research ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 2/10: Problem Validation Research',
-                'request_id': request_id
-            })
-            step_data = {'market_research': market_research}
-            step2_result = self.generate_step_response(2, product_idea, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step2_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 2 failed: {step2_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 2 failed: {step2_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step2_result['error'], 'step': 2}
-            
-            problem_validation = step2_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 3: Draft Press Release ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 3/10: Draft Press Release',
-                'request_id': request_id
-            })
-            step_data['problem_validation'] = problem_validation
-            step3_result = self.generate_step_response(3, product_idea, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step3_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 3 failed: {step3_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 3 failed: {step3_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step3_result['error'], 'step': 3}
-            
-            press_release_draft = step3_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 4: Refine Press Release ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 4/10: Refine Press Release',
-                'request_id': request_id
-            })
-            step4_result = self.generate_step_response(4, press_release_draft, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step4_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 4 failed: {step4_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 4 failed: {step4_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step4_result['error'], 'step': 4}
-            
-            refined_press_release = step4_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 5: Internal FAQ ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 5/10: Internal FAQ',
-                'request_id': request_id
-            })
-            step5_result = self.generate_step_response(5, refined_press_release, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step5_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 5 failed: {step5_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 5 failed: {step5_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step5_result['error'], 'step': 5}
-            
-            internal_faq = step5_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 6: Concept Validation Research ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 6/10: Concept Validation Research',
-                'request_id': request_id
-            })
-            step_data['internal_faq'] = internal_faq
-            step6_result = self.generate_step_response(6, refined_press_release, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step6_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 6 failed: {step6_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 6 failed: {step6_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step6_result['error'], 'step': 6}
-            
-            concept_validation = step6_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 7: Solution Refinement ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 7/10: Solution Refinement',
-                'request_id': request_id
-            })
-            step_data['concept_validation'] = concept_validation
-            step7_result = self.generate_step_response(7, refined_press_release, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step7_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 7 failed: {step7_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 7 failed: {step7_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step7_result['error'], 'step': 7}
-            
-            solution_refined_pr = step7_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 8: External FAQ ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 8/10: External FAQ',
-                'request_id': request_id
-            })
-            step8_result = self.generate_step_response(8, solution_refined_pr, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step8_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 8 failed: {step8_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 8 failed: {step8_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step8_result['error'], 'step': 8}
-            
-            external_faq = step8_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 9: Synthesize PRFAQ ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 9/10: Synthesize PRFAQ',
-                'request_id': request_id
-            })
-            step_data['external_faq'] = external_faq
-            step_data['refined_press_release'] = solution_refined_pr
-            step9_result = self.generate_step_response(9, solution_refined_pr, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step9_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 9 failed: {step9_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 9 failed: {step9_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step9_result['error'], 'step': 9}
-            
-            prfaq_document = step9_result['output']
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step 10: MLP Plan ---")
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '📊 Step 10/10: MLP Plan',
-                'request_id': request_id
-            })
-            step10_result = self.generate_step_response(10, prfaq_document, step_data, progress_callback=safe_callback, request_id=request_id)
-            
-            if 'error' in step10_result:
-                logger.error(f"[{request_id or 'NO_REQ_ID'}] Step 10 failed: {step10_result['error']}")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 10 failed: {step10_result["error"]}',
-                    'request_id': request_id
-                })
-                return {'error': step10_result['error'], 'step': 10}
-            
-            mlp_plan = step10_result['output']
-            
-            # Wait for step 10 insight extraction before completion
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] Step 10 completed, waiting for insight extraction...")
-            self._wait_for_step_10_insight(request_id, timeout_seconds=2)
-            
-            results = {
-                'prfaq': prfaq_document,
-                'mlp_plan': mlp_plan,
-                'steps': [
-                    {'id': 1, 'name': 'Market Research & Analysis', 'output': market_research},
-                    {'id': 2, 'name': 'Problem Validation Research', 'output': problem_validation},
-                    {'id': 3, 'name': 'Draft Press Release', 'output': press_release_draft},
-                    {'id': 4, 'name': 'Refined Press Release', 'output': refined_press_release},
-                    {'id': 5, 'name': 'Internal FAQ', 'output': internal_faq},
-                    {'id': 6, 'name': 'Concept Validation Research', 'output': concept_validation},
-                    {'id': 7, 'name': 'Solution Refinement', 'output': solution_refined_pr},
-                    {'id': 8, 'name': 'External FAQ', 'output': external_faq},
-                    {'id': 9, 'name': 'PRFAQ Document', 'output': prfaq_document},
-                    {'id': 10, 'name': 'MLP Plan', 'output': mlp_plan}
-                ]
-            }
-            
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': '🎉 All 10 steps completed successfully',
-                'request_id': request_id
-            })
-            
-            logger.info(f"[{request_id or 'NO_REQ_ID'}] Complete Working Backwards process completed successfully")
-            return results
+        Restored steps are recorded on the context and reported to the client as
+        completed so the UI shows them, but they are not executed or checkpointed again.
+        
+        Args:
+            checkpoints: Dict of step_id to output text, or None
+            context: PipelineContext of the resumed run
             
-        except Exception as e:
-            logger.error(f"[{request_id or 'NO_REQ_ID'}] Error in process_all_steps: {str(e)}")
-            logger.exception("Full error traceback:")
-            safe_callback({
-                'type': 'log',
-                'level': 'error',
-                'message': f'💥 Workflow failed: {str(e)}',
-                'request_id': request_id
+        Returns:
+            Dict of step_id to output for the scheduler's completed_steps
+        """
+        if not checkpoints:
+            return {}
+        
+        request_id = context.request_id
+        completed_steps = {
+            step_id: output for step_id, output in checkpoints.items()
+            if step_id in self.step_scheduler.steps and output
+        }
+        remaining = sorted(set(self.step_scheduler.steps) - set(completed_steps))
+        logger.info(f"[{request_id or 'NO_REQ_ID'}] Resuming with checkpoints for steps {sorted(completed_steps)}; remaining steps {remaining}")
+        
+        for step_id in sorted(completed_steps):
+            context.restore_step_output(step_id, completed_steps[step_id])
+            context.emit({
+                "step": step_id,
+                "status": "completed",
+                "message": f"Step {step_id} restored from checkpoint",
+                "progress": self.claude_processor._calculate_step_progress(step_id, 7),
+                "output": completed_steps[step_id],
+                "request_id": request_id
             })
-            return {"error": f"Processing failed: {str(e)}"}
+        
+        context.emit({
+            'type': 'log',
+            'level': 'info',
+            'message': f'⏩ Restored {len(completed_steps)} completed steps from checkpoints; resuming from step {remaining[0] if remaining else "-"}',
+            'request_id': request_id
+        })
+        return completed_steps
+
+    def _announce_step_start(self, step_id, context):
+        """Log and emit the start of a single step"""
+        request_id = context.request_id
+        step_label = PIPELINE_STEP_LABELS.get(step_id, f'Step {step_id}')
+        logger.info(f"[{request_id or 'NO_REQ_ID'}] --- Processing Step {step_id}: {step_label} ---")
+        context.emit({
+            'type': 'log',
+            'level': 'info',
+            'message': f'📊 Step {step_id}/{len(self.steps)}: {step_label}',
+            'request_id': request_id
+        })
+
+    def _report_pipeline_failure(self, failure, context):
+        """Emit the failure of the first failed step and return the error result"""
+        request_id = context.request_id
+        failed_step = failure['step']
+        logger.error(f"[{request_id or 'NO_REQ_ID'}] Step {failed_step} failed: {failure['error']}")
+        context.emit({
+            'type': 'log',
+            'level': 'error',
+            'message': f'❌ Step {failed_step} failed: {failure["error"]}',
+            'request_id': request_id
+        })
+        return {'error': failure['error'], 'step': failed_step}
+
+    def _report_pipeline_exception(self, e, context):
+        """Emit an unexpected pipeline error and return the error result"""
+        request_id = context.request_id
+        logger.error(f"[{request_id or 'NO_REQ_ID'}] Error in process_all_steps: {str(e)}")
+        logger.exception("Full error traceback:")
+        context.emit({
+            'type': 'log',
+            'level': 'error',
+            'message': f'💥 Workflow failed: {str(e)}',
+            'request_id': request_id
+        })
+        return {"error": f"Processing failed: {str(e)}"}
+
+    def _build_pipeline_results(self, outputs, context):
+        """Assemble the final results from the scheduler outputs and emit completion"""
+        request_id = context.request_id
+        results = {
+            'prfaq': outputs['prfaq'],
+            'mlp_plan': outputs['mlp_plan'],
+            'steps': [
+                {'id': step['id'], 'name': PIPELINE_STEP_LABELS[step['id']], 'output': outputs[step['output_key']]}
+                for step in self.steps
+            ]
+        }
+        
+        context.emit({
+            'type': 'log',
+            'level': 'info',
+            'message': '🎉 All 10 steps completed successfully',
+            'request_id': request_id
+        })
+        
+        logger.info(f"[{request_id or 'NO_REQ_ID'}] Complete Working Backwards process completed successfully")
+        return results
 
     def analyze_product_idea(self, product_idea, request_id=None):
         """Analyze a product idea using the Product Analysis step configuration"""
@@ -914,9 +889,14 @@ This enriched brief combines the original product idea with strategic insights t
             logger.error(f"Failed to create enriched brief: {str(e)}")
             return original_idea  # Fallback to original
 
-    def _wait_for_step_10_insight(self, request_id, timeout_seconds=5):
-        """Wait for step 10 insight to complete with timeout"""
-        import time
+    def _wait_for_step_10_insight(self, request_id, timeout_seconds=5, context=None):
+        """
+        Wait for step 10 insight to complete with timeout.
+
+        Waits on the run's step 10 extraction future when there is one, so the
+        wait ends as soon as extraction finishes (with or without an insight);
+        otherwise waits for the insight cache to signal that it was stored.
+        """
         start_time = time.time()
         
         if not request_id:
@@ -925,101 +905,129 @@ This enriched brief combines the original product idea with strategic insights t
             
         logger.info(f"[{request_id}] Waiting for step 10 insight extraction (timeout: {timeout_seconds}s)...")
         
-        while time.time() - start_time < timeout_seconds:
-            # Check if insight has been stored in cache
-            try:
-                cached_insights = get_insights(request_id)
-                if cached_insights and 10 in cached_insights:
-                    elapsed = time.time() - start_time
-                    logger.info(f"[{request_id}] Step 10 insight found in cache after {elapsed:.1f}s")
-                    return True
-            except Exception as e:
-                logger.error(f"[{request_id}] Error checking for step 10 insight in cache: {e}")
-                break
-                
-            time.sleep(0.5)  # Check every 500ms
-        
+        try:
+            future = context.get_insight_future(10) if context else None
+            if future is not None:
+                wait_for_futures([future], timeout=timeout_seconds)
+                found = future.done() and not future.cancelled() and future.exception() is None and bool(future.result())
+            else:
+                found = 10 in wait_for_insights(request_id, timeout_seconds, step_id=10)
+        except Exception as e:
+            logger.error(f"[{request_id}] Error waiting for step 10 insight: {e}")
+            return False
+
         elapsed = time.time() - start_time
-        logger.warning(f"[{request_id}] Step 10 insight not found after {elapsed:.1f}s timeout - will rely on late retrieval")
+        if found:
+            logger.info(f"[{request_id}] Step 10 insight ready after {elapsed:.1f}s")
+            return True
+        logger.warning(f"[{request_id}] Step 10 insight not available after {elapsed:.1f}s - will rely on late retrieval")
         return False
 
-    def _trigger_insight_extraction(self, step_id, output, progress_callback, request_id=None):
+    def _trigger_insight_extraction(self, step_id, output, context):
         """
-        Trigger insight extraction for any step in a background thread.
+        Queue insight extraction for any step on the shared insight batcher.
         This method is used by both Claude-based steps and Perplexity-based Step 1.
+        Insights that can be read straight from the output's structure (headline,
+        first question, press release thesis) are delivered immediately without a
+        model call; the LLM is only used when that parsing fails.
+        Earlier outputs needed for comparative insights are read from the run's
+        context here, so the worker only sees the finished prompt.
+
+        Returns:
+            Future resolving to the stored insight text (None if none was produced),
+            also tracked on the context under step_id
         """
-        def extract_async():
-            logger.info(f"[INSIGHT THREAD - Step {step_id}] Thread started.")
-            try:
-                insight = None
-                label = None
-                logger.debug(f"[INSIGHT THREAD - Step {step_id}] Initial check: isolated Claude client available: {self.insight_claude_client is not None}")
-                
-                if step_id == 4:  # PR Refinement
-                    draft_pr_data = self.step_outputs.get(3, {})
-                    draft_pr = draft_pr_data.get('output', '') if isinstance(draft_pr_data, dict) else str(draft_pr_data)
-                    logger.debug(f"[INSIGHT THREAD - Step {step_id}] Comparative insight for step 4. Draft PR (len: {len(draft_pr)}): '{draft_pr[:50]}...'")
-                    if draft_pr:
-                        insight = self._extract_comparative_insight(
-                            step_id=4,
-                            before_content=draft_pr,
-                            after_content=output,
-                            prompt_template="Compare these press releases. What's the most important strategic improvement made? Focus on positioning, messaging, or differentiation changes.\\n\\nDraft: {before}\\n\\nRefined: {after}"
-                        )
-                        label = "Refined:"
-                    else:
-                        logger.warning(f"[INSIGHT THREAD - Step {step_id}] Draft PR for step 4 not found, falling back to single content extraction.")
-                        insight = self._extract_key_insight(step_id, output)
-                        label = "Key change:"
-                        
-                elif step_id == 7:  # Solution Refinement
-                    validation_feedback_data = self.step_outputs.get(6, {})
-                    validation_feedback = validation_feedback_data.get('output', '') if isinstance(validation_feedback_data, dict) else str(validation_feedback_data)
-                    logger.debug(f"[INSIGHT THREAD - Step {step_id}] Comparative insight for step 7. Validation feedback (len: {len(validation_feedback)}): '{validation_feedback[:50]}...'")
-                    if validation_feedback:
-                        insight = self._extract_comparative_insight(
-                            step_id=7,
-                            before_content=validation_feedback,
-                            after_content=output,
-                            prompt_template="Given this user feedback, what specific change was made to the solution? Focus on what was added or modified to address user concerns.\\n\\nUser feedback themes: {before}\\n\\nRefined solution: {after}"
-                        )
-                        label = "Added:"
-                    else:
-                        logger.warning(f"[INSIGHT THREAD - Step {step_id}] Validation feedback for step 7 not found, falling back to single content extraction.")
-                        insight = self._extract_key_insight(step_id, output)
-                        label = "Refined:"
-                        
-                else:
-                    logger.debug(f"[INSIGHT THREAD - Step {step_id}] Standard insight: calling _extract_key_insight.")
-                    insight = self._extract_key_insight(step_id, output)
-                    label = self._get_insight_label(step_id)
-                
-                logger.info(f"[INSIGHT THREAD - Step {step_id}] Insight generation attempt completed. Insight: '{str(insight)[:50]}...', Label: {label}")
-                
-                # Always store insight in cache, regardless of progress_callback status
-                if insight and request_id:
-                    logger.info(f"[INSIGHT THREAD - Step {step_id}] Storing insight in cache for potential late retrieval")
-                    store_insight(request_id, step_id, insight, label)
-                
-                if insight and progress_callback:
-                    logger.info(f"[INSIGHT THREAD - Step {step_id}] Insight is valid. Sending to frontend via progress_callback.")
-                    progress_callback({
-                        "step": step_id,
-                        "keyInsight": insight,
-                        "insightLabel": label
-                    })
-                elif not insight:
-                    logger.warning(f"[INSIGHT THREAD - Step {step_id}] Insight was None or empty, not sending to frontend.")
-                elif not progress_callback:
-                    logger.warning(f"[INSIGHT THREAD - Step {step_id}] Progress_callback was None, cannot send insight.")
+        request_id = context.request_id
+        progress_callback = context.emit if context.progress_callback else None
 
-            except Exception as e:
-                logger.error(f"[INSIGHT THREAD - Step {step_id}] Insight extraction thread failed: {e}", exc_info=True)
-                pass  # Silent fail (as per original plan for non-blocking)
-            finally:
-                logger.info(f"[INSIGHT THREAD - Step {step_id}] Thread finished.")
+        def deliver(insight, telemetry=None):
+            logger.info(f"[INSIGHT WORKER - Step {step_id}] Insight generation attempt completed. Insight: '{str(insight)[:50]}...', Label: {label}")
 
-        threading.Thread(target=extract_async, daemon=True).start()
+            # Always store insight in cache, regardless of progress_callback status
+            if insight and request_id:
+                logger.info(f"[INSIGHT WORKER - Step {step_id}] Storing insight in cache for potential late retrieval")
+                store_insight(request_id, step_id, insight, label,
+                              telemetry=telemetry.to_record() if telemetry else None)
+
+            if insight and progress_callback:
+                logger.info(f"[INSIGHT WORKER - Step {step_id}] Insight is valid. Sending to frontend via progress_callback.")
+                progress_callback({
+                    "step": step_id,
+                    "keyInsight": insight,
+                    "insightLabel": label
+                })
+            elif not insight:
+                logger.warning(f"[INSIGHT WORKER - Step {step_id}] Insight was None or empty, not sending to frontend.")
+            elif not progress_callback:
+                logger.warning(f"[INSIGHT WORKER - Step {step_id}] Progress_callback was None, cannot send insight.")
+
+        if LOCAL_INSIGHT_EXTRACTION_ENABLED:
+            local_insight = extract_local_insight(step_id, output)
+            if local_insight:
+                label = self._get_insight_label(step_id)
+                logger.info(f"[{request_id or 'NO_REQ_ID'}] Step {step_id}: Insight extracted locally from output structure")
+                # Parsed without a model call: no attempts, tokens or cost
+                telemetry = CallTelemetry('local')
+                telemetry.cost = 0.0
+                deliver(local_insight, telemetry)
+                future = Future()
+                future.set_result(local_insight)
+                context.track_insight(step_id, future)
+                return future
+            if step_id in LOCAL_INSIGHT_EXTRACTORS:
+                logger.info(f"[{request_id or 'NO_REQ_ID'}] Step {step_id}: Local insight parsing failed, falling back to LLM extraction")
+
+        try:
+            prompt, label = self._plan_insight(step_id, output, context)
+        except Exception as e:
+            logger.error(f"[{request_id or 'NO_REQ_ID'}] Planning insight extraction for step {step_id} failed: {e}", exc_info=True)
+            prompt, label = None, None
+
+        if prompt is None:
+            future = Future()
+            future.set_result(None)
+        else:
+            future = self.insight_batcher.submit(InsightJob(request_id, step_id, prompt, label, deliver=deliver,
+                                                            trace_parent=tracing.current_span()))
+        context.track_insight(step_id, future)
+        return future
+
+    def _plan_insight(self, step_id, output, context):
+        """
+        Choose the insight prompt and label for a completed step.
+
+        Returns:
+            Tuple of (prompt, label); prompt is None when no extraction is possible
+        """
+        if not self.insight_claude_client:
+            logger.warning(f"[{context.request_id or 'NO_REQ_ID'}] Step {step_id}: Isolated Claude client not initialized - skipping insight extraction")
+            return None, None
+
+        if step_id == 4:  # PR Refinement
+            draft_pr = context.get_step_output(3)
+            logger.debug(f"[INSIGHT PLAN - Step {step_id}] Comparative insight for step 4. Draft PR (len: {len(draft_pr)}): '{draft_pr[:50]}...'")
+            if draft_pr:
+                return self._comparative_insight_prompt(
+                    before_content=draft_pr,
+                    after_content=output,
+                    prompt_template="Compare these press releases. What's the most important strategic improvement made? Focus on positioning, messaging, or differentiation changes.\n\nDraft: {before}\n\nRefined: {after}"
+                ), "Refined:"
+            logger.warning(f"[INSIGHT PLAN - Step {step_id}] Draft PR for step 4 not found, falling back to single content extraction.")
+            return self._key_insight_prompt(step_id, output), "Key change:"
+
+        if step_id == 7:  # Solution Refinement
+            validation_feedback = context.get_step_output(6)
+            logger.debug(f"[INSIGHT PLAN - Step {step_id}] Comparative insight for step 7. Validation feedback (len: {len(validation_feedback)}): '{validation_feedback[:50]}...'")
+            if validation_feedback:
+                return self._comparative_insight_prompt(
+                    before_content=validation_feedback,
+                    after_content=output,
+                    prompt_template="Given this user feedback, what specific change was made to the solution? Focus on what was added or modified to address user concerns.\n\nUser feedback themes: {before}\n\nRefined solution: {after}"
+                ), "Added:"
+            logger.warning(f"[INSIGHT PLAN - Step {step_id}] Validation feedback for step 7 not found, falling back to single content extraction.")
+            return self._key_insight_prompt(step_id, output), "Refined:"
+
+        return self._key_insight_prompt(step_id, output), self._get_insight_label(step_id)
 
     def _get_insight_label(self, step_id):
         """Get the appropriate label for each step's insight"""
@@ -1037,14 +1045,8 @@ This enriched brief combines the original product idea with strategic insights t
         }
         return labels.get(step_id)
 
-    def _extract_key_insight(self, step_id, output):
-        logger.info(f"[_extract_key_insight - Step {step_id}] Method called. Output length: {len(output)}. Using isolated Claude client: {self.insight_claude_client is not None}")
-        
-        # Check if isolated Claude client is available
-        if not self.insight_claude_client:
-            logger.warning(f"[_extract_key_insight - Step {step_id}] Isolated Claude client not initialized - skipping insight extraction")
-            return None
-        
+    def _key_insight_prompt(self, step_id, output):
+        """Build the single-content insight prompt for a step"""
         insight_prompts = {
             1: "What is the primary finding from this research? One sentence.",
             2: "What issue appears most frequently? One sentence.",
@@ -1060,181 +1062,178 @@ This enriched brief combines the original product idea with strategic insights t
         
         prompt = insight_prompts.get(step_id, "Summarize the key finding in one concise sentence.")
         
-        # Import time for retry delays
-        import time
-        
-        # Create Claude-format prompt
-        user_prompt = f"""Thoroughly review the following content and extract the most important insight. Respond with exactly one clear, concise sentence. No quotes around the response. Write with maximum economy. Use only essential words. No adjectives, adverbs, or qualifiers unless absolutely necessary for clarity.
+        return f"""Thoroughly review the following content and extract the most important insight. Respond with exactly one clear, concise sentence. No quotes around the response. Write with maximum economy. Use only essential words. No adjectives, adverbs, or qualifiers unless absolutely necessary for clarity.
 
 Task: {prompt}
 
 Content to analyze:
 {output}"""
-        
-        # Retry logic for 529 "Overloaded" errors
-        max_retries = 3
-        retry_delays = [1.0, 2.0, 3.0]  # Increasing delays between retries
-        
-        for attempt in range(max_retries):
-            try:
-                if attempt == 0:
-                    logger.info(f"[_extract_key_insight - Step {step_id}] Attempting isolated Claude API call with model: {self.insight_claude_model}")
-                else:
-                    logger.info(f"[_extract_key_insight - Step {step_id}] Retry attempt {attempt + 1}/{max_retries} after {retry_delays[attempt - 1]}s delay")
-                
-                logger.debug(f"[_extract_key_insight - Step {step_id}] Prompt task: '{prompt[:100]}...'")
-                
-                # Call isolated Claude client
-                response = self.insight_claude_client.messages.create(
-                    model=self.insight_claude_model,
-                    max_tokens=60,
-                    temperature=0,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": user_prompt
-                        }
-                    ]
-                )
-                
-                logger.info(f"[_extract_key_insight - Step {step_id}] Isolated Claude API call completed successfully on attempt {attempt + 1}")
-                
-                # Extract content from response
-                if response.content and len(response.content) > 0:
-                    insight_text = response.content[0].text.strip()
-                    logger.info(f"[_extract_key_insight - Step {step_id}] Insight extracted (first 50 chars): '{insight_text[:50]}...'")
-                    
-                    if insight_text:
-                        # Clean up any quotes that might have been added
-                        clean_insight = insight_text.strip().strip('"').strip("'")
-                        logger.debug(f"[_extract_key_insight - Step {step_id}] Cleaned insight: '{clean_insight[:50]}...'")
-                        return clean_insight
-                    else:
-                        logger.warning(f"[_extract_key_insight - Step {step_id}] Empty insight text received from Claude")
-                        return None
-                else:
-                    logger.warning(f"[_extract_key_insight - Step {step_id}] No content in Claude response")
-                    return None
-                    
-            except Exception as e:
-                # Check if this is a 529 "Overloaded" error that we should retry
-                is_529_error = (
-                    hasattr(e, 'status_code') and e.status_code == 529
-                ) or (
-                    'error code: 529' in str(e).lower() or 
-                    'overloaded' in str(e).lower()
-                )
-                
-                if is_529_error and attempt < max_retries - 1:
-                    delay = retry_delays[attempt]
-                    logger.warning(f"[_extract_key_insight - Step {step_id}] 529 Overloaded error on attempt {attempt + 1}, retrying in {delay}s: {str(e)}")
-                    time.sleep(delay)
-                    continue
-                else:
-                    # Either not a 529 error, or we've exhausted retries
-                    if is_529_error:
-                        logger.error(f"[_extract_key_insight - Step {step_id}] 529 Overloaded error persisted after {max_retries} attempts: {str(e)}")
-                    else:
-                        logger.error(f"[_extract_key_insight - Step {step_id}] Non-retryable error during Claude API call: {str(e)}")
-                    
-                    logger.error(f"[_extract_key_insight - Step {step_id}] Failed during isolated Claude API call or processing after {attempt + 1} attempts", exc_info=True)
-                    return None
-        
-        # Should never reach here, but safety fallback
-        logger.error(f"[_extract_key_insight - Step {step_id}] Unexpected: exhausted retry loop without return")
-        return None
 
-    def _extract_comparative_insight(self, step_id, before_content, after_content, prompt_template):
-        logger.info(f"[_extract_comparative_insight - Step {step_id}] Method called. Before length: {len(before_content)}, After length: {len(after_content)}. Using isolated Claude client: {self.insight_claude_client is not None}")
-        
-        # Check if isolated Claude client is available
-        if not self.insight_claude_client:
-            logger.warning(f"[_extract_comparative_insight - Step {step_id}] Isolated Claude client not initialized - skipping comparative insight extraction")
-            return None
-
-        # Import time for retry delays
-        import time
-        
-        # Format the comparison prompt using the template
+    def _comparative_insight_prompt(self, before_content, after_content, prompt_template):
+        """Build the before/after comparison insight prompt"""
         comparison_prompt = prompt_template.format(
             before=before_content, 
             after=after_content 
         )
         
-        # Create Claude-format prompt for comparison
-        user_prompt = f"""Compare the content and extract a key insight. Respond with exactly one clear, concise sentence. No quotes around the response.
+        return f"""Compare the content and extract a key insight. Respond with exactly one clear, concise sentence. No quotes around the response.
 
 {comparison_prompt}"""
+
+    @staticmethod
+    def _clean_insight(insight_text):
+        """Strip whitespace and any quotes the model wrapped around the insight"""
+        clean_insight = (insight_text or '').strip().strip('"').strip("'").strip()
+        return clean_insight or None
+
+    def _extract_insight_batch(self, jobs):
+        """
+        Extract insights for a batch of InsightJobs.
+
+        A single job is sent with its own prompt as before. Several jobs are merged
+        into one request whose items carry each job's full prompt; the model answers
+        with a JSON object keyed by item number. Items missing from the reply fall
+        back to individual requests. Each job's telemetry gets an even share of
+        the batched request plus any fallback request of its own.
+
+        Returns:
+            List with one insight (or None) per job, in order
+        """
+        if len(jobs) == 1:
+            job = jobs[0]
+            job.telemetry = CallTelemetry(self.insight_claude_model)
+            return [self._clean_insight(self._request_insight(job.step_id, job.prompt, max_tokens=60, telemetry=job.telemetry))]
+
+        items = "\n\n".join(
+            f'<item number="{number}">\n{job.prompt}\n</item>'
+            for number, job in enumerate(jobs, start=1)
+        )
+        user_prompt = f"""The numbered items below are independent insight extraction tasks. Follow each item's own instructions using only the content inside that item; never mix content between items.
+
+{items}
+
+Respond with only a JSON object mapping every item number to that item's one-sentence answer, for example {{"1": "...", "2": "..."}}. No other text."""
+
+        step_ids = [job.step_id for job in jobs]
+        logger.info(f"[INSIGHT BATCH] Extracting {len(jobs)} insights in one request (steps: {step_ids})")
+        batch_telemetry = CallTelemetry(self.insight_claude_model)
+        response_text = self._request_insight(f"batch {step_ids}", user_prompt, max_tokens=80 * len(jobs),
+                                              telemetry=batch_telemetry, metrics_step='batch')
+        answers = self._parse_insight_batch(response_text)
+
+        insights = []
+        for number, (job, share) in enumerate(zip(jobs, batch_telemetry.split(len(jobs))), start=1):
+            job.telemetry = share
+            insight = self._clean_insight(answers.get(str(number)))
+            if insight is None:
+                logger.warning(f"[INSIGHT BATCH] No answer for step {job.step_id} in batched reply, extracting individually")
+                fallback_telemetry = CallTelemetry(self.insight_claude_model)
+                insight = self._clean_insight(self._request_insight(job.step_id, job.prompt, max_tokens=60, telemetry=fallback_telemetry))
+                share.add(fallback_telemetry)
+            insights.append(insight)
+        return insights
+
+    @staticmethod
+    def _parse_insight_batch(response_text):
+        """Parse the JSON object of a batched insight reply; returns {} if unparseable"""
+        if not response_text:
+            return {}
+        start = response_text.find('{')
+        end = response_text.rfind('}')
+        if start == -1 or end <= start:
+            return {}
+        try:
+            answers = json.loads(response_text[start:end + 1])
+        except ValueError:
+            logger.warning(f"[INSIGHT BATCH] Could not parse batched reply: '{response_text[:100]}...'")
+            return {}
+        if not isinstance(answers, dict):
+            return {}
+        return {str(key): value for key, value in answers.items() if isinstance(value, str)}
+
+    def _request_insight(self, step_id, user_prompt, max_tokens=60, telemetry=None, metrics_step=None):
+        """
+        Send one insight request on the isolated Claude client.
+
+        Args:
+            step_id: Step ID (or batch description) used in log messages
+            user_prompt: Complete user prompt
+            max_tokens: Response token limit
+            telemetry: Optional CallTelemetry that records the attempts and usage
+            metrics_step: Step label of the call's latency metrics (defaults to step_id)
+
+        Returns:
+            The stripped response text, or None on failure or empty response
+        """
+        if not self.insight_claude_client:
+            logger.warning(f"[_request_insight - Step {step_id}] Isolated Claude client not initialized - skipping insight extraction")
+            return None
+        if metrics_step is None:
+            metrics_step = step_id
+
+        # Own breaker: failing best-effort insight calls must not fail fast the user-facing step calls
+        retry = get_retry_policy('insight').begin(get_circuit_breaker('anthropic:insight'))
+        limiter = get_rate_limiter('anthropic', self.insight_claude_model)
+        estimated_tokens = estimate_tokens(len(user_prompt), max_tokens)
         
-        # Retry logic for 529 "Overloaded" errors
-        max_retries = 3
-        retry_delays = [1.0, 2.0, 3.0]  # Increasing delays between retries
-        
-        for attempt in range(max_retries):
+        while True:
+            ticket = None
             try:
-                if attempt == 0:
-                    logger.info(f"[_extract_comparative_insight - Step {step_id}] Attempting isolated Claude API call with model: {self.insight_claude_model}")
+                retry.start_attempt()
+                if telemetry:
+                    telemetry.attempts = retry.attempt
+                ticket = limiter.acquire(PRIORITY_INSIGHT, estimated_tokens)
+                if retry.attempt == 1:
+                    logger.info(f"[_request_insight - Step {step_id}] Attempting isolated Claude API call with model: {self.insight_claude_model}")
                 else:
-                    logger.info(f"[_extract_comparative_insight - Step {step_id}] Retry attempt {attempt + 1}/{max_retries} after {retry_delays[attempt - 1]}s delay")
-                
-                logger.debug(f"[_extract_comparative_insight - Step {step_id}] Using prompt template for comparison analysis")
+                    logger.info(f"[_request_insight - Step {step_id}] Retry attempt {retry.attempt}/{retry.max_attempts}")
                 
                 # Call isolated Claude client
                 response = self.insight_claude_client.messages.create(
                     model=self.insight_claude_model,
-                    max_tokens=60,
+                    max_tokens=max_tokens,
                     temperature=0,
                     messages=[
                         {
                             "role": "user",
                             "content": user_prompt
                         }
-                    ]
+                    ],
+                    timeout=retry.attempt_timeout()
                 )
-
-                logger.info(f"[_extract_comparative_insight - Step {step_id}] Isolated Claude API call completed successfully on attempt {attempt + 1}")
-
+                ticket.release(tokens_used=usage_tokens(response))
+                retry.succeeded()
+                if telemetry:
+                    telemetry.record_response(response)
+                    observe_llm_call('anthropic', 'insight', metrics_step, telemetry)
+                
+                logger.info(f"[_request_insight - Step {step_id}] Isolated Claude API call completed successfully on attempt {retry.attempt}")
+                
                 # Extract content from response
                 if response.content and len(response.content) > 0:
                     insight_text = response.content[0].text.strip()
-                    logger.info(f"[_extract_comparative_insight - Step {step_id}] Comparative insight extracted (first 50 chars): '{insight_text[:50]}...'")
-                    
-                    if insight_text:
-                        # Clean up any quotes that might have been added
-                        clean_insight = insight_text.strip().strip('"').strip("'")
-                        logger.debug(f"[_extract_comparative_insight - Step {step_id}] Cleaned comparative insight: '{clean_insight[:50]}...'")
-                        return clean_insight
-                    else:
-                        logger.warning(f"[_extract_comparative_insight - Step {step_id}] Empty insight text received from Claude")
-                        return None
+                    logger.info(f"[_request_insight - Step {step_id}] Insight extracted (first 50 chars): '{insight_text[:50]}...'")
+                    if not insight_text:
+                        logger.warning(f"[_request_insight - Step {step_id}] Empty insight text received from Claude")
+                    return insight_text or None
                 else:
-                    logger.warning(f"[_extract_comparative_insight - Step {step_id}] No content in Claude response")
+                    logger.warning(f"[_request_insight - Step {step_id}] No content in Claude response")
                     return None
                     
             except Exception as e:
-                # Check if this is a 529 "Overloaded" error that we should retry
-                is_529_error = (
-                    hasattr(e, 'status_code') and e.status_code == 529
-                ) or (
-                    'error code: 529' in str(e).lower() or 
-                    'overloaded' in str(e).lower()
-                )
+                delay = retry.failed(e)
+                error_class = retry.last_error_class
+                if ticket:
+                    ticket.release(overloaded=error_class.overload)
                 
-                if is_529_error and attempt < max_retries - 1:
-                    delay = retry_delays[attempt]
-                    logger.warning(f"[_extract_comparative_insight - Step {step_id}] 529 Overloaded error on attempt {attempt + 1}, retrying in {delay}s: {str(e)}")
+                if delay is not None:
+                    logger.warning(f"[_request_insight - Step {step_id}] {error_class.name} error on attempt {retry.attempt}, retrying in {delay:.1f}s: {str(e)}")
                     time.sleep(delay)
                     continue
+                
+                if error_class.retryable:
+                    logger.error(f"[_request_insight - Step {step_id}] {error_class.name} error persisted after {retry.attempt} attempts: {str(e)}")
                 else:
-                    # Either not a 529 error, or we've exhausted retries
-                    if is_529_error:
-                        logger.error(f"[_extract_comparative_insight - Step {step_id}] 529 Overloaded error persisted after {max_retries} attempts: {str(e)}")
-                    else:
-                        logger.error(f"[_extract_comparative_insight - Step {step_id}] Non-retryable error during Claude API call: {str(e)}")
-                    
-                    logger.error(f"[_extract_comparative_insight - Step {step_id}] Failed during isolated Claude API call or processing after {attempt + 1} attempts", exc_info=True)
-                    return None
-        
-        # Should never reach here, but safety fallback
-        logger.error(f"[_extract_comparative_insight - Step {step_id}] Unexpected: exhausted retry loop without return")
-        return None
+                    logger.error(f"[_request_insight - Step {step_id}] Non-retryable {error_class.name} error during Claude API call: {str(e)}")
+                logger.error(f"[_request_insight - Step {step_id}] Failed during isolated Claude API call or processing after {retry.attempt} attempts", exc_info=True)
+                return None
@@ -1,10 +1,18 @@
+import asyncio
 import logging
-from openai import OpenAI
 import time
-from config import PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, PERPLEXITY_MODEL
+from config import PERPLEXITY_API_KEY, PERPLEXITY_MODEL
 
 # Import store_raw_llm_output from the new utility location
 from utils.raw_output_cache import store_raw_llm_output
+from utils.llm_result_cache import get_llm_cache
+from utils.rate_limiter import get_rate_limiter, estimate_tokens, usage_tokens, PRIORITY_STEP
+from utils.retry_policy import get_retry_policy, get_circuit_breaker
+from utils.llm_telemetry import CallTelemetry
+from utils.metrics import observe_llm_call
+from utils import tracing
+from utils.llm_backends import get_llm_backend
+from utils.background import get_background_service
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +32,19 @@ def format_response_summary(text: str, max_length: int = 150) -> str:
 
 class PerplexityProcessor:
     def __init__(self):
-        # The OpenAI client automatically adds the Bearer prefix to the API key
-        self.client = OpenAI(
-            api_key=PERPLEXITY_API_KEY,
-            base_url=PERPLEXITY_BASE_URL
-        )
+        # Clients come from the configured LLM backend (live API or local fake);
+        # SDK retries are disabled: the 'perplexity' retry policy owns every retry decision
+        backend = get_llm_backend()
+        self.client = backend.perplexity_client()
+        # Async client used by the asyncio pipeline engine (see aconduct_initial_market_research)
+        self.async_client = backend.async_perplexity_client()
+        self.requires_api_key = backend.requires_api_keys
         self.model = PERPLEXITY_MODEL
         logger.info(f"PerplexityProcessor initialized with model: {self.model}")
         
-        if not PERPLEXITY_API_KEY:
+        if not self.requires_api_key:
+            logger.info(f"PerplexityProcessor using the '{backend.name}' LLM backend; PERPLEXITY_API_KEY is not needed")
+        elif not PERPLEXITY_API_KEY:
             logger.error("PERPLEXITY_API_KEY is not set. Research functionality will not work.")
         else:
             logger.info("PERPLEXITY_API_KEY is properly configured")
@@ -70,7 +82,248 @@ class PerplexityProcessor:
         # Cap at 97% to ensure we never exceed 99% with safety margins
         return min(base_progress + step_increment, 97)
     
-    def conduct_initial_market_research(self, product_idea, system_prompt, user_prompt, progress_callback=None, request_id=None, step_info=None):
+    def _make_safe_callback(self, progress_callback, log_prefix):
+        """Protected progress callback wrapper"""
+        def safe_callback(update):
+            if progress_callback:
+                try:
+                    progress_callback(update)
+                except Exception as e:
+                    logger.error(f"{log_prefix} Progress callback failed: {e}")
+                    # Don't re-raise to avoid killing the calling thread
+        return safe_callback
+    
+    def _report_not_configured(self, safe_callback, request_id, log_prefix):
+        error_msg = "Perplexity API client not initialized. Please set PERPLEXITY_API_KEY in Replit Secrets."
+        logger.error(f"{log_prefix} {error_msg}")
+        safe_callback({
+            "step": 1, # Assuming step 1 for market research
+            "status": "error",
+            "message": "Market research failed: API key not configured",
+            "error": error_msg
+        })
+        safe_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'❌ Step 1 failed: Perplexity API not configured',
+            'request_id': request_id
+        })
+        return {"error": error_msg}
+    
+    def _log_request_start(self, safe_callback, request_id, log_prefix):
+        safe_callback({
+            "step": 1, # Assuming step 1
+            "status": "processing",
+            "message": "Market analyst pulling competitive intelligence...",
+            "progress": self._calculate_step_progress(1)
+        })
+        
+        logger.info(f"{log_prefix} Calling Perplexity Sonar API for initial research...")
+        logger.debug(f"{log_prefix} Using model: {self.model}")
+        
+        # Send API call start log
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'🔄 Step 1 calling Perplexity API (model: {self.model})',
+            'request_id': request_id
+        })
+    
+    def _build_request_params(self, system_prompt, formatted_prompt):
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": formatted_prompt}
+            ],
+            max_tokens=8192,
+            temperature=0.3,
+            top_p=0.9
+        )
+    
+    def _limiter(self):
+        return get_rate_limiter('perplexity', self.model)
+    
+    def _log_retry(self, e, delay, retry, safe_callback, request_id, log_prefix):
+        error_class = retry.last_error_class.name
+        logger.warning(f"{log_prefix} Perplexity attempt {retry.attempt}/{retry.max_attempts} failed ({error_class}), retrying in {delay:.1f}s: {str(e)}")
+        safe_callback({
+            'type': 'log',
+            'level': 'warn',
+            'message': f'⚠️ Step 1 retrying in {delay:.1f}s (attempt {retry.attempt}/{retry.max_attempts}): {type(e).__name__}',
+            'request_id': request_id
+        })
+    
+    @staticmethod
+    def _estimate_tokens(request_params):
+        prompt_chars = sum(len(message['content']) for message in request_params['messages'])
+        return estimate_tokens(prompt_chars, request_params['max_tokens'])
+    
+    def _finalize_response(self, response, api_duration, telemetry, safe_callback, request_id, step_info, log_prefix):
+        """Validate the API response, append citations, store the raw output and report completion"""
+        if not response or not response.choices or not response.choices[0].message.content:
+            logger.error(f"{log_prefix} Invalid response from Perplexity API")
+            safe_callback({
+                'type': 'log',
+                'level': 'error',
+                'message': f'❌ Step 1 received invalid Perplexity API response',
+                'request_id': request_id
+            })
+            return {"error": "Invalid response from Perplexity API"}
+        
+        research_output = response.choices[0].message.content
+        
+        # Extract citations from Perplexity API response and append to output
+        try:
+            if hasattr(response, 'citations') and response.citations:
+                research_output += "\n\n## Source List\n\n"
+                for i, url in enumerate(response.citations, 1):
+                    # Extract meaningful title from URL path
+                    from urllib.parse import urlparse
+                    parsed = urlparse(url)
+                    path_parts = [part for part in parsed.path.strip('/').split('/') if part]
+                    
+                    if path_parts:
+                        # Take the last meaningful part (usually the article slug)
+                        title_slug = path_parts[-1]
+                        # Convert slug to readable title
+                        title = title_slug.replace('-', ' ').replace('_', ' ')
+                        title = ' '.join(word.capitalize() for word in title.split())
+                        
+                        # Remove common file extensions
+                        title = title.replace('.Html', '').replace('.Php', '').replace('.Aspx', '')
+                    else:
+                        # Fallback to domain name if no path
+                        domain = parsed.netloc.replace('www.', '').replace('.com', '').replace('.edu', '').replace('.org', '')
+                        title = ' '.join(word.capitalize() for word in domain.split('.'))
+                    
+                    # Format as numbered list with clickable markdown links
+                    research_output += f"{i}. [{title}]({url})\n"
+                
+                logger.info(f"{log_prefix} Successfully appended {len(response.citations)} citations to research output")
+            else:
+                logger.warning(f"{log_prefix} No citations found in Perplexity response")
+        except Exception as e:
+            logger.warning(f"{log_prefix} Error processing citations: {str(e)}")
+            # Continue without citations if there's an error
+        
+        logger.info(f"{log_prefix} Perplexity response: {format_response_summary(research_output)}")
+
+        # Send API completion log with timing
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'✅ Step 1 Perplexity API completed in {api_duration:.1f}s ({len(research_output)} chars)',
+            'request_id': request_id
+        })
+
+        usage = telemetry.finish().usage
+        tracing.set_attributes(**telemetry.to_record())
+        observe_llm_call('perplexity', 'step', 1, telemetry)
+        logger.info(f"{log_prefix} Step 1 tokens: input {usage['input_tokens']}, output {usage['output_tokens']}, "
+                    f"attempts {telemetry.attempts}, est. cost ${telemetry.cost or 0:.4f}")
+        return self._report_research_output(research_output, telemetry, safe_callback, request_id, step_info, log_prefix)
+    
+    def _report_research_output(self, research_output, telemetry, safe_callback, request_id, step_info, log_prefix):
+        """Store the raw research output with the call's telemetry, run quality checks and report completion"""
+        # Store raw output if request_id is provided
+        if request_id and step_info:
+            try:
+                store_raw_llm_output(request_id, step_info, research_output, telemetry=telemetry.to_record())
+            except Exception as e_store:
+                logger.error(f"{log_prefix} Failed to store raw LLM output for {step_info}: {e_store}")
+        
+        # Quality validation
+        if len(research_output.strip()) < 500:
+            logger.warning(f"{log_prefix} Perplexity response seems unusually short: {len(research_output)} chars")
+            safe_callback({
+                'type': 'log',
+                'level': 'warn',
+                'message': f'⚠️ Step 1 research response unusually short ({len(research_output)} chars)',
+                'request_id': request_id
+            })
+        elif not any(keyword in research_output.lower() for keyword in ['market', 'competitive', 'customer', 'industry']):
+            logger.warning(f"{log_prefix} Perplexity response may not contain expected research sections")
+            safe_callback({
+                'type': 'log',
+                'level': 'warn',
+                'message': f'⚠️ Step 1 research may be missing key sections (market/competitive/customer)',
+                'request_id': request_id
+            })
+        else:
+            logger.info(f"{log_prefix} Perplexity response appears to contain expected research sections")
+        
+        safe_callback({
+            "step": 1, # Assuming step 1
+            "status": "completed",
+            "message": "Market research and competitive analysis complete",
+            "progress": self._calculate_step_progress(1, 7),
+            "output": research_output
+        })
+        
+        logger.info(f"{log_prefix} Initial market research completed successfully")
+        
+        return {
+            "output": research_output,
+            "step": "Market Research & Analysis",
+            "persona": "Expert Market Research Analyst",
+            "description": "Comprehensive market research and competitive analysis using real-time web data."
+        }
+    
+    def _serve_cached_response(self, cache_key, use_cache, safe_callback, request_id, step_info, log_prefix):
+        """
+        Return cached research for identical request parameters, reporting it like a fresh completion.
+        
+        Returns:
+            The cached result dict, or None on a miss or when the cache is bypassed
+        """
+        cache = get_llm_cache()
+        if not use_cache:
+            cache.record_bypass()
+            logger.info(f"{log_prefix} Bypassing LLM result cache for market research")
+            return None
+        
+        cached = cache.get(cache_key)
+        if not cached or not cached.get('output'):
+            return None
+        
+        research_output = cached['output']
+        tracing.set_attributes(cache_hit=True)
+        logger.info(f"{log_prefix} Market research served from LLM result cache ({len(research_output)} chars)")
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'⚡ Step 1 served from cache ({len(research_output)} chars)',
+            'request_id': request_id
+        })
+        # Served without an API request: no attempts, tokens or cost
+        telemetry = CallTelemetry(self.model)
+        telemetry.cost = 0.0
+        return self._report_research_output(research_output, telemetry, safe_callback, request_id, step_info, log_prefix)
+    
+    def _report_failure(self, e, api_duration, safe_callback, request_id, log_prefix):
+        logger.error(f"{log_prefix} API call failed | Model: {self.model}, Error: {type(e).__name__}: {str(e)}")
+        logger.exception("Full error traceback:")
+        tracing.current_span().fail(f"Market research failed: {str(e)}")
+        
+        safe_callback({
+            "step": 1, # Assuming step 1
+            "status": "error",
+            "message": f"Market research failed: {str(e)}",
+            "error": str(e)
+        })
+        
+        safe_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'💥 Step 1 Perplexity API failed after {api_duration:.1f}s: {type(e).__name__}: {str(e)}',
+            'request_id': request_id
+        })
+        
+        return {"error": f"Market research failed: {str(e)}"}
+    
+    @tracing.traced('llm.perplexity')
+    def conduct_initial_market_research(self, product_idea, system_prompt, user_prompt, progress_callback=None, request_id=None, step_info=None, use_cache=True, priority=PRIORITY_STEP):
         """
         Conduct initial market research using Perplexity's Sonar API on raw product idea
         
@@ -81,21 +334,20 @@ class PerplexityProcessor:
             progress_callback: Optional callback for progress updates
             request_id: Optional request ID for caching raw output
             step_info: Optional string describing the step for caching (e.g., "step_1_MarketResearch")
+            use_cache: Serve an identical earlier request from the LLM result cache;
+                pass False to force a fresh call (its result still refreshes the cache)
+            priority: Rate limiter admission class (utils.rate_limiter PRIORITY_*)
+            
+        Failed attempts are retried under the 'perplexity' policy in utils.retry_policy.
             
         Returns:
             Dict containing research results or error information
         """
         log_prefix = f"[{request_id or 'NO_REQ_ID'}]" if request_id else "[PerplexityResearch]"
+        tracing.set_attributes(step=1, model=self.model, priority=priority)
         logger.info(f"{log_prefix} Starting initial Perplexity market research")
         
-        # Protected progress callback wrapper
-        def safe_callback(update):
-            if progress_callback:
-                try:
-                    progress_callback(update)
-                except Exception as e:
-                    logger.error(f"{log_prefix} Progress callback failed: {e}")
-                    # Don't re-raise to avoid killing the calling thread
+        safe_callback = self._make_safe_callback(progress_callback, log_prefix)
         
         # Send step start log
         safe_callback({
@@ -105,177 +357,130 @@ class PerplexityProcessor:
             'request_id': request_id
         })
         
+        # Format the user prompt with the product idea
+        request_params = self._build_request_params(system_prompt, user_prompt.format(input=product_idea))
+        cache_key = get_llm_cache().make_key('perplexity', request_params)
+        cached = self._serve_cached_response(cache_key, use_cache, safe_callback, request_id, step_info, log_prefix)
+        if cached:
+            return cached
+        
         # Check if client was properly initialized
         if not self.client:
-            error_msg = "Perplexity API client not initialized. Please set PERPLEXITY_API_KEY in Replit Secrets."
-            logger.error(f"{log_prefix} {error_msg}")
-            safe_callback({
-                "step": 1, # Assuming step 1 for market research
-                "status": "error",
-                "message": "Market research failed: API key not configured",
-                "error": error_msg
-            })
-            safe_callback({
-                'type': 'log',
-                'level': 'error',
-                'message': f'❌ Step 1 failed: Perplexity API not configured',
-                'request_id': request_id
-            })
-            return {"error": error_msg}
+            return self._report_not_configured(safe_callback, request_id, log_prefix)
         
+        api_start_time = time.time()
         try:
-            # Format the user prompt with the product idea
-            formatted_prompt = user_prompt.format(input=product_idea)
-            
-            safe_callback({
-                "step": 1, # Assuming step 1
-                "status": "processing",
-                "message": "Market analyst pulling competitive intelligence...",
-                "progress": self._calculate_step_progress(1)
-            })
-            
-            logger.info(f"{log_prefix} Calling Perplexity Sonar API for initial research...")
-            logger.debug(f"{log_prefix} Using model: {self.model}")
-            
-            # Send API call start log with timing
+            self._log_request_start(safe_callback, request_id, log_prefix)
             api_start_time = time.time()
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': f'🔄 Step 1 calling Perplexity API (model: {self.model})',
-                'request_id': request_id
-            })
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": formatted_prompt}
-                ],
-                max_tokens=8192,
-                temperature=0.3,
-                top_p=0.9
-            )
-            
-            api_duration = time.time() - api_start_time
+            telemetry = CallTelemetry(self.model)
             
-            if not response or not response.choices or not response.choices[0].message.content:
-                logger.error(f"{log_prefix} Invalid response from Perplexity API")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'error',
-                    'message': f'❌ Step 1 received invalid Perplexity API response',
-                    'request_id': request_id
-                })
-                return {"error": "Invalid response from Perplexity API"}
-            
-            research_output = response.choices[0].message.content
-            
-            # Extract citations from Perplexity API response and append to output
-            try:
-                if hasattr(response, 'citations') and response.citations:
-                    research_output += "\n\n## Source List\n\n"
-                    for i, url in enumerate(response.citations, 1):
-                        # Extract meaningful title from URL path
-                        from urllib.parse import urlparse
-                        parsed = urlparse(url)
-                        path_parts = [part for part in parsed.path.strip('/').split('/') if part]
-                        
-                        if path_parts:
-                            # Take the last meaningful part (usually the article slug)
-                            title_slug = path_parts[-1]
-                            # Convert slug to readable title
-                            title = title_slug.replace('-', ' ').replace('_', ' ')
-                            title = ' '.join(word.capitalize() for word in title.split())
-                            
-                            # Remove common file extensions
-                            title = title.replace('.Html', '').replace('.Php', '').replace('.Aspx', '')
-                        else:
-                            # Fallback to domain name if no path
-                            domain = parsed.netloc.replace('www.', '').replace('.com', '').replace('.edu', '').replace('.org', '')
-                            title = ' '.join(word.capitalize() for word in domain.split('.'))
-                        
-                        # Format as numbered list with clickable markdown links
-                        research_output += f"{i}. [{title}]({url})\n"
-                    
-                    logger.info(f"{log_prefix} Successfully appended {len(response.citations)} citations to research output")
-                else:
-                    logger.warning(f"{log_prefix} No citations found in Perplexity response")
-            except Exception as e:
-                logger.warning(f"{log_prefix} Error processing citations: {str(e)}")
-                # Continue without citations if there's an error
-            
-            logger.info(f"{log_prefix} Perplexity response: {format_response_summary(research_output)}")
-
-            # Send API completion log with timing
-            safe_callback({
-                'type': 'log',
-                'level': 'info',
-                'message': f'✅ Step 1 Perplexity API completed in {api_duration:.1f}s ({len(research_output)} chars)',
-                'request_id': request_id
-            })
-
-            # Store raw output if request_id is provided
-            if request_id and step_info:
+            retry = get_retry_policy('perplexity').begin(get_circuit_breaker('perplexity'))
+            limiter = self._limiter()
+            estimated_tokens = self._estimate_tokens(request_params)
+            while True:
+                ticket = None
                 try:
-                    store_raw_llm_output(request_id, step_info, research_output)
-                except Exception as e_store:
-                    logger.error(f"{log_prefix} Failed to store raw LLM output for {step_info}: {e_store}")
-            
-            # Quality validation
-            if len(research_output.strip()) < 500:
-                logger.warning(f"{log_prefix} Perplexity response seems unusually short: {len(research_output)} chars")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'warn',
-                    'message': f'⚠️ Step 1 research response unusually short ({len(research_output)} chars)',
-                    'request_id': request_id
-                })
-            elif not any(keyword in research_output.lower() for keyword in ['market', 'competitive', 'customer', 'industry']):
-                logger.warning(f"{log_prefix} Perplexity response may not contain expected research sections")
-                safe_callback({
-                    'type': 'log',
-                    'level': 'warn',
-                    'message': f'⚠️ Step 1 research may be missing key sections (market/competitive/customer)',
-                    'request_id': request_id
-                })
-            else:
-                logger.info(f"{log_prefix} Perplexity response appears to contain expected research sections")
-            
-            safe_callback({
-                "step": 1, # Assuming step 1
-                "status": "completed",
-                "message": "Market research and competitive analysis complete",
-                "progress": self._calculate_step_progress(1, 7),
-                "output": research_output
-            })
-            
-            logger.info(f"{log_prefix} Initial market research completed successfully")
+                    retry.start_attempt()
+                    ticket = limiter.acquire(priority, estimated_tokens)
+                    api_start_time = time.time()
+                    response = self.client.chat.completions.create(**request_params, timeout=retry.attempt_timeout())
+                    ticket.release(tokens_used=usage_tokens(response))
+                    retry.succeeded()
+                    telemetry.record_response(response)
+                    break
+                except Exception as e:
+                    delay = retry.failed(e)
+                    if ticket:
+                        ticket.release(overloaded=retry.last_error_class.overload)
+                    if delay is None:
+                        raise
+                    self._log_retry(e, delay, retry, safe_callback, request_id, log_prefix)
+                    time.sleep(delay)
             
-            return {
-                "output": research_output,
-                "step": "Market Research & Analysis",
-                "persona": "Expert Market Research Analyst",
-                "description": "Comprehensive market research and competitive analysis using real-time web data."
-            }
+            telemetry.attempts = retry.attempt
+            result = self._finalize_response(response, time.time() - api_start_time, telemetry, safe_callback, request_id, step_info, log_prefix)
+            if 'output' in result:
+                get_llm_cache().put(cache_key, result, provider='perplexity', step_id=1)
+            return result
             
         except Exception as e:
-            api_duration = time.time() - api_start_time if 'api_start_time' in locals() else 0
-            logger.error(f"{log_prefix} API call failed | Model: {self.model}, Error: {type(e).__name__}: {str(e)}")
-            logger.exception("Full error traceback:")
+            return self._report_failure(e, time.time() - api_start_time, safe_callback, request_id, log_prefix)
+    
+    @tracing.traced('llm.perplexity')
+    async def aconduct_initial_market_research(self, product_idea, system_prompt, user_prompt, progress_callback=None, request_id=None, step_info=None, use_cache=True, priority=PRIORITY_STEP):
+        """
+        Async counterpart of conduct_initial_market_research for the asyncio
+        pipeline engine. Uses the AsyncOpenAI client; arguments, progress
+        events and the returned dict are identical.
+        """
+        log_prefix = f"[{request_id or 'NO_REQ_ID'}]" if request_id else "[PerplexityResearch]"
+        tracing.set_attributes(step=1, model=self.model, priority=priority)
+        logger.info(f"{log_prefix} Starting async Perplexity market research")
+        
+        safe_callback = self._make_safe_callback(progress_callback, log_prefix)
+        
+        safe_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': f'🎯 Step 1 starting Perplexity market research',
+            'request_id': request_id
+        })
+        
+        # Format the user prompt with the product idea
+        request_params = self._build_request_params(system_prompt, user_prompt.format(input=product_idea))
+        cache_key = get_llm_cache().make_key('perplexity', request_params)
+        # SQLite lookups and the raw output store block, so they run on the shared 'io' executor
+        io_executor = get_background_service().executor('io')
+        cached = await io_executor.arun(self._serve_cached_response, cache_key, use_cache, safe_callback, request_id, step_info, log_prefix)
+        if cached:
+            return cached
+        
+        if not self.async_client:
+            return self._report_not_configured(safe_callback, request_id, log_prefix)
+        
+        api_start_time = time.time()
+        try:
+            self._log_request_start(safe_callback, request_id, log_prefix)
+            api_start_time = time.time()
+            telemetry = CallTelemetry(self.model)
             
-            safe_callback({
-                "step": 1, # Assuming step 1
-                "status": "error",
-                "message": f"Market research failed: {str(e)}",
-                "error": str(e)
-            })
+            retry = get_retry_policy('perplexity').begin(get_circuit_breaker('perplexity'))
+            limiter = self._limiter()
+            estimated_tokens = self._estimate_tokens(request_params)
+            while True:
+                ticket = None
+                try:
+                    retry.start_attempt()
+                    ticket = await limiter.aacquire(priority, estimated_tokens)
+                    api_start_time = time.time()
+                    attempt_timeout = retry.attempt_timeout()
+                    response = await asyncio.wait_for(
+                        self.async_client.chat.completions.create(**request_params, timeout=attempt_timeout),
+                        attempt_timeout
+                    )
+                    ticket.release(tokens_used=usage_tokens(response))
+                    retry.succeeded()
+                    telemetry.record_response(response)
+                    break
+                except asyncio.CancelledError:
+                    if ticket:
+                        ticket.release()
+                    raise
+                except Exception as e:
+                    delay = retry.failed(e)
+                    if ticket:
+                        ticket.release(overloaded=retry.last_error_class.overload)
+                    if delay is None:
+                        raise
+                    self._log_retry(e, delay, retry, safe_callback, request_id, log_prefix)
+                    await asyncio.sleep(delay)
             
-            safe_callback({
-                'type': 'log',
-                'level': 'error',
-                'message': f'💥 Step 1 Perplexity API failed after {api_duration:.1f}s: {type(e).__name__}: {str(e)}',
-                'request_id': request_id
-            })
+            telemetry.attempts = retry.attempt
+            # Storing the raw output compresses it and queues a DB write, so it stays off the loop too
+            result = await io_executor.arun(self._finalize_response, response, time.time() - api_start_time, telemetry, safe_callback, request_id, step_info, log_prefix)
+            if 'output' in result:
+                await io_executor.arun(get_llm_cache().put, cache_key, result, 'perplexity', 1)
+            return result
             
-            return {"error": f"Market research failed: {str(e)}"} 
\ No newline at end of file
+        except Exception as e:
+            return self._report_failure(e, time.time() - api_start_time, safe_callback, request_id, log_prefix)
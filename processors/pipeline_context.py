@@ -0,0 +1,134 @@
+import logging
+import threading
+from utils.rate_limiter import PRIORITY_STEP
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineContext:
+    """
+    Per-run state for one Working Backwards pipeline execution.
+
+    LLMProcessor keeps no per-request state of its own; everything a run needs
+    (request_id, progress callback, step_data inputs and completed step outputs)
+    travels through this object so one processor can serve many concurrent
+    pipelines. Step-scoped views created with for_step() share the run's step
+    outputs but carry their own step_data.
+
+    The asyncio engine sets defer_llm_calls so step handlers return a
+    DeferredLLMCall instead of blocking on the provider, and supplies a
+    bounded background_executor for blocking completion bookkeeping.
+
+    When a checkpoint_callback is given, every recorded step output is also
+    handed to it (e.g. to persist a resumable checkpoint). use_cache=False
+    makes every LLM call of the run bypass the LLM result cache. priority is
+    the rate limiter admission class used for the run's step LLM calls.
+
+    Insight extraction futures are tracked per step so the run can wait on
+    exactly the insight it needs instead of polling the insight cache.
+    """
+
+    def __init__(self, request_id=None, progress_callback=None, step_data=None, defer_llm_calls=False,
+                 background_executor=None, checkpoint_callback=None, use_cache=True, priority=PRIORITY_STEP, _step_outputs=None, _insight_futures=None, _lock=None):
+        self.request_id = request_id
+        self.progress_callback = progress_callback
+        self.step_data = dict(step_data or {})
+        self.defer_llm_calls = defer_llm_calls
+        self.background_executor = background_executor
+        self.checkpoint_callback = checkpoint_callback
+        self.use_cache = use_cache
+        self.priority = priority
+        self._step_outputs = _step_outputs if _step_outputs is not None else {}
+        self._insight_futures = _insight_futures if _insight_futures is not None else {}
+        self._lock = _lock or threading.Lock()
+
+    @property
+    def log_prefix(self):
+        return f"[{self.request_id or 'NO_REQ_ID'}]"
+
+    def for_step(self, step_data=None):
+        """Create a view for a single step that shares this run's step outputs"""
+        return PipelineContext(
+            request_id=self.request_id,
+            progress_callback=self.progress_callback,
+            step_data=step_data if step_data is not None else self.step_data,
+            defer_llm_calls=self.defer_llm_calls,
+            background_executor=self.background_executor,
+            checkpoint_callback=self.checkpoint_callback,
+            use_cache=self.use_cache,
+            priority=self.priority,
+            _step_outputs=self._step_outputs,
+            _insight_futures=self._insight_futures,
+            _lock=self._lock
+        )
+
+    def emit(self, update):
+        """Send a progress update without ever raising into the calling thread"""
+        if not self.progress_callback:
+            return
+        try:
+            self.progress_callback(update)
+        except Exception as e:
+            logger.error(f"{self.log_prefix} Progress callback failed: {e}")
+            # Don't re-raise to avoid killing the processing thread
+
+    def record_step_output(self, step_id, input_text, output):
+        """Store complete step data for recovery (both input and output)"""
+        with self._lock:
+            self._step_outputs[step_id] = {
+                'input': input_text[:1000] if input_text else None,  # Store first 1000 chars of input
+                'output': output,
+                'status': 'completed'
+            }
+        
+        if self.checkpoint_callback:
+            try:
+                self.checkpoint_callback(step_id, input_text, output)
+            except Exception as e:
+                logger.error(f"{self.log_prefix} Checkpoint callback failed for step {step_id}: {e}")
+
+    def restore_step_output(self, step_id, output):
+        """Seed a step output from a checkpoint without checkpointing it again"""
+        with self._lock:
+            self._step_outputs[step_id] = {
+                'input': None,
+                'output': output,
+                'status': 'completed'
+            }
+
+    def get_step_output(self, step_id):
+        """Return the output text of a completed step, or an empty string"""
+        with self._lock:
+            step_output = self._step_outputs.get(step_id, {})
+        return step_output.get('output', '') if isinstance(step_output, dict) else str(step_output)
+
+    def track_insight(self, step_id, future):
+        """Remember the future resolving to a step's extracted insight (or None)"""
+        with self._lock:
+            self._insight_futures[step_id] = future
+
+    def get_insight_future(self, step_id):
+        """Return the insight future for a step, or None if no extraction was started"""
+        with self._lock:
+            return self._insight_futures.get(step_id)
+
+    def snapshot_step_outputs(self):
+        """Return a copy of all recorded step outputs"""
+        with self._lock:
+            return dict(self._step_outputs)
+
+
+class DeferredLLMCall:
+    """
+    An LLM request planned by a step handler but not yet executed.
+
+    Handlers build prompts and validate inputs as usual; the caller performs
+    the provider call (e.g. with an async client) and passes the provider's
+    result dict to complete(), which applies the same post-processing as the
+    synchronous path and returns the step result.
+    """
+
+    def __init__(self, provider, request_kwargs, complete):
+        self.provider = provider  # 'claude' or 'perplexity'
+        self.request_kwargs = request_kwargs
+        self.complete = complete
@@ -0,0 +1,241 @@
+import asyncio
+import contextlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.tracing import bind_context
+
+logger = logging.getLogger(__name__)
+
+# The raw product idea is the only input that is not produced by a step
+PIPELINE_ROOT_INPUT = "product_idea"
+
+
+def build_step_graph(steps):
+    """
+    Build the step dependency graph from each step's declared inputs.
+
+    A step depends on every step whose output_key appears in its input_key or
+    context_keys. The product idea is supplied by the caller and has no producer.
+
+    Args:
+        steps: Step configurations (WORKING_BACKWARDS_STEPS)
+
+    Returns:
+        Dict mapping step_id to the set of step_ids it depends on
+
+    Raises:
+        ValueError: If an input has no producing step or the graph contains a cycle
+    """
+    producers = {}
+    for step in steps:
+        output_key = step.get("output_key")
+        if output_key:
+            producers[output_key] = step["id"]
+
+    graph = {}
+    for step in steps:
+        required_keys = [step.get("input_key", PIPELINE_ROOT_INPUT)] + list(step.get("context_keys", []))
+        dependencies = set()
+        for key in required_keys:
+            if key == PIPELINE_ROOT_INPUT:
+                continue
+            if key not in producers:
+                raise ValueError(f"Step {step['id']} requires '{key}' but no step produces it")
+            dependencies.add(producers[key])
+        graph[step["id"]] = dependencies
+
+    # Reject cycles up front so the scheduler can never stall
+    visited = set()
+    visiting = set()
+
+    def visit(step_id):
+        if step_id in visited:
+            return
+        if step_id in visiting:
+            raise ValueError(f"Step dependency cycle detected at step {step_id}")
+        visiting.add(step_id)
+        for dependency in graph[step_id]:
+            visit(dependency)
+        visiting.discard(step_id)
+        visited.add(step_id)
+
+    for step_id in graph:
+        visit(step_id)
+
+    return graph
+
+
+class StepGraphScheduler:
+    """
+    Runs pipeline steps as soon as their declared inputs are ready.
+
+    Independent steps (e.g. Internal FAQ and Concept Validation, which both only
+    need the refined press release and research) execute concurrently on a
+    bounded worker pool. Ready steps are started in step-id order so progress
+    stays close to the familiar 1-10 sequence.
+
+    With a shared executor (a BoundedExecutor or ThreadPoolExecutor) every run
+    submits its steps there and max_workers only caps each run's in-flight
+    steps; without one each run starts a private pool of max_workers threads.
+    """
+
+    def __init__(self, steps, max_workers=2, executor=None):
+        self.steps = {step["id"]: step for step in steps}
+        self.graph = build_step_graph(steps)
+        self.max_workers = max(1, max_workers)
+        self.executor = executor
+
+    def _run_executor(self, request_id):
+        """Context manager yielding the executor this run submits its steps to"""
+        if self.executor is not None:
+            return contextlib.nullcontext(self.executor)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"step-{request_id or 'anon'}")
+
+    def run(self, product_idea, execute_step, on_step_start=None, request_id=None, completed_steps=None):
+        """
+        Execute every step in dependency order.
+
+        Args:
+            product_idea: The product idea fed to steps that declare it as input
+            execute_step: Callable(step_id, input_text, step_data) returning a result dict
+            on_step_start: Optional callable(step_id) invoked when a step is submitted
+            request_id: Optional request ID for logging
+            completed_steps: Optional dict of step_id to output text for steps that
+                already ran (e.g. restored checkpoints); they are not executed again
+
+        Returns:
+            Tuple of (outputs, failure) where outputs maps output_key to text and
+            failure is None or {'error': ..., 'step': step_id} for the first failed step
+        """
+        log_prefix = f"[{request_id or 'NO_REQ_ID'}]"
+        outputs, completed, pending = self._initial_state(product_idea, completed_steps)
+        failures = {}
+        running = {}
+
+        with self._run_executor(request_id) as executor:
+            while pending or running:
+                if not failures:
+                    for step_id in self._ready_steps(pending, completed):
+                        if len(running) >= self.max_workers:
+                            break
+                        input_text, step_data = self._start_step(step_id, outputs, pending, running, on_step_start, log_prefix)
+                        try:
+                            # bind_context carries the pipeline's trace span into the worker thread
+                            running[executor.submit(bind_context(execute_step), step_id, input_text, step_data)] = step_id
+                        except RuntimeError as e:
+                            # A saturated or shut down executor fails the step like any other error
+                            self._record_result(step_id, {"error": f"Step {step_id} could not be scheduled: {str(e)}"},
+                                                outputs, completed, failures, log_prefix)
+                            break
+
+                if not running:
+                    # Nothing in flight and nothing schedulable: either a failure
+                    # stopped scheduling or all remaining steps are blocked by it
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.exception(f"{log_prefix} Step {step_id} raised in scheduler worker")
+                        result = {"error": f"Step {step_id} failed: {str(e)}"}
+                    self._record_result(step_id, result, outputs, completed, failures, log_prefix)
+
+        return self._finish(outputs, failures)
+
+    async def arun(self, product_idea, execute_step, on_step_start=None, request_id=None, completed_steps=None):
+        """
+        Async variant of run() for use on an event loop.
+
+        Same scheduling rules and return value as run(), but execute_step is an
+        async callable and concurrency is bounded by max_workers in-flight tasks
+        instead of a thread pool.
+
+        Args:
+            product_idea: The product idea fed to steps that declare it as input
+            execute_step: Async callable(step_id, input_text, step_data) returning a result dict
+            on_step_start: Optional callable(step_id) invoked when a step is started
+            request_id: Optional request ID for logging
+            completed_steps: Optional dict of step_id to output text, as for run()
+
+        Returns:
+            Tuple of (outputs, failure), as for run()
+        """
+        log_prefix = f"[{request_id or 'NO_REQ_ID'}]"
+        outputs, completed, pending = self._initial_state(product_idea, completed_steps)
+        failures = {}
+        running = {}
+
+        while pending or running:
+            if not failures:
+                for step_id in self._ready_steps(pending, completed):
+                    if len(running) >= self.max_workers:
+                        break
+                    input_text, step_data = self._start_step(step_id, outputs, pending, running, on_step_start, log_prefix)
+                    task = asyncio.ensure_future(execute_step(step_id, input_text, step_data))
+                    running[task] = step_id
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step_id = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.exception(f"{log_prefix} Step {step_id} raised in async scheduler")
+                    result = {"error": f"Step {step_id} failed: {str(e)}"}
+                self._record_result(step_id, result, outputs, completed, failures, log_prefix)
+
+        return self._finish(outputs, failures)
+
+    def _initial_state(self, product_idea, completed_steps):
+        """Build the outputs, completed and pending sets, seeding already-completed steps"""
+        outputs = {PIPELINE_ROOT_INPUT: product_idea}
+        completed = set()
+        for step_id, output in (completed_steps or {}).items():
+            if step_id in self.steps:
+                outputs[self.steps[step_id]["output_key"]] = output
+                completed.add(step_id)
+        pending = set(self.graph) - completed
+        return outputs, completed, pending
+
+    def _ready_steps(self, pending, completed):
+        """Pending steps whose dependencies have all completed, in step-id order"""
+        return sorted(
+            step_id for step_id in pending
+            if self.graph[step_id] <= completed
+        )
+
+    def _start_step(self, step_id, outputs, pending, running, on_step_start, log_prefix):
+        """Mark a step as started and resolve its input text and context data"""
+        step = self.steps[step_id]
+        input_text = outputs[step.get("input_key", PIPELINE_ROOT_INPUT)]
+        step_data = {key: outputs[key] for key in step.get("context_keys", [])}
+        pending.discard(step_id)
+        if on_step_start:
+            on_step_start(step_id)
+        logger.info(f"{log_prefix} Scheduler starting step {step_id} (running: {sorted(list(running.values()) + [step_id])})")
+        return input_text, step_data
+
+    def _record_result(self, step_id, result, outputs, completed, failures, log_prefix):
+        """Store a finished step's output or record it as failed"""
+        if not isinstance(result, dict) or "error" in result or "output" not in result:
+            error = result.get("error") if isinstance(result, dict) else None
+            failures[step_id] = error or f"Step {step_id} returned no output"
+            logger.error(f"{log_prefix} Step {step_id} failed in scheduler: {failures[step_id]}")
+            return
+
+        outputs[self.steps[step_id]["output_key"]] = result["output"]
+        completed.add(step_id)
+
+    @staticmethod
+    def _finish(outputs, failures):
+        if failures:
+            failed_step = min(failures)
+            return outputs, {"error": failures[failed_step], "step": failed_step}
+
+        return outputs, None
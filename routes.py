@@ -1,63 +1,77 @@
 from flask import request, jsonify, Response, render_template
 from app import app
 from processors.llm_processor import LLMProcessor
+from processors.pipeline_context import PipelineContext
+from processors.async_pipeline import AsyncPipelineEngine
+from config import (
+    ASYNC_PIPELINE_ENABLED, PIPELINE_HEARTBEAT_INTERVAL_SECONDS, INSIGHT_WAIT_MAX_SECONDS, METRICS_ENABLED,
+    PIPELINE_LEASE_TTL_SECONDS, PIPELINE_LEASE_RENEW_INTERVAL_SECONDS
+)
 import logging
 import json
 import time
 import threading
 import queue
 import os
+import socket
 import uuid
 
 # Import cache utilities from the new location
-from utils.raw_output_cache import store_raw_llm_output, get_raw_llm_output, get_insights
+from utils.raw_output_cache import store_raw_llm_output, get_raw_llm_output, get_insights, wait_for_insights, get_raw_output_cache_stats
+from utils.llm_result_cache import get_llm_cache
+from utils.inflight_pipelines import PipelineRun, get_inflight_pipelines, format_sse_frame
+from utils.rate_limiter import get_rate_limiter_stats, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from utils.retry_policy import get_circuit_breaker_stats
+from utils import metrics
+from utils.tracing import get_trace_store, build_waterfall, render_waterfall_text
+from utils.llm_backends import get_llm_backend
+from utils.completion_store import get_completion_store
+from utils.background import get_background_service, ExecutorSaturated
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# NEW: Completion state tracking (independent of streaming)
-completion_states = {}
-
+# Completion state tracking (independent of streaming), shared across worker processes
 def store_completion_state(request_id, status, result=None, error=None, step_outputs=None):
     """Store completion state independently of streaming mechanism"""
-    completion_states[request_id] = {
-        'status': status,  # 'processing', 'completed', 'failed'
-        'result': result,
-        'error': error,
-        'step_outputs': step_outputs or {},  # Store all step outputs for recovery
-        'timestamp': time.time()
-    }
-    logger.info(f"[{request_id}] Stored completion state: {status}")
+    version = get_completion_store().put(request_id, status, result=result, error=error, step_outputs=step_outputs)
+    logger.info(f"[{request_id}] Stored completion state: {status} (version {version})")
 
-def get_completion_state(request_id):
-    """Get completion state for a request"""
-    # Clean up old completion states (older than 1 hour)
-    current_time = time.time()
-    old_request_ids = []
-    for req_id, state in completion_states.items():
-        if current_time - state['timestamp'] > 3600:  # 1 hour
-            old_request_ids.append(req_id)
+def get_completion_state(request_id, if_newer_than=None):
+    """
+    Get completion state for a request.
     
-    for old_id in old_request_ids:
-        del completion_states[old_id]
-        logger.info(f"[{old_id}] Cleaned up old completion state")
+    Args:
+        request_id: Request ID of the pipeline run
+        if_newer_than: Version the caller already has; an unchanged state comes back without its payload
     
-    return completion_states.get(request_id, None)
+    Returns:
+        State dict (status, version, timestamp, modified and, when modified, result/error/step_outputs) or None
+    """
+    return get_completion_store().get(request_id, if_newer_than=if_newer_than)
 
 # Import database service for session tracking (dual-write pattern)
 try:
     from utils.database_service import get_db_service
+    from utils.db_write_queue import get_db_write_queue
     DATABASE_ENABLED = True
     logger.info("Database service available for session tracking")
 except ImportError as e:
     logger.warning(f"Database service not available: {e}")
     DATABASE_ENABLED = False
 
-# Create LLM processor instance
+# Create LLM processor instance (stateless; shared by all concurrent requests)
 logger.info("Creating LLMProcessor instance...")
 llm_processor = LLMProcessor()
 logger.info("LLMProcessor instance created successfully")
 
+# Streamed pipelines share one event loop instead of holding threads while waiting on LLMs
+async_pipeline_engine = AsyncPipelineEngine(llm_processor)
+
+def wants_cache_bypass(data):
+    """True when the request body asks to skip the LLM result cache ("bypass_cache": true)"""
+    return bool(data and data.get('bypass_cache'))
+
 def generate_request_id():
     """Generate a short request ID for tracking"""
     return str(uuid.uuid4())[:8]
@@ -125,7 +139,8 @@ def process_product_idea():
     
     Expects a JSON payload with the following structure:
     {
-        "product_idea": "Description of the product idea"
+        "product_idea": "Description of the product idea",
+        "bypass_cache": false (optional, force fresh LLM calls)
     }
     
     Returns a JSON response with the results of each step in the process.
@@ -165,7 +180,8 @@ def process_product_idea():
         # Process the product idea through all steps
         logger.info(f"[{request_id}] Starting LLM processing...")
         start_time = time.time()
-        results = llm_processor.process_all_steps(product_idea, request_id=request_id)
+        pipeline_context = PipelineContext(request_id=request_id, use_cache=not wants_cache_bypass(data), priority=PRIORITY_BATCH)
+        results = llm_processor.process_all_steps(product_idea, request_id=request_id, context=pipeline_context)
         end_time = time.time()
         
         logger.info(f"[{request_id}] LLM processing completed in {end_time - start_time:.2f} seconds")
@@ -219,6 +235,389 @@ def process_product_idea():
             'request_id': request_id
         }), 500
 
+def make_checkpoint_callback(request_id):
+    """Build a PipelineContext checkpoint callback that persists step outputs for resume"""
+    def save_checkpoint(step_id, input_text, output):
+        try:
+            get_db_write_queue().enqueue('step_checkpoint', request_id, step_id=step_id, output_text=output, input_text=input_text)
+        except Exception as e:
+            logger.error(f"Database: Failed to checkpoint step {step_id} for {request_id}: {e}")
+    return save_checkpoint
+
+def session_lease_owner():
+    """Session lease owner id of this worker process (not cached: gunicorn forks workers after import)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def start_pipeline_run(run, product_idea, checkpoints=None, use_cache=True):
+    """
+    Start the Working Backwards pipeline for a run, publishing its progress to the run.
+    
+    Args:
+        run: PipelineRun whose request_id identifies the session being processed
+        product_idea: The product idea to process
+        checkpoints: Optional dict of step_id to output restored from an earlier
+            attempt of the same request; those steps are not re-executed
+        use_cache: Whether LLM calls may be served from the LLM result cache
+    """
+    request_id = run.request_id
+
+    def safe_progress_callback(update):
+        """Protected progress callback that won't kill the background thread"""
+        try:
+            if update.get('type') == 'heartbeat':
+                run.last_heartbeat = time.time()
+            # Don't log heartbeat or streamed partial output messages to avoid log clutter
+            elif update.get('type') != 'partial_output':
+                logger.info(f"[{request_id}] Step {update.get('step', '?')} | {update.get('status', 'unknown')}")
+            run.publish(update)
+        except Exception as e:
+            logger.error(f"[{request_id}] Progress callback failed but thread continues: {e}")
+            # Don't re-raise - keep the background thread alive
+            try:
+                run.publish({
+                    'type': 'log',
+                    'level': 'error',
+                    'message': f'🚨 Progress callback failed: {str(e)}',
+                    'request_id': request_id
+                })
+            except:
+                pass  # Final safety net
+
+    # Per-run context keeps this pipeline's state isolated from concurrent streams
+    pipeline_context = PipelineContext(
+        request_id=request_id,
+        progress_callback=safe_progress_callback,
+        checkpoint_callback=make_checkpoint_callback(request_id) if DATABASE_ENABLED else None,
+        use_cache=use_cache,
+        priority=PRIORITY_INTERACTIVE
+    )
+    processing_start_time = time.time()
+    worker_finished = threading.Event()
+
+    def finish_processing(result):
+        """Record the pipeline result and signal the stream generator"""
+        get_background_service().timers.cancel_owner(request_id)
+        run.result = result
+        processing_end_time = time.time()
+
+        # NEW: Track completion state independently with step outputs
+        if 'error' in result:
+            store_completion_state(request_id, 'failed', error=result['error'])
+        else:
+            # Collect all step outputs for recovery
+            step_outputs = pipeline_context.snapshot_step_outputs()
+            store_completion_state(request_id, 'completed', result=result, step_outputs=step_outputs)
+
+        # === NEW: DATABASE SESSION COMPLETION TRACKING (ADDITIVE ONLY) ===
+        if DATABASE_ENABLED:
+            try:
+                db_service = get_db_service()
+                if 'error' in result:
+                    db_service.update_session_completion(
+                        request_id=request_id,
+                        status='failed',
+                        duration=processing_end_time - processing_start_time,
+                        error=result['error']
+                    )
+                    logger.debug(f"Database: Updated session {request_id} as failed (stream)")
+                else:
+                    db_service.update_session_completion(
+                        request_id=request_id,
+                        status='completed',
+                        duration=processing_end_time - processing_start_time
+                    )
+                    logger.debug(f"Database: Updated session {request_id} as completed (stream)")
+                db_service.release_session_lease(request_id, session_lease_owner())
+            except Exception as e:
+                logger.error(f"Database: Failed to update session completion for {request_id} (stream): {e}")
+
+        # Send completion log
+        safe_progress_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': '✅ Background processing completed successfully',
+            'request_id': request_id
+        })
+
+        run.finish({'done': True})
+        worker_finished.set()
+        get_inflight_pipelines().complete(run)
+        logger.info(f"[{request_id}] Background processing completed")
+
+    def fail_processing(e):
+        """Record an unexpected processing error and signal the stream generator"""
+        get_background_service().timers.cancel_owner(request_id)
+        processing_end_time = time.time()
+
+        # NEW: Track error state independently
+        store_completion_state(request_id, 'failed', error=str(e))
+
+        # === NEW: DATABASE SESSION ERROR TRACKING (ADDITIVE ONLY) ===
+        if DATABASE_ENABLED:
+            try:
+                db_service = get_db_service()
+                db_service.update_session_completion(
+                    request_id=request_id,
+                    status='failed',
+                    duration=processing_end_time - processing_start_time,
+                    error=str(e)
+                )
+                logger.debug(f"Database: Updated session {request_id} as failed due to exception (stream)")
+                db_service.release_session_lease(request_id, session_lease_owner())
+            except Exception as db_e:
+                logger.error(f"Database: Failed to update session exception for {request_id} (stream): {db_e}")
+
+        # Send error log to frontend
+        safe_progress_callback({
+            'type': 'log',
+            'level': 'error',
+            'message': f'🚨 Background thread failed: {str(e)}',
+            'request_id': request_id
+        })
+
+        run.finish({
+            'error': True,
+            'message': f'Server error: {str(e)}'
+        })
+        worker_finished.set()
+        get_inflight_pipelines().complete(run)
+
+    def on_pipeline_done(future):
+        """Completion hook for pipelines run on the async engine"""
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception(f"[{request_id}] Error in async pipeline")
+            fail_processing(e)
+            return
+        try:
+            finish_processing(result)
+        except Exception as e:
+            logger.exception(f"[{request_id}] Error recording async pipeline completion")
+            fail_processing(e)
+
+    def process_in_thread():
+        try:
+            logger.info(f"[{request_id}] Background processing thread started")
+
+            # Send thread start log to frontend
+            safe_progress_callback({
+                'type': 'log',
+                'level': 'info',
+                'message': '🧵 Background processing thread started',
+                'request_id': request_id
+            })
+
+            result = llm_processor.process_all_steps(product_idea, request_id=request_id, context=pipeline_context, checkpoints=checkpoints)
+            finish_processing(result)
+
+        except Exception as e:
+            logger.exception(f"[{request_id}] Error in background processing thread")
+            fail_processing(e)
+
+    # NEW: Track processing start
+    store_completion_state(request_id, 'processing')
+
+    if DATABASE_ENABLED:
+        # Keep the session lease fresh while the run works, so resumes on any worker are refused;
+        # scheduled before the pipeline starts so cancel_owner in finish/fail always stops it
+        def renew_session_lease():
+            if run.worker_alive() and not get_db_service().renew_session_lease(request_id, session_lease_owner(), PIPELINE_LEASE_TTL_SECONDS):
+                logger.warning(f"[{request_id}] Session lease is no longer held by this worker")
+        background = get_background_service()
+        background.timers.schedule_periodic(
+            PIPELINE_LEASE_RENEW_INTERVAL_SECONDS, renew_session_lease,
+            owner=request_id, executor=background.executor('io')
+        )
+
+    if ASYNC_PIPELINE_ENABLED:
+        # The pipeline runs as a coroutine on the shared event loop; no per-request threads
+        safe_progress_callback({
+            'type': 'log',
+            'level': 'info',
+            'message': '🧵 Pipeline scheduled on async engine',
+            'request_id': request_id
+        })
+        async_pipeline_engine.submit(product_idea, pipeline_context, on_done=on_pipeline_done, checkpoints=checkpoints)
+        run.worker_alive = lambda: not worker_finished.is_set()
+        logger.info(f"[{request_id}] Pipeline submitted to async engine")
+    else:
+        # Run on the bounded pipeline executor; heartbeats are timers owned by the request,
+        # cancelled when it finishes (and sent while the run waits for a free worker)
+        background = get_background_service()
+        background.timers.schedule_periodic(
+            PIPELINE_HEARTBEAT_INTERVAL_SECONDS,
+            lambda: safe_progress_callback({
+                'type': 'heartbeat',
+                'timestamp': time.time(),
+                'request_id': request_id
+            }),
+            owner=request_id,
+            initial_delay=0
+        )
+        try:
+            future = background.executor('pipeline').submit(process_in_thread)
+        except ExecutorSaturated as e:
+            logger.error(f"[{request_id}] Pipeline executor saturated: {e}")
+            fail_processing(e)
+            return
+        run.worker_alive = lambda: not future.done()
+        logger.info(f"[{request_id}] Pipeline submitted to pipeline executor")
+
+def stream_run_events(run, last_event_id=None):
+    """
+    Yield the SSE events of a pipeline run, replaying anything already emitted.
+    
+    Used both by the request that started the run and by identical requests
+    coalesced into it, so every attached stream sees the same event sequence.
+    
+    Args:
+        run: The PipelineRun to stream
+        last_event_id: Last event id a reconnecting client received; only later
+            events are replayed, and the 'started' event is not repeated
+    """
+    request_id = run.request_id
+    logger.info(f"[{request_id}] Starting stream generator" + (f" after event {last_event_id}" if last_event_id is not None else ""))
+    progress_queue, missed = run.subscribe(last_event_id)
+    stream_start = time.time()
+    outcome = 'disconnected'  # generator closed before the stream ended, i.e. the client went away
+    metrics.sse_active_streams.inc()
+    try:
+        if last_event_id is not None:
+            replayed = progress_queue.qsize()
+            metrics.sse_resumes.inc(outcome='gap' if missed else 'replayed')
+            metrics.sse_replayed_events.inc(replayed)
+            logger.info(f"[{request_id}] Stream resumed after event {last_event_id}: replaying {replayed} events ({missed} no longer buffered)")
+        outcome = yield from _stream_run_updates(run, progress_queue, stream_start, resumed=last_event_id is not None, missed=missed)
+    finally:
+        run.unsubscribe(progress_queue)
+        metrics.sse_active_streams.dec()
+        metrics.sse_stream_seconds.observe(time.time() - stream_start, outcome=outcome)
+
+def _stream_run_updates(run, progress_queue, stream_start, resumed=False, missed=0):
+    """
+    Yield the run's SSE frames until it completes, fails or stalls.
+
+    Returns:
+        How the stream ended: 'complete', 'error' or 'timeout'
+    """
+    request_id = run.request_id
+    outcome = 'error'
+
+    if not resumed:
+        # Send initial status, including request_id
+        initial_update = {'status': 'started', 'message': 'Starting evaluation...', 'progress': 0, 'request_id': request_id}
+        logger.debug(f"[{request_id}] Sending initial update: {initial_update}")
+        yield format_sse_frame(initial_update)
+    if missed:
+        # Events this client never saw were evicted from the replay buffer; it should refetch state
+        yield format_sse_frame({'type': 'replay_gap', 'missed_events': missed, 'request_id': request_id})
+
+    # Stream progress updates
+    update_count = 0
+    last_step_time = time.time()
+    current_step_id = None  # Track current step for step-aware timeouts
+
+    while True:
+        try:
+            event = progress_queue.get(timeout=10)  # Reduced from 60s to 10s for faster detection
+            update = event.update
+            update_count += 1
+            current_time = time.time()
+            if update_count == 1:
+                metrics.sse_first_event_seconds.observe(current_time - stream_start)
+
+            # Log step timing for debugging; partial-output deltas are not step transitions
+            if update.get('step') and update.get('type') != 'partial_output':
+                step_duration = current_time - last_step_time
+                logger.info(f"[{request_id}] Step {update.get('step')} update after {step_duration:.1f}s | Status: {update.get('status', 'unknown')}")
+                last_step_time = current_time
+                # Track current step for step-aware timeouts
+                current_step_id = update.get('step')
+
+            # Update heartbeat tracking for non-heartbeat messages
+            if update.get('type') != 'heartbeat':
+                run.last_heartbeat = current_time
+            else:
+                # Reset elapsed time on heartbeat for long-running steps (9-10)
+                if current_step_id and current_step_id >= 9:
+                    last_step_time = current_time
+                    logger.debug(f"[{request_id}] Heartbeat reset elapsed time for Step {current_step_id}")
+
+            logger.debug(f"[{request_id}] Streaming update #{update_count}: {update.get('status', 'unknown')}")
+
+            # Frames are serialized once at publish time and shared by every attached stream
+            yield event.frame
+            if event.ends_stream:
+                if event.payload.get('complete'):
+                    logger.info(f"[{request_id}] Processing completed - sent successful completion result")
+                    outcome = 'complete'
+                elif update.get('done'):
+                    logger.error(f"[{request_id}] Final result contains error at step {event.payload.get('step')}: {event.payload['error']}")
+                else:
+                    logger.error(f"[{request_id}] Error in stream: {event.payload['error']}")
+                break
+
+        except queue.Empty:
+            # Faster timeout detection with thread health checking
+            elapsed_time = time.time() - last_step_time
+            heartbeat_elapsed = time.time() - run.last_heartbeat
+            thread_alive = run.worker_alive()
+
+            logger.warning(f"[{request_id}] Stream timeout after {elapsed_time:.1f}s | Thread alive: {thread_alive} | Heartbeat age: {heartbeat_elapsed:.1f}s | Current step: {current_step_id}")
+
+            # Check if thread died
+            if not thread_alive:
+                logger.error(f"[{request_id}] Background thread died unexpectedly")
+                yield f"data: {json.dumps({'error': 'Processing thread failed unexpectedly. Please try again.', 'request_id': request_id})}\n\n"
+                break
+
+            # Check if we've lost heartbeat (thread might be hung)
+            if heartbeat_elapsed > 45:  # No heartbeat for 45 seconds = hung thread
+                logger.error(f"[{request_id}] Thread appears hung (no heartbeat for {heartbeat_elapsed:.1f}s)")
+                yield f"data: {json.dumps({'error': 'Processing appears to be stuck. Please try again.', 'request_id': request_id})}\n\n"
+                outcome = 'timeout'
+                break
+
+            # Production-aware timeout: extended timeouts for production environment
+            if os.environ.get('FLASK_DEPLOYMENT_MODE') == 'production':
+                # Production: Extended timeouts for all steps due to infrastructure constraints
+                timeout_threshold = 300 if current_step_id and current_step_id >= 7 else 240
+            else:
+                # Development: Step-aware timeout for steps 9-10 (PRFAQ synthesis and MLP plan)
+                timeout_threshold = 180 if current_step_id and current_step_id >= 9 else 120
+
+            # If we've been stuck for too long, consider it a failure
+            if elapsed_time > timeout_threshold:
+                step_info = f" (Step {current_step_id})" if current_step_id else ""
+                logger.error(f"[{request_id}] Processing appears stuck{step_info} - terminating stream after {elapsed_time:.1f}s (threshold: {timeout_threshold}s)")
+                yield f"data: {json.dumps({'error': 'Processing timeout - the operation took too long to complete. Please try again.', 'request_id': request_id})}\n\n"
+                outcome = 'timeout'
+                break
+
+            yield f"data: {json.dumps({'keepalive': True, 'message': 'Processing continues...', 'request_id': request_id})}\n\n"
+            continue
+        except Exception as e:
+            logger.exception(f"[{request_id}] Error in stream generator")
+            yield f"data: {json.dumps({'error': f'Stream error: {str(e)}', 'request_id': request_id})}\n\n"
+            break
+
+    logger.info(f"[{request_id}] Stream generator completed after {update_count} updates")
+    return outcome
+
+def sse_response(events):
+    """Wrap an SSE event generator in a streaming response"""
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': 'Cache-Control'
+        }
+    )
+
 @app.route('/api/process_stream', methods=['POST'])
 def process_product_idea_stream():
     """
@@ -226,10 +625,13 @@ def process_product_idea_stream():
     
     Expects a JSON payload with the following structure:
     {
-        "product_idea": "Description of the product idea"
+        "product_idea": "Description of the product idea",
+        "bypass_cache": false (optional, force fresh LLM calls)
     }
     
-    Returns Server-Sent Events stream with real-time progress updates.
+    Returns Server-Sent Events stream with real-time progress updates. A request
+    for an idea that is already being processed joins that run: it receives the
+    events emitted so far, then the live stream, and the leader's request_id.
     """
     request_id = generate_request_id()
     logger.info(f"[{request_id}] API /process_stream endpoint called")
@@ -252,281 +654,39 @@ def process_product_idea_stream():
                 'error': 'Product idea is too short. Please provide more details.'
             }), 400
 
+        # Identical ideas arriving while a run is in flight attach to it instead of
+        # starting duplicate paid work; cache-bypass requests always run fresh
+        use_cache = not wants_cache_bypass(data)
+        if use_cache:
+            run, is_leader = get_inflight_pipelines().start_or_join(product_idea, request_id)
+        else:
+            run, is_leader = get_inflight_pipelines().track(PipelineRun(request_id)), True
+        
+        if not is_leader:
+            logger.info(f"[{request_id}] Joined in-flight pipeline {run.request_id} - streaming its events")
+            return sse_response(stream_run_events(run))
+        
         # === NEW: DATABASE SESSION TRACKING (ADDITIVE ONLY) ===
         if DATABASE_ENABLED:
             try:
                 db_service = get_db_service()
                 db_service.save_processing_session(request_id, product_idea)
+                db_service.claim_session_lease(request_id, session_lease_owner(), PIPELINE_LEASE_TTL_SECONDS)
                 logger.debug(f"Database: Started session tracking for {request_id} (stream)")
             except Exception as e:
                 logger.error(f"Database: Failed to start session tracking for {request_id} (stream): {e}")
                 # Continue - don't break processing
         
-        def generate():
-            logger.info(f"[{request_id}] Starting stream generator")
-            # Create a queue for progress updates
-            progress_queue = queue.Queue()
-            result_container = {}
-            last_heartbeat = {'time': time.time()}
-            
-            def safe_progress_callback(update):
-                """Protected progress callback that won't kill the background thread"""
-                try:
-                    # Don't log heartbeat messages to avoid log clutter
-                    if update.get('type') != 'heartbeat':
-                        logger.info(f"[{request_id}] Step {update.get('step', '?')} | {update.get('status', 'unknown')}")
-                    progress_queue.put(update)
-                except Exception as e:
-                    logger.error(f"[{request_id}] Progress callback failed but thread continues: {e}")
-                    # Don't re-raise - keep the background thread alive
-                    try:
-                        progress_queue.put({
-                            'type': 'log',
-                            'level': 'error',
-                            'message': f'🚨 Progress callback failed: {str(e)}',
-                            'request_id': request_id
-                        })
-                    except:
-                        pass  # Final safety net
-            
-            def process_in_thread():
-                processing_start_time = time.time()
-                try:
-                    logger.info(f"[{request_id}] Background processing thread started")
-                    
-                    # NEW: Track processing start
-                    store_completion_state(request_id, 'processing')
-                    
-                    # Send thread start log to frontend
-                    safe_progress_callback({
-                        'type': 'log',
-                        'level': 'info',
-                        'message': '🧵 Background processing thread started',
-                        'request_id': request_id
-                    })
-                    
-                    # Heartbeat mechanism with stop flag
-                    heartbeat_stop = {'stop': False}
-                    import threading
-                    def heartbeat():
-                        while not heartbeat_stop['stop']:
-                            try:
-                                last_heartbeat['time'] = time.time()
-                                safe_progress_callback({
-                                    'type': 'heartbeat',
-                                    'timestamp': time.time(),
-                                    'request_id': request_id
-                                })
-                                time.sleep(15)  # Heartbeat every 15 seconds
-                            except:
-                                break  # Exit heartbeat if main thread ends
-                    
-                    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
-                    heartbeat_thread.start()
-                    
-                    result = llm_processor.process_all_steps(product_idea, safe_progress_callback, request_id=request_id)
-                    result_container['result'] = result
-                    processing_end_time = time.time()
-                    
-                    # NEW: Track completion state independently with step outputs
-                    if 'error' in result:
-                        store_completion_state(request_id, 'failed', error=result['error'])
-                    else:
-                        # Collect all step outputs for recovery
-                        step_outputs = {}
-                        if hasattr(llm_processor, 'step_outputs') and llm_processor.step_outputs:
-                            step_outputs = llm_processor.step_outputs.copy()
-                        store_completion_state(request_id, 'completed', result=result, step_outputs=step_outputs)
-                    
-                    # Stop heartbeat thread
-                    heartbeat_stop['stop'] = True
-
-                    # === NEW: DATABASE SESSION COMPLETION TRACKING (ADDITIVE ONLY) ===
-                    if DATABASE_ENABLED:
-                        try:
-                            db_service = get_db_service()
-                            if 'error' in result:
-                                db_service.update_session_completion(
-                                    request_id=request_id,
-                                    status='failed',
-                                    duration=processing_end_time - processing_start_time,
-                                    error=result['error']
-                                )
-                                logger.debug(f"Database: Updated session {request_id} as failed (stream)")
-                            else:
-                                db_service.update_session_completion(
-                                    request_id=request_id,
-                                    status='completed',
-                                    duration=processing_end_time - processing_start_time
-                                )
-                                logger.debug(f"Database: Updated session {request_id} as completed (stream)")
-                        except Exception as e:
-                            logger.error(f"Database: Failed to update session completion for {request_id} (stream): {e}")
-                    
-                    # Send completion log
-                    safe_progress_callback({
-                        'type': 'log',
-                        'level': 'info',
-                        'message': '✅ Background processing completed successfully',
-                        'request_id': request_id
-                    })
-                    
-                    progress_queue.put({'done': True})
-                    logger.info(f"[{request_id}] Background processing thread completed")
-                    
-                except Exception as e:
-                    # Stop heartbeat thread on error too
-                    heartbeat_stop['stop'] = True
-                    processing_end_time = time.time()
-                    
-                    # NEW: Track error state independently
-                    store_completion_state(request_id, 'failed', error=str(e))
-                    
-                    logger.exception(f"[{request_id}] Error in background processing thread")
-
-                    # === NEW: DATABASE SESSION ERROR TRACKING (ADDITIVE ONLY) ===
-                    if DATABASE_ENABLED:
-                        try:
-                            db_service = get_db_service()
-                            db_service.update_session_completion(
-                                request_id=request_id,
-                                status='failed',
-                                duration=processing_end_time - processing_start_time,
-                                error=str(e)
-                            )
-                            logger.debug(f"Database: Updated session {request_id} as failed due to exception (stream)")
-                        except Exception as db_e:
-                            logger.error(f"Database: Failed to update session exception for {request_id} (stream): {db_e}")
-                    
-                    # Send error log to frontend
-                    safe_progress_callback({
-                        'type': 'log',
-                        'level': 'error',
-                        'message': f'🚨 Background thread failed: {str(e)}',
-                        'request_id': request_id
-                    })
-                    
-                    progress_queue.put({
-                        'error': True,
-                        'message': f'Server error: {str(e)}'
-                    })
-            
-            # Start processing in background thread
-            thread = threading.Thread(target=process_in_thread)
-            thread.daemon = True
-            thread.start()
-            logger.info(f"[{request_id}] Background thread started")
-            
-            # Send initial status, including request_id
-            initial_update = {'status': 'started', 'message': 'Starting evaluation...', 'progress': 0, 'request_id': request_id}
-            logger.debug(f"[{request_id}] Sending initial update: {initial_update}")
-            yield f"data: {json.dumps(initial_update)}\n\n"
-            
-            # Stream progress updates
-            update_count = 0
-            last_step_time = time.time()
-            current_step_id = None  # Track current step for step-aware timeouts
-            
-            while True:
-                try:
-                    update = progress_queue.get(timeout=10)  # Reduced from 60s to 10s for faster detection
-                    update_count += 1
-                    current_time = time.time()
-                    
-                    # Log step timing for debugging
-                    if update.get('step'):
-                        step_duration = current_time - last_step_time
-                        logger.info(f"[{request_id}] Step {update.get('step')} update after {step_duration:.1f}s | Status: {update.get('status', 'unknown')}")
-                        last_step_time = current_time
-                        # Track current step for step-aware timeouts
-                        current_step_id = update.get('step')
-                    
-                    # Update heartbeat tracking for non-heartbeat messages
-                    if update.get('type') != 'heartbeat':
-                        last_heartbeat['time'] = current_time
-                    else:
-                        # Reset elapsed time on heartbeat for long-running steps (9-10)
-                        if current_step_id and current_step_id >= 9:
-                            last_step_time = current_time
-                            logger.debug(f"[{request_id}] Heartbeat reset elapsed time for Step {current_step_id}")
-                    
-                    logger.debug(f"[{request_id}] Streaming update #{update_count}: {update.get('status', 'unknown')}")
-                    
-                    if update.get('done'):
-                        logger.info(f"[{request_id}] Processing completed - sending final result")
-                        # Send final result
-                        if 'result' in result_container:
-                            if 'error' in result_container['result']:
-                                error_step = result_container['result'].get('step', 'unknown')
-                                logger.error(f"[{request_id}] Final result contains error at step {error_step}: {result_container['result']['error']}")
-                                yield f"data: {json.dumps({'error': result_container['result']['error'], 'step': error_step, 'request_id': request_id})}\n\n"
-                            else:
-                                logger.info(f"[{request_id}] Sending successful completion result")
-                                yield f"data: {json.dumps({'complete': True, 'result': result_container['result'], 'request_id': request_id})}\n\n"
-                        break
-                    elif update.get('error'):
-                        logger.error(f"[{request_id}] Error in stream: {update['message']}")
-                        yield f"data: {json.dumps({'error': update['message'], 'request_id': request_id})}\n\n"
-                        break
-                    else:
-                        # Send progress update (including logs and heartbeats)
-                        yield f"data: {json.dumps(update)}\n\n"
-                        
-                except queue.Empty:
-                    # Faster timeout detection with thread health checking
-                    elapsed_time = time.time() - last_step_time
-                    heartbeat_elapsed = time.time() - last_heartbeat['time']
-                    thread_alive = thread.is_alive()
-                    
-                    logger.warning(f"[{request_id}] Stream timeout after {elapsed_time:.1f}s | Thread alive: {thread_alive} | Heartbeat age: {heartbeat_elapsed:.1f}s | Current step: {current_step_id}")
-                    
-                    # Check if thread died
-                    if not thread_alive:
-                        logger.error(f"[{request_id}] Background thread died unexpectedly")
-                        yield f"data: {json.dumps({'error': 'Processing thread failed unexpectedly. Please try again.', 'request_id': request_id})}\n\n"
-                        break
-                    
-                    # Check if we've lost heartbeat (thread might be hung)
-                    if heartbeat_elapsed > 45:  # No heartbeat for 45 seconds = hung thread
-                        logger.error(f"[{request_id}] Thread appears hung (no heartbeat for {heartbeat_elapsed:.1f}s)")
-                        yield f"data: {json.dumps({'error': 'Processing appears to be stuck. Please try again.', 'request_id': request_id})}\n\n"
-                        break
-                    
-                    # Production-aware timeout: extended timeouts for production environment
-                    if os.environ.get('FLASK_DEPLOYMENT_MODE') == 'production':
-                        # Production: Extended timeouts for all steps due to infrastructure constraints
-                        timeout_threshold = 300 if current_step_id and current_step_id >= 7 else 240
-                    else:
-                        # Development: Step-aware timeout for steps 9-10 (PRFAQ synthesis and MLP plan)
-                        timeout_threshold = 180 if current_step_id and current_step_id >= 9 else 120
-                    
-                    # If we've been stuck for too long, consider it a failure
-                    if elapsed_time > timeout_threshold:
-                        step_info = f" (Step {current_step_id})" if current_step_id else ""
-                        logger.error(f"[{request_id}] Processing appears stuck{step_info} - terminating stream after {elapsed_time:.1f}s (threshold: {timeout_threshold}s)")
-                        yield f"data: {json.dumps({'error': 'Processing timeout - the operation took too long to complete. Please try again.', 'request_id': request_id})}\n\n"
-                        break
-                    
-                    yield f"data: {json.dumps({'keepalive': True, 'message': 'Processing continues...', 'request_id': request_id})}\n\n"
-                    continue
-                except Exception as e:
-                    logger.exception(f"[{request_id}] Error in stream generator")
-                    yield f"data: {json.dumps({'error': f'Stream error: {str(e)}', 'request_id': request_id})}\n\n"
-                    break
-                    
-            logger.info(f"[{request_id}] Stream generator completed after {update_count} updates")
+        try:
+            start_pipeline_run(run, product_idea, use_cache=use_cache)
+        except Exception as e:
+            # Release coalesced followers rather than leaving them attached to a run that never started
+            run.finish({'error': True, 'message': f'Server error: {str(e)}'})
+            get_inflight_pipelines().complete(run)
+            raise
         
         logger.info(f"[{request_id}] Returning streaming response")
-        return Response(
-            generate(),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Connection': 'keep-alive',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Cache-Control'
-            }
-        )
+        return sse_response(stream_run_events(run))
         
     except Exception as e:
         logger.exception(f"[{request_id}] Error setting up stream")
@@ -535,6 +695,134 @@ def process_product_idea_stream():
             'request_id': request_id
         }), 500
 
+@app.route('/api/process_stream/<request_id>', methods=['GET'])
+def reconnect_product_idea_stream(request_id):
+    """
+    Reattach to the progress stream of a running or recently finished pipeline.
+    
+    The last event id the client received is read from the Last-Event-ID header
+    (sent automatically by EventSource reconnects) or the last_event_id query
+    parameter. Buffered events after it are replayed, then the stream continues
+    live. Without an id every buffered event is replayed. If events the client
+    missed were already evicted from the buffer, a 'replay_gap' event precedes
+    the replay; /api/check-completion/<request_id> has the full state.
+    
+    Run registries are per worker process. When this worker does not hold the
+    run, the shared completion store decides: a finished run is answered with
+    its final result as a one-event stream, and a run still processing
+    elsewhere gets a 409 pointing at /api/check-completion (live replay needs
+    sticky routing to the owning worker).
+    
+    Returns Server-Sent Events stream in the same format as /api/process_stream,
+    409 when the run is processing on another worker, or 404 when the request is unknown.
+    """
+    raw_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(raw_event_id) if raw_event_id not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': f'Invalid Last-Event-ID: {raw_event_id}', 'request_id': request_id}), 400
+    
+    run = get_inflight_pipelines().get(request_id)
+    if run is None:
+        return reconnect_from_completion_store(request_id)
+    
+    logger.info(f"[{request_id}] Stream reconnect (Last-Event-ID: {last_event_id})")
+    return sse_response(stream_run_events(run, last_event_id=last_event_id if last_event_id is not None else 0))
+
+def reconnect_from_completion_store(request_id):
+    """Answer a stream reconnect for a run this worker does not hold from the shared completion state"""
+    check_completion = f'/api/check-completion/{request_id}'
+    state = get_completion_state(request_id)
+    if state is None:
+        metrics.sse_resumes.inc(outcome='not_found')
+        logger.info(f"[{request_id}] Stream reconnect rejected - no resumable run")
+        return jsonify({
+            'error': 'No resumable stream for this request',
+            'request_id': request_id,
+            'check_completion': check_completion
+        }), 404
+    
+    if state['status'] == 'processing':
+        # Owned by another worker process (or by one that died); its replay buffer is not reachable from here
+        metrics.sse_resumes.inc(outcome='other_worker')
+        logger.info(f"[{request_id}] Stream reconnect rejected - run is processing outside this worker")
+        return jsonify({
+            'error': 'Run is processing on another worker; poll check_completion for its state',
+            'request_id': request_id,
+            'status': 'processing',
+            'check_completion': check_completion
+        }), 409
+    
+    # Finished: send the final payload exactly as the live stream would have ended
+    if state['status'] == 'completed':
+        payload = {'complete': True, 'result': state['result'], 'request_id': request_id}
+    else:
+        payload = {'error': state['error'] or 'Processing failed', 'request_id': request_id}
+    metrics.sse_resumes.inc(outcome='stored')
+    logger.info(f"[{request_id}] Stream reconnect answered from stored completion state: {state['status']}")
+    return sse_response(iter([format_sse_frame(payload)]))
+
+@app.route('/api/resume_stream/<request_id>', methods=['POST'])
+def resume_product_idea_stream(request_id):
+    """
+    Resume a failed or interrupted session from its first incomplete step.
+    
+    Steps checkpointed by the earlier attempt are restored (and streamed back as
+    completed) instead of being re-run; the remaining steps receive the same
+    step_data they would have had in an uninterrupted run.
+    
+    Returns Server-Sent Events stream in the same format as /api/process_stream.
+    """
+    logger.info(f"[{request_id}] API /resume_stream endpoint called")
+    try:
+        if not DATABASE_ENABLED:
+            return jsonify({'error': 'Resume requires the database service'}), 503
+        
+        db_service = get_db_service()
+        session_details = db_service.get_session_details(request_id)
+        if 'error' in session_details:
+            logger.warning(f"[{request_id}] Resume rejected - session not found")
+            return jsonify({'error': 'Session not found', 'request_id': request_id}), 404
+        
+        session = session_details['session']
+        if session['status'] == 'completed':
+            logger.warning(f"[{request_id}] Resume rejected - session already completed")
+            return jsonify({'error': 'Session already completed', 'request_id': request_id}), 409
+        
+        # Liveness comes from the session lease shared by every worker: a crashed worker's
+        # stored state still says 'processing', but its lease stops being renewed and lapses
+        lease_owner = session_lease_owner()
+        if not db_service.claim_session_lease(request_id, lease_owner, PIPELINE_LEASE_TTL_SECONDS):
+            logger.warning(f"[{request_id}] Resume rejected - session is still processing (lease held)")
+            return jsonify({'error': 'Session is still processing', 'request_id': request_id}), 409
+        run = get_inflight_pipelines().start_resume(request_id)
+        if run is None:
+            db_service.release_session_lease(request_id, lease_owner)
+            logger.warning(f"[{request_id}] Resume rejected - session is still processing")
+            return jsonify({'error': 'Session is still processing', 'request_id': request_id}), 409
+        
+        try:
+            # Checkpoints may still be waiting in the write-behind queue
+            get_db_write_queue().flush()
+            checkpoints = db_service.get_step_checkpoints(request_id)
+            logger.info(f"[{request_id}] Resuming session with checkpoints for steps {sorted(checkpoints)}")
+            db_service.reopen_session(request_id)
+            start_pipeline_run(run, session['original_idea'], checkpoints=checkpoints)
+        except Exception as e:
+            # Release the claim so the session can be resumed again
+            run.finish({'error': True, 'message': f'Server error: {str(e)}'})
+            get_inflight_pipelines().complete(run)
+            db_service.release_session_lease(request_id, lease_owner)
+            raise
+        return sse_response(stream_run_events(run))
+        
+    except Exception as e:
+        logger.exception(f"[{request_id}] Error setting up resume stream")
+        return jsonify({
+            'error': f'Server error: {str(e)}',
+            'request_id': request_id
+        }), 500
+
 @app.route('/api/process_step', methods=['POST'])
 def process_single_step():
     """
@@ -544,7 +832,8 @@ def process_single_step():
     {
         "step_id": 1,
         "input": "Input text for this step",
-        "step_data": {} (optional, for steps requiring multiple inputs)
+        "step_data": {} (optional, for steps requiring multiple inputs),
+        "bypass_cache": false (optional, force a fresh LLM call)
     }
     
     Returns a JSON response with the results of the requested step.
@@ -570,7 +859,7 @@ def process_single_step():
         
         # Process the single step
         start_time = time.time()
-        result = llm_processor.generate_step_response(step_id, input_text, step_data, request_id=request_id)
+        result = llm_processor.generate_step_response(step_id, input_text, step_data, request_id=request_id, use_cache=not wants_cache_bypass(data))
         end_time = time.time()
         
         logger.info(f"[{request_id}] Single step {step_id} completed in {end_time - start_time:.2f} seconds")
@@ -802,18 +1091,123 @@ def debug_status():
             "anthropic_configured": bool(ANTHROPIC_API_KEY),
             "perplexity_configured": bool(PERPLEXITY_API_KEY),
             "steps_configured": len(llm_processor.steps),
-            "processor_ready": hasattr(llm_processor, 'claude_processor') and llm_processor.claude_processor is not None
+            "processor_ready": hasattr(llm_processor, 'claude_processor') and llm_processor.claude_processor is not None,
+            "inflight_pipelines": get_inflight_pipelines().get_stats(),
+            "raw_output_cache": get_raw_output_cache_stats(),
+            "insight_batcher": llm_processor.insight_batcher.get_stats(),
+            "rate_limiters": get_rate_limiter_stats(),
+            "circuit_breakers": get_circuit_breaker_stats(),
+            "claude_usage": llm_processor.claude_processor.get_usage_stats(),
+            "tracing": get_trace_store().get_stats(),
+            "llm_backend": get_llm_backend().get_stats(),
+            "completion_store": get_completion_store().get_stats(),
+            "background": get_background_service().get_stats(),
+            "db_write_queue": get_db_write_queue().get_metrics() if DATABASE_ENABLED else None
         }
         
         return jsonify(status)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def collect_runtime_metrics():
+    """Refresh the scrape-time gauges (pipelines, progress queues, executors, timers, caches, DB write queue)"""
+    pipeline_stats = get_inflight_pipelines().get_stats()
+    metrics.inflight_pipelines_gauge.set(pipeline_stats['in_flight'])
+    metrics.progress_queue_depth.set(pipeline_stats['queued_events'], aggregate='sum')
+    metrics.progress_queue_depth.set(pipeline_stats['max_queue_depth'], aggregate='max')
+    metrics.sse_event_buffer_bytes.set(pipeline_stats['event_buffer_bytes'])
+    
+    raw_stats = get_raw_output_cache_stats()
+    metrics.cache_entries.set(raw_stats['entries'], cache='raw_output')
+    metrics.cache_bytes.set(raw_stats['resident_bytes'], cache='raw_output')
+    llm_cache_stats = get_llm_cache().get_stats()
+    metrics.cache_entries.set(llm_cache_stats['entries'], cache='llm_result')
+    metrics.cache_bytes.set(llm_cache_stats['size_bytes'], cache='llm_result')
+    background_stats = get_background_service().get_stats()
+    for name, executor_stats in background_stats['executors'].items():
+        metrics.executor_queue_depth.set(executor_stats['queue_depth'], executor=name)
+        metrics.executor_active_workers.set(executor_stats['active_workers'], executor=name)
+        metrics.executor_utilization.set(executor_stats['utilization'], executor=name)
+    metrics.timers_pending.set(background_stats['timers']['pending'])
+    metrics.timer_max_lag_seconds.set(background_stats['timers']['max_lag_seconds'])
+    
+    completion_stats = get_completion_store().get_stats()
+    metrics.cache_entries.set(completion_stats.get('entries', 0), cache='completion_state')
+    metrics.cache_bytes.set(completion_stats.get('payload_bytes', 0), cache='completion_state')
+    
+    if DATABASE_ENABLED:
+        write_metrics = get_db_write_queue().get_metrics()
+        metrics.db_write_queue_depth.set(write_metrics['queue_depth'])
+        metrics.db_write_last_commit_seconds.set(write_metrics['last_commit_ms'] / 1000)
+
+metrics.metrics_registry.add_collector(collect_runtime_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of the in-process metrics registry"""
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/debug/trace/<request_id>', methods=['GET'])
+def debug_trace(request_id):
+    """
+    Waterfall of a pipeline run's trace spans.
+    
+    Query params:
+        format: 'json' (default) or 'text' for a plain-text waterfall
+    
+    Returns:
+        JSON with the trace duration, spans in start order with depth and
+        offset_ms, and the critical path; 404 if no spans were recorded
+    """
+    try:
+        spans = get_trace_store().get_trace(request_id)
+        if not spans:
+            return jsonify({"error": f"No trace recorded for {request_id}"}), 404
+        waterfall = build_waterfall(spans)
+        if request.args.get('format') == 'text':
+            return Response(render_waterfall_text(waterfall), mimetype='text/plain')
+        return jsonify({"request_id": request_id, "span_count": len(spans), **waterfall})
+    except Exception as e:
+        logger.exception(f"[{request_id}] Error building trace waterfall")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/debug/llm-cache', methods=['GET', 'DELETE'])
+def debug_llm_cache():
+    """Debug endpoint for LLM result cache hit/miss counters; DELETE clears the cache"""
+    try:
+        llm_cache = get_llm_cache()
+        if request.method == 'DELETE':
+            llm_cache.clear()
+            logger.info("LLM result cache cleared via debug endpoint")
+        return jsonify(llm_cache.get_stats())
+    except Exception as e:
+        logger.exception("Error reading LLM result cache stats")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/check-completion/<request_id>', methods=['GET'])
 def check_completion_status(request_id):
-    """Check completion status independently of streaming (for stuck requests)"""
+    """
+    Check completion status independently of streaming (for stuck requests).
+    
+    Conditional reads: pass the last seen version as ?since_version=N or as an
+    If-None-Match ETag; if the state has not changed since, the response is a
+    304 with no body.
+    """
     try:
-        completion_state = get_completion_state(request_id)
+        since_version = request.args.get('since_version')
+        if since_version is None:
+            etag = request.headers.get('If-None-Match', '').strip()
+            since_version = etag[2:] if etag.startswith('W/') else etag
+            since_version = since_version.strip('"') or None
+        if since_version is not None:
+            try:
+                since_version = int(since_version)
+            except ValueError:
+                return jsonify({"error": "since_version must be an integer version", "request_id": request_id}), 400
+        
+        completion_state = get_completion_state(request_id, if_newer_than=since_version)
         
         if not completion_state:
             return jsonify({
@@ -822,10 +1216,15 @@ def check_completion_status(request_id):
                 "request_id": request_id
             })
         
+        etag = f'"{completion_state["version"]}"'
+        if not completion_state['modified']:
+            return Response(status=304, headers={'ETag': etag})
+        
         response_data = {
             "found": True,
             "status": completion_state['status'],
             "request_id": request_id,
+            "version": completion_state['version'],
             "timestamp": completion_state['timestamp']
         }
         
@@ -839,7 +1238,9 @@ def check_completion_status(request_id):
             response_data['error'] = completion_state['error']
         
         logger.info(f"[{request_id}] Completion status checked: {completion_state['status']}")
-        return jsonify(response_data)
+        response = jsonify(response_data)
+        response.headers['ETag'] = etag
+        return response
         
     except Exception as e:
         logger.error(f"[{request_id}] Error checking completion status: {e}")
@@ -896,7 +1297,7 @@ def debug_test_step(step_id):
         
         logger.info(f"[{request_id}] Debug: Testing step {step_id} with input length {len(input_text)}")
         
-        result = llm_processor.generate_step_response(step_id, input_text, step_data, request_id=request_id)
+        result = llm_processor.generate_step_response(step_id, input_text, step_data, request_id=request_id, use_cache=not wants_cache_bypass(data), priority=PRIORITY_BATCH)
         
         final_response = {
             "step_id": step_id,
@@ -935,16 +1336,34 @@ def get_raw_llm_output_route():
 # --- END: New Raw LLM Output Debug Endpoint ---
 
 # --- BEGIN: Insights API Endpoint ---
+def read_insights(request_id, args):
+    """
+    Return the stored insights for request_id, optionally long-polling.
+
+    With ?wait=<seconds> the request is held until new insights are stored
+    (up to INSIGHT_WAIT_MAX_SECONDS): until the insight for ?step=<id> exists,
+    or until more than ?have=<count> insights exist (default: at least one).
+    Waiters are woken the moment an insight is stored rather than polling.
+    """
+    wait_seconds = min(max(args.get('wait', 0, type=float), 0), INSIGHT_WAIT_MAX_SECONDS)
+    if not wait_seconds:
+        return get_insights(request_id)
+
+    step_id = args.get('step', type=int)
+    have = args.get('have', 0, type=int)
+    return wait_for_insights(request_id, wait_seconds, step_id=step_id, min_count=max(have + 1, 1))
+
 @app.route('/api/insights/<request_id>', methods=['GET'])
 def get_request_insights(request_id):
     """
     Fetch any stored insights for a specific request_id.
     Used to retrieve insights that may have been generated after stream completion.
+    Supports ?wait=, ?step= and ?have= long-polling (see read_insights).
     """
     logger.info(f"[{request_id}] Fetching insights via API")
     
     try:
-        insights = get_insights(request_id)
+        insights = read_insights(request_id, request.args)
         
         if insights:
             logger.info(f"[{request_id}] Retrieved {len(insights)} insights via API")
@@ -977,6 +1396,7 @@ def get_insights_by_query():
     Fetch any stored insights for a specific request_id using query parameters.
     Used to retrieve insights that may have been generated after stream completion.
     Safe route that won't conflict with React app routing.
+    Supports ?wait=, ?step= and ?have= long-polling (see read_insights).
     """
     request_id = request.args.get('request_id')
     
@@ -990,7 +1410,7 @@ def get_insights_by_query():
     logger.info(f"[{request_id}] Fetching insights via safe API")
     
     try:
-        insights = get_insights(request_id)
+        insights = read_insights(request_id, request.args)
         
         if insights:
             logger.info(f"[{request_id}] Retrieved {len(insights)} insights via safe API")
@@ -1137,7 +1557,9 @@ def get_ideas_report():
     - page: Page number (default: 1)
     - limit: Items per page (default: 50, max: 100)
     - status: Filter by status ('processing', 'completed', 'failed')
-    - search: Search in idea text
+    - search: Full-text search in idea text; results are ranked by relevance
+      and carry a highlighted snippet_html
+    - search_outputs: 'true' to also search each session's generated step outputs
     
     Returns paginated list with:
     - Original idea text (truncated)
@@ -1158,6 +1580,7 @@ def get_ideas_report():
         limit = min(int(request.args.get('limit', 50)), 100)  # Cap at 100
         status = request.args.get('status')
         search = request.args.get('search')
+        search_outputs = request.args.get('search_outputs', 'false').lower() == 'true'
         
         if page < 1:
             return jsonify({
@@ -1179,7 +1602,7 @@ def get_ideas_report():
             }), 400
         
         db_service = get_db_service()
-        ideas_data = db_service.get_ideas_list(page, limit, status, search)
+        ideas_data = db_service.get_ideas_list(page, limit, status, search, search_outputs=search_outputs)
         
         if 'error' in ideas_data:
             logger.error(f"Ideas list failed: {ideas_data['error']}")
@@ -1196,7 +1619,8 @@ def get_ideas_report():
                 'page': page,
                 'limit': limit,
                 'status': status,
-                'search': search
+                'search': search,
+                'search_outputs': search_outputs
             }
         })
         
@@ -1212,6 +1636,80 @@ def get_ideas_report():
             'message': str(e)
         }), 500
 
+@app.route('/api/reporting/search', methods=['GET'])
+def search_outputs_report():
+    """
+    Full-text search over generated step outputs (press releases, FAQs, research).
+    
+    Query parameters:
+    - q: Search text (required); every word must match, the last one as a prefix
+    - step_id: Only search this step's outputs
+    - page: Page number (default: 1)
+    - limit: Items per page (default: 20, max: 100)
+    
+    Returns results by relevance with request_id, step, score and a
+    highlighted snippet_html, plus pagination info
+    """
+    logger.info("API /api/reporting/search endpoint called")
+    
+    if not DATABASE_ENABLED:
+        return jsonify({
+            'error': 'Reporting database not available',
+            'message': 'Database service is not configured'
+        }), 503
+    
+    try:
+        query = (request.args.get('q') or '').strip()
+        page = int(request.args.get('page', 1))
+        limit = min(int(request.args.get('limit', 20)), 100)  # Cap at 100
+        step_id = request.args.get('step_id')
+        step_id = int(step_id) if step_id not in (None, '') else None
+        
+        if not query:
+            return jsonify({
+                'error': 'Missing search text',
+                'message': 'Query parameter q is required'
+            }), 400
+        
+        if page < 1 or limit < 1:
+            return jsonify({
+                'error': 'Invalid pagination',
+                'message': 'Page and limit must be >= 1'
+            }), 400
+        
+        search_data = get_db_service().search_step_outputs(query, step_id=step_id, page=page, limit=limit)
+        
+        if 'error' in search_data:
+            logger.error(f"Output search failed: {search_data['error']}")
+            return jsonify({
+                'error': 'Failed to search outputs',
+                'details': search_data['error']
+            }), 500
+        
+        logger.info(f"Output search: page {page}, {len(search_data['results'])} of {search_data['pagination']['total_count']} results")
+        return jsonify({
+            'success': True,
+            'data': search_data,
+            'filters': {
+                'q': query,
+                'step_id': step_id,
+                'page': page,
+                'limit': limit
+            }
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid parameter format',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.exception("Error in output search endpoint")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
 @app.route('/api/reporting/session/<request_id>', methods=['GET'])
 def get_session_details(request_id):
     """
@@ -7,9 +7,21 @@ let charts = {};
 // Initialize dashboard when page loads
 document.addEventListener('DOMContentLoaded', function() {
     initializeTabs();
+    initializeIdeasSearch();
     loadUsageAnalytics(); // Load default tab data
 });
 
+// Search as you type; the server answers from a full-text index
+let ideasSearchTimer = null;
+function initializeIdeasSearch() {
+    const reload = () => {
+        clearTimeout(ideasSearchTimer);
+        ideasSearchTimer = setTimeout(() => loadIdeasList(1), 250);
+    };
+    document.getElementById('ideasSearch').addEventListener('input', reload);
+    document.getElementById('ideasSearchOutputs').addEventListener('change', reload);
+}
+
 // Tab Management
 function initializeTabs() {
     const tabButtons = document.querySelectorAll('.tab-button');
@@ -199,7 +211,8 @@ async function loadIdeasList(page = 1) {
             page: page,
             limit: document.getElementById('ideasLimit').value,
             status: document.getElementById('ideasStatus').value,
-            search: document.getElementById('ideasSearch').value
+            search: document.getElementById('ideasSearch').value,
+            search_outputs: document.getElementById('ideasSearchOutputs').checked
         };
         
         const data = await apiCall('/api/reporting/ideas', params);
@@ -229,7 +242,10 @@ function renderIdeasTable(ideas) {
         
         row.innerHTML = `
             <td><code>${idea.request_id}</code></td>
-            <td title="${idea.idea_preview}">${idea.idea_preview}</td>
+            <td title="${idea.idea_preview}">
+                ${idea.idea_preview}
+                ${idea.snippet_html ? `<div class="search-snippet">${idea.matched_step_id != null ? `<strong>Step ${idea.matched_step_id}:</strong> ` : ''}${idea.snippet_html}</div>` : ''}
+            </td>
             <td><span class="${statusClass}">${idea.status.toUpperCase()}</span></td>
             <td>${formatDate(idea.created_at)}</td>
             <td>${formatDuration(idea.duration_seconds)}</td>
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+End-to-end pipeline load benchmark.
+
+Drives N concurrent /api/process_stream sessions and reports p50/p95/p99 per
+step and end to end, time to first event, thread count, RSS and reporting
+database write latency.
+
+By default the Flask app runs in-process on the fake LLM backend
+(LLM_BACKEND=fake), so no API keys are needed and results are reproducible for
+a given seed; working files (reporting DB, caches, traces) go to a fresh
+temporary directory. With --base-url it drives a running server instead and
+reads database latency from that server's /metrics and /api/debug/status
+(thread and RSS figures are then not available).
+
+Examples:
+    python tests/load_benchmark.py --sessions 20 --concurrency 10 --time-scale 0.05
+    python tests/load_benchmark.py --sessions 20 --concurrency 10 --time-scale 0.05 --overload-rate 0.05
+    python tests/load_benchmark.py --engine threads --json baseline.json
+    python tests/load_benchmark.py --base-url http://localhost:5000 --sessions 4
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IDEA_TEMPLATES = [
+    "A mobile app that helps {n} independent restaurants forecast ingredient orders from reservation data",
+    "A browser extension that summarizes {n} long procurement contracts for small business owners",
+    "A subscription service that matches {n} retired engineers with hardware startups for part-time mentoring",
+    "A scheduling tool that lets {n} home care agencies fill last-minute shift gaps automatically",
+    "A marketplace where {n} community gardens sell surplus produce to nearby cafes",
+]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values (q in 0-100); None when empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+
+def histogram_quantile(metrics_text, name, q):
+    """Estimate a quantile (0-1) from a Prometheus histogram's cumulative buckets, summed over label sets"""
+    buckets = {}
+    pattern = re.compile(rf'^{re.escape(name)}_bucket\{{(?:[^}}]*,)?le="([^"]+)"\}} (\S+)$')
+    for line in metrics_text.splitlines():
+        match = pattern.match(line)
+        if match:
+            bound = math.inf if match.group(1) == '+Inf' else float(match.group(1))
+            buckets[bound] = buckets.get(bound, 0) + float(match.group(2))
+    if not buckets or not buckets.get(math.inf):
+        return None
+    target = q * buckets[math.inf]
+    lower = 0.0
+    previous = 0.0
+    for bound in sorted(buckets):
+        count = buckets[bound]
+        if count >= target:
+            if bound == math.inf:
+                return lower
+            if count == previous:
+                return bound
+            return lower + (bound - lower) * (target - previous) / (count - previous)
+        lower, previous = bound, count
+    return lower
+
+
+class InProcessClient:
+    """Flask test client; streamed responses are consumed as the server generates them"""
+
+    def __init__(self, log_level):
+        from app import app
+        # The app logs every step at INFO to stdout; keep the report readable
+        for handler in logging.getLogger().handlers:
+            handler.setLevel(log_level)
+        self.client = app.test_client()
+
+    def stream(self, path, payload):
+        response = self.client.post(path, json=payload)
+        try:
+            for chunk in response.response:
+                yield chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        finally:
+            response.close()
+
+    def get(self, path):
+        return self.client.get(path).get_data(as_text=True)
+
+
+class HttpClient:
+    """Plain HTTP client for a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def stream(self, path, payload):
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=900) as response:
+            for line in response:
+                yield line.decode('utf-8')
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base_url + path, timeout=30) as response:
+            return response.read().decode('utf-8')
+
+
+def iter_events(chunks):
+    """Parse 'data: {...}' SSE events out of a stream of text chunks"""
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        while '\n\n' in buffer:
+            event, buffer = buffer.split('\n\n', 1)
+            for line in event.splitlines():
+                if line.startswith('data: '):
+                    yield json.loads(line[len('data: '):])
+
+
+def run_session(client, index, args):
+    """
+    Stream one pipeline run and time it from the client side.
+
+    A step runs from its first 'processing' event to its 'completed' event.
+    """
+    idea = IDEA_TEMPLATES[index % len(IDEA_TEMPLATES)].format(n=f"#{index}")
+    payload = {'product_idea': idea, 'bypass_cache': not args.with_cache}
+    started = time.time()
+    first_event = None
+    step_started = {}
+    step_seconds = {}
+    outcome = 'incomplete'
+    error = None
+    try:
+        for event in iter_events(client.stream('/api/process_stream', payload)):
+            now = time.time()
+            if first_event is None:
+                first_event = now - started
+            step = event.get('step')
+            if step is not None and event.get('status') == 'processing':
+                step_started.setdefault(step, now)
+            elif step is not None and event.get('status') == 'completed' and step in step_started:
+                step_seconds.setdefault(step, now - step_started[step])
+            if event.get('complete'):
+                outcome = 'complete'
+                break
+            if event.get('error') and 'step' in event:
+                outcome = 'error'
+                error = event.get('error')
+                break
+    except Exception as e:
+        outcome = 'error'
+        error = f"{type(e).__name__}: {e}"
+    return {
+        'session': index,
+        'outcome': outcome,
+        'error': error,
+        'seconds': time.time() - started,
+        'first_event_seconds': first_event,
+        'step_seconds': step_seconds,
+    }
+
+
+def read_rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ProcessSampler:
+    """Samples thread count and RSS of this process in the background"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.threads = []
+        self.rss = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='benchmark-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.threads.append(threading.active_count())
+            self.rss.append(read_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def summary(self):
+        if not self.threads:
+            return {}
+        megabytes = [value / (1024 * 1024) for value in self.rss]
+        return {
+            'threads_start': self.threads[0],
+            'threads_peak': max(self.threads),
+            'threads_end': self.threads[-1],
+            'rss_mb_start': round(megabytes[0], 1),
+            'rss_mb_peak': round(max(megabytes), 1),
+            'rss_mb_end': round(megabytes[-1], 1),
+        }
+
+
+def configure_environment(args):
+    """Set backend and fake-LLM settings; must run before the app (and config) is imported"""
+    os.environ['LLM_BACKEND'] = 'fake'
+    os.environ['FAKE_LLM_SEED'] = str(args.seed)
+    os.environ['FAKE_LLM_TIME_SCALE'] = str(args.time_scale)
+    os.environ['FAKE_LLM_OVERLOAD_RATE'] = str(args.overload_rate)
+    os.environ['FAKE_LLM_TIMEOUT_RATE'] = str(args.timeout_rate)
+    os.environ['ASYNC_PIPELINE_ENABLED'] = 'true' if args.engine == 'async' else 'false'
+    workdir = args.workdir or tempfile.mkdtemp(prefix='chatprfaq-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    return workdir
+
+
+def collect_server_stats(client, in_process):
+    """Database write latency (and fake-LLM counters) from the server's own endpoints"""
+    if in_process:
+        from utils.db_write_queue import get_db_write_queue
+        get_db_write_queue().flush()
+    metrics_text = client.get('/metrics')
+    status = json.loads(client.get('/api/debug/status'))
+    db_queue = status.get('db_write_queue') or {}
+    max_commit_ms = round(db_queue.get('max_commit_ms', 0.0), 3)
+
+    def commit_quantile_ms(q):
+        # Bucket interpolation can overshoot the largest observed commit
+        seconds = histogram_quantile(metrics_text, 'chatprfaq_db_write_commit_seconds', q)
+        return min(_ms(seconds), max_commit_ms) if seconds is not None else None
+
+    return {
+        'db_writes': {
+            'batches': db_queue.get('batches'),
+            'written': db_queue.get('written'),
+            'dropped': db_queue.get('dropped'),
+            'avg_commit_ms': round(db_queue.get('avg_commit_ms', 0.0), 3),
+            'p95_commit_ms': commit_quantile_ms(0.95),
+            'p99_commit_ms': commit_quantile_ms(0.99),
+            'max_commit_ms': max_commit_ms,
+            'max_queue_depth': db_queue.get('max_queue_depth'),
+        },
+        'llm_backend': status.get('llm_backend'),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def run_benchmark(args):
+    in_process = not args.base_url
+    workdir = configure_environment(args) if in_process else None
+    client = InProcessClient(args.log_level) if in_process else HttpClient(args.base_url)
+
+    started = time.time()
+    with ProcessSampler(args.sample_interval) as sampler:
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='benchmark-session') as pool:
+            sessions = list(pool.map(lambda index: run_session(client, index, args), range(args.sessions)))
+    wall_seconds = time.time() - started
+
+    completed = [session for session in sessions if session['outcome'] == 'complete']
+    steps = sorted({step for session in completed for step in session['step_seconds']})
+    report = {
+        'config': {
+            'sessions': args.sessions,
+            'concurrency': args.concurrency,
+            'engine': args.engine if in_process else 'server',
+            'target': args.base_url or 'in-process',
+            'seed': args.seed,
+            'time_scale': args.time_scale,
+            'overload_rate': args.overload_rate,
+            'timeout_rate': args.timeout_rate,
+            'with_cache': args.with_cache,
+            'workdir': workdir,
+        },
+        'wall_seconds': round(wall_seconds, 3),
+        'completed': len(completed),
+        'failed': len(sessions) - len(completed),
+        'errors': [session['error'] for session in sessions if session['error']][:10],
+        'sessions_per_minute': round(len(completed) / wall_seconds * 60, 2) if wall_seconds else None,
+        'end_to_end_seconds': summarize([session['seconds'] for session in completed]),
+        'first_event_seconds': summarize([session['first_event_seconds'] for session in sessions
+                                          if session['first_event_seconds'] is not None]),
+        'step_seconds': {
+            str(step): summarize([session['step_seconds'][step] for session in completed if step in session['step_seconds']])
+            for step in steps
+        },
+        'process': sampler.summary() if in_process else None,
+    }
+    report.update(collect_server_stats(client, in_process))
+    return report
+
+
+def _fmt(value):
+    return f"{value:.3f}" if isinstance(value, float) else ('-' if value is None else str(value))
+
+
+def print_report(report):
+    config = report['config']
+    print(f"\nSessions: {config['sessions']} at concurrency {config['concurrency']} "
+          f"(engine {config['engine']}, target {config['target']}, seed {config['seed']}, time scale {config['time_scale']})")
+    print(f"Completed {report['completed']}, failed {report['failed']} in {report['wall_seconds']:.1f}s "
+          f"({_fmt(report['sessions_per_minute'])} sessions/min)")
+    for error in report['errors']:
+        print(f"  error: {error}")
+
+    print(f"\n{'':<22}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = [('end-to-end (s)', report['end_to_end_seconds']), ('first event (s)', report['first_event_seconds'])]
+    rows += [(f"step {step} (s)", summary) for step, summary in report['step_seconds'].items()]
+    for label, summary in rows:
+        print(f"{label:<22}{summary['count']:>6}" + ''.join(f"{_fmt(summary[key]):>10}" for key in ('p50', 'p95', 'p99', 'max')))
+
+    process = report['process']
+    if process:
+        print(f"\nThreads: start {process['threads_start']}, peak {process['threads_peak']}, end {process['threads_end']}")
+        print(f"RSS (MB): start {process['rss_mb_start']}, peak {process['rss_mb_peak']}, end {process['rss_mb_end']}")
+
+    db = report['db_writes']
+    print(f"\nDB writes: {db['written']} records in {db['batches']} batches ({db['dropped']} dropped), "
+          f"commit avg {_fmt(db['avg_commit_ms'])}ms, p95 {_fmt(db['p95_commit_ms'])}ms, "
+          f"p99 {_fmt(db['p99_commit_ms'])}ms, max {_fmt(db['max_commit_ms'])}ms, max queue depth {db['max_queue_depth']}")
+    backend = report.get('llm_backend') or {}
+    if backend.get('backend') == 'fake':
+        print(f"Fake LLM: {backend['requests']} requests, {backend['overloaded']} overloaded (529), {backend['timeouts']} timeouts")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=10, help='total pipeline runs (default 10)')
+    parser.add_argument('--concurrency', type=int, default=5, help='runs streamed at once (default 5)')
+    parser.add_argument('--engine', choices=['async', 'threads'], default='async', help='pipeline engine for in-process runs')
+    parser.add_argument('--seed', type=int, default=42, help='fake LLM seed')
+    parser.add_argument('--time-scale', type=float, default=0.05,
+                        help='multiplier on simulated LLM latency (1.0 = production-like, default 0.05)')
+    parser.add_argument('--overload-rate', type=float, default=0.0, help='fraction of LLM requests failing with HTTP 529')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='fraction of LLM requests timing out')
+    parser.add_argument('--with-cache', action='store_true', help='let runs use the LLM result cache (bypassed by default)')
+    parser.add_argument('--base-url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--workdir', help='working directory for in-process runs (default: a new temp dir)')
+    parser.add_argument('--sample-interval', type=float, default=0.2, help='seconds between thread/RSS samples')
+    parser.add_argument('--log-level', default='WARNING', help='app log level for in-process runs (default WARNING)')
+    parser.add_argument('--json', dest='json_path', help='also write the report as JSON to this path')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    report = run_benchmark(args)
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"\nReport written to {json_path}")
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
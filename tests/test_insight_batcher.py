@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from processors.insight_batcher import InsightBatcher, InsightJob
+from utils.background import BoundedExecutor, TimerWheel
+
+
+class BatchRecorder:
+    """extract_batch stand-in returning one insight per job and recording each batch"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def __call__(self, jobs):
+        with self.lock:
+            self.batches.append([job.step_id for job in jobs])
+        if self.fail:
+            raise RuntimeError("provider down")
+        return [f"insight {job.step_id}" for job in jobs]
+
+
+@pytest.fixture
+def background():
+    timers = TimerWheel(tick_seconds=0.01, slots=64)
+    executor = BoundedExecutor('insight-test', max_workers=4, max_queue=16)
+    yield timers, executor
+    timers.stop()
+    executor.shutdown()
+
+
+def make_batcher(background, recorder, **kwargs):
+    timers, executor = background
+    settings = dict(workers=4, max_items=10, max_chars=10000, window_seconds=0.1, across_requests=True)
+    settings.update(kwargs)
+    return InsightBatcher(recorder, executor=executor, timers=timers, **settings)
+
+
+def job(step_id, prompt="p" * 10, request_id="r1"):
+    return InsightJob(request_id, step_id, prompt, f"label {step_id}")
+
+
+def test_lone_job_waits_for_the_window(background):
+    recorder = BatchRecorder()
+    batcher = make_batcher(background, recorder, window_seconds=0.15)
+
+    started = time.time()
+    future = batcher.submit(job(1))
+    assert recorder.batches == []
+
+    assert future.result(timeout=2) == "insight 1"
+    assert time.time() - started >= 0.15
+    assert recorder.batches == [[1]]
+
+
+def test_jobs_inside_the_window_share_a_batch(background):
+    recorder = BatchRecorder()
+    batcher = make_batcher(background, recorder, window_seconds=0.2)
+
+    futures = [batcher.submit(job(step_id)) for step_id in (2, 3, 4)]
+
+    assert [future.result(timeout=2) for future in futures] == ["insight 2", "insight 3", "insight 4"]
+    assert recorder.batches == [[2, 3, 4]]
+    assert batcher.get_stats()['merged_batches'] == 1
+
+
+def test_full_batch_flushes_before_the_window(background):
+    recorder = BatchRecorder()
+    batcher = make_batcher(background, recorder, max_items=3, window_seconds=30)
+
+    started = time.time()
+    futures = [batcher.submit(job(step_id)) for step_id in (1, 2, 3)]
+
+    assert [future.result(timeout=2) for future in futures] == ["insight 1", "insight 2", "insight 3"]
+    assert time.time() - started < 5
+    assert recorder.batches == [[1, 2, 3]]
+
+
+def test_batches_stay_within_the_char_budget(background):
+    recorder = BatchRecorder()
+    batcher = make_batcher(background, recorder, max_chars=100, window_seconds=0.05)
+
+    futures = [batcher.submit(job(step_id, prompt="p" * 40)) for step_id in (1, 2, 3)]
+
+    assert all(future.result(timeout=2) for future in futures)
+    assert sorted(recorder.batches) == [[1, 2], [3]]
+
+
+def test_requests_are_not_mixed_unless_allowed(background):
+    recorder = BatchRecorder()
+    batcher = make_batcher(background, recorder, across_requests=False, window_seconds=0.05)
+
+    futures = [batcher.submit(job(1, request_id="r1")), batcher.submit(job(2, request_id="r2")),
+               batcher.submit(job(3, request_id="r1"))]
+
+    assert all(future.result(timeout=2) for future in futures)
+    assert sorted(recorder.batches) == [[1, 3], [2]]
+
+
+def test_failed_batch_resolves_every_job_with_none(background):
+    recorder = BatchRecorder(fail=True)
+    batcher = make_batcher(background, recorder, window_seconds=0.01)
+
+    futures = [batcher.submit(job(step_id)) for step_id in (1, 2)]
+
+    assert [future.result(timeout=2) for future in futures] == [None, None]
+    assert batcher.get_stats()['failed_batches'] == 1
@@ -0,0 +1,75 @@
+from concurrent.futures import Future
+
+from processors.pipeline_context import PipelineContext
+
+
+def test_runs_keep_separate_step_outputs():
+    first = PipelineContext(request_id="r1")
+    second = PipelineContext(request_id="r2")
+
+    first.record_step_output(1, "idea", "first research")
+    second.record_step_output(1, "idea", "second research")
+
+    assert first.get_step_output(1) == "first research"
+    assert second.get_step_output(1) == "second research"
+    assert first.get_step_output(2) == ""
+
+
+def test_step_view_shares_outputs_but_not_step_data():
+    run = PipelineContext(request_id="r1", step_data={"market_research": "run data"})
+    step = run.for_step({"draft": "step data"})
+
+    step.record_step_output(2, "research", "draft text")
+
+    assert run.get_step_output(2) == "draft text"
+    assert step.step_data == {"draft": "step data"}
+    assert run.step_data == {"market_research": "run data"}
+    assert step.request_id == "r1"
+
+
+def test_record_step_output_checkpoints_and_truncates_input():
+    checkpoints = []
+    context = PipelineContext(checkpoint_callback=lambda *args: checkpoints.append(args))
+
+    context.record_step_output(3, "x" * 5000, "output")
+
+    assert checkpoints == [(3, "x" * 5000, "output")]
+    assert len(context.snapshot_step_outputs()[3]["input"]) == 1000
+
+
+def test_failing_checkpoint_callback_does_not_fail_the_step():
+    def broken(*args):
+        raise RuntimeError("database down")
+
+    context = PipelineContext(checkpoint_callback=broken)
+    context.record_step_output(1, "idea", "research")
+
+    assert context.get_step_output(1) == "research"
+
+
+def test_restored_outputs_are_not_checkpointed_again():
+    checkpoints = []
+    context = PipelineContext(checkpoint_callback=lambda *args: checkpoints.append(args))
+
+    context.restore_step_output(1, "saved research")
+
+    assert context.get_step_output(1) == "saved research"
+    assert checkpoints == []
+
+
+def test_emit_swallows_progress_callback_errors():
+    def broken(update):
+        raise RuntimeError("client gone")
+
+    PipelineContext(progress_callback=broken).emit({"step": 1})
+    PipelineContext().emit({"step": 1})
+
+
+def test_insight_futures_are_shared_with_step_views():
+    run = PipelineContext(request_id="r1")
+    future = Future()
+
+    run.for_step({}).track_insight(4, future)
+
+    assert run.get_insight_future(4) is future
+    assert run.get_insight_future(5) is None
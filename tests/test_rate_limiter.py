@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import (
+    ProviderRateLimiter, AdmissionTimeout, estimate_tokens,
+    PRIORITY_INTERACTIVE, PRIORITY_STEP, PRIORITY_INSIGHT, PRIORITY_BATCH
+)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "condition not reached in time"
+        time.sleep(0.005)
+
+
+def queue_waiters(limiter, priorities):
+    """Start one blocked acquire per priority, in order; returns (threads, admission order list)"""
+    admitted = []
+    threads = []
+    for index, priority in enumerate(priorities):
+        def acquire(priority=priority, index=index):
+            ticket = limiter.acquire(priority, timeout=5)
+            admitted.append((priority, index))
+            ticket.release()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: limiter.get_stats()['queued_now'] == index + 1)
+    return threads, admitted
+
+
+def test_waiters_are_admitted_by_priority():
+    limiter = ProviderRateLimiter('test', max_concurrency=1)
+    holder = limiter.acquire(PRIORITY_STEP)
+
+    threads, admitted = queue_waiters(limiter, [PRIORITY_BATCH, PRIORITY_INSIGHT, PRIORITY_INTERACTIVE, PRIORITY_STEP])
+    holder.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert [priority for priority, _ in admitted] == [PRIORITY_INTERACTIVE, PRIORITY_STEP, PRIORITY_INSIGHT, PRIORITY_BATCH]
+
+
+def test_equal_priorities_are_admitted_in_arrival_order():
+    limiter = ProviderRateLimiter('test', max_concurrency=1)
+    holder = limiter.acquire(PRIORITY_STEP)
+
+    threads, admitted = queue_waiters(limiter, [PRIORITY_STEP] * 3)
+    holder.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert [index for _, index in admitted] == [0, 1, 2]
+
+
+def test_acquire_times_out_when_no_slot_frees():
+    limiter = ProviderRateLimiter('test', max_concurrency=1)
+    limiter.acquire(PRIORITY_STEP)
+
+    with pytest.raises(AdmissionTimeout):
+        limiter.acquire(PRIORITY_INTERACTIVE, timeout=0.05)
+    assert limiter.get_stats()['timeouts'] == 1
+    assert limiter.get_stats()['queued_now'] == 0
+
+
+def test_overload_halves_the_concurrency_limit_once_per_cooldown():
+    limiter = ProviderRateLimiter('test', max_concurrency=8)
+
+    limiter.acquire().release(overloaded=True)
+    assert limiter.concurrency_limit == 4
+    # A second overload inside the cooldown is the same burst
+    limiter.acquire().release(overloaded=True)
+    assert limiter.concurrency_limit == 4
+    assert limiter.get_stats()['decreases'] == 1
+    assert limiter.get_stats()['overloads'] == 2
+
+
+def test_limit_recovers_additively_and_respects_bounds(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'AIMD_DECREASE_COOLDOWN_SECONDS', 0)
+    limiter = ProviderRateLimiter('test', max_concurrency=8, min_concurrency=2)
+
+    for _ in range(5):
+        limiter.acquire().release(overloaded=True)
+    assert limiter.concurrency_limit == 2
+
+    limiter.acquire().release()
+    assert limiter.concurrency_limit == pytest.approx(2.5)
+    for _ in range(200):
+        limiter.acquire().release()
+    assert limiter.concurrency_limit == 8
+
+
+def test_decreased_limit_caps_admissions(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'AIMD_DECREASE_COOLDOWN_SECONDS', 0)
+    limiter = ProviderRateLimiter('test', max_concurrency=2)
+    limiter.acquire().release(overloaded=True)
+
+    limiter.acquire()
+    with pytest.raises(AdmissionTimeout):
+        limiter.acquire(timeout=0.05)
+
+
+def test_token_bucket_refunds_overestimates():
+    limiter = ProviderRateLimiter('test', tpm=10000)
+    ticket = limiter.acquire(tokens=estimate_tokens(4000, 3000))
+    assert limiter.get_stats()['tpm_available'] == pytest.approx(6000, abs=5)
+
+    ticket.release(tokens_used=1000)
+    assert limiter.get_stats()['tpm_available'] == pytest.approx(9000, abs=5)
+
+
+def test_async_waiter_is_admitted_on_release():
+    async def scenario():
+        limiter = ProviderRateLimiter('test', max_concurrency=1)
+        holder = await limiter.aacquire(PRIORITY_STEP)
+        waiter = asyncio.ensure_future(limiter.aacquire(PRIORITY_INTERACTIVE, timeout=5))
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        holder.release()
+        ticket = await asyncio.wait_for(waiter, 2)
+        assert ticket.priority == PRIORITY_INTERACTIVE
+
+    asyncio.run(scenario())
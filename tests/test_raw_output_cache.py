@@ -0,0 +1,102 @@
+import os
+import time
+
+from utils.raw_output_cache import RawOutputCache
+
+
+def output(size=4000):
+    # Random hex keeps roughly half its size after compression, so entries have a predictable cost
+    return os.urandom(size // 2).hex()
+
+
+def cache_with_room_for(entries, ttl_seconds=3600):
+    """A cache whose byte budget fits `entries` single-output requests but not one more"""
+    probe = RawOutputCache(ttl_seconds=ttl_seconds)
+    probe.append_step_output('probe', 'step_1_Research', output())
+    per_entry = probe.get_stats()['resident_bytes']
+    return RawOutputCache(ttl_seconds=ttl_seconds, max_bytes=int(per_entry * (entries + 0.5)))
+
+
+def test_outputs_round_trip_through_compression():
+    cache = RawOutputCache()
+    text = "Press release draft\n" * 500
+
+    cache.append_step_output('r1', 'step_3_PressRelease', text)
+    entry = cache.get_entry('r1')
+
+    assert entry['steps_outputs'][0]['raw_output'] == text
+    stats = cache.get_stats()
+    assert stats['uncompressed_bytes'] == len(text)
+    assert stats['resident_bytes'] < len(text)
+
+
+def test_least_recently_written_entry_is_evicted_over_budget():
+    cache = cache_with_room_for(2)
+    cache.append_step_output('r1', 'step_1_Research', output())
+    cache.append_step_output('r2', 'step_1_Research', output())
+    # Writing to r1 again makes r2 the least recently used
+    cache.put_insight('r1', 1, 'short insight')
+
+    cache.append_step_output('r3', 'step_1_Research', output())
+
+    assert cache.get_entry('r2') is None
+    assert cache.get_entry('r1') is not None
+    assert cache.get_entry('r3') is not None
+    stats = cache.get_stats()
+    assert stats['evictions'] == 1
+    assert stats['resident_bytes'] <= cache.max_bytes
+
+
+def test_entry_being_written_is_never_evicted():
+    cache = cache_with_room_for(1)
+
+    for step_id in range(1, 4):
+        cache.append_step_output('r1', f'step_{step_id}_Step', output())
+
+    assert len(cache.get_entry('r1')['steps_outputs']) == 3
+    assert cache.get_stats()['resident_bytes'] > cache.max_bytes
+
+
+def test_byte_accounting_follows_removals_and_replaced_insights():
+    cache = cache_with_room_for(1)
+    cache.put_insight('r1', 2, 'x' * 100)
+    cache.put_insight('r1', 2, 'y' * 40)
+    assert cache.get_stats()['resident_bytes'] == 40
+
+    cache.append_step_output('r2', 'step_1_Research', output())
+    cache.append_step_output('r3', 'step_1_Research', output())
+
+    stats = cache.get_stats()
+    assert stats['entries'] == 1
+    assert stats['resident_bytes'] == cache.entry_bytes['r3'][0]
+
+
+def test_insights_are_counted_in_utf8_bytes():
+    cache = cache_with_room_for(1)
+    cache.put_insight('r1', 2, 'é' * 10)
+    assert cache.get_stats()['resident_bytes'] == 20
+
+    cache.put_insight('r1', 2, '→')
+    assert cache.get_stats()['resident_bytes'] == 3
+
+
+def test_expired_entries_are_dropped():
+    cache = RawOutputCache(ttl_seconds=0.05)
+    cache.append_step_output('r1', 'step_1_Research', output())
+    time.sleep(0.1)
+    cache.append_step_output('r2', 'step_1_Research', output())
+
+    assert cache.get_entry('r1') is None
+    assert cache.get_insights('r1') == {}
+    stats = cache.get_stats()
+    assert stats['expired'] == 1
+    assert stats['entries'] == 1
+
+
+def test_wait_for_insights_returns_once_stored():
+    cache = RawOutputCache()
+    assert cache.wait_for_insights('r1', timeout=0.01, step_id=3) == {}
+
+    cache.put_insight('r1', 3, 'insight', 'label')
+
+    assert cache.wait_for_insights('r1', timeout=1, step_id=3)[3]['insight'] == 'insight'
@@ -0,0 +1,224 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import anthropic
+import httpx
+import openai
+import pytest
+
+from config import CIRCUIT_BREAKER_ENABLED
+from utils.rate_limiter import AdmissionTimeout
+from utils.retry_policy import (
+    classify_error, retry_after_seconds, get_circuit_breaker, CircuitBreaker, CircuitOpenError, RetryPolicy,
+    RATE_LIMITED, OVERLOADED, SERVER_ERROR, TIMEOUT, CONNECTION, CONFLICT, CLIENT_ERROR,
+    ADMISSION_TIMEOUT, CIRCUIT_OPEN, UNKNOWN
+)
+
+REQUEST = httpx.Request('POST', 'https://api.example.com/v1/messages')
+
+
+def status_error(status_code, headers=None, sdk=anthropic):
+    response = httpx.Response(status_code, headers=headers or {}, request=REQUEST)
+    return sdk.APIStatusError(f"HTTP {status_code}", response=response, body=None)
+
+
+@pytest.mark.parametrize("status_code, expected", [
+    (429, RATE_LIMITED),
+    (529, OVERLOADED),
+    (503, OVERLOADED),
+    (500, SERVER_ERROR),
+    (502, SERVER_ERROR),
+    (408, TIMEOUT),
+    (409, CONFLICT),
+    (400, CLIENT_ERROR),
+    (401, CLIENT_ERROR),
+])
+@pytest.mark.parametrize("sdk", [anthropic, openai])
+def test_classify_status_codes(status_code, expected, sdk):
+    assert classify_error(status_error(status_code, sdk=sdk)) is expected
+
+
+def test_classify_error_body_sent_mid_stream():
+    error = anthropic.APIError("stream error", REQUEST, body={'type': 'error', 'error': {'type': 'overloaded_error'}})
+    assert classify_error(error) is OVERLOADED
+
+
+@pytest.mark.parametrize("error, expected", [
+    (anthropic.APITimeoutError(request=REQUEST), TIMEOUT),
+    (openai.APITimeoutError(request=REQUEST), TIMEOUT),
+    (httpx.ReadTimeout("read timed out"), TIMEOUT),
+    (TimeoutError(), TIMEOUT),
+    (anthropic.APIConnectionError(request=REQUEST), CONNECTION),
+    (httpx.ConnectError("refused"), CONNECTION),
+    (ConnectionResetError(), CONNECTION),
+    (AdmissionTimeout("queued too long"), ADMISSION_TIMEOUT),
+    (CircuitOpenError('anthropic', 5.0), CIRCUIT_OPEN),
+    (ValueError("bad prompt"), UNKNOWN),
+])
+def test_classify_exception_types(error, expected):
+    assert classify_error(error) is expected
+
+
+def test_only_provider_failures_are_retried_or_trip_the_circuit():
+    assert RATE_LIMITED.retryable and not RATE_LIMITED.trips_circuit and RATE_LIMITED.overload
+    assert OVERLOADED.retryable and OVERLOADED.trips_circuit
+    assert not CLIENT_ERROR.retryable and not CLIENT_ERROR.trips_circuit
+    assert not UNKNOWN.retryable
+
+
+def test_retry_after_ms_takes_precedence():
+    error = status_error(429, {'retry-after-ms': '1500', 'retry-after': '9'})
+    assert retry_after_seconds(error) == 1.5
+
+
+def test_retry_after_seconds_header():
+    assert retry_after_seconds(status_error(529, {'retry-after': '7'})) == 7.0
+
+
+def test_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    error = status_error(503, {'retry-after': format_datetime(retry_at, usegmt=True)})
+    assert retry_after_seconds(error) == pytest.approx(30, abs=2)
+
+
+@pytest.mark.parametrize("headers", [{}, {'retry-after': 'soon'}, {'retry-after-ms': 'x'}])
+def test_retry_after_missing_or_invalid(headers):
+    assert retry_after_seconds(status_error(429, headers)) is None
+
+
+def test_retry_after_without_response():
+    assert retry_after_seconds(ValueError("no response")) is None
+
+
+def test_past_retry_after_date_means_no_wait():
+    error = status_error(503, {'retry-after': format_datetime(datetime.now(timezone.utc) - timedelta(minutes=1), usegmt=True)})
+    assert retry_after_seconds(error) == 0.0
+
+
+def test_circuit_opens_after_consecutive_provider_failures():
+    breaker = CircuitBreaker('test', failure_threshold=3, open_seconds=60)
+
+    breaker.record_failure(SERVER_ERROR)
+    breaker.record_failure(TIMEOUT)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure(OVERLOADED)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_in <= 60
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_client_errors_and_successes_keep_the_circuit_closed():
+    breaker = CircuitBreaker('test', failure_threshold=2, open_seconds=60)
+
+    breaker.record_failure(SERVER_ERROR)
+    breaker.record_success()
+    breaker.record_failure(SERVER_ERROR)
+    for _ in range(5):
+        breaker.record_failure(CLIENT_ERROR)
+        breaker.record_failure(RATE_LIMITED)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 1
+
+
+def open_breaker(open_seconds=0.05):
+    breaker = CircuitBreaker('test', failure_threshold=1, open_seconds=open_seconds)
+    breaker.record_failure(SERVER_ERROR)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(open_seconds + 0.01)
+    return breaker
+
+
+def test_half_open_admits_one_probe():
+    breaker = open_breaker()
+
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probe_closes_the_circuit():
+    breaker = open_breaker()
+    breaker.before_call()
+
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = open_breaker()
+    breaker.before_call()
+
+    breaker.record_failure(TIMEOUT)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()['opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_answered_with_client_error_closes_the_circuit():
+    breaker = open_breaker()
+    breaker.before_call()
+
+    breaker.record_failure(CLIENT_ERROR)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_lost_probe_does_not_wedge_the_circuit():
+    breaker = open_breaker()
+    breaker.before_call()  # probe that never reports back
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_retry_waits_at_least_the_server_retry_after():
+    retry = RetryPolicy('test', max_attempts=3, base_delay=0.01, max_delay=0.02).begin(CircuitBreaker('test'))
+    retry.start_attempt()
+
+    delay = retry.failed(status_error(529, {'retry-after': '2'}))
+
+    assert delay >= 2
+    assert retry.last_error_class is OVERLOADED
+
+
+def test_retry_gives_up_on_client_errors_and_exhausted_attempts():
+    policy = RetryPolicy('test', max_attempts=2, base_delay=0.01, max_delay=0.02)
+    retry = policy.begin(CircuitBreaker('test'))
+    retry.start_attempt()
+    assert retry.failed(status_error(400)) is None
+
+    retry = policy.begin(CircuitBreaker('test'))
+    retry.start_attempt()
+    assert retry.failed(status_error(500)) is not None
+    retry.start_attempt()
+    assert retry.failed(status_error(500)) is None
+
+
+def test_retry_failures_feed_the_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=2, open_seconds=60)
+    retry = RetryPolicy('test', max_attempts=5, base_delay=0.01, max_delay=0.02, total_timeout=120).begin(breaker)
+
+    for _ in range(2):
+        retry.start_attempt()
+        retry.failed(status_error(500))
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        retry.start_attempt()
+
+
+@pytest.mark.skipif(not CIRCUIT_BREAKER_ENABLED, reason="circuit breakers disabled")
+def test_insight_calls_have_their_own_breaker():
+    assert get_circuit_breaker('anthropic:insight') is not get_circuit_breaker('anthropic')
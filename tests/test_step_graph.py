@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from config import WORKING_BACKWARDS_STEPS
+from processors.step_graph import build_step_graph, StepGraphScheduler
+
+
+# 1 -> {2, 3}; 4 needs 2 and 3; 5 needs only 2
+STEPS = [
+    {"id": 1, "input_key": "product_idea", "output_key": "research"},
+    {"id": 2, "input_key": "research", "output_key": "draft"},
+    {"id": 3, "input_key": "research", "output_key": "validation"},
+    {"id": 4, "input_key": "draft", "context_keys": ["validation"], "output_key": "faq"},
+    {"id": 5, "input_key": "draft", "output_key": "summary"},
+]
+
+
+def test_build_step_graph_dependencies():
+    assert build_step_graph(STEPS) == {1: set(), 2: {1}, 3: {1}, 4: {2, 3}, 5: {2}}
+
+
+def test_build_step_graph_accepts_pipeline_config():
+    graph = build_step_graph(WORKING_BACKWARDS_STEPS)
+    assert set(graph) == {step["id"] for step in WORKING_BACKWARDS_STEPS}
+
+
+def test_build_step_graph_rejects_cycle():
+    steps = [
+        {"id": 1, "input_key": "product_idea", "output_key": "a"},
+        {"id": 2, "input_key": "a", "context_keys": ["c"], "output_key": "b"},
+        {"id": 3, "input_key": "b", "output_key": "c"},
+    ]
+    with pytest.raises(ValueError, match="cycle"):
+        build_step_graph(steps)
+
+
+def test_build_step_graph_rejects_self_dependency():
+    with pytest.raises(ValueError, match="cycle"):
+        build_step_graph([{"id": 1, "input_key": "a", "output_key": "a"}])
+
+
+def test_build_step_graph_rejects_missing_producer():
+    with pytest.raises(ValueError, match="no step produces"):
+        build_step_graph([{"id": 1, "input_key": "unknown", "output_key": "a"}])
+
+
+class Recorder:
+    """execute_step stand-in that records when each step started and finished"""
+
+    def __init__(self, fail=(), delays=None):
+        self.fail = set(fail)
+        self.delays = delays or {}
+        self.lock = threading.Lock()
+        self.events = []
+        self.inputs = {}
+
+    def _record(self, event, step_id):
+        with self.lock:
+            self.events.append((event, step_id))
+
+    def _result(self, step_id):
+        if step_id in self.fail:
+            return {"error": f"step {step_id} broke"}
+        return {"output": f"out{step_id}"}
+
+    def __call__(self, step_id, input_text, step_data):
+        self._record("start", step_id)
+        self.inputs[step_id] = (input_text, step_data)
+        time.sleep(self.delays.get(step_id, 0.01))
+        self._record("end", step_id)
+        return self._result(step_id)
+
+    async def run_async(self, step_id, input_text, step_data):
+        self._record("start", step_id)
+        self.inputs[step_id] = (input_text, step_data)
+        await asyncio.sleep(self.delays.get(step_id, 0.01))
+        self._record("end", step_id)
+        return self._result(step_id)
+
+    def started(self):
+        return [step_id for event, step_id in self.events if event == "start"]
+
+    def assert_dependency_order(self, graph):
+        finished = set()
+        for event, step_id in self.events:
+            if event == "start":
+                assert graph[step_id] <= finished, f"step {step_id} started before {graph[step_id] - finished}"
+            else:
+                finished.add(step_id)
+
+
+def run_scheduler(recorder, use_async, **kwargs):
+    scheduler = StepGraphScheduler(STEPS, max_workers=2)
+    if use_async:
+        return asyncio.run(scheduler.arun("idea", recorder.run_async, **kwargs))
+    return scheduler.run("idea", recorder, **kwargs)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_scheduler_runs_steps_in_dependency_order(use_async):
+    recorder = Recorder()
+    outputs, failure = run_scheduler(recorder, use_async)
+
+    assert failure is None
+    assert sorted(recorder.started()) == [1, 2, 3, 4, 5]
+    recorder.assert_dependency_order(build_step_graph(STEPS))
+    assert outputs["faq"] == "out4"
+    assert recorder.inputs[1] == ("idea", {})
+    assert recorder.inputs[4] == ("out2", {"validation": "out3"})
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_scheduler_stops_scheduling_after_first_failure(use_async):
+    # Step 3 fails while step 2 is still running; step 5 becomes ready once 2 ends but must not start
+    recorder = Recorder(fail={3}, delays={2: 0.1})
+    outputs, failure = run_scheduler(recorder, use_async)
+
+    assert failure == {"error": "step 3 broke", "step": 3}
+    assert sorted(recorder.started()) == [1, 2, 3]
+    assert outputs["draft"] == "out2"
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_scheduler_skips_completed_steps(use_async):
+    recorder = Recorder()
+    outputs, failure = run_scheduler(recorder, use_async, completed_steps={1: "saved research", 2: "saved draft"})
+
+    assert failure is None
+    assert sorted(recorder.started()) == [3, 4, 5]
+    assert recorder.inputs[3] == ("saved research", {})
+    assert outputs["draft"] == "saved draft"
+
+
+def test_scheduler_caps_in_flight_steps():
+    in_flight = []
+    active = set()
+    lock = threading.Lock()
+
+    def execute_step(step_id, input_text, step_data):
+        with lock:
+            active.add(step_id)
+            in_flight.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.discard(step_id)
+        return {"output": f"out{step_id}"}
+
+    wide = [{"id": 1, "input_key": "product_idea", "output_key": "root"}] + [
+        {"id": step_id, "input_key": "root", "output_key": f"leaf{step_id}"} for step_id in range(2, 8)
+    ]
+    _, failure = StepGraphScheduler(wide, max_workers=2).run("idea", execute_step)
+
+    assert failure is None
+    assert max(in_flight) <= 2
@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from config import BACKGROUND_TIMER_TICK_SECONDS, BACKGROUND_TIMER_WHEEL_SLOTS, BACKGROUND_EXECUTORS
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised by BoundedExecutor.submit when its queue is full"""
+
+
+class BoundedExecutor:
+    """
+    Named thread pool with a fixed worker count and a bounded queue.
+
+    Workers are started on demand up to max_workers and then reused, so a burst
+    of work makes the queue longer rather than creating threads. Submitting to a
+    full queue raises ExecutorSaturated instead of growing without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                      'busy_seconds': 0.0, 'max_queue_depth': 0, 'max_queue_wait_seconds': 0.0}
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) for a worker.
+
+        Returns:
+            concurrent.futures.Future of the call's result
+
+        Raises:
+            ExecutorSaturated: max_queue tasks are already waiting for a worker
+        """
+        with self.lock:
+            if self.queued >= self.max_queue:
+                self.stats['rejected'] += 1
+                metrics.executor_tasks.inc(executor=self.name, outcome='rejected')
+                raise ExecutorSaturated(f"Executor '{self.name}' queue is full ({self.max_queue} waiting)")
+            self.queued += 1
+            self.stats['submitted'] += 1
+            if self.queued > self.stats['max_queue_depth']:
+                self.stats['max_queue_depth'] = self.queued
+        try:
+            return self._executor.submit(self._run, time.monotonic(), fn, args, kwargs)
+        except Exception:
+            with self.lock:
+                self.queued -= 1
+            raise
+
+    async def arun(self, fn: Callable, *args):
+        """
+        Await fn(*args) on a worker from a coroutine, keeping blocking work off the event loop.
+
+        fn runs in a copy of the caller's context, so it stays inside the active
+        trace span. If the queue is full the call runs inline instead: callers on
+        the loop have no way to retry work they have already started.
+
+        Returns:
+            fn's return value
+        """
+        loop = asyncio.get_running_loop()
+        bound = tracing.bind_context(fn)
+        try:
+            return await loop.run_in_executor(self, bound, *args)
+        except ExecutorSaturated as e:
+            logger.warning(f"{e}; running {getattr(fn, '__qualname__', fn)} on the event loop")
+            return bound(*args)
+
+    def _run(self, submitted_at, fn, args, kwargs):
+        started = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+            self.stats['max_queue_wait_seconds'] = max(self.stats['max_queue_wait_seconds'], started - submitted_at)
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            busy = time.monotonic() - started
+            outcome = 'failed' if failed else 'completed'
+            with self.lock:
+                self.active -= 1
+                self.stats['busy_seconds'] += busy
+                self.stats[outcome] += 1
+            metrics.executor_busy_seconds.inc(busy, executor=self.name)
+            metrics.executor_tasks.inc(executor=self.name, outcome=outcome)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats, queue_depth=self.queued, active_workers=self.active)
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        stats['utilization'] = round(stats['active_workers'] / self.max_workers, 3)
+        return stats
+
+
+class TimerHandle:
+    """A callback scheduled on a TimerWheel; cancel() stops it (and, if periodic, its repeats)"""
+
+    __slots__ = ('wheel', 'callback', 'owner', 'interval', 'executor', 'deadline', 'rounds', 'cancelled', 'fired')
+
+    def __init__(self, wheel, callback, owner, interval, executor):
+        self.wheel = wheel
+        self.callback = callback
+        self.owner = owner
+        self.interval = interval
+        self.executor = executor
+        self.deadline = 0.0
+        self.rounds = 0
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def active(self) -> bool:
+        return not self.cancelled and not (self.fired and self.interval is None)
+
+    def cancel(self) -> bool:
+        """Cancel the timer; returns False if it already fired (one-shot) or was cancelled"""
+        return self.wheel.cancel(self)
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel running every delayed and periodic callback on one thread.
+
+    Time is divided into ticks of tick_seconds spread over a ring of slots; a
+    timer lives in the slot of its deadline tick with a count of remaining
+    full rotations, so scheduling and cancelling are O(1) however many timers
+    are pending. Callbacks run on the wheel thread and must be quick (e.g.
+    pushing a progress event); anything that blocks should name an executor
+    and is submitted to it when due.
+
+    Timers may carry an owner (the request_id for per-request timers) so
+    everything a finished request left behind can be cancelled in one call.
+    """
+
+    def __init__(self, tick_seconds: float = BACKGROUND_TIMER_TICK_SECONDS, slots: int = BACKGROUND_TIMER_WHEEL_SLOTS,
+                 name: str = "timer-wheel"):
+        self.tick_seconds = tick_seconds
+        self.slots = [[] for _ in range(max(1, slots))]
+        self.name = name
+        self.condition = threading.Condition()
+        self.by_owner = {}  # owner -> set of live TimerHandles
+        self.pending = 0
+        self._origin = time.monotonic()
+        self._tick = 0  # last tick processed
+        self._thread = None
+        self._stopping = False
+        self.stats = {'scheduled': 0, 'fired': 0, 'cancelled': 0, 'callback_errors': 0, 'rejected': 0, 'max_lag_seconds': 0.0}
+
+    def schedule(self, delay: float, callback: Callable[[], Any], owner: Optional[str] = None,
+                 executor: Optional[BoundedExecutor] = None) -> TimerHandle:
+        """
+        Run callback once after delay seconds.
+
+        Args:
+            delay: Seconds from now; rounded up to the next tick
+            callback: Zero-argument callable
+            owner: Optional key (e.g. request_id) for cancel_owner
+            executor: Run the callback on this executor instead of the wheel thread
+
+        Returns:
+            TimerHandle that can cancel the callback
+        """
+        handle = TimerHandle(self, callback, owner, None, executor)
+        self._add(handle, time.monotonic() + max(0.0, delay), new=True)
+        return handle
+
+    def schedule_periodic(self, interval: float, callback: Callable[[], Any], owner: Optional[str] = None,
+                          executor: Optional[BoundedExecutor] = None, initial_delay: Optional[float] = None) -> TimerHandle:
+        """
+        Run callback every interval seconds until cancelled.
+
+        Args:
+            interval: Seconds between runs
+            callback: Zero-argument callable
+            owner: Optional key (e.g. request_id) for cancel_owner
+            executor: Run the callback on this executor instead of the wheel thread
+            initial_delay: Seconds before the first run (defaults to interval)
+
+        Returns:
+            TimerHandle that stops the repeats
+        """
+        handle = TimerHandle(self, callback, owner, max(self.tick_seconds, interval), executor)
+        self._add(handle, time.monotonic() + (interval if initial_delay is None else max(0.0, initial_delay)), new=True)
+        return handle
+
+    def _add(self, handle: TimerHandle, deadline: float, new: bool = False):
+        with self.condition:
+            if handle.cancelled:
+                return
+            self._ensure_thread()
+            if self.pending == 0 and new:
+                # Nothing was due while idle; skip the empty ticks instead of walking them
+                self._tick = max(self._tick, int((time.monotonic() - self._origin) / self.tick_seconds))
+            target = max(self._tick + 1, math.ceil((deadline - self._origin) / self.tick_seconds))
+            handle.deadline = deadline
+            handle.rounds = (target - self._tick - 1) // len(self.slots)
+            self.slots[target % len(self.slots)].append(handle)
+            if new:
+                self.pending += 1
+                self.stats['scheduled'] += 1
+                if handle.owner is not None:
+                    self.by_owner.setdefault(handle.owner, set()).add(handle)
+            self.condition.notify()
+
+    def cancel(self, handle: TimerHandle) -> bool:
+        with self.condition:
+            if not handle.active:
+                return False
+            handle.cancelled = True
+            self._forget(handle)
+            self.stats['cancelled'] += 1
+            # The handle stays in its slot and is dropped when the wheel reaches it
+            return True
+
+    def cancel_owner(self, owner: str) -> int:
+        """Cancel every pending timer of an owner; returns how many were cancelled"""
+        with self.condition:
+            handles = list(self.by_owner.get(owner, ()))
+        return sum(1 for handle in handles if self.cancel(handle))
+
+    def _forget(self, handle: TimerHandle):
+        """Stop counting a timer that will not fire again (caller holds self.condition)"""
+        self.pending -= 1
+        owned = self.by_owner.get(handle.owner)
+        if owned is not None:
+            owned.discard(handle)
+            if not owned:
+                del self.by_owner[handle.owner]
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _collect_due(self):
+        """Advance over every elapsed tick and return the timers due (caller holds self.condition)"""
+        now = time.monotonic()
+        current = int((now - self._origin) / self.tick_seconds)
+        due = []
+        while self._tick < current:
+            self._tick += 1
+            slot = self.slots[self._tick % len(self.slots)]
+            keep = []
+            for handle in slot:
+                if handle.cancelled:
+                    continue
+                if handle.rounds > 0:
+                    handle.rounds -= 1
+                    keep.append(handle)
+                    continue
+                due.append(handle)
+            slot[:] = keep
+        for handle in due:
+            self.stats['max_lag_seconds'] = max(self.stats['max_lag_seconds'], now - handle.deadline)
+            handle.fired = True
+            if handle.interval is None:
+                self._forget(handle)
+        return due
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending == 0 and not self._stopping:
+                    self.condition.wait()
+                if self._stopping:
+                    return
+                due = self._collect_due()
+            for handle in due:
+                self._fire(handle)
+                if handle.interval is not None:
+                    self._add(handle, handle.deadline + handle.interval)
+            with self.condition:
+                if self.pending:
+                    next_tick_at = self._origin + (self._tick + 1) * self.tick_seconds
+                    self.condition.wait(max(0.0, next_tick_at - time.monotonic()))
+
+    def _fire(self, handle: TimerHandle):
+        with self.condition:
+            if handle.cancelled:
+                return
+            self.stats['fired'] += 1
+        if handle.executor is not None:
+            try:
+                handle.executor.submit(self._call, handle)
+            except ExecutorSaturated as e:
+                with self.condition:
+                    self.stats['rejected'] += 1
+                logger.warning(f"Timer callback dropped: {e}")
+            return
+        self._call(handle)
+
+    def _call(self, handle: TimerHandle):
+        try:
+            handle.callback()
+        except Exception as e:
+            with self.condition:
+                self.stats['callback_errors'] += 1
+            logger.error(f"Timer callback failed (owner: {handle.owner}): {e}", exc_info=True)
+
+    def stop(self):
+        with self.condition:
+            self._stopping = True
+            self.condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            stats = dict(self.stats, pending=self.pending, owners=len(self.by_owner))
+        stats['tick_seconds'] = self.tick_seconds
+        stats['slots'] = len(self.slots)
+        return stats
+
+
+class BackgroundService:
+    """
+    The process's shared timer wheel and named bounded executors.
+
+    Executors (see BACKGROUND_EXECUTORS):
+        pipeline: threaded pipeline runs (one task per run)
+        step: blocking step calls of threaded pipeline runs
+        insight: insight extraction batches
+        io: blocking side work (async pipeline completion bookkeeping, TTL sweeps)
+    """
+
+    def __init__(self, executors: Optional[Dict[str, Dict[str, int]]] = None, timers: Optional[TimerWheel] = None):
+        self.timers = timers or TimerWheel()
+        self.executors = {
+            name: BoundedExecutor(name, spec['workers'], spec['max_queue'])
+            for name, spec in (BACKGROUND_EXECUTORS if executors is None else executors).items()
+        }
+        logger.info(f"BackgroundService initialized (executors: {', '.join(f'{name}={executor.max_workers}' for name, executor in self.executors.items())})")
+
+    def executor(self, name: str) -> BoundedExecutor:
+        """Named executor; raises KeyError for an unknown name"""
+        return self.executors[name]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'timers': self.timers.get_stats(),
+            'executors': {name: executor.get_stats() for name, executor in self.executors.items()},
+            'threads': threading.active_count()
+        }
+
+
+# Global instance
+background_service = None
+_background_service_lock = threading.Lock()
+
+def get_background_service() -> BackgroundService:
+    """Get or create the background service instance"""
+    global background_service
+    if background_service is None:
+        with _background_service_lock:
+            if background_service is None:
+                background_service = BackgroundService()
+    return background_service
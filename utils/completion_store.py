@@ -0,0 +1,340 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from config import (
+    COMPLETION_STORE_BACKEND, COMPLETION_STORE_DB_PATH, COMPLETION_STATE_TTL_SECONDS,
+    COMPLETION_STORE_JANITOR_INTERVAL_SECONDS, COMPLETION_STORE_JANITOR_BATCH_SIZE,
+    COMPLETION_STORE_COMPRESSION_LEVEL, DATABASE_BUSY_TIMEOUT_MS, DATABASE_SYNCHRONOUS
+)
+from utils.background import get_background_service
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionStateStore:
+    """
+    Completion state of each pipeline run ('processing', 'completed', 'failed'),
+    read by /api/check-completion and the resume endpoint independently of the stream.
+
+    Every put bumps the request's version, so pollers can pass the last version
+    they saw and get back only the status line when nothing changed. A state is
+    returned as a dict:
+
+        {'status', 'version', 'timestamp', 'modified',
+         'result', 'error', 'step_outputs'}   # payload keys only when modified
+    """
+
+    name = None
+
+    def __init__(self, ttl_seconds: int = COMPLETION_STATE_TTL_SECONDS,
+                 compression_level: int = COMPLETION_STORE_COMPRESSION_LEVEL):
+        self.ttl_seconds = ttl_seconds
+        self.compression_level = compression_level
+        self.lock = threading.Lock()
+        self.stats = {'puts': 0, 'reads': 0, 'not_modified': 0, 'misses': 0, 'expired': 0, 'errors': 0}
+
+    def put(self, request_id: str, status: str, result=None, error=None, step_outputs=None) -> Optional[int]:
+        """
+        Store a request's completion state, replacing the previous one.
+
+        Args:
+            request_id: Request ID of the pipeline run
+            status: 'processing', 'completed' or 'failed'
+            result: Final pipeline result (completed runs)
+            error: Error message (failed runs)
+            step_outputs: Step outputs kept for missing-step recovery
+
+        Returns:
+            The state's new version, or None if it could not be stored
+        """
+        raise NotImplementedError
+
+    def get(self, request_id: str, if_newer_than: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Read a request's completion state.
+
+        Args:
+            request_id: Request ID of the pipeline run
+            if_newer_than: Version the caller already has; when the stored version
+                is not newer the payload is skipped and 'modified' is False
+
+        Returns:
+            The state dict, or None if the request is unknown or its state expired
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _count(self, stat: str, amount: int = 1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def _encode(self, result, error, step_outputs) -> bytes:
+        payload = {'result': result, 'error': error, 'step_outputs': step_outputs or {}}
+        encoded = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+        return zlib.compress(encoded, self.compression_level)
+
+    @staticmethod
+    def _decode(payload: bytes) -> Dict[str, Any]:
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+    @staticmethod
+    def _state(status: str, version: int, timestamp: float, payload: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        state = {'status': status, 'version': version, 'timestamp': timestamp, 'modified': payload is not None}
+        if payload is not None:
+            state.update(payload)
+        return state
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        stats['backend'] = self.name
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+
+class MemoryCompletionStateStore(CompletionStateStore):
+    """
+    Per-process store. States live in an OrderedDict ordered by last write; with
+    one TTL for every state the front entry is always the next to expire, so
+    cleanup only pops from the front. Only correct with a single worker process.
+    """
+
+    name = 'memory'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.entries = OrderedDict()  # request_id -> (status, version, updated_at, compressed payload)
+        self.resident_bytes = 0
+
+    def _expire(self, now: float):
+        """Drop expired states from the front of the write order (caller holds self.lock)"""
+        while self.entries:
+            request_id, entry = next(iter(self.entries.items()))
+            if now - entry[2] <= self.ttl_seconds:
+                return
+            del self.entries[request_id]
+            self.resident_bytes -= len(entry[3])
+            self.stats['expired'] += 1
+
+    def put(self, request_id, status, result=None, error=None, step_outputs=None):
+        payload = self._encode(result, error, step_outputs)
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            previous = self.entries.pop(request_id, None)
+            version = 1
+            if previous is not None:
+                version = previous[1] + 1
+                self.resident_bytes -= len(previous[3])
+            self.entries[request_id] = (status, version, now, payload)
+            self.resident_bytes += len(payload)
+            self.stats['puts'] += 1
+        return version
+
+    def get(self, request_id, if_newer_than=None):
+        with self.lock:
+            self._expire(time.time())
+            entry = self.entries.get(request_id)
+            self.stats['reads'] += 1
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if if_newer_than is not None and entry[1] <= if_newer_than:
+                self.stats['not_modified'] += 1
+                return self._state(entry[0], entry[1], entry[2], None)
+        return self._state(entry[0], entry[1], entry[2], self._decode(entry[3]))
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self.lock:
+            stats['entries'] = len(self.entries)
+            stats['payload_bytes'] = self.resident_bytes
+        return stats
+
+
+class SQLiteCompletionStateStore(CompletionStateStore):
+    """
+    Store shared by every worker process on the host through one SQLite file in
+    WAL mode, so /api/check-completion works whichever worker the poll lands on.
+
+    Each thread keeps its own connection. Payloads (result, error, step outputs)
+    are stored as zlib-compressed compact JSON and only read and decompressed
+    when the caller's version is stale. Reads filter on expires_at, and a
+    janitor on the background timer wheel deletes expired rows in small
+    batches through the expires_at index instead of sweeping on every read.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str = COMPLETION_STORE_DB_PATH,
+                 janitor_interval: float = COMPLETION_STORE_JANITOR_INTERVAL_SECONDS,
+                 janitor_batch_size: int = COMPLETION_STORE_JANITOR_BATCH_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self.janitor_interval = janitor_interval
+        self.janitor_batch_size = max(1, janitor_batch_size)
+        self._local = threading.local()
+        self._stopping = threading.Event()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._init_database()
+        self._janitor = None
+        if self.janitor_interval > 0:
+            background = get_background_service()
+            self._janitor = background.timers.schedule_periodic(
+                self.janitor_interval, self._run_janitor, executor=background.executor('io')
+            )
+        logger.info(f"SQLiteCompletionStateStore initialized (path: {db_path}, ttl: {self.ttl_seconds}s)")
+
+    def _create_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=DATABASE_BUSY_TIMEOUT_MS / 1000)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={DATABASE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA busy_timeout={DATABASE_BUSY_TIMEOUT_MS}')
+        return conn
+
+    def _connection(self):
+        """This thread's connection, opened on first use; closed when the thread exits"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._create_connection()
+            self._local.conn = conn
+        return conn
+
+    def _init_database(self):
+        """Initialize schema if not exists"""
+        with self._connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS completion_states (
+                    request_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_completion_states_expires_at ON completion_states(expires_at)')
+
+    def put(self, request_id, status, result=None, error=None, step_outputs=None):
+        payload = self._encode(result, error, step_outputs)
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                # An expired row restarts at version 1, as if it had been cleaned up already
+                conn.execute('''
+                    INSERT INTO completion_states (request_id, status, version, updated_at, expires_at, payload)
+                    VALUES (?, ?, 1, ?, ?, ?)
+                    ON CONFLICT(request_id) DO UPDATE SET
+                        status = excluded.status,
+                        version = CASE WHEN completion_states.expires_at > excluded.updated_at
+                                       THEN completion_states.version + 1 ELSE 1 END,
+                        updated_at = excluded.updated_at,
+                        expires_at = excluded.expires_at,
+                        payload = excluded.payload
+                ''', (request_id, status, now, now + self.ttl_seconds, payload))
+                row = conn.execute('SELECT version FROM completion_states WHERE request_id = ?', (request_id,)).fetchone()
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.error(f"[{request_id}] Failed to store completion state: {e}")
+            return None
+        self._count('puts')
+        return row[0]
+
+    def get(self, request_id, if_newer_than=None):
+        try:
+            # The payload column is only read when the caller's version is stale
+            row = self._connection().execute('''
+                SELECT status, version, updated_at,
+                       CASE WHEN ? IS NULL OR version > ? THEN payload END
+                FROM completion_states
+                WHERE request_id = ? AND expires_at > ?
+            ''', (if_newer_than, if_newer_than, request_id, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.error(f"[{request_id}] Failed to read completion state: {e}")
+            return None
+
+        with self.lock:
+            self.stats['reads'] += 1
+            if row is None:
+                self.stats['misses'] += 1
+            elif row[3] is None:
+                self.stats['not_modified'] += 1
+        if row is None:
+            return None
+        status, version, updated_at, payload = row
+        return self._state(status, version, updated_at, self._decode(payload) if payload is not None else None)
+
+    def purge_expired(self) -> int:
+        """Delete expired states a batch at a time; returns the number of rows removed"""
+        removed = 0
+        while not self._stopping.is_set():
+            with self._connection() as conn:
+                cursor = conn.execute('''
+                    DELETE FROM completion_states WHERE request_id IN (
+                        SELECT request_id FROM completion_states WHERE expires_at <= ? LIMIT ?
+                    )
+                ''', (time.time(), self.janitor_batch_size))
+            removed += cursor.rowcount
+            if cursor.rowcount < self.janitor_batch_size:
+                break
+        if removed:
+            self._count('expired', removed)
+            logger.info(f"Completion store janitor removed {removed} expired states")
+        return removed
+
+    def _run_janitor(self):
+        try:
+            self.purge_expired()
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.error(f"Completion store janitor failed: {e}")
+
+    def close(self):
+        """Stop the janitor; per-thread connections close with their threads"""
+        self._stopping.set()
+        if self._janitor is not None:
+            self._janitor.cancel()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        try:
+            entries, payload_bytes = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM completion_states'
+            ).fetchone()
+            stats['entries'] = entries
+            stats['payload_bytes'] = payload_bytes
+        except sqlite3.Error as e:
+            logger.error(f"Completion store stats query failed: {e}")
+        stats['db_path'] = self.db_path
+        return stats
+
+
+COMPLETION_STORES = {
+    'sqlite': SQLiteCompletionStateStore,
+    'memory': MemoryCompletionStateStore,
+}
+
+# Global instance
+completion_store = None
+_completion_store_lock = threading.Lock()
+
+def get_completion_store() -> CompletionStateStore:
+    """Get or create the completion state store selected by COMPLETION_STORE_BACKEND"""
+    global completion_store
+    if completion_store is None:
+        with _completion_store_lock:
+            if completion_store is None:
+                store_class = COMPLETION_STORES.get(COMPLETION_STORE_BACKEND)
+                if store_class is None:
+                    raise ValueError(f"Unknown COMPLETION_STORE_BACKEND '{COMPLETION_STORE_BACKEND}'; expected one of {sorted(COMPLETION_STORES)}")
+                completion_store = store_class()
+    return completion_store
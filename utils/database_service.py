@@ -1,22 +1,78 @@
 import sqlite3
 import logging
+import atexit
 import threading
+import weakref
 import os
+import re
+import html
+import time
+from collections import OrderedDict
 from datetime import datetime, date
 from typing import Optional, Dict, List, Any
 import json
+from config import (
+    DATABASE_SYNCHRONOUS, DATABASE_CACHE_SIZE_KB, DATABASE_BUSY_TIMEOUT_MS, DATABASE_SESSION_MEMO_SIZE,
+    REPORTING_SEARCH_TOKENIZER, REPORTING_SEARCH_PREFIX_INDEX, REPORTING_SEARCH_SNIPPET_TOKENS,
+    REPORTING_SEARCH_MAX_RANKED_MATCHES
+)
 
 logger = logging.getLogger(__name__)
 
+# LLM telemetry columns (see utils/llm_telemetry.CallTelemetry.to_record) beyond the original schema
+TOKEN_USAGE_COLUMNS = [
+    ('input_tokens', 'INTEGER'),
+    ('output_tokens', 'INTEGER'),
+    ('cache_read_tokens', 'INTEGER'),
+    ('cache_write_tokens', 'INTEGER'),
+    ('attempts', 'INTEGER'),
+]
+STEP_OUTPUT_TELEMETRY_COLUMNS = TOKEN_USAGE_COLUMNS
+INSIGHT_TELEMETRY_COLUMNS = [
+    ('model_used', 'TEXT'),
+    ('duration_seconds', 'REAL'),
+    ('token_count', 'INTEGER'),
+    ('cost_estimate', 'REAL'),
+    *TOKEN_USAGE_COLUMNS,
+    ('batch_size', 'INTEGER'),
+]
+
+# Run lease of a session: the worker process running its pipeline and when that claim lapses
+SESSION_LEASE_COLUMNS = [
+    ('lease_owner', 'TEXT'),
+    ('lease_expires_at', 'REAL'),
+]
+
+# FTS5 external-content indexes over source table text columns, kept in sync by triggers:
+# index name -> (source table, indexed columns)
+SEARCH_INDEXES = {
+    'ideas_fts': ('processing_sessions', ['original_idea']),
+    'step_outputs_fts': ('step_outputs', ['output_text', 'raw_llm_output']),
+}
+# Snippet match markers; replaced with <mark> after the snippet text is HTML-escaped
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
 class DatabaseService:
     """
     Database service for storing processing sessions, step outputs, and insights for reporting.
     Uses SQLite for simplicity and zero external dependencies.
+    
+    Each thread keeps one long-lived connection in WAL mode, so writes skip
+    connection setup and reuse the connection's prepared-statement cache, and
+    readers never block the writer. Session ids are memoized per request_id.
     """
     
+    # Per-connection cache of compiled statements reused across calls
+    STATEMENT_CACHE_SIZE = 256
+    
     def __init__(self, db_path: str = "data/reporting.db"):
         self.db_path = db_path
         self.lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = {}  # thread ident -> (weakref to thread, connection)
+        self._session_ids = OrderedDict()  # request_id -> session_id, LRU-bounded
+        self.search_index_enabled = False  # set once the FTS5 indexes exist
         self._ensure_db_directory()
         self._init_database()
         logger.info(f"DatabaseService initialized with SQLite at {db_path}")
@@ -25,10 +81,88 @@ class DatabaseService:
         """Ensure the database directory exists"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
+    def _create_connection(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DATABASE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # closed from other threads on cleanup only
+            cached_statements=self.STATEMENT_CACHE_SIZE
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={DATABASE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size=-{DATABASE_CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={DATABASE_BUSY_TIMEOUT_MS}')
+        return conn
+    
+    def _connection(self):
+        """
+        Return this thread's persistent connection, opening it on first use.
+        
+        Use as `with self._connection() as conn:`; the context manager commits
+        or rolls back the transaction but keeps the connection open.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        
+        conn = self._create_connection()
+        self._local.conn = conn
+        thread = threading.current_thread()
+        with self.lock:
+            self._close_dead_thread_connections()
+            self._connections[thread.ident] = (weakref.ref(thread), conn)
+        logger.debug(f"Opened database connection for thread {thread.name} ({len(self._connections)} open)")
+        return conn
+    
+    def _close_dead_thread_connections(self):
+        """Close connections owned by threads that have exited (caller holds self.lock)"""
+        for ident, (thread_ref, conn) in list(self._connections.items()):
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.debug(f"Failed to close database connection of exited thread: {e}")
+                del self._connections[ident]
+    
+    def close(self):
+        """Close every open connection (e.g. on shutdown)"""
+        with self.lock:
+            for _, conn in self._connections.values():
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.debug(f"Failed to close database connection: {e}")
+            self._connections.clear()
+        self._local = threading.local()
+    
+    def _remember_session_id(self, request_id: str, session_id: int):
+        with self.lock:
+            self._session_ids[request_id] = session_id
+            self._session_ids.move_to_end(request_id)
+            while len(self._session_ids) > DATABASE_SESSION_MEMO_SIZE:
+                self._session_ids.popitem(last=False)
+    
+    def _get_session_id(self, cursor, request_id: str) -> Optional[int]:
+        """Resolve a request_id to its session id, memoized after the first lookup"""
+        with self.lock:
+            session_id = self._session_ids.get(request_id)
+            if session_id is not None:
+                self._session_ids.move_to_end(request_id)
+                return session_id
+        
+        cursor.execute('SELECT id FROM processing_sessions WHERE request_id = ?', (request_id,))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        self._remember_session_id(request_id, result[0])
+        return result[0]
+    
     def _init_database(self):
         """Initialize database schema if not exists"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Core processing sessions
@@ -75,6 +209,18 @@ class DatabaseService:
                     )
                 ''')
                 
+                # Latest completed output per pipeline step, used to resume failed runs
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS step_checkpoints (
+                        session_id INTEGER NOT NULL REFERENCES processing_sessions(id),
+                        step_id INTEGER NOT NULL,
+                        input_text TEXT,
+                        output_text TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (session_id, step_id)
+                    )
+                ''')
+                
                 # Usage analytics aggregated by date
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS usage_metrics (
@@ -89,6 +235,11 @@ class DatabaseService:
                     )
                 ''')
                 
+                # Telemetry columns added after the original schema, added in place on existing databases
+                self._ensure_columns(cursor, 'step_outputs', STEP_OUTPUT_TELEMETRY_COLUMNS)
+                self._ensure_columns(cursor, 'insights', INSIGHT_TELEMETRY_COLUMNS)
+                self._ensure_columns(cursor, 'processing_sessions', SESSION_LEASE_COLUMNS)
+                
                 # Create indexes for better query performance
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_request_id ON processing_sessions(request_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON processing_sessions(created_at)')
@@ -97,6 +248,8 @@ class DatabaseService:
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_step_outputs_step_id ON step_outputs(step_id)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_insights_session_id ON insights(session_id)')
                 
+                self._init_search_indexes(cursor)
+                
                 conn.commit()
                 logger.info("Database schema initialized successfully")
                 
@@ -104,10 +257,129 @@ class DatabaseService:
             logger.error(f"Failed to initialize database: {e}")
             # Don't raise - allow app to continue without database
     
+    def _init_search_indexes(self, cursor):
+        """Create the full-text indexes, backfilling any that did not exist yet from their source tables"""
+        try:
+            for name, (table, columns) in SEARCH_INDEXES.items():
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+                existed = cursor.fetchone() is not None
+                self._create_search_index(cursor, name, table, columns)
+                if not existed:
+                    cursor.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+                    logger.info(f"Database: built full-text index {name} over {table}")
+            self.search_index_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable ({e}); reporting search falls back to LIKE scans")
+    
+    @staticmethod
+    def _create_search_index(cursor, name: str, table: str, columns: List[str]):
+        """Create an FTS5 external-content index and the triggers that mirror inserts, deletes and updates into it"""
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(
+                {column_list}, content='{table}', content_rowid='id',
+                tokenize='{REPORTING_SEARCH_TOKENIZER}', prefix='{REPORTING_SEARCH_PREFIX_INDEX}'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        # Status and timing updates don't touch the indexed columns and skip this trigger
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {name}({name}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {name}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+    
+    def rebuild_search_index(self) -> Dict[str, Any]:
+        """
+        Drop and rebuild the full-text indexes and their triggers from the source tables.
+        
+        Needed after changing REPORTING_SEARCH_TOKENIZER or REPORTING_SEARCH_PREFIX_INDEX, or to repair an index that
+        drifted from its table; the rebuilt index is merged into a single b-tree.
+        
+        Returns:
+            Dict with rows indexed per index and the duration, or {'error': ...}
+        """
+        start_time = time.time()
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                indexed_rows = {}
+                for name, (table, columns) in SEARCH_INDEXES.items():
+                    for suffix in ('ai', 'ad', 'au'):
+                        cursor.execute(f'DROP TRIGGER IF EXISTS {name}_{suffix}')
+                    cursor.execute(f'DROP TABLE IF EXISTS {name}')
+                    self._create_search_index(cursor, name, table, columns)
+                    cursor.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+                    cursor.execute(f"INSERT INTO {name}({name}) VALUES ('optimize')")
+                    cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                    indexed_rows[name] = cursor.fetchone()[0]
+                conn.commit()
+            self.search_index_enabled = True
+            duration = time.time() - start_time
+            logger.info(f"Database: rebuilt full-text indexes {indexed_rows} in {duration:.2f}s")
+            return {'indexed_rows': indexed_rows, 'duration_seconds': round(duration, 3)}
+        except Exception as e:
+            logger.error(f"Failed to rebuild full-text indexes: {e}")
+            return {'error': str(e)}
+    
+    @staticmethod
+    def _fts_query(search: str) -> Optional[str]:
+        """
+        Turn free text into an FTS5 query: every word must match, the last one as a
+        prefix so results narrow while the user types. A single-character last word
+        is matched whole, since as a prefix it would match most of the index.
+        Returns None if there are no words.
+        """
+        words = re.findall(r'\w+', search or '')
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        if len(words[-1]) > 1:
+            terms[-1] += '*'
+        return ' '.join(terms)
+    
+    @staticmethod
+    def _snippets(cursor, index: str, match: str, rowids: List[int]) -> Dict[int, str]:
+        """HTML snippets (matches wrapped in <mark>) for the given rows of an index, from their best-matching column"""
+        if not rowids:
+            return {}
+        placeholders = ', '.join('?' * len(rowids))
+        cursor.execute(f'''
+            SELECT rowid, snippet({index}, -1, ?, ?, '…', ?)
+            FROM {index}
+            WHERE {index} MATCH ? AND rowid IN ({placeholders})
+        ''', [_HIGHLIGHT_START, _HIGHLIGHT_END, REPORTING_SEARCH_SNIPPET_TOKENS, match, *rowids])
+        return {
+            rowid: html.escape(snippet or '').replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+            for rowid, snippet in cursor.fetchall()
+        }
+    
+    @staticmethod
+    def _ensure_columns(cursor, table: str, columns):
+        """Add any of the given (name, type) columns the table does not have yet"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, column_type in columns:
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+                logger.info(f"Database: added column {table}.{name}")
+    
     def save_processing_session(self, request_id: str, original_idea: str) -> Optional[int]:
         """Create new processing session record"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO processing_sessions (request_id, original_idea, created_at, status)
@@ -116,6 +388,7 @@ class DatabaseService:
                 
                 session_id = cursor.lastrowid
                 conn.commit()
+                self._remember_session_id(request_id, session_id)
                 logger.debug(f"Saved processing session {request_id} with session_id {session_id}")
                 return session_id
                 
@@ -126,7 +399,7 @@ class DatabaseService:
     def update_session_completion(self, request_id: str, status: str, duration: Optional[float] = None, error: Optional[str] = None):
         """Mark session as completed/failed"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE processing_sessions 
@@ -140,32 +413,100 @@ class DatabaseService:
         except Exception as e:
             logger.error(f"Failed to update session completion {request_id}: {e}")
     
+    def _execute_write(self, cursor, kind: str, session_id: int, record: Dict[str, Any]):
+        """Execute the INSERT for one reporting record of the given kind"""
+        created_at = record.get('created_at') or datetime.now()
+        if kind == 'step_output':
+            telemetry = [name for name, _ in STEP_OUTPUT_TELEMETRY_COLUMNS]
+            cursor.execute(f'''
+                INSERT INTO step_outputs 
+                (session_id, step_id, step_name, input_text, output_text, raw_llm_output, 
+                 duration_seconds, model_used, token_count, cost_estimate, {', '.join(telemetry)}, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {', '.join('?' * len(telemetry))}, ?)
+            ''', (session_id, record['step_id'], record['step_name'], record.get('input_text'), record.get('output_text'),
+                  record.get('raw_llm_output'), record.get('duration_seconds'), record.get('model_used'),
+                  record.get('token_count'), record.get('cost_estimate'), *[record.get(name) for name in telemetry], created_at))
+        elif kind == 'insight':
+            telemetry = [name for name, _ in INSIGHT_TELEMETRY_COLUMNS]
+            cursor.execute(f'''
+                INSERT INTO insights (session_id, step_id, insight_text, insight_label, {', '.join(telemetry)}, created_at)
+                VALUES (?, ?, ?, ?, {', '.join('?' * len(telemetry))}, ?)
+            ''', (session_id, record['step_id'], record['insight_text'], record.get('insight_label'),
+                  *[record.get(name) for name in telemetry], created_at))
+        elif kind == 'step_checkpoint':
+            # A rerun of the step replaces its previous checkpoint
+            cursor.execute('''
+                INSERT OR REPLACE INTO step_checkpoints (session_id, step_id, input_text, output_text, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (session_id, record['step_id'], record.get('input_text'), record['output_text'], created_at))
+        else:
+            raise ValueError(f"Unknown write kind: {kind}")
+    
+    def write_batch(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Write many reporting records in a single transaction.
+        
+        Args:
+            records: Dicts with 'kind' ('step_output', 'insight' or 'step_checkpoint'),
+                'request_id' and the fields of the matching save_* method
+            
+        Returns:
+            Number of records written; records whose session is unknown are skipped.
+            If the batch transaction fails, records are retried one by one so a
+            single bad record cannot drop the rest.
+        """
+        if not records:
+            return 0
+        try:
+            written = 0
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                for record in records:
+                    session_id = self._get_session_id(cursor, record['request_id'])
+                    if session_id is None:
+                        logger.warning(f"No session found for request_id {record['request_id']}")
+                        continue
+                    self._execute_write(cursor, record['kind'], session_id, record)
+                    written += 1
+            return written
+        except Exception as e:
+            logger.error(f"Batch write of {len(records)} records failed, retrying individually: {e}")
+        
+        written = 0
+        for record in records:
+            try:
+                with self._connection() as conn:
+                    cursor = conn.cursor()
+                    session_id = self._get_session_id(cursor, record['request_id'])
+                    if session_id is None:
+                        continue
+                    self._execute_write(cursor, record['kind'], session_id, record)
+                    written += 1
+            except Exception as e:
+                logger.error(f"Failed to write {record.get('kind')} record for {record.get('request_id')}: {e}")
+        return written
+    
     def save_step_output(self, request_id: str, step_id: int, step_name: str, 
                         input_text: Optional[str] = None, output_text: Optional[str] = None,
                         raw_llm_output: Optional[str] = None, duration_seconds: Optional[float] = None,
                         model_used: Optional[str] = None, token_count: Optional[int] = None,
-                        cost_estimate: Optional[float] = None):
-        """Store individual step results"""
+                        cost_estimate: Optional[float] = None, **telemetry: Any):
+        """Store individual step results; telemetry takes the STEP_OUTPUT_TELEMETRY_COLUMNS fields"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get session_id from request_id
-                cursor.execute('SELECT id FROM processing_sessions WHERE request_id = ?', (request_id,))
-                result = cursor.fetchone()
-                if not result:
+                session_id = self._get_session_id(cursor, request_id)
+                if session_id is None:
                     logger.warning(f"No session found for request_id {request_id}")
                     return
                 
-                session_id = result[0]
-                
-                cursor.execute('''
-                    INSERT INTO step_outputs 
-                    (session_id, step_id, step_name, input_text, output_text, raw_llm_output, 
-                     duration_seconds, model_used, token_count, cost_estimate, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (session_id, step_id, step_name, input_text, output_text, raw_llm_output,
-                      duration_seconds, model_used, token_count, cost_estimate, datetime.now()))
+                self._execute_write(cursor, 'step_output', session_id, dict(
+                    step_id=step_id, step_name=step_name, input_text=input_text, output_text=output_text,
+                    raw_llm_output=raw_llm_output, duration_seconds=duration_seconds, model_used=model_used,
+                    token_count=token_count, cost_estimate=cost_estimate, **telemetry
+                ))
                 
                 conn.commit()
                 logger.debug(f"Saved step {step_id} output for session {request_id}")
@@ -173,25 +514,22 @@ class DatabaseService:
         except Exception as e:
             logger.error(f"Failed to save step output {request_id}/step_{step_id}: {e}")
     
-    def save_insight(self, request_id: str, step_id: int, insight_text: str, insight_label: Optional[str] = None):
-        """Store extracted insights"""
+    def save_insight(self, request_id: str, step_id: int, insight_text: str, insight_label: Optional[str] = None,
+                     **telemetry: Any):
+        """Store extracted insights; telemetry takes the INSIGHT_TELEMETRY_COLUMNS fields"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get session_id from request_id
-                cursor.execute('SELECT id FROM processing_sessions WHERE request_id = ?', (request_id,))
-                result = cursor.fetchone()
-                if not result:
+                session_id = self._get_session_id(cursor, request_id)
+                if session_id is None:
                     logger.warning(f"No session found for request_id {request_id}")
                     return
                 
-                session_id = result[0]
-                
-                cursor.execute('''
-                    INSERT INTO insights (session_id, step_id, insight_text, insight_label, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (session_id, step_id, insight_text, insight_label, datetime.now()))
+                self._execute_write(cursor, 'insight', session_id, dict(
+                    step_id=step_id, insight_text=insight_text, insight_label=insight_label, **telemetry
+                ))
                 
                 conn.commit()
                 logger.debug(f"Saved insight for session {request_id}, step {step_id}")
@@ -199,11 +537,136 @@ class DatabaseService:
         except Exception as e:
             logger.error(f"Failed to save insight {request_id}/step_{step_id}: {e}")
     
+    def save_step_checkpoint(self, request_id: str, step_id: int, output_text: str, input_text: Optional[str] = None) -> bool:
+        """Persist a completed step's final output so the session can be resumed from it"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                # Get session_id from request_id
+                session_id = self._get_session_id(cursor, request_id)
+                if session_id is None:
+                    logger.warning(f"No session found for request_id {request_id}")
+                    return False
+                
+                self._execute_write(cursor, 'step_checkpoint', session_id, dict(
+                    step_id=step_id, output_text=output_text, input_text=input_text
+                ))
+                
+                conn.commit()
+                logger.debug(f"Saved step {step_id} checkpoint for session {request_id}")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Failed to save step checkpoint {request_id}/step_{step_id}: {e}")
+            return False
+    
+    def get_step_checkpoints(self, request_id: str) -> Dict[int, str]:
+        """Get checkpointed step outputs for a session, keyed by step_id"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT sc.step_id, sc.output_text
+                    FROM step_checkpoints sc
+                    JOIN processing_sessions ps ON sc.session_id = ps.id
+                    WHERE ps.request_id = ?
+                    ORDER BY sc.step_id
+                ''', (request_id,))
+                
+                return {row[0]: row[1] for row in cursor.fetchall()}
+                
+        except Exception as e:
+            logger.error(f"Failed to get step checkpoints for {request_id}: {e}")
+            return {}
+    
+    def reopen_session(self, request_id: str) -> bool:
+        """Mark a failed session as processing again before it is resumed"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE processing_sessions 
+                    SET status = 'processing', completed_at = NULL, error_message = NULL
+                    WHERE request_id = ?
+                ''', (request_id,))
+                
+                conn.commit()
+                logger.debug(f"Reopened session {request_id} for resume")
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to reopen session {request_id}: {e}")
+            return False
+    
+    def claim_session_lease(self, request_id: str, owner: str, ttl_seconds: float) -> bool:
+        """
+        Atomically take the run lease of an unfinished session whose lease is free or has lapsed.
+        
+        Args:
+            request_id: Request ID of the session
+            owner: Identifies the claiming worker process
+            ttl_seconds: How long the lease holds without being renewed
+            
+        Returns:
+            True if this owner now holds the lease; False while another run's lease is fresh
+        """
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                # One conditional UPDATE, so two workers racing for the same session cannot both win
+                cursor.execute('''
+                    UPDATE processing_sessions 
+                    SET lease_owner = ?, lease_expires_at = ?
+                    WHERE request_id = ? AND status != 'completed'
+                      AND (lease_expires_at IS NULL OR lease_expires_at <= ?)
+                ''', (owner, now + ttl_seconds, request_id, now))
+                
+                conn.commit()
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to claim session lease {request_id}: {e}")
+            return False
+    
+    def renew_session_lease(self, request_id: str, owner: str, ttl_seconds: float) -> bool:
+        """Extend a lease this owner holds; returns False if it was lost"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE processing_sessions 
+                    SET lease_expires_at = ?
+                    WHERE request_id = ? AND lease_owner = ?
+                ''', (time.time() + ttl_seconds, request_id, owner))
+                
+                conn.commit()
+                return cursor.rowcount > 0
+                
+        except Exception as e:
+            logger.error(f"Failed to renew session lease {request_id}: {e}")
+            return False
+    
+    def release_session_lease(self, request_id: str, owner: str):
+        """Give up a lease this owner holds so the session can be resumed right away"""
+        try:
+            with self._connection() as conn:
+                conn.execute('''
+                    UPDATE processing_sessions 
+                    SET lease_expires_at = NULL
+                    WHERE request_id = ? AND lease_owner = ?
+                ''', (request_id, owner))
+                conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Failed to release session lease {request_id}: {e}")
+    
     def get_usage_analytics(self, start_date: Optional[str] = None, end_date: Optional[str] = None, 
                            granularity: str = 'daily') -> Dict[str, Any]:
         """Generate usage analytics report"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Build date filter
@@ -239,7 +702,10 @@ class DatabaseService:
                         COUNT(*) as executions,
                         AVG(so.duration_seconds) as avg_duration,
                         SUM(COALESCE(so.token_count, 0)) as total_tokens,
-                        SUM(COALESCE(so.cost_estimate, 0)) as total_cost
+                        SUM(COALESCE(so.cost_estimate, 0)) as total_cost,
+                        SUM(COALESCE(so.cache_read_tokens, 0)) as cache_read_tokens,
+                        SUM(COALESCE(so.cache_write_tokens, 0)) as cache_write_tokens,
+                        AVG(so.attempts) as avg_attempts
                     FROM step_outputs so
                     JOIN processing_sessions ps ON so.session_id = ps.id
                     WHERE 1=1 {date_filter.replace('created_at', 'ps.created_at')}
@@ -249,6 +715,32 @@ class DatabaseService:
                 
                 step_analytics = cursor.fetchall()
                 
+                # Insight extraction spend per step
+                cursor.execute(f'''
+                    SELECT 
+                        i.step_id,
+                        COUNT(*) as insights,
+                        AVG(i.duration_seconds) as avg_duration,
+                        SUM(COALESCE(i.token_count, 0)) as total_tokens,
+                        SUM(COALESCE(i.cost_estimate, 0)) as total_cost
+                    FROM insights i
+                    JOIN processing_sessions ps ON i.session_id = ps.id
+                    WHERE 1=1 {date_filter.replace('created_at', 'ps.created_at')}
+                    GROUP BY i.step_id
+                    ORDER BY i.step_id
+                ''', params)
+                
+                insight_analytics = [
+                    {
+                        'step_id': row[0],
+                        'insights': row[1],
+                        'avg_duration_seconds': row[2],
+                        'total_tokens': row[3],
+                        'total_cost': row[4]
+                    }
+                    for row in cursor.fetchall()
+                ]
+                
                 # Get daily trends if requested
                 daily_trends = []
                 if granularity == 'daily':
@@ -292,10 +784,14 @@ class DatabaseService:
                             'executions': row[2],
                             'avg_duration_seconds': row[3],
                             'total_tokens': row[4],
-                            'total_cost': row[5]
+                            'total_cost': row[5],
+                            'cache_read_tokens': row[6],
+                            'cache_write_tokens': row[7],
+                            'avg_attempts': row[8]
                         }
                         for row in step_analytics
                     ],
+                    'insight_analytics': insight_analytics,
                     'daily_trends': daily_trends
                 }
                 
@@ -304,66 +800,217 @@ class DatabaseService:
             return {'error': str(e)}
     
     def get_ideas_list(self, page: int = 1, limit: int = 50, status: Optional[str] = None, 
-                      search: Optional[str] = None) -> Dict[str, Any]:
-        """Get paginated list of processed ideas"""
+                      search: Optional[str] = None, search_outputs: bool = False) -> Dict[str, Any]:
+        """
+        Get paginated list of processed ideas.
+        
+        Without a search ideas are listed newest first. A search goes through the
+        full-text index and lists matching ideas by relevance, each with an HTML
+        snippet of where it matched; with search_outputs the generated step
+        outputs of each session are searched as well.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
-                # Build filters
-                where_clauses = []
-                params = []
+                match = self._fts_query(search) if search and self.search_index_enabled else None
+                if match:
+                    ideas, total_count = self._search_ideas(cursor, match, status, search_outputs, page, limit)
+                else:
+                    ideas, total_count = self._list_ideas(cursor, status, search, page, limit)
                 
-                if status:
-                    where_clauses.append("status = ?")
-                    params.append(status)
+                total_pages = (total_count + limit - 1) // limit
                 
-                if search:
-                    where_clauses.append("original_idea LIKE ?")
-                    params.append(f"%{search}%")
+                return {
+                    'ideas': ideas,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'total_count': total_count,
+                        'total_pages': total_pages,
+                        'has_next': page < total_pages,
+                        'has_prev': page > 1
+                    }
+                }
                 
-                where_sql = " AND ".join(where_clauses)
-                if where_sql:
-                    where_sql = "WHERE " + where_sql
+        except Exception as e:
+            logger.error(f"Failed to get ideas list: {e}")
+            return {'error': str(e)}
+    
+    @staticmethod
+    def _idea_row(row) -> Dict[str, Any]:
+        return {
+            'request_id': row[0],
+            'idea_preview': row[1] + ('...' if len(row[1]) == 200 else ''),
+            'status': row[2],
+            'created_at': row[3],
+            'completed_at': row[4],
+            'duration_seconds': row[5],
+            'error_message': row[6]
+        }
+    
+    def _list_ideas(self, cursor, status, search, page, limit):
+        """Newest-first page of ideas; search here is the LIKE fallback used without a full-text index"""
+        # Build filters
+        where_clauses = []
+        params = []
+        
+        if status:
+            where_clauses.append("status = ?")
+            params.append(status)
+        
+        if search and not self.search_index_enabled:
+            where_clauses.append("original_idea LIKE ?")
+            params.append(f"%{search}%")
+        
+        where_sql = " AND ".join(where_clauses)
+        if where_sql:
+            where_sql = "WHERE " + where_sql
+        
+        # Get total count
+        cursor.execute(f'SELECT COUNT(*) FROM processing_sessions {where_sql}', params)
+        total_count = cursor.fetchone()[0]
+        
+        # Get paginated results
+        offset = (page - 1) * limit
+        cursor.execute(f'''
+            SELECT 
+                request_id,
+                SUBSTR(original_idea, 1, 200) as idea_preview,
+                status,
+                created_at,
+                completed_at,
+                total_duration_seconds,
+                error_message
+            FROM processing_sessions 
+            {where_sql}
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        
+        return [self._idea_row(row) for row in cursor.fetchall()], total_count
+    
+    def _search_ideas(self, cursor, match, status, search_outputs, page, limit):
+        """
+        Page of sessions matching an FTS5 query, by relevance.
+        
+        A session ranks by its best hit (bm25) in the idea text or, with
+        search_outputs, any of its step outputs. Ranking costs time per match,
+        so searches with more than REPORTING_SEARCH_MAX_RANKED_MATCHES hits are
+        ordered newest first instead. Snippets are only built for the returned page.
+        """
+        def matches_sql(rank):
+            if not search_outputs:
+                # One hit per session; the CTE is flattened into the outer query
+                return f'WITH best AS (SELECT rowid AS session_id, {rank} AS rank, NULL AS step_id, rowid AS hit_rowid FROM ideas_fts WHERE ideas_fts MATCH ?)'
+            # MIN() makes SQLite return step_id and hit_rowid from the best-ranked hit of each session
+            return f'''
+                WITH hits AS (
+                    SELECT rowid AS session_id, {rank} AS rank, NULL AS step_id, rowid AS hit_rowid FROM ideas_fts WHERE ideas_fts MATCH ?
+                    UNION ALL
+                    SELECT o.session_id, {rank.replace('rank', 'step_outputs_fts.rank')}, o.step_id, step_outputs_fts.rowid
+                    FROM step_outputs_fts JOIN step_outputs o ON o.id = step_outputs_fts.rowid
+                    WHERE step_outputs_fts MATCH ?
+                ),
+                best AS (SELECT session_id, MIN(rank) AS rank, step_id, hit_rowid FROM hits GROUP BY session_id)
+            '''
+        
+        params = [match, match] if search_outputs else [match]
+        status_sql = 'WHERE s.status = ?' if status else ''
+        if status:
+            params.append(status)
+        
+        cursor.execute(f'{matches_sql("NULL")} SELECT COUNT(*) FROM best JOIN processing_sessions s ON s.id = best.session_id {status_sql}', params)
+        total_count = cursor.fetchone()[0]
+        ranked = total_count <= REPORTING_SEARCH_MAX_RANKED_MATCHES
+        
+        offset = (page - 1) * limit
+        cursor.execute(f'''
+            {matches_sql('rank' if ranked else 'NULL')}
+            SELECT s.request_id, SUBSTR(s.original_idea, 1, 200), s.status, s.created_at, s.completed_at,
+                   s.total_duration_seconds, s.error_message, best.rank, best.step_id, best.hit_rowid
+            FROM best JOIN processing_sessions s ON s.id = best.session_id
+            {status_sql}
+            ORDER BY {'best.rank' if ranked else 'best.session_id DESC'}
+            LIMIT ? OFFSET ?
+        ''', params + [limit, offset])
+        rows = cursor.fetchall()
+        
+        idea_snippets = self._snippets(cursor, 'ideas_fts', match, [row[9] for row in rows if row[8] is None])
+        output_snippets = self._snippets(cursor, 'step_outputs_fts', match, [row[9] for row in rows if row[8] is not None])
+        ideas = []
+        for row in rows:
+            idea = self._idea_row(row)
+            idea['score'] = round(-row[7], 4) if ranked else None  # bm25 rank is lower-is-better
+            idea['matched_step_id'] = row[8]
+            idea['snippet_html'] = (idea_snippets if row[8] is None else output_snippets).get(row[9], '')
+            ideas.append(idea)
+        return ideas, total_count
+    
+    def search_step_outputs(self, search: str, step_id: Optional[int] = None, page: int = 1,
+                            limit: int = 20) -> Dict[str, Any]:
+        """
+        Full-text search over generated step outputs (PRFAQ drafts, research, FAQs).
+        
+        Args:
+            search: Free-text query; every word must match, the last as a prefix
+            step_id: Only search this step's outputs
+            page: Page number (1-based)
+            limit: Results per page
+            
+        Returns:
+            Dict with 'results' (request_id, step, score, snippet_html) by relevance and
+            'pagination', or {'error': ...}
+        """
+        if not self.search_index_enabled:
+            return {'error': 'Full-text search index is not available'}
+        match = self._fts_query(search)
+        if not match:
+            return {'error': 'Search query has no searchable words'}
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                step_sql = 'AND o.step_id = ?' if step_id is not None else ''
+                params = [match] + ([step_id] if step_id is not None else [])
                 
-                # Get total count
-                cursor.execute(f'SELECT COUNT(*) FROM processing_sessions {where_sql}', params)
+                cursor.execute(f'''
+                    SELECT COUNT(*) FROM step_outputs_fts JOIN step_outputs o ON o.id = step_outputs_fts.rowid
+                    WHERE step_outputs_fts MATCH ? {step_sql}
+                ''', params)
                 total_count = cursor.fetchone()[0]
+                # Broad searches are ordered newest first; ranking them would cost time per match
+                ranked = total_count <= REPORTING_SEARCH_MAX_RANKED_MATCHES
                 
-                # Get paginated results
                 offset = (page - 1) * limit
                 cursor.execute(f'''
-                    SELECT 
-                        request_id,
-                        SUBSTR(original_idea, 1, 200) as idea_preview,
-                        status,
-                        created_at,
-                        completed_at,
-                        total_duration_seconds,
-                        error_message
-                    FROM processing_sessions 
-                    {where_sql}
-                    ORDER BY created_at DESC
+                    SELECT step_outputs_fts.rowid, {'step_outputs_fts.rank' if ranked else 'NULL'}, s.request_id, o.step_id, o.step_name,
+                           o.created_at, SUBSTR(s.original_idea, 1, 200)
+                    FROM step_outputs_fts
+                    JOIN step_outputs o ON o.id = step_outputs_fts.rowid
+                    JOIN processing_sessions s ON s.id = o.session_id
+                    WHERE step_outputs_fts MATCH ? {step_sql}
+                    ORDER BY {'step_outputs_fts.rank' if ranked else 'step_outputs_fts.rowid DESC'}
                     LIMIT ? OFFSET ?
                 ''', params + [limit, offset])
+                rows = cursor.fetchall()
+                snippets = self._snippets(cursor, 'step_outputs_fts', match, [row[0] for row in rows])
                 
-                ideas = [
+                results = [
                     {
-                        'request_id': row[0],
-                        'idea_preview': row[1] + ('...' if len(row[1]) == 200 else ''),
-                        'status': row[2],
-                        'created_at': row[3],
-                        'completed_at': row[4],
-                        'duration_seconds': row[5],
-                        'error_message': row[6]
+                        'request_id': row[2],
+                        'step_id': row[3],
+                        'step_name': row[4],
+                        'created_at': row[5],
+                        'idea_preview': row[6] + ('...' if len(row[6]) == 200 else ''),
+                        'score': round(-row[1], 4) if ranked else None,
+                        'snippet_html': snippets.get(row[0], '')
                     }
-                    for row in cursor.fetchall()
+                    for row in rows
                 ]
-                
                 total_pages = (total_count + limit - 1) // limit
-                
                 return {
-                    'ideas': ideas,
+                    'results': results,
+                    'ordering': 'relevance' if ranked else 'newest',
                     'pagination': {
                         'page': page,
                         'limit': limit,
@@ -373,15 +1020,14 @@ class DatabaseService:
                         'has_prev': page > 1
                     }
                 }
-                
         except Exception as e:
-            logger.error(f"Failed to get ideas list: {e}")
+            logger.error(f"Failed to search step outputs: {e}")
             return {'error': str(e)}
     
     def get_session_details(self, request_id: str) -> Dict[str, Any]:
         """Get complete processing details for specific session"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Get session info
@@ -410,7 +1056,8 @@ class DatabaseService:
                 cursor.execute('''
                     SELECT so.step_id, so.step_name, so.input_text, so.output_text,
                            so.raw_llm_output, so.duration_seconds, so.created_at,
-                           so.model_used, so.token_count, so.cost_estimate
+                           so.model_used, so.token_count, so.cost_estimate,
+                           so.input_tokens, so.output_tokens, so.cache_read_tokens, so.cache_write_tokens, so.attempts
                     FROM step_outputs so
                     JOIN processing_sessions ps ON so.session_id = ps.id
                     WHERE ps.request_id = ?
@@ -428,14 +1075,20 @@ class DatabaseService:
                         'created_at': row[6],
                         'model_used': row[7],
                         'token_count': row[8],
-                        'cost_estimate': row[9]
+                        'cost_estimate': row[9],
+                        'input_tokens': row[10],
+                        'output_tokens': row[11],
+                        'cache_read_tokens': row[12],
+                        'cache_write_tokens': row[13],
+                        'attempts': row[14]
                     }
                     for row in cursor.fetchall()
                 ]
                 
                 # Get insights
                 cursor.execute('''
-                    SELECT i.step_id, i.insight_text, i.insight_label, i.created_at
+                    SELECT i.step_id, i.insight_text, i.insight_label, i.created_at,
+                           i.model_used, i.duration_seconds, i.token_count, i.cost_estimate, i.batch_size
                     FROM insights i
                     JOIN processing_sessions ps ON i.session_id = ps.id
                     WHERE ps.request_id = ?
@@ -447,7 +1100,12 @@ class DatabaseService:
                         'step_id': row[0],
                         'insight_text': row[1],
                         'insight_label': row[2],
-                        'created_at': row[3]
+                        'created_at': row[3],
+                        'model_used': row[4],
+                        'duration_seconds': row[5],
+                        'token_count': row[6],
+                        'cost_estimate': row[7],
+                        'batch_size': row[8]
                     }
                     for row in cursor.fetchall()
                 ]
@@ -464,10 +1122,31 @@ class DatabaseService:
 
 # Global instance
 db_service = None
+_db_service_lock = threading.Lock()
 
 def get_db_service() -> DatabaseService:
     """Get or create database service instance"""
     global db_service
     if db_service is None:
-        db_service = DatabaseService()
-    return db_service 
\ No newline at end of file
+        with _db_service_lock:
+            if db_service is None:
+                db_service = DatabaseService()
+                atexit.register(db_service.close)
+    return db_service 
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Reporting database maintenance')
+    parser.add_argument('--db', default='data/reporting.db', help='Path of the reporting database')
+    parser.add_argument('--rebuild-search-index', action='store_true',
+                        help='Drop and rebuild the full-text search indexes from the source tables')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(name)s | %(levelname)s | %(message)s')
+    if not args.rebuild_search_index:
+        parser.error('nothing to do; pass --rebuild-search-index')
+    outcome = DatabaseService(args.db).rebuild_search_index()
+    print(json.dumps(outcome, indent=2))
+    raise SystemExit(1 if 'error' in outcome else 0)
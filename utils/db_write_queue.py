@@ -0,0 +1,226 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+from config import (
+    DB_WRITE_BEHIND_ENABLED, DB_WRITE_QUEUE_MAX_SIZE, DB_WRITE_BATCH_SIZE,
+    DB_WRITE_FLUSH_INTERVAL_SECONDS, DB_WRITE_ENQUEUE_TIMEOUT_SECONDS
+)
+from utils.database_service import get_db_service
+from utils.metrics import db_write_seconds
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class _FlushMarker:
+    """Queued behind pending records; set once everything before it is committed"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DatabaseWriteQueue:
+    """
+    Write-behind queue for reporting dual-writes.
+
+    Producers (LLM steps, insight extraction, checkpointing) enqueue records and
+    return immediately; a single writer thread group-commits them with
+    DatabaseService.write_batch once DB_WRITE_BATCH_SIZE records are waiting or
+    DB_WRITE_FLUSH_INTERVAL_SECONDS has passed. The queue is bounded: when it is
+    full a producer waits at most DB_WRITE_ENQUEUE_TIMEOUT_SECONDS before the
+    record is dropped and counted. Step checkpoints are what resume restores,
+    so they are never dropped: a checkpoint that does not fit is written
+    synchronously instead.
+    """
+
+    # Record kinds written inline rather than dropped when the queue is full
+    DURABLE_KINDS = frozenset({'step_checkpoint'})
+
+    def __init__(self, db_service=None, max_queue_size=DB_WRITE_QUEUE_MAX_SIZE, batch_size=DB_WRITE_BATCH_SIZE,
+                 flush_interval=DB_WRITE_FLUSH_INTERVAL_SECONDS, enqueue_timeout=DB_WRITE_ENQUEUE_TIMEOUT_SECONDS,
+                 enabled=DB_WRITE_BEHIND_ENABLED):
+        self.db_service = db_service or get_db_service()
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.enabled = enabled
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.metrics = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'written_inline': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'total_commit_ms': 0.0,
+            'max_queue_depth': 0
+        }
+        self._stopping = False
+        self._writer = None
+        if self.enabled:
+            self._writer = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+            self._writer.start()
+        logger.info(f"DatabaseWriteQueue initialized (enabled: {self.enabled}, max_queue_size: {max_queue_size}, batch_size: {self.batch_size})")
+
+    def enqueue(self, kind: str, request_id: str, **fields: Any) -> bool:
+        """
+        Queue one record for the writer thread.
+
+        Args:
+            kind: 'step_output', 'insight' or 'step_checkpoint'
+            request_id: Request ID of the session the record belongs to
+            **fields: Fields of the matching DatabaseService save_* method
+
+        Returns:
+            True if the record was queued (or written, when write-behind is disabled)
+        """
+        record: Dict[str, Any] = dict(fields, kind=kind, request_id=request_id, created_at=datetime.now())
+        span = tracing.current_span()
+        if span.span_id:
+            # The writer thread records the write as a span of the enqueuing operation
+            record['trace_parent'] = span
+            record['enqueued_at'] = time.time()
+
+        if not self.enabled or self._stopping:
+            return self.db_service.write_batch([record]) > 0
+
+        try:
+            self.queue.put(record, timeout=self.enqueue_timeout)
+        except queue.Full:
+            if kind in self.DURABLE_KINDS:
+                logger.warning(f"[{request_id}] Database write queue full ({self.queue.maxsize}) - writing {kind} record inline")
+                written = self.db_service.write_batch([record])
+                with self.lock:
+                    self.metrics['written_inline'] += written
+                return written > 0
+            with self.lock:
+                self.metrics['dropped'] += 1
+            logger.error(f"[{request_id}] Database write queue full ({self.queue.maxsize}) - dropped {kind} record")
+            return False
+
+        depth = self.queue.qsize()
+        with self.lock:
+            self.metrics['enqueued'] += 1
+            if depth > self.metrics['max_queue_depth']:
+                self.metrics['max_queue_depth'] = depth
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until every record queued before this call is committed"""
+        if not self.enabled or not self._writer or not self._writer.is_alive():
+            return True
+        marker = _FlushMarker()
+        try:
+            self.queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Flush pending records and stop the writer thread"""
+        if not self.enabled or self._stopping:
+            return
+        flushed = self.flush(timeout)
+        self._stopping = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self._writer:
+            self._writer.join(timeout)
+        logger.info(f"DatabaseWriteQueue shut down (flushed: {flushed}, written: {self.metrics['written']}, dropped: {self.metrics['dropped']})")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = []
+            markers = []
+            deadline = time.time() + self.flush_interval
+            while True:
+                if isinstance(item, _FlushMarker):
+                    # Commit what we have now so the flusher is released promptly
+                    markers.append(item)
+                    break
+                if item is None:
+                    self._stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            self._commit(batch)
+            for marker in markers:
+                marker.done.set()
+            if item is None:
+                return
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        start = time.time()
+        try:
+            written = self.db_service.write_batch(batch)
+        except Exception as e:
+            logger.error(f"Database write-behind batch of {len(batch)} records failed: {e}")
+            written = 0
+        end = time.time()
+        commit_ms = (end - start) * 1000
+        db_write_seconds.observe(commit_ms / 1000)
+        for record in batch:
+            if 'trace_parent' in record:
+                tracing.record_span(
+                    'db.write', record['enqueued_at'], end, parent=record['trace_parent'],
+                    kind=record['kind'], batch_size=len(batch), commit_ms=round(commit_ms, 3),
+                    queued_ms=round((start - record['enqueued_at']) * 1000, 3)
+                )
+        with self.lock:
+            self.metrics['written'] += written
+            self.metrics['batches'] += 1
+            self.metrics['last_batch_size'] = len(batch)
+            self.metrics['last_commit_ms'] = commit_ms
+            self.metrics['total_commit_ms'] += commit_ms
+            self.metrics['max_commit_ms'] = max(self.metrics['max_commit_ms'], commit_ms)
+        logger.debug(f"Database write-behind committed {written}/{len(batch)} records in {commit_ms:.1f}ms")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Queue depth, throughput and commit latency"""
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics['enabled'] = self.enabled
+        metrics['queue_depth'] = self.queue.qsize()
+        metrics['max_queue_size'] = self.queue.maxsize
+        metrics['avg_commit_ms'] = metrics['total_commit_ms'] / metrics['batches'] if metrics['batches'] else 0.0
+        metrics['avg_batch_size'] = metrics['written'] / metrics['batches'] if metrics['batches'] else 0.0
+        return metrics
+
+
+# Global instance
+db_write_queue = None
+_db_write_queue_lock = threading.Lock()
+
+def get_db_write_queue() -> DatabaseWriteQueue:
+    """Get or create the database write-behind queue"""
+    global db_write_queue
+    if db_write_queue is None:
+        with _db_write_queue_lock:
+            if db_write_queue is None:
+                db_write_queue = DatabaseWriteQueue()
+                atexit.register(db_write_queue.shutdown)
+    return db_write_queue
@@ -0,0 +1,410 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+import anthropic
+import httpx
+import openai
+from anthropic.types import Message, TextBlock, Usage
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from config import FAKE_LLM_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+
+_ENDPOINTS = {
+    'anthropic': 'https://api.anthropic.com/v1/messages',
+    'perplexity': 'https://api.perplexity.ai/chat/completions',
+}
+
+_WORDS = (
+    'customer', 'market', 'pricing', 'adoption', 'workflow', 'retention', 'launch', 'segment',
+    'onboarding', 'integration', 'competitive', 'revenue', 'feedback', 'pilot', 'team', 'platform',
+    'insight', 'risk', 'metric', 'growth', 'channel', 'experience', 'problem', 'solution',
+    'industry', 'budget', 'value', 'usage', 'trial', 'roadmap', 'partner', 'support',
+)
+_CLAUDE_SECTIONS = ('Overview', 'Customer Experience', 'Key Risks', 'Success Metrics', 'Next Steps', 'Open Questions')
+_RESEARCH_SECTIONS = ('Market Overview', 'Competitive Landscape', 'Customer Segments', 'Industry Trends', 'Pricing Benchmarks')
+_ITEM_NUMBER = re.compile(r'<item number="(\d+)">')
+
+
+def _sentence(rng, words):
+    text = ' '.join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:]
+
+
+def _paragraph(rng):
+    return ' '.join(_sentence(rng, rng.randint(8, 16)) + '.' for _ in range(rng.randint(3, 6)))
+
+
+def _sections(rng, lines, titles, chars):
+    """Append headed paragraphs until the text reaches chars, then cut it there"""
+    text = '\n'.join(lines)
+    index = 0
+    while len(text) < chars:
+        text += f"\n\n## {titles[index % len(titles)]}\n\n{_paragraph(rng)}"
+        index += 1
+    return text[:chars]
+
+
+def _timeout_seconds(timeout) -> Optional[float]:
+    if isinstance(timeout, httpx.Timeout):
+        return timeout.read
+    return timeout
+
+
+def _text_of(content) -> str:
+    """Plain text of a message or system content: a string or a list of text blocks"""
+    if isinstance(content, str):
+        return content
+    return '\n'.join(block.get('text', '') for block in content or [] if isinstance(block, dict))
+
+
+class FakeResult:
+    """A planned fake response: how long it takes and whether it fails instead"""
+
+    def __init__(self, fake: 'FakeLLM', provider: str, latency: float, failure: Optional[str], response, text: str):
+        self.fake = fake
+        self.provider = provider
+        self.latency = latency
+        self.failure = failure
+        self.response = response
+        self.text = text
+
+    def resolve(self, timeout) -> tuple:
+        """
+        Outcome of sending this request with the given HTTP timeout.
+
+        An injected 529 answers after a twentieth of the drawn latency. An
+        injected timeout, or a latency beyond the timeout, fails once the
+        timeout (or, for injected timeouts, the drawn latency if shorter)
+        has passed, so benchmark runs are not held up by long attempt timeouts.
+
+        Returns:
+            (seconds to wait, exception to raise or None)
+        """
+        timeout = _timeout_seconds(timeout)
+        if self.failure == 'overloaded':
+            return self.latency / 20, self.fake.error(self.provider, 'overloaded')
+        if self.failure == 'timeout':
+            return min(self.latency, timeout or self.latency), self.fake.error(self.provider, 'timeout')
+        if timeout is not None and self.latency > timeout:
+            self.fake.count('timeouts')
+            return timeout, self.fake.error(self.provider, 'timeout')
+        return self.latency, None
+
+
+class FakeLLM:
+    """
+    Deterministic local stand-in for the Anthropic and Perplexity APIs.
+
+    Each request draws its latency, output size and any injected failure from
+    an RNG seeded by the configured seed, the model and prompt, and how many
+    times that prompt was sent before. Responses therefore do not depend on how
+    concurrent requests interleave, and a retry of a failed request gets a
+    fresh draw. Responses are real SDK Message / ChatCompletion objects and
+    failures are real SDK exceptions, so the processors, retry policy and
+    telemetry run exactly as they do against the live APIs.
+    """
+
+    def __init__(self, config: Dict[str, Any] = FAKE_LLM_CONFIG):
+        self.config = config
+        self.lock = threading.Lock()
+        self.prompt_counts = {}
+        self.cached_prefixes = set()
+        self.stats = {'requests': 0, 'overloaded': 0, 'timeouts': 0, 'output_chars': 0,
+                      'cache_read_tokens': 0, 'cache_write_tokens': 0}
+
+    def count(self, stat: str, amount: int = 1):
+        with self.lock:
+            self.stats[stat] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats)
+
+    def _plan(self, profile: str, prompt_key: str):
+        digest = hashlib.sha256(prompt_key.encode('utf-8')).hexdigest()
+        with self.lock:
+            sent = self.prompt_counts[(profile, digest)] = self.prompt_counts.get((profile, digest), 0) + 1
+            self.stats['requests'] += 1
+        rng = random.Random(f"{self.config['seed']}:{profile}:{digest}:{sent}")
+
+        latency = self.config['latency'][profile]
+        median = latency['median'] * self.config['time_scale']
+        seconds = rng.lognormvariate(math.log(median), latency['sigma']) if median > 0 else 0.0
+
+        roll = rng.random()
+        failure = None
+        if roll < self.config['overload_rate']:
+            failure = 'overloaded'
+        elif roll < self.config['overload_rate'] + self.config['timeout_rate']:
+            failure = 'timeout'
+        if failure:
+            self.count('overloaded' if failure == 'overloaded' else 'timeouts')
+        return rng, seconds, failure
+
+    def _output(self, rng, profile: str, prompt: str, max_tokens: Optional[int]):
+        """Generated text for the profile, cut at max_tokens; returns (text, truncated)"""
+        chars = max(1, int(self.config['output_chars'][profile] * rng.uniform(0.75, 1.25)))
+        if profile == 'insight':
+            numbers = _ITEM_NUMBER.findall(prompt)
+            if numbers:
+                text = json.dumps({number: _sentence(rng, max(4, chars // 8)) + '.' for number in numbers})
+            else:
+                text = (_sentence(rng, max(4, chars // 8)) + '.')[:chars]
+        elif profile == 'perplexity':
+            text = _sections(rng, [f"# Market Research\n\n{_paragraph(rng)}"], _RESEARCH_SECTIONS, chars)
+        else:
+            lines = [
+                f"**{_sentence(rng, 8)}**", '',
+                '## Press Release', '',
+                f"**{_sentence(rng, 10)}**", '',
+                f"**Question:** {_sentence(rng, 9)}?",
+            ]
+            text = _sections(rng, lines, _CLAUDE_SECTIONS, chars)
+        if max_tokens and len(text) > max_tokens * CHARS_PER_TOKEN:
+            return text[:max_tokens * CHARS_PER_TOKEN], True
+        return text, False
+
+    def error(self, provider: str, failure: str) -> Exception:
+        """The SDK exception the provider's client raises for a 529 or a timed-out request"""
+        sdk = anthropic if provider == 'anthropic' else openai
+        request = httpx.Request('POST', _ENDPOINTS[provider])
+        if failure == 'timeout':
+            return sdk.APITimeoutError(request=request)
+        response = httpx.Response(529, request=request)
+        body = {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}}
+        return sdk.InternalServerError('Overloaded', response=response, body=body)
+
+    def anthropic_message(self, profile: str, params: Dict[str, Any]) -> FakeResult:
+        """
+        Plan a Messages API response.
+
+        System blocks up to the last one marked with cache_control form the
+        cached prefix: the first request carrying a prefix reports it as
+        cache_write_tokens and later ones as cache_read_tokens.
+        """
+        system = params.get('system')
+        blocks = system if isinstance(system, list) else [{'text': system or ''}]
+        cached_upto = max((index + 1 for index, block in enumerate(blocks) if block.get('cache_control')), default=0)
+        prefix = _text_of(blocks[:cached_upto])
+        prompt = _text_of(blocks) + '\n' + '\n'.join(_text_of(message.get('content')) for message in params.get('messages', []))
+        model = params.get('model', '')
+
+        rng, latency, failure = self._plan(profile, model + prompt)
+        text, truncated = self._output(rng, profile, prompt, params.get('max_tokens'))
+
+        cache_read = cache_write = 0
+        if prefix and failure is None:
+            key = hashlib.sha256((model + prefix).encode('utf-8')).hexdigest()
+            with self.lock:
+                seen = key in self.cached_prefixes
+                self.cached_prefixes.add(key)
+            if seen:
+                cache_read = len(prefix) // CHARS_PER_TOKEN
+            else:
+                cache_write = len(prefix) // CHARS_PER_TOKEN
+        if failure is None:
+            self.count('output_chars', len(text))
+            self.count('cache_read_tokens', cache_read)
+            self.count('cache_write_tokens', cache_write)
+
+        usage = Usage(
+            input_tokens=max(0, len(prompt) // CHARS_PER_TOKEN - cache_read - cache_write),
+            output_tokens=len(text) // CHARS_PER_TOKEN + 1,
+            cache_creation_input_tokens=cache_write,
+            cache_read_input_tokens=cache_read,
+        )
+        message = Message(
+            id=f"msg_fake_{rng.getrandbits(64):016x}",
+            type='message',
+            role='assistant',
+            model=model,
+            content=[TextBlock(type='text', text=text)],
+            stop_reason='max_tokens' if truncated else 'end_turn',
+            stop_sequence=None,
+            usage=usage,
+        )
+        return FakeResult(self, 'anthropic', latency, failure, message, text)
+
+    def chat_completion(self, params: Dict[str, Any]) -> FakeResult:
+        """Plan a Perplexity chat completion, with citations like Sonar responses"""
+        prompt = '\n'.join(_text_of(message.get('content')) for message in params.get('messages', []))
+        model = params.get('model', '')
+        rng, latency, failure = self._plan('perplexity', model + prompt)
+        text, truncated = self._output(rng, 'perplexity', prompt, params.get('max_tokens'))
+        if failure is None:
+            self.count('output_chars', len(text))
+
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        completion_tokens = len(text) // CHARS_PER_TOKEN + 1
+        completion = ChatCompletion(
+            id=f"fake-{rng.getrandbits(64):016x}",
+            object='chat.completion',
+            created=int(time.time()),
+            model=model,
+            choices=[Choice(
+                index=0,
+                finish_reason='length' if truncated else 'stop',
+                message=ChatCompletionMessage(role='assistant', content=text),
+            )],
+            usage=CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+            citations=[f"https://example.com/research/{rng.getrandbits(32):08x}" for _ in range(rng.randint(3, 8))],
+        )
+        return FakeResult(self, 'perplexity', latency, failure, completion, text)
+
+    def chunks(self, text: str):
+        """Split text into the configured number of stream deltas"""
+        count = max(1, min(self.config['stream_chunks'], len(text)))
+        size = math.ceil(len(text) / count)
+        return [text[start:start + size] for start in range(0, len(text), size)] or ['']
+
+
+class _FakeMessageStream:
+    """Context manager mirroring anthropic's MessageStreamManager / MessageStream"""
+
+    def __init__(self, result: FakeResult, timeout):
+        self.result = result
+        self.timeout = timeout
+
+    def __enter__(self):
+        delay, error = self.result.resolve(self.timeout)
+        if error is not None:
+            time.sleep(delay)
+            raise error
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    def text_stream(self):
+        chunks = self.result.fake.chunks(self.result.text)
+        pause = self.result.latency / len(chunks)
+        for chunk in chunks:
+            time.sleep(pause)
+            yield chunk
+
+    def get_final_message(self):
+        return self.result.response
+
+
+class _FakeAsyncMessageStream(_FakeMessageStream):
+    """Async context manager mirroring anthropic's AsyncMessageStreamManager / AsyncMessageStream"""
+
+    async def __aenter__(self):
+        delay, error = self.result.resolve(self.timeout)
+        if error is not None:
+            await asyncio.sleep(delay)
+            raise error
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    async def text_stream(self):
+        chunks = self.result.fake.chunks(self.result.text)
+        pause = self.result.latency / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(pause)
+            yield chunk
+
+    async def get_final_message(self):
+        return self.result.response
+
+
+class _FakeMessages:
+    def __init__(self, fake: FakeLLM, profile: str, timeout):
+        self.fake = fake
+        self.profile = profile
+        self.timeout = timeout
+
+    def create(self, timeout=None, **params):
+        result = self.fake.anthropic_message(self.profile, params)
+        delay, error = result.resolve(timeout or self.timeout)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result.response
+
+    def stream(self, timeout=None, **params):
+        return _FakeMessageStream(self.fake.anthropic_message(self.profile, params), timeout or self.timeout)
+
+
+class _FakeAsyncMessages(_FakeMessages):
+    async def create(self, timeout=None, **params):
+        result = self.fake.anthropic_message(self.profile, params)
+        delay, error = result.resolve(timeout or self.timeout)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result.response
+
+    def stream(self, timeout=None, **params):
+        return _FakeAsyncMessageStream(self.fake.anthropic_message(self.profile, params), timeout or self.timeout)
+
+
+class _FakeCompletions:
+    def __init__(self, fake: FakeLLM):
+        self.fake = fake
+
+    def create(self, timeout=None, **params):
+        result = self.fake.chat_completion(params)
+        delay, error = result.resolve(timeout)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return result.response
+
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def create(self, timeout=None, **params):
+        result = self.fake.chat_completion(params)
+        delay, error = result.resolve(timeout)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result.response
+
+
+class FakeAnthropic:
+    """Stand-in for anthropic.Anthropic: messages.create() and messages.stream()"""
+
+    messages_class = _FakeMessages
+
+    def __init__(self, fake: FakeLLM, profile: str = 'claude', timeout=None):
+        self._timeout = timeout
+        self.messages = self.messages_class(fake, profile, timeout)
+
+
+class FakeAsyncAnthropic(FakeAnthropic):
+    """Stand-in for anthropic.AsyncAnthropic"""
+
+    messages_class = _FakeAsyncMessages
+
+
+class FakeOpenAI:
+    """Stand-in for the OpenAI client pointed at Perplexity: chat.completions.create()"""
+
+    def __init__(self, fake: FakeLLM):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(fake))
+
+
+class FakeAsyncOpenAI:
+    """Stand-in for openai.AsyncOpenAI pointed at Perplexity"""
+
+    def __init__(self, fake: FakeLLM):
+        self.chat = SimpleNamespace(completions=_FakeAsyncCompletions(fake))
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from config import SSE_EVENT_BUFFER_MAX_EVENTS, SSE_EVENT_BUFFER_MAX_BYTES, SSE_RESUME_RETENTION_SECONDS, SSE_RESUME_MAX_FINISHED_RUNS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_idea_key(product_idea: str) -> str:
+    """Hash a product idea ignoring case and whitespace differences"""
+    normalized = ' '.join(product_idea.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def format_sse_frame(payload, event_id=None) -> str:
+    """Serialize a payload as one SSE frame, with an id line when it is resumable"""
+    frame = f"data: {json.dumps(payload)}\n\n"
+    return f"id: {event_id}\n{frame}" if event_id is not None else frame
+
+
+class StreamEvent:
+    """
+    One published update and the SSE frame every stream sends for it.
+
+    Args:
+        event_id: Monotonically increasing id within the run; None for live-only events (heartbeats)
+        update: The update as published by the pipeline
+        payload: What clients receive; differs from update only for stream-ending events
+        ends_stream: True for the final result and for errors that end the stream
+    """
+
+    __slots__ = ('event_id', 'update', 'payload', 'frame', 'ends_stream')
+
+    def __init__(self, event_id, update, payload, ends_stream=False):
+        self.event_id = event_id
+        self.update = update
+        self.payload = payload
+        self.frame = format_sse_frame(payload, event_id)
+        self.ends_stream = ends_stream
+
+
+class PipelineRun:
+    """
+    Fan-out of one pipeline's progress events to every stream attached to it.
+
+    The leader's pipeline publishes each update once. It is serialized once
+    into an SSE frame with a monotonically increasing event id and kept in a
+    bounded ring buffer; every subscriber gets its own queue, pre-filled with
+    the buffered events after the id it last saw, so a stream that attaches
+    mid-run or reconnects with Last-Event-ID replays what it missed before
+    going live. Heartbeats are delivered live but not kept for replay.
+    """
+
+    def __init__(self, request_id, key=None, max_events=SSE_EVENT_BUFFER_MAX_EVENTS, max_bytes=SSE_EVENT_BUFFER_MAX_BYTES):
+        self.request_id = request_id
+        self.key = key
+        self.events = deque()
+        self.buffered_bytes = 0
+        self.max_events = max(1, max_events)
+        self.max_bytes = max_bytes
+        self.next_event_id = 1
+        self.evicted_events = 0
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.finished = False
+        self.finished_at = None
+        self.result = None
+        self.last_heartbeat = time.time()
+        self.worker_alive = lambda: True
+
+    def _client_payload(self, update):
+        """Stream-ending updates are sent as the client-facing error / completion payload"""
+        if update.get('done'):
+            if self.result is not None and 'error' in self.result:
+                return {'error': self.result['error'], 'step': self.result.get('step', 'unknown'), 'request_id': self.request_id}
+            return {'complete': True, 'result': self.result, 'request_id': self.request_id}
+        if update.get('error'):
+            return {'error': update.get('message') or update['error'], 'request_id': self.request_id}
+        return None
+
+    def _append(self, update):
+        """Serialize an update under the next event id and add it to the ring buffer (caller holds the lock)"""
+        payload = self._client_payload(update)
+        event = StreamEvent(self.next_event_id, update, payload if payload is not None else update, ends_stream=payload is not None)
+        self.next_event_id += 1
+        self.events.append(event)
+        self.buffered_bytes += len(event.frame)
+        # The newest event always stays, so the final result survives even when it alone exceeds max_bytes
+        while len(self.events) > 1 and (len(self.events) > self.max_events or self.buffered_bytes > self.max_bytes):
+            self.buffered_bytes -= len(self.events.popleft().frame)
+            self.evicted_events += 1
+        return event
+
+    def publish(self, update):
+        with self.lock:
+            if update.get('type') == 'heartbeat':
+                event = StreamEvent(None, update, update)
+            else:
+                event = self._append(update)
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Return a queue with the buffered events after last_event_id, followed by all future events.
+
+        Args:
+            last_event_id: Id of the last event the client received (Last-Event-ID); None replays
+                everything still buffered
+
+        Returns:
+            Tuple of (queue, missed) where missed counts events the client never saw that were
+            already evicted from the ring buffer
+        """
+        subscriber = queue.Queue()
+        after = last_event_id or 0
+        with self.lock:
+            oldest = self.events[0].event_id if self.events else self.next_event_id
+            missed = max(0, oldest - after - 1)
+            for event in self.events:
+                if event.event_id > after:
+                    subscriber.put(event)
+            if not self.finished:
+                self.subscribers.append(subscriber)
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def finish(self, terminal_update):
+        """Publish the final 'done'/'error' marker and stop accepting subscribers"""
+        with self.lock:
+            event = self._append(terminal_update)
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+            self.subscribers = []
+            self.finished = True
+            self.finished_at = time.time()
+
+    def get_buffer_stats(self):
+        with self.lock:
+            return {
+                'buffered_events': len(self.events),
+                'buffered_bytes': self.buffered_bytes,
+                'evicted_events': self.evicted_events,
+                'last_event_id': self.next_event_id - 1,
+            }
+
+
+class InFlightPipelines:
+    """
+    Single-flight registry of running pipelines keyed by normalized product idea.
+
+    The first request for an idea becomes the leader and runs the pipeline;
+    identical ideas arriving while it is still running attach to the leader's
+    PipelineRun instead of starting duplicate paid work. Every run is also
+    indexed by request_id for stream reconnects, and finished runs stay there
+    for SSE_RESUME_RETENTION_SECONDS so a late reconnect still gets the result.
+    """
+
+    def __init__(self, retention_seconds=SSE_RESUME_RETENTION_SECONDS, max_finished_runs=SSE_RESUME_MAX_FINISHED_RUNS):
+        self.runs = {}
+        self.by_request_id = {}
+        self.finished_runs = OrderedDict()  # request_id -> run, oldest finished first
+        self.retention_seconds = retention_seconds
+        self.max_finished_runs = max_finished_runs
+        self.lock = threading.Lock()
+        self.coalesced_count = 0
+
+    def start_or_join(self, product_idea, request_id):
+        """
+        Args:
+            product_idea: The submitted product idea
+            request_id: Request ID to use if this request becomes the leader
+
+        Returns:
+            Tuple of (run, is_leader)
+        """
+        key = normalize_idea_key(product_idea)
+        with self.lock:
+            run = self.runs.get(key)
+            if run is not None and not run.finished:
+                self.coalesced_count += 1
+                logger.info(f"[{request_id}] Coalescing into in-flight pipeline {run.request_id}")
+                return run, False
+            run = PipelineRun(request_id, key)
+            self.runs[key] = run
+            self._index(run)
+            return run, True
+
+    def track(self, run):
+        """
+        Make a run that bypasses coalescing (cache bypass, session resume) reconnectable.
+
+        A run replacing an earlier one with the same request_id continues its
+        event ids, so a client's Last-Event-ID from the earlier stream stays meaningful.
+        """
+        with self.lock:
+            previous = self.by_request_id.get(run.request_id)
+            if previous is not None and previous is not run:
+                run.next_event_id = max(run.next_event_id, previous.next_event_id)
+            self._index(run)
+        return run
+
+    def start_resume(self, request_id):
+        """
+        Atomically claim a request_id for a resumed run.
+
+        Args:
+            request_id: Request ID of the session being resumed
+
+        Returns:
+            New tracked PipelineRun, or None when a run for this request_id is
+            still unfinished and its worker alive (the session is not interrupted)
+        """
+        with self.lock:
+            previous = self.by_request_id.get(request_id)
+            if previous is not None and not previous.finished and previous.worker_alive():
+                return None
+            run = PipelineRun(request_id)
+            if previous is not None:
+                run.next_event_id = previous.next_event_id
+            self._index(run)
+        return run
+
+    def _index(self, run):
+        self.finished_runs.pop(run.request_id, None)
+        self.by_request_id[run.request_id] = run
+
+    def get(self, request_id):
+        """The running or recently finished run with this request_id, or None"""
+        with self.lock:
+            self._prune_finished()
+            return self.by_request_id.get(request_id)
+
+    def complete(self, run):
+        """Forget a finished run so the next identical idea starts fresh; it stays reconnectable for a while"""
+        with self.lock:
+            if run.key and self.runs.get(run.key) is run:
+                del self.runs[run.key]
+            if self.by_request_id.get(run.request_id) is run:
+                self.finished_runs.pop(run.request_id, None)
+                self.finished_runs[run.request_id] = run
+            self._prune_finished()
+
+    def _prune_finished(self):
+        """Drop finished runs past their retention or beyond the count bound (caller holds the lock)"""
+        cutoff = time.time() - self.retention_seconds
+        while self.finished_runs:
+            request_id, run = next(iter(self.finished_runs.items()))
+            if len(self.finished_runs) <= self.max_finished_runs and (run.finished_at or 0) >= cutoff:
+                break
+            del self.finished_runs[request_id]
+            if self.by_request_id.get(request_id) is run:
+                del self.by_request_id[request_id]
+
+    def get_stats(self):
+        """Run counts, resumable runs and the progress queue depths of every attached stream"""
+        with self.lock:
+            self._prune_finished()
+            runs = list(self.by_request_id.values())
+            stats = {
+                'in_flight': sum(1 for run in runs if not run.finished),
+                'coalesced_requests': self.coalesced_count,
+                'resumable_runs': len(self.by_request_id),
+                'finished_runs_retained': len(self.finished_runs)
+            }
+        depths = []
+        buffered_bytes = 0
+        for run in runs:
+            with run.lock:
+                depths.extend(subscriber.qsize() for subscriber in run.subscribers)
+                buffered_bytes += run.buffered_bytes
+        stats['subscribers'] = len(depths)
+        stats['queued_events'] = sum(depths)
+        stats['max_queue_depth'] = max(depths, default=0)
+        stats['event_buffer_bytes'] = buffered_bytes
+        return stats
+
+
+# Global instance
+inflight_pipelines = None
+_inflight_pipelines_lock = threading.Lock()
+
+def get_inflight_pipelines() -> InFlightPipelines:
+    """Get or create the in-flight pipeline registry"""
+    global inflight_pipelines
+    if inflight_pipelines is None:
+        with _inflight_pipelines_lock:
+            if inflight_pipelines is None:
+                inflight_pipelines = InFlightPipelines()
+    return inflight_pipelines
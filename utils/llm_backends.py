@@ -0,0 +1,120 @@
+import logging
+import threading
+from typing import Any, Dict, Optional
+import anthropic
+from openai import OpenAI, AsyncOpenAI
+from config import ANTHROPIC_API_KEY, PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, LLM_BACKEND
+from utils.fake_llm import FakeLLM, FakeAnthropic, FakeAsyncAnthropic, FakeOpenAI, FakeAsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """
+    Source of the provider clients used by ClaudeProcessor, PerplexityProcessor
+    and the insight client.
+
+    Clients expose the SDK surface the processors call (messages.create /
+    messages.stream, chat.completions.create), so swapping the backend changes
+    where requests go without touching retries, rate limiting or telemetry.
+    """
+
+    name = None
+    requires_api_keys = True
+
+    def anthropic_client(self, timeout=None, profile: str = 'claude'):
+        """
+        Sync Anthropic client.
+
+        Args:
+            timeout: Default HTTP timeout (float or httpx.Timeout); None keeps the SDK default
+            profile: 'claude' for pipeline steps, 'insight' for insight extraction
+        """
+        raise NotImplementedError
+
+    def async_anthropic_client(self, timeout=None, profile: str = 'claude'):
+        """Async counterpart of anthropic_client"""
+        raise NotImplementedError
+
+    def perplexity_client(self):
+        """Sync OpenAI-compatible client for the Perplexity API"""
+        raise NotImplementedError
+
+    def async_perplexity_client(self):
+        """Async counterpart of perplexity_client"""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'backend': self.name}
+
+
+class LiveLLMBackend(LLMBackend):
+    """The Anthropic and Perplexity APIs. SDK retries are disabled: the retry policies own every retry decision."""
+
+    name = 'live'
+
+    @staticmethod
+    def _timeout_kwargs(timeout):
+        return {'timeout': timeout} if timeout is not None else {}
+
+    def anthropic_client(self, timeout=None, profile='claude'):
+        return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0, **self._timeout_kwargs(timeout))
+
+    def async_anthropic_client(self, timeout=None, profile='claude'):
+        return anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0, **self._timeout_kwargs(timeout))
+
+    def perplexity_client(self):
+        # The OpenAI client automatically adds the Bearer prefix to the API key.
+        return OpenAI(api_key=PERPLEXITY_API_KEY, base_url=PERPLEXITY_BASE_URL, max_retries=0)
+
+    def async_perplexity_client(self):
+        return AsyncOpenAI(api_key=PERPLEXITY_API_KEY, base_url=PERPLEXITY_BASE_URL, max_retries=0)
+
+
+class FakeLLMBackend(LLMBackend):
+    """Deterministic local responses from a shared FakeLLM (see utils.fake_llm); no API keys or network needed"""
+
+    name = 'fake'
+    requires_api_keys = False
+
+    def __init__(self, fake: Optional[FakeLLM] = None):
+        self.fake = fake or FakeLLM()
+
+    def anthropic_client(self, timeout=None, profile='claude'):
+        return FakeAnthropic(self.fake, profile, timeout)
+
+    def async_anthropic_client(self, timeout=None, profile='claude'):
+        return FakeAsyncAnthropic(self.fake, profile, timeout)
+
+    def perplexity_client(self):
+        return FakeOpenAI(self.fake)
+
+    def async_perplexity_client(self):
+        return FakeAsyncOpenAI(self.fake)
+
+    def get_stats(self):
+        return dict(self.fake.get_stats(), backend=self.name)
+
+
+LLM_BACKENDS = {
+    'live': LiveLLMBackend,
+    'fake': FakeLLMBackend,
+}
+
+# Global instance
+llm_backend = None
+_llm_backend_lock = threading.Lock()
+
+def get_llm_backend() -> LLMBackend:
+    """Get or create the LLM backend selected by LLM_BACKEND"""
+    global llm_backend
+    if llm_backend is None:
+        with _llm_backend_lock:
+            if llm_backend is None:
+                backend_class = LLM_BACKENDS.get(LLM_BACKEND)
+                if backend_class is None:
+                    raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}'; expected one of {sorted(LLM_BACKENDS)}")
+                llm_backend = backend_class()
+                if not llm_backend.requires_api_keys:
+                    logger.warning(f"Using the '{llm_backend.name}' LLM backend: responses are generated locally, not by the provider APIs")
+    return llm_backend
@@ -0,0 +1,309 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Optional, Dict, Any
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_DB_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_DEFAULT_TTL_SECONDS, LLM_CACHE_STEP_TTL_SECONDS,
+    LLM_CACHE_TOUCH_BATCH_SIZE, LLM_CACHE_TOUCH_FLUSH_SECONDS, LLM_CACHE_EVICT_HEADROOM,
+    DATABASE_SYNCHRONOUS, DATABASE_BUSY_TIMEOUT_MS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResultCache:
+    """
+    Persistent, content-addressed cache of successful LLM results.
+
+    Entries are keyed by a SHA-256 of the provider and the exact request
+    parameters (model, system prompt, rendered user prompt, sampling params),
+    so any prompt or config change naturally misses. Entries expire after a
+    per-step TTL and the least recently used ones are evicted once the cache
+    exceeds its entry or byte budget. Stored in SQLite so hits survive restarts.
+
+    Each thread keeps one WAL connection, so lookups are plain reads: hits queue
+    their last_accessed update and a batch is written every few seconds. Entry
+    and byte totals are kept in memory and only resynced from the table when
+    they cross the budget, at which point eviction frees some headroom.
+    """
+
+    def __init__(self, db_path: str = LLM_CACHE_DB_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, default_ttl: int = LLM_CACHE_DEFAULT_TTL_SECONDS,
+                 step_ttls: Optional[Dict[int, int]] = None, enabled: bool = LLM_CACHE_ENABLED,
+                 touch_batch_size: int = LLM_CACHE_TOUCH_BATCH_SIZE, touch_flush_seconds: float = LLM_CACHE_TOUCH_FLUSH_SECONDS,
+                 evict_headroom: float = LLM_CACHE_EVICT_HEADROOM):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.step_ttls = dict(LLM_CACHE_STEP_TTL_SECONDS if step_ttls is None else step_ttls)
+        self.enabled = enabled
+        self.touch_batch_size = max(1, touch_batch_size)
+        self.touch_flush_seconds = touch_flush_seconds
+        self.evict_headroom = min(max(evict_headroom, 0.0), 0.5)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = {}  # thread ident -> (weakref to thread, connection)
+        self._pending_touches = {}  # cache_key -> last hit time, not yet written
+        self._last_touch_flush = time.monotonic()
+        self.entries = 0
+        self.size_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'bypasses': 0, 'stores': 0, 'expired': 0, 'evictions': 0, 'errors': 0}
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._init_database()
+        logger.info(f"LLMResultCache initialized (enabled: {self.enabled}, path: {db_path}, max_entries: {max_entries})")
+
+    def _init_database(self):
+        """Initialize cache schema if not exists and load the running totals"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        provider TEXT NOT NULL,
+                        step_id INTEGER,
+                        result_json TEXT NOT NULL,
+                        size_bytes INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL,
+                        last_accessed REAL NOT NULL
+                    )
+                ''')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed ON llm_cache(last_accessed)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache(expires_at)')
+                self._sync_totals(cursor)
+        except Exception as e:
+            logger.error(f"Failed to initialize LLM cache database: {e}")
+            self.enabled = False
+
+    def _connection(self):
+        """
+        Return this thread's persistent WAL connection, opening it on first use.
+
+        Use as `with self._connection() as conn:`; the context manager commits
+        or rolls back the transaction but keeps the connection open.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=DATABASE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={DATABASE_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA busy_timeout={DATABASE_BUSY_TIMEOUT_MS}')
+        self._local.conn = conn
+        thread = threading.current_thread()
+        with self.lock:
+            for ident, (thread_ref, old_conn) in list(self._connections.items()):
+                owner = thread_ref()
+                if owner is None or not owner.is_alive():
+                    old_conn.close()
+                    del self._connections[ident]
+            self._connections[thread.ident] = (weakref.ref(thread), conn)
+        return conn
+
+    def close(self):
+        """Write pending hit times and close every open connection (e.g. on shutdown)"""
+        if self.enabled:
+            self.flush_touches()
+        with self.lock:
+            for _, conn in self._connections.values():
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.debug(f"Failed to close LLM cache connection: {e}")
+            self._connections.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def make_key(provider: str, request_params: Dict[str, Any]) -> str:
+        """Hash the provider and full request parameters into a cache key"""
+        payload = json.dumps({'provider': provider, 'request': request_params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def ttl_for_step(self, step_id: Optional[int]) -> int:
+        return self.step_ttls.get(step_id, self.default_ttl)
+
+    def _count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def record_bypass(self):
+        self._count('bypasses')
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result dict, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        try:
+            now = time.time()
+            row = self._connection().execute(
+                'SELECT result_json, expires_at FROM llm_cache WHERE cache_key = ?', (cache_key,)
+            ).fetchone()
+            if not row:
+                self._count('misses')
+                return None
+            if row[1] <= now:
+                # Left for the following put to replace, or for eviction to purge
+                with self.lock:
+                    self.stats['expired'] += 1
+                    self.stats['misses'] += 1
+                return None
+            with self.lock:
+                self.stats['hits'] += 1
+                self._pending_touches[cache_key] = now
+                flush_due = (len(self._pending_touches) >= self.touch_batch_size or
+                             time.monotonic() - self._last_touch_flush >= self.touch_flush_seconds)
+            if flush_due:
+                self.flush_touches()
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"LLM cache lookup failed: {e}")
+            self._count('errors')
+            return None
+
+    def flush_touches(self) -> int:
+        """Write queued hit times to last_accessed in one transaction; returns the number written"""
+        with self.lock:
+            touches = self._pending_touches
+            self._pending_touches = {}
+            self._last_touch_flush = time.monotonic()
+        if not touches:
+            return 0
+        try:
+            with self._connection() as conn:
+                conn.executemany(
+                    'UPDATE llm_cache SET last_accessed = ? WHERE cache_key = ? AND last_accessed < ?',
+                    [(accessed, cache_key, accessed) for cache_key, accessed in touches.items()]
+                )
+        except Exception as e:
+            logger.error(f"LLM cache access-time flush failed: {e}")
+            self._count('errors')
+        return len(touches)
+
+    def put(self, cache_key: str, result: Dict[str, Any], provider: str, step_id: Optional[int] = None):
+        """Store a successful result and evict least recently used entries once over budget"""
+        if not self.enabled:
+            return
+        try:
+            result_json = json.dumps(result)
+            size_bytes = len(result_json.encode('utf-8'))
+            if size_bytes > self.max_bytes:
+                return
+            now = time.time()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT size_bytes FROM llm_cache WHERE cache_key = ?', (cache_key,))
+                replaced = cursor.fetchone()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO llm_cache
+                    (cache_key, provider, step_id, result_json, size_bytes, created_at, expires_at, last_accessed)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (cache_key, provider, step_id, result_json, size_bytes, now, now + self.ttl_for_step(step_id), now))
+                with self.lock:
+                    self.stats['stores'] += 1
+                    if replaced:
+                        self.size_bytes += size_bytes - replaced[0]
+                    else:
+                        self.entries += 1
+                        self.size_bytes += size_bytes
+                    over_budget = self.entries > self.max_entries or self.size_bytes > self.max_bytes
+            if over_budget:
+                self.flush_touches()
+                with self._connection() as conn:
+                    evicted = self._evict(conn.cursor())
+                with self.lock:
+                    self.stats['evictions'] += evicted
+        except Exception as e:
+            logger.error(f"LLM cache store failed: {e}")
+            self._count('errors')
+
+    def _sync_totals(self, cursor):
+        """Reload the entry and byte totals from the table (other processes may share it)"""
+        cursor.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache')
+        entries, size_bytes = cursor.fetchone()
+        with self.lock:
+            self.entries = entries
+            self.size_bytes = size_bytes
+        return entries, size_bytes
+
+    def _evict(self, cursor) -> int:
+        """Drop expired entries, then least recently used ones until within budget minus the headroom"""
+        cursor.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (time.time(),))
+        evicted = cursor.rowcount
+
+        entries, total_bytes = self._sync_totals(cursor)
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return evicted
+
+        target_entries = int(self.max_entries * (1 - self.evict_headroom))
+        target_bytes = int(self.max_bytes * (1 - self.evict_headroom))
+        victims = max(entries - target_entries, 0)
+        if total_bytes > target_bytes:
+            # Walk the last_accessed index from the oldest entry only as far as the byte overflow needs
+            freed = 0
+            needed = 0
+            for (size_bytes,) in cursor.execute('SELECT size_bytes FROM llm_cache ORDER BY last_accessed ASC'):
+                if freed >= total_bytes - target_bytes:
+                    break
+                freed += size_bytes
+                needed += 1
+            victims = max(victims, needed)
+
+        cursor.execute('''
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache ORDER BY last_accessed ASC LIMIT ?
+            )
+        ''', (victims,))
+        evicted += cursor.rowcount
+        self._sync_totals(cursor)
+        return evicted
+
+    def clear(self):
+        """Remove every cached entry"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self._pending_touches = {}
+        with self._connection() as conn:
+            conn.execute('DELETE FROM llm_cache')
+            self._sync_totals(conn.cursor())
+        logger.info("LLM result cache cleared")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current size"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = self.entries
+            stats['size_bytes'] = self.size_bytes
+            stats['pending_touches'] = len(self._pending_touches)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups * 100) if lookups else 0
+        stats['enabled'] = self.enabled
+        stats['max_entries'] = self.max_entries
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+# Global instance
+llm_result_cache = None
+_llm_result_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResultCache:
+    """Get or create the LLM result cache instance"""
+    global llm_result_cache
+    if llm_result_cache is None:
+        with _llm_result_cache_lock:
+            if llm_result_cache is None:
+                llm_result_cache = LLMResultCache()
+                atexit.register(llm_result_cache.close)
+    return llm_result_cache
@@ -0,0 +1,143 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+from config import LLM_PRICING
+
+logger = logging.getLogger(__name__)
+
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens')
+
+
+def usage_from_response(response) -> Dict[str, int]:
+    """
+    Token usage reported on an Anthropic or OpenAI-compatible (Perplexity) response.
+
+    Returns:
+        Dict with input_tokens (uncached prompt tokens), output_tokens,
+        cache_read_tokens and cache_write_tokens; missing counts are 0
+    """
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return dict.fromkeys(USAGE_FIELDS, 0)
+    input_tokens = getattr(usage, 'input_tokens', None)
+    if input_tokens is None:
+        input_tokens = getattr(usage, 'prompt_tokens', None)
+    output_tokens = getattr(usage, 'output_tokens', None)
+    if output_tokens is None:
+        output_tokens = getattr(usage, 'completion_tokens', None)
+    return {
+        'input_tokens': input_tokens or 0,
+        'output_tokens': output_tokens or 0,
+        'cache_read_tokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+        'cache_write_tokens': getattr(usage, 'cache_creation_input_tokens', None) or 0,
+    }
+
+
+def estimate_cost(model: str, usage: Dict[str, int], requests: int = 1) -> Optional[float]:
+    """
+    USD cost of the given usage under LLM_PRICING.
+
+    Args:
+        model: Model name the usage was billed under
+        usage: Token counts as returned by usage_from_response
+        requests: Number of billed API requests, for providers with a per-request fee
+
+    Returns:
+        Estimated cost, or None when the model has no price entry
+    """
+    prices = LLM_PRICING.get(model)
+    if prices is None:
+        return None
+    cost = (
+        usage.get('input_tokens', 0) * prices.get('input', 0)
+        + usage.get('output_tokens', 0) * prices.get('output', 0)
+        + usage.get('cache_read_tokens', 0) * prices.get('cache_read', prices.get('input', 0))
+        + usage.get('cache_write_tokens', 0) * prices.get('cache_write', prices.get('input', 0))
+    ) / 1_000_000
+    return cost + requests * prices.get('per_request', 0)
+
+
+class CallTelemetry:
+    """
+    Model, token usage, HTTP attempts and wall time of one logical LLM call.
+
+    Covers every attempt of the call, including rate limiter admission and
+    retry backoff, so duration_seconds is what the step actually waited.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.time()
+        self.duration_seconds = None
+        self.attempts = 0
+        self.requests = 0  # attempts that returned a response
+        self.batch_size = 1
+        self.usage = dict.fromkeys(USAGE_FIELDS, 0)
+        self.cost = 0.0 if model in LLM_PRICING else None
+
+    def record_response(self, response):
+        """Add the usage and cost of a successful attempt's response"""
+        self.requests += 1
+        usage = usage_from_response(response)
+        for field, count in usage.items():
+            self.usage[field] += count
+        if self.cost is not None:
+            self.cost += estimate_cost(self.model, usage)
+
+    def finish(self):
+        if self.duration_seconds is None:
+            self.duration_seconds = time.time() - self.started
+        return self
+
+    @property
+    def token_count(self) -> int:
+        return sum(self.usage.values())
+
+    def split(self, parts: int):
+        """
+        Divide a batched call's usage evenly between the jobs it served.
+
+        Token counts and cost are split so the shares add up to the call's
+        totals; every share keeps the call's wall time and attempt count, since
+        each job waited for the whole call.
+        """
+        self.finish()
+        shares = []
+        for index in range(parts):
+            share = CallTelemetry(self.model)
+            share.started = self.started
+            share.duration_seconds = self.duration_seconds
+            share.attempts = self.attempts
+            share.requests = self.requests
+            share.batch_size = parts
+            share.cost = self.cost / parts if self.cost is not None else None
+            for field, count in self.usage.items():
+                share.usage[field] = count // parts + (1 if index < count % parts else 0)
+            shares.append(share)
+        return shares
+
+    def add(self, other: 'CallTelemetry'):
+        """Fold a follow-up call (e.g. an individual fallback request) into this one"""
+        other.finish()
+        self.finish()
+        self.duration_seconds += other.duration_seconds
+        self.attempts += other.attempts
+        self.requests += other.requests
+        for field, count in other.usage.items():
+            self.usage[field] += count
+        if self.cost is not None and other.cost is not None:
+            self.cost += other.cost
+        return self
+
+    def to_record(self) -> Dict[str, Any]:
+        """Fields for the step_outputs / insights telemetry columns"""
+        self.finish()
+        return dict(
+            self.usage,
+            model_used=self.model,
+            duration_seconds=round(self.duration_seconds, 3),
+            token_count=self.token_count,
+            cost_estimate=round(self.cost, 6) if self.cost is not None else None,
+            attempts=self.attempts,
+            batch_size=self.batch_size,
+        )
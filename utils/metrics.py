@@ -0,0 +1,335 @@
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Tuple
+from config import (
+    METRICS_LLM_LATENCY_BUCKETS, METRICS_SSE_FIRST_EVENT_BUCKETS, METRICS_SSE_STREAM_BUCKETS,
+    METRICS_DB_WRITE_BUCKETS
+)
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """Named metric with a fixed label set; one value series per label combination"""
+
+    type_name = None
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """Drop every series, e.g. before a collector re-reports a gauge"""
+        with self.lock:
+            self.series.clear()
+
+    def samples(self) -> List[Tuple[str, Tuple, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        for name, pairs, value in self.samples():
+            lines.append(f'{name}{_format_labels(pairs)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count; by convention the name ends in _total"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+    def samples(self):
+        with self.lock:
+            series = dict(self.series)
+        return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in sorted(series.items())]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self.lock:
+            series = dict(self.series)
+        return [(self.name, tuple(zip(self.labelnames, key)), value) for key, value in sorted(series.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed cumulative buckets"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=METRICS_LLM_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = sorted(float(bound) for bound in buckets if bound != math.inf) + [math.inf]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.series.get(key)
+            if state is None:
+                state = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def samples(self):
+        with self.lock:
+            series = {key: dict(state, counts=list(state['counts'])) for key, state in self.series.items()}
+        samples = []
+        for key, state in sorted(series.items()):
+            pairs = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', pairs + (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', pairs, state['sum']))
+            samples.append((f'{self.name}_count', pairs, state['count']))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    In-process metrics registry rendered in the Prometheus text exposition format.
+
+    Hot paths update counters and histograms directly. Values that are cheaper
+    to read than to track (queue depths, cache sizes) are filled in by
+    collectors, which run at scrape time just before rendering.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+        self.lock = threading.Lock()
+
+    def _register(self, metric_class, name, help_text, labelnames, **kwargs):
+        with self.lock:
+            existing = self.metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, metric_class) or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"Metric {name} already registered with a different type or labels")
+                return existing
+            metric = metric_class(name, help_text, labelnames, **kwargs)
+            self.metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=METRICS_LLM_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Register a callable run before every render to refresh scrape-time gauges"""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Run the collectors and return every metric in text exposition format"""
+        with self.lock:
+            collectors = list(self.collectors)
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}", exc_info=True)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+metrics_registry = MetricsRegistry()
+
+# LLM calls
+llm_call_seconds = metrics_registry.histogram(
+    'chatprfaq_llm_call_duration_seconds',
+    'Wall time of a successful logical LLM call, including retries and rate limiter admission',
+    ('provider', 'kind', 'step')
+)
+llm_call_attempts = metrics_registry.histogram(
+    'chatprfaq_llm_call_attempts',
+    'HTTP attempts made by a successful logical LLM call',
+    ('provider', 'kind'),
+    buckets=[1, 2, 3, 4, 5]
+)
+llm_errors = metrics_registry.counter(
+    'chatprfaq_llm_errors_total',
+    'Failed LLM attempts by retry policy and error class (timeout, overloaded = HTTP 529, rate_limited, ...)',
+    ('policy', 'error_class')
+)
+llm_retries = metrics_registry.counter(
+    'chatprfaq_llm_retries_total',
+    'Failed LLM attempts that were retried, by retry policy and error class',
+    ('policy', 'error_class')
+)
+
+# SSE streams
+sse_first_event_seconds = metrics_registry.histogram(
+    'chatprfaq_sse_time_to_first_event_seconds',
+    'Time from opening a progress stream to its first pipeline event',
+    buckets=METRICS_SSE_FIRST_EVENT_BUCKETS
+)
+sse_stream_seconds = metrics_registry.histogram(
+    'chatprfaq_sse_stream_duration_seconds',
+    'Lifetime of a progress stream by how it ended',
+    ('outcome',),
+    buckets=METRICS_SSE_STREAM_BUCKETS
+)
+sse_active_streams = metrics_registry.gauge(
+    'chatprfaq_sse_active_streams',
+    'Progress streams currently open'
+)
+sse_resumes = metrics_registry.counter(
+    'chatprfaq_sse_resumes_total',
+    'Progress stream reconnects by outcome (replayed, gap = some missed events were already evicted, stored = answered from the completion store, other_worker, not_found)',
+    ('outcome',)
+)
+sse_replayed_events = metrics_registry.counter(
+    'chatprfaq_sse_replayed_events_total',
+    'Buffered events replayed to reconnecting streams'
+)
+
+# Reporting database
+db_write_seconds = metrics_registry.histogram(
+    'chatprfaq_db_write_commit_seconds',
+    'Commit latency of one write-behind batch',
+    buckets=METRICS_DB_WRITE_BUCKETS
+)
+
+# Background executors
+executor_tasks = metrics_registry.counter(
+    'chatprfaq_executor_tasks_total',
+    'Tasks handled by each background executor by outcome (completed, failed, rejected = queue full)',
+    ('executor', 'outcome')
+)
+executor_busy_seconds = metrics_registry.counter(
+    'chatprfaq_executor_busy_seconds_total',
+    'Worker time spent running tasks; rate() divided by the worker count is the utilization',
+    ('executor',)
+)
+
+# Scrape-time gauges, set by the collector registered in routes
+inflight_pipelines_gauge = metrics_registry.gauge(
+    'chatprfaq_inflight_pipelines',
+    'Pipelines currently running'
+)
+progress_queue_depth = metrics_registry.gauge(
+    'chatprfaq_progress_queue_depth',
+    'Progress events waiting in stream subscriber queues, summed (aggregate="sum") or for the deepest queue (aggregate="max")',
+    ('aggregate',)
+)
+sse_event_buffer_bytes = metrics_registry.gauge(
+    'chatprfaq_sse_event_buffer_bytes',
+    'Serialized SSE frames held in the per-run replay buffers'
+)
+cache_entries = metrics_registry.gauge(
+    'chatprfaq_cache_entries',
+    'Entries held by each cache',
+    ('cache',)
+)
+cache_bytes = metrics_registry.gauge(
+    'chatprfaq_cache_bytes',
+    'Bytes held by each cache',
+    ('cache',)
+)
+executor_queue_depth = metrics_registry.gauge(
+    'chatprfaq_executor_queue_depth',
+    'Tasks waiting for a worker in each background executor',
+    ('executor',)
+)
+executor_active_workers = metrics_registry.gauge(
+    'chatprfaq_executor_active_workers',
+    'Workers of each background executor currently running a task',
+    ('executor',)
+)
+executor_utilization = metrics_registry.gauge(
+    'chatprfaq_executor_utilization',
+    'Fraction of each background executor\'s workers currently busy',
+    ('executor',)
+)
+timers_pending = metrics_registry.gauge(
+    'chatprfaq_timers_pending',
+    'Delayed and periodic callbacks scheduled on the timer wheel'
+)
+timer_max_lag_seconds = metrics_registry.gauge(
+    'chatprfaq_timer_max_lag_seconds',
+    'Largest delay between a timer\'s deadline and its callback being run'
+)
+db_write_queue_depth = metrics_registry.gauge(
+    'chatprfaq_db_write_queue_depth',
+    'Records waiting in the database write-behind queue'
+)
+db_write_last_commit_seconds = metrics_registry.gauge(
+    'chatprfaq_db_write_last_commit_seconds',
+    'Commit latency of the most recent write-behind batch'
+)
+
+
+def observe_llm_call(provider: str, kind: str, step, telemetry):
+    """
+    Record a successful LLM call's latency and attempt count.
+
+    Args:
+        provider: 'anthropic' or 'perplexity'
+        kind: 'step' for pipeline steps, 'insight' for insight extraction
+        step: Step ID (or 'batch' for a merged insight request); None is reported as 'other'
+        telemetry: The call's CallTelemetry
+    """
+    telemetry.finish()
+    llm_call_seconds.observe(telemetry.duration_seconds, provider=provider, kind=kind, step=step if step is not None else 'other')
+    llm_call_attempts.observe(telemetry.attempts, provider=provider, kind=kind)
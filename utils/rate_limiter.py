@@ -0,0 +1,362 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from config import (
+    RATE_LIMITER_ENABLED, LLM_RATE_LIMITS, LLM_RATE_LIMIT_DEFAULTS, LLM_ADMISSION_TIMEOUT_SECONDS,
+    AIMD_ADDITIVE_INCREASE, AIMD_DECREASE_FACTOR, AIMD_DECREASE_COOLDOWN_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Admission priority classes; lower values are admitted first
+PRIORITY_INTERACTIVE = 0  # streamed pipelines a user is watching
+PRIORITY_STEP = 1  # single-step API calls
+PRIORITY_INSIGHT = 2  # background insight extraction
+PRIORITY_BATCH = 3  # synchronous whole-pipeline and debug runs
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_STEP: 'step',
+    PRIORITY_INSIGHT: 'insight',
+    PRIORITY_BATCH: 'batch',
+}
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a call could not be admitted by its provider limiter in time"""
+
+
+def estimate_tokens(prompt_chars: int, max_tokens: int) -> int:
+    """Rough token cost of a request: ~4 characters per prompt token plus the full output budget"""
+    return prompt_chars // 4 + max_tokens
+
+
+def usage_tokens(response) -> Optional[int]:
+    """Total tokens reported by an Anthropic or OpenAI-compatible response, if any"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None
+    total = getattr(usage, 'total_tokens', None)
+    if total is not None:
+        return total
+    input_tokens = getattr(usage, 'input_tokens', None)
+    output_tokens = getattr(usage, 'output_tokens', None)
+    if input_tokens is None and output_tokens is None:
+        return None
+    return (input_tokens or 0) + (output_tokens or 0)
+
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to one minute of budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (after refill)"""
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class _Waiter:
+    """A caller queued for admission; woken through an Event (threads) or a Future (asyncio)"""
+
+    def __init__(self, priority: int, tokens: int, seq: int, loop=None):
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def reset(self):
+        """Prepare for the next wait; called with the limiter lock held"""
+        if self.loop:
+            self.future = self.loop.create_future()
+        else:
+            self.event.clear()
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._resolve, self.future)
+        else:
+            self.event.set()
+
+    @staticmethod
+    def _resolve(future):
+        if future is not None and not future.done():
+            future.set_result(None)
+
+
+class RateLimitTicket:
+    """Proof of admission; hand it back to release() when the call finishes"""
+
+    def __init__(self, limiter, tokens: int, priority: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.priority = priority
+        self.admitted_at = time.time()
+        self.released = False
+
+    def release(self, tokens_used: Optional[int] = None, overloaded: bool = False):
+        if self.limiter is not None:
+            self.limiter.release(self, tokens_used=tokens_used, overloaded=overloaded)
+
+
+class ProviderRateLimiter:
+    """
+    Admission control for one provider/model.
+
+    A call is admitted when it is the highest-priority waiter (FIFO within a
+    priority class), a request token and its estimated LLM tokens are available
+    in the per-minute buckets, and fewer than the adaptive concurrency limit are
+    in flight. The limit grows additively on success and is cut multiplicatively
+    (at most once per cooldown) when the provider reports overload, so a burst
+    backs off together instead of retrying in lockstep.
+    """
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 16, min_concurrency: int = 1):
+        self.name = name
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.waiters = []
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.last_decrease = 0.0
+        self.stats = {'admitted': 0, 'queued': 0, 'timeouts': 0, 'overloads': 0, 'decreases': 0,
+                      'total_wait_ms': 0.0, 'max_wait_ms': 0.0, 'tokens_used': 0}
+
+    # --- admission -------------------------------------------------------
+
+    def _try_admit(self, waiter: _Waiter) -> Optional[float]:
+        """
+        Admit the waiter if possible; called with the lock held.
+
+        Returns:
+            None once admitted, otherwise the seconds to wait before re-checking
+            (float('inf') when only a release can unblock it)
+        """
+        if not self.waiters or self.waiters[0] is not waiter:
+            return float('inf')
+        if self.in_flight >= max(self.min_concurrency, int(self.concurrency_limit)):
+            return float('inf')
+
+        now = time.monotonic()
+        delay = 0.0
+        if self.rpm_bucket:
+            self.rpm_bucket.refill(now)
+            delay = max(delay, self.rpm_bucket.wait_time(1))
+        if self.tpm_bucket:
+            self.tpm_bucket.refill(now)
+            delay = max(delay, self.tpm_bucket.wait_time(waiter.tokens))
+        if delay > 0:
+            return delay
+
+        if self.rpm_bucket:
+            self.rpm_bucket.tokens -= 1
+        if self.tpm_bucket:
+            self.tpm_bucket.tokens -= min(waiter.tokens, self.tpm_bucket.capacity)
+        self.in_flight += 1
+        heapq.heappop(self.waiters)
+        self._wake_head()
+        return None
+
+    def _wake_head(self):
+        if self.waiters:
+            self.waiters[0].wake()
+
+    def _enqueue(self, waiter: _Waiter):
+        heapq.heappush(self.waiters, waiter)
+        self.stats['queued'] += 1
+
+    def _abandon(self, waiter: _Waiter):
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            heapq.heapify(self.waiters)
+        self.stats['timeouts'] += 1
+        self._wake_head()
+
+    def _admitted(self, waiter: _Waiter, started: float) -> RateLimitTicket:
+        wait_ms = (time.monotonic() - started) * 1000
+        self.stats['admitted'] += 1
+        self.stats['total_wait_ms'] += wait_ms
+        self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], wait_ms)
+        if wait_ms > 1000:
+            logger.info(f"Rate limiter {self.name}: {PRIORITY_NAMES.get(waiter.priority, waiter.priority)} call admitted after {wait_ms:.0f}ms")
+        return RateLimitTicket(self, waiter.tokens, waiter.priority)
+
+    def acquire(self, priority: int = PRIORITY_STEP, tokens: int = 0,
+                timeout: float = LLM_ADMISSION_TIMEOUT_SECONDS) -> RateLimitTicket:
+        """
+        Block until the call may be sent.
+
+        Args:
+            priority: One of the PRIORITY_* classes
+            tokens: Estimated LLM tokens for the call (see estimate_tokens)
+            timeout: Maximum seconds to wait for admission
+
+        Returns:
+            RateLimitTicket to release when the call completes
+
+        Raises:
+            AdmissionTimeout: If the call was not admitted within timeout
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.lock:
+            waiter = _Waiter(priority, tokens, next(self.sequence))
+            self._enqueue(waiter)
+        while True:
+            with self.lock:
+                waiter.reset()
+                delay = self._try_admit(waiter)
+                if delay is None:
+                    return self._admitted(waiter, started)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(waiter)
+                    raise AdmissionTimeout(f"LLM admission for {self.name} timed out after {timeout:.1f}s")
+            waiter.event.wait(min(delay, remaining))
+
+    async def aacquire(self, priority: int = PRIORITY_STEP, tokens: int = 0,
+                       timeout: float = LLM_ADMISSION_TIMEOUT_SECONDS) -> RateLimitTicket:
+        """Async counterpart of acquire(); waits on the event loop without blocking it"""
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.lock:
+            waiter = _Waiter(priority, tokens, next(self.sequence), loop=asyncio.get_running_loop())
+            self._enqueue(waiter)
+        try:
+            while True:
+                with self.lock:
+                    waiter.reset()
+                    delay = self._try_admit(waiter)
+                    if delay is None:
+                        return self._admitted(waiter, started)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._abandon(waiter)
+                        raise AdmissionTimeout(f"LLM admission for {self.name} timed out after {timeout:.1f}s")
+                    future = waiter.future
+                await asyncio.wait({future}, timeout=min(delay, remaining))
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                    heapq.heapify(self.waiters)
+                    self._wake_head()
+            raise
+
+    # --- completion ------------------------------------------------------
+
+    def release(self, ticket: RateLimitTicket, tokens_used: Optional[int] = None, overloaded: bool = False):
+        """
+        Return a ticket once its call has finished.
+
+        Args:
+            ticket: The ticket returned by acquire()/aacquire()
+            tokens_used: Actual tokens reported by the provider, to correct the estimate
+            overloaded: Whether the call failed with a rate limit / overload response
+        """
+        with self.lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.in_flight = max(0, self.in_flight - 1)
+
+            if tokens_used is not None:
+                self.stats['tokens_used'] += tokens_used
+                if self.tpm_bucket:
+                    # Refund an overestimate, or carry an underestimate as debt
+                    self.tpm_bucket.tokens = min(self.tpm_bucket.capacity, self.tpm_bucket.tokens + ticket.tokens - tokens_used)
+
+            now = time.monotonic()
+            if overloaded:
+                self.stats['overloads'] += 1
+                if now - self.last_decrease >= AIMD_DECREASE_COOLDOWN_SECONDS:
+                    previous = self.concurrency_limit
+                    self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * AIMD_DECREASE_FACTOR)
+                    self.last_decrease = now
+                    self.stats['decreases'] += 1
+                    logger.warning(f"Rate limiter {self.name}: provider overloaded, concurrency limit {previous:.1f} -> {self.concurrency_limit:.1f}")
+            else:
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + AIMD_ADDITIVE_INCREASE / self.concurrency_limit)
+
+            self._wake_head()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = self.in_flight
+            stats['queued_now'] = len(self.waiters)
+            stats['concurrency_limit'] = round(self.concurrency_limit, 2)
+            stats['max_concurrency'] = self.max_concurrency
+            now = time.monotonic()
+            if self.rpm_bucket:
+                self.rpm_bucket.refill(now)
+                stats['rpm_available'] = round(self.rpm_bucket.tokens, 1)
+            if self.tpm_bucket:
+                self.tpm_bucket.refill(now)
+                stats['tpm_available'] = round(self.tpm_bucket.tokens)
+        stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['admitted'] if stats['admitted'] else 0.0
+        return stats
+
+
+class _UnlimitedLimiter:
+    """Stand-in used when rate limiting is disabled"""
+
+    def acquire(self, priority=PRIORITY_STEP, tokens=0, timeout=None):
+        return RateLimitTicket(None, tokens, priority)
+
+    async def aacquire(self, priority=PRIORITY_STEP, tokens=0, timeout=None):
+        return RateLimitTicket(None, tokens, priority)
+
+    def release(self, ticket, tokens_used=None, overloaded=False):
+        pass
+
+
+# Global registry, one limiter per provider/model
+rate_limiters: Dict[str, ProviderRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+_unlimited = _UnlimitedLimiter()
+
+def get_rate_limiter(provider: str, model: str):
+    """Get or create the limiter for a provider/model, configured from LLM_RATE_LIMITS"""
+    if not RATE_LIMITER_ENABLED:
+        return _unlimited
+    key = f"{provider}:{model}"
+    limiter = rate_limiters.get(key)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = rate_limiters.get(key)
+            if limiter is None:
+                limits = dict(LLM_RATE_LIMIT_DEFAULTS, **LLM_RATE_LIMITS.get(key, {}))
+                limiter = ProviderRateLimiter(key, **limits)
+                rate_limiters[key] = limiter
+                logger.info(f"Rate limiter created for {key}: {limits}")
+    return limiter
+
+def get_rate_limiter_stats() -> Dict[str, Any]:
+    """Per provider/model admission counters, queue depth and current concurrency limit"""
+    with _rate_limiters_lock:
+        limiters = dict(rate_limiters)
+    return {key: limiter.get_stats() for key, limiter in limiters.items()}
@@ -1,11 +1,17 @@
 import time
 import logging
+import threading
+import zlib
+from collections import OrderedDict
+from config import RAW_OUTPUT_CACHE_TTL_SECONDS, RAW_OUTPUT_CACHE_MAX_BYTES, RAW_OUTPUT_CACHE_COMPRESSION_LEVEL
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
 # Import database service for dual-write pattern
 try:
     from utils.database_service import get_db_service
+    from utils.db_write_queue import get_db_write_queue
     DATABASE_ENABLED = True
     logger.info("Database service available for dual-write reporting")
 except ImportError as e:
@@ -13,54 +19,211 @@ except ImportError as e:
     DATABASE_ENABLED = False
 
 # --- BEGIN: Raw LLM Output Cache ---
-# Structure: {'request_id': {'timestamp': time.time(), 'steps_outputs': list}}
-raw_llm_outputs_cache = {}
-CACHE_TTL_SECONDS = 24 * 60 * 60  # 24 hours
-MAX_CACHE_ENTRIES = 100 # Max number of unique request_id entries to keep
+class RawOutputCache:
+    """
+    Thread-safe LRU cache of per-request raw step outputs and insights.
 
-def store_raw_llm_output(request_id: str, step_info: str, raw_output: str):
+    Entries live in an OrderedDict ordered by last write: every store moves the
+    request_id to the end and refreshes its timestamp. Because the TTL is the
+    same for every entry, the least recently used entry is also the next one
+    to expire, so TTL cleanup only ever pops from the front and get/put/evict
+    are all O(1) amortized.
+
+    Step outputs are held zlib-compressed and only decompressed when a reader
+    asks for them. Capacity is a budget on resident bytes (compressed outputs
+    plus insight text) rather than an entry count, so long runs and short runs
+    are charged for what they actually hold.
+
+    Entry structure: {'timestamp': time.time(), 'steps_outputs': list, 'insights': dict (optional)}
+    """
+
+    def __init__(self, ttl_seconds: int = RAW_OUTPUT_CACHE_TTL_SECONDS, max_bytes: int = RAW_OUTPUT_CACHE_MAX_BYTES,
+                 compression_level: int = RAW_OUTPUT_CACHE_COMPRESSION_LEVEL):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self.entries = OrderedDict()
+        self.entry_bytes = {}  # request_id -> [resident_bytes, uncompressed_bytes]
+        self.resident_bytes = 0
+        self.uncompressed_bytes = 0
+        self.lock = threading.Lock()
+        # Signalled whenever an insight is stored, so waiters wake immediately
+        self.insight_stored = threading.Condition(self.lock)
+        self.stats = {'evictions': 0, 'expired': 0}
+
+    def _expire(self, now: float):
+        """Drop expired entries; they are always at the front of the LRU order"""
+        while self.entries:
+            request_id, entry = next(iter(self.entries.items()))
+            if now - entry['timestamp'] <= self.ttl_seconds:
+                return
+            self._remove(request_id)
+            self.stats['expired'] += 1
+            logger.info(f"Expired request_id entry '{request_id}' from cache. Cache size: {len(self.entries)}")
+
+    def _remove(self, request_id: str):
+        self.entries.pop(request_id, None)
+        resident, uncompressed = self.entry_bytes.pop(request_id, (0, 0))
+        self.resident_bytes -= resident
+        self.uncompressed_bytes -= uncompressed
+
+    def _evict_over_budget(self, keep: str):
+        """Evict least recently used entries (never `keep`) until within the byte budget"""
+        while self.entries and self.resident_bytes > self.max_bytes:
+            oldest_req_id = next(iter(self.entries))
+            if oldest_req_id == keep:
+                return
+            self._remove(oldest_req_id)
+            self.stats['evictions'] += 1
+            logger.info(f"Evicted oldest request_id entry '{oldest_req_id}' from cache due to size limit. Cache size: {len(self.entries)}, resident bytes: {self.resident_bytes}")
+
+    def _touch(self, request_id: str, now: float) -> dict:
+        """Get or create the entry for request_id and mark it most recently used"""
+        self._expire(now)
+        entry = self.entries.get(request_id)
+        if entry is None:
+            entry = {'timestamp': now, 'steps_outputs': []}
+            self.entries[request_id] = entry
+            self.entry_bytes[request_id] = [0, 0]
+            logger.info(f"Initialized new cache entry for request_id '{request_id}'. Cache size: {len(self.entries)}")
+        else:
+            # Update the main timestamp for existing request_id to reflect recent activity
+            entry['timestamp'] = now
+            self.entries.move_to_end(request_id)
+        return entry
+
+    def _add_bytes(self, request_id: str, resident: int, uncompressed: int):
+        sizes = self.entry_bytes[request_id]
+        sizes[0] += resident
+        sizes[1] += uncompressed
+        self.resident_bytes += resident
+        self.uncompressed_bytes += uncompressed
+
+    def append_step_output(self, request_id: str, step_info: str, raw_output: str) -> int:
+        """Append one step's raw output; returns the number of outputs stored for the request"""
+        encoded = raw_output.encode('utf-8')
+        # Compress before taking the lock so concurrent writers don't serialize on zlib
+        compressed = zlib.compress(encoded, self.compression_level)
+        now = time.time()
+        with self.lock:
+            entry = self._touch(request_id, now)
+            entry['steps_outputs'].append({
+                'step_info': step_info,
+                'raw_output_compressed': compressed,
+                'timestamp_step': now
+            })
+            self._add_bytes(request_id, len(compressed), len(encoded))
+            self._evict_over_budget(keep=request_id)
+            return len(entry['steps_outputs'])
+
+    def put_insight(self, request_id: str, step_id: int, insight: str, insight_label: str = None):
+        """Store (or replace) the insight for one step"""
+        now = time.time()
+        with self.lock:
+            insights = self._touch(request_id, now).setdefault('insights', {})
+            previous = insights.get(step_id)
+            if previous:
+                previous_size = len(previous['insight'].encode('utf-8'))
+                self._add_bytes(request_id, -previous_size, -previous_size)
+            insights[step_id] = {
+                'insight': insight,
+                'insight_label': insight_label,
+                'timestamp': now
+            }
+            # Counted in UTF-8 bytes, the same unit as the step outputs and max_bytes
+            size = len(insight.encode('utf-8'))
+            self._add_bytes(request_id, size, size)
+            self._evict_over_budget(keep=request_id)
+            self.insight_stored.notify_all()
+
+    def get_entry(self, request_id: str):
+        """Return a decompressed copy of the entry for request_id, or None if missing or expired"""
+        with self.lock:
+            self._expire(time.time())
+            entry = self.entries.get(request_id)
+            if entry is None:
+                return None
+            timestamp = entry['timestamp']
+            steps_outputs = list(entry['steps_outputs'])
+            insights = dict(entry['insights']) if 'insights' in entry else None
+
+        # Stored step dicts are never mutated, so decompression can happen outside the lock
+        snapshot = {
+            'timestamp': timestamp,
+            'steps_outputs': [
+                {
+                    'step_info': step['step_info'],
+                    'raw_output': zlib.decompress(step['raw_output_compressed']).decode('utf-8'),
+                    'timestamp_step': step['timestamp_step']
+                }
+                for step in steps_outputs
+            ]
+        }
+        if insights is not None:
+            snapshot['insights'] = insights
+        return snapshot
+
+    def get_insights(self, request_id: str) -> dict:
+        """Return a copy of the insights stored for request_id"""
+        with self.lock:
+            self._expire(time.time())
+            entry = self.entries.get(request_id)
+            return dict(entry['insights']) if entry and 'insights' in entry else {}
+
+    def wait_for_insights(self, request_id: str, timeout: float, step_id: int = None, min_count: int = 1) -> dict:
+        """
+        Block until insights are available for request_id, or the timeout elapses.
+
+        Args:
+            request_id: Request ID to wait on
+            timeout: Maximum seconds to wait
+            step_id: Wait for this step's insight; otherwise wait for min_count insights
+            min_count: Number of insights to wait for when step_id is not given
+
+        Returns:
+            Copy of the insights stored for request_id when the wait ended
+        """
+        def ready():
+            entry = self.entries.get(request_id)
+            insights = entry.get('insights', {}) if entry else {}
+            return step_id in insights if step_id is not None else len(insights) >= min_count
+
+        with self.insight_stored:
+            self.insight_stored.wait_for(ready, timeout)
+            entry = self.entries.get(request_id)
+            return dict(entry['insights']) if entry and 'insights' in entry else {}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            stats = {
+                'entries': len(self.entries),
+                'resident_bytes': self.resident_bytes,
+                'uncompressed_bytes': self.uncompressed_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                **self.stats
+            }
+        stats['compression_ratio'] = (stats['uncompressed_bytes'] / stats['resident_bytes']) if stats['resident_bytes'] else 0
+        return stats
+
+
+raw_llm_outputs_cache = RawOutputCache()
+
+@traced('store_raw_output')
+def store_raw_llm_output(request_id: str, step_info: str, raw_output: str, telemetry: dict = None):
+    """
+    Store a step's raw LLM output for the request.
+
+    Args:
+        telemetry: Optional CallTelemetry.to_record() fields (model, tokens, cost,
+            attempts, duration) persisted alongside the output
+    """
     if not request_id or not step_info or not raw_output:
         logger.debug(f"Skipping storage: missing request_id, step_info, or raw_output. ReqID: {request_id}, StepInfo: {step_info}, OutputPresent: {bool(raw_output)}")
         return
 
-    current_time = time.time()
-
-    # === EXISTING CACHE LOGIC (UNCHANGED) ===
-    # Evict oldest request_id entry if cache is full and new request_id is being added
-    if request_id not in raw_llm_outputs_cache and len(raw_llm_outputs_cache) >= MAX_CACHE_ENTRIES:
-        oldest_req_id_to_evict = None
-        min_ts = float('inf')
-        for r_id, entry in raw_llm_outputs_cache.items():
-            if entry['timestamp'] < min_ts:
-                min_ts = entry['timestamp']
-                oldest_req_id_to_evict = r_id
-        if oldest_req_id_to_evict:
-            try:
-                del raw_llm_outputs_cache[oldest_req_id_to_evict]
-                logger.info(f"Evicted oldest request_id entry '{oldest_req_id_to_evict}' from cache due to size limit. Cache size: {len(raw_llm_outputs_cache)}")
-            except KeyError:
-                logger.warning(f"Failed to evict oldest request_id entry '{oldest_req_id_to_evict}', key not found.")
-
-    # Get or initialize the entry for the request_id
-    if request_id not in raw_llm_outputs_cache:
-        raw_llm_outputs_cache[request_id] = {
-            'timestamp': current_time, 
-            'steps_outputs': []
-        }
-        logger.info(f"Initialized new cache entry for request_id '{request_id}'. Cache size: {len(raw_llm_outputs_cache)}")
-    else:
-        # Update the main timestamp for existing request_id to reflect recent activity
-        raw_llm_outputs_cache[request_id]['timestamp'] = current_time
-
-    # Append the current step's output
-    step_output_entry = {
-        'step_info': step_info,
-        'raw_output': raw_output,
-        'timestamp_step': current_time
-    }
-    raw_llm_outputs_cache[request_id]['steps_outputs'].append(step_output_entry)
-    
-    logger.debug(f"Stored/Appended raw LLM output for request_id '{request_id}', step '{step_info}'. Num steps stored for this ID: {len(raw_llm_outputs_cache[request_id]['steps_outputs'])}")
+    steps_stored = raw_llm_outputs_cache.append_step_output(request_id, step_info, raw_output)
+    logger.debug(f"Stored/Appended raw LLM output for request_id '{request_id}', step '{step_info}'. Num steps stored for this ID: {steps_stored}")
 
     # === NEW: DATABASE DUAL-WRITE (ADDITIVE ONLY) ===
     if DATABASE_ENABLED:
@@ -71,15 +234,16 @@ def store_raw_llm_output(request_id: str, step_info: str, raw_output: str):
                 step_id = int(step_parts[1])
                 step_name = '_'.join(step_parts[2:])
                 
-                # Save to database (non-blocking, graceful failure)
-                db_service = get_db_service()
-                db_service.save_step_output(
+                # Queue for the write-behind writer (non-blocking, graceful failure)
+                get_db_write_queue().enqueue(
+                    'step_output',
                     request_id=request_id,
                     step_id=step_id,
                     step_name=step_name,
-                    raw_llm_output=raw_output
+                    raw_llm_output=raw_output,
+                    **(telemetry or {})
                 )
-                logger.debug(f"Database: Saved step output for {request_id}/step_{step_id}")
+                logger.debug(f"Database: Queued step output for {request_id}/step_{step_id}")
             else:
                 logger.debug(f"Database: Could not parse step_info '{step_info}' for database storage")
                 
@@ -92,67 +256,38 @@ def get_raw_llm_output(request_id: str):
     if not request_id:
         logger.debug(f"Cannot get raw LLM output due to missing request_id.")
         return None
-    
-    current_time = time.time()
-
-    # Clean expired top-level request_id entries before retrieving
-    for r_id_key in list(raw_llm_outputs_cache.keys()): 
-        entry = raw_llm_outputs_cache.get(r_id_key)
-        if entry and (current_time - entry['timestamp'] > CACHE_TTL_SECONDS):
-            try:
-                del raw_llm_outputs_cache[r_id_key]
-                logger.info(f"Expired request_id entry '{r_id_key}' from cache. Cache size: {len(raw_llm_outputs_cache)}")
-            except KeyError:
-                logger.warning(f"Failed to remove expired request_id entry '{r_id_key}', key not found during TTL cleanup.")
-    
-    return raw_llm_outputs_cache.get(request_id) # Returns the dict {'timestamp': ..., 'steps_outputs': [...]} or None
+
+    return raw_llm_outputs_cache.get_entry(request_id) # Returns the dict {'timestamp': ..., 'steps_outputs': [...]} or None
+
+def get_raw_output_cache_stats():
+    """Entry count, resident and uncompressed size, and eviction counters of the raw output cache"""
+    return raw_llm_outputs_cache.get_stats()
 
 # --- END: Raw LLM Output Cache --- 
 
 # --- BEGIN: Insight Cache ---
-def store_insight(request_id: str, step_id: int, insight: str, insight_label: str = None):
-    """Store insight for a specific step, even after main processing completes"""
+def store_insight(request_id: str, step_id: int, insight: str, insight_label: str = None, telemetry: dict = None):
+    """Store insight for a specific step, even after main processing completes; telemetry as in store_raw_llm_output"""
     if not request_id or not step_id or not insight:
         logger.debug(f"Skipping insight storage: missing required data. ReqID: {request_id}, StepID: {step_id}, InsightPresent: {bool(insight)}")
         return
 
-    current_time = time.time()
-    
-    # === EXISTING CACHE LOGIC (UNCHANGED) ===
-    # Get or initialize the entry for the request_id (reuse existing logic)
-    if request_id not in raw_llm_outputs_cache:
-        raw_llm_outputs_cache[request_id] = {
-            'timestamp': current_time, 
-            'steps_outputs': [],
-            'insights': {}  # New field for insights
-        }
-        logger.info(f"Initialized new cache entry with insights for request_id '{request_id}'. Cache size: {len(raw_llm_outputs_cache)}")
-    else:
-        # Update timestamp and ensure insights field exists
-        raw_llm_outputs_cache[request_id]['timestamp'] = current_time
-        if 'insights' not in raw_llm_outputs_cache[request_id]:
-            raw_llm_outputs_cache[request_id]['insights'] = {}
-    
-    # Store the insight for this step
-    raw_llm_outputs_cache[request_id]['insights'][step_id] = {
-        'insight': insight,
-        'insight_label': insight_label,
-        'timestamp': current_time
-    }
+    raw_llm_outputs_cache.put_insight(request_id, step_id, insight, insight_label)
     
     logger.info(f"Stored insight for request_id '{request_id}', step {step_id}: '{insight[:50]}...' with label '{insight_label}'")
 
     # === NEW: DATABASE DUAL-WRITE (ADDITIVE ONLY) ===
     if DATABASE_ENABLED:
         try:
-            db_service = get_db_service()
-            db_service.save_insight(
+            get_db_write_queue().enqueue(
+                'insight',
                 request_id=request_id,
                 step_id=step_id,
                 insight_text=insight,
-                insight_label=insight_label
+                insight_label=insight_label,
+                **(telemetry or {})
             )
-            logger.debug(f"Database: Saved insight for {request_id}/step_{step_id}")
+            logger.debug(f"Database: Queued insight for {request_id}/step_{step_id}")
             
         except Exception as e:
             # Log error but don't break existing functionality
@@ -165,23 +300,17 @@ def get_insights(request_id: str):
         logger.debug(f"Cannot get insights due to missing request_id.")
         return {}
     
-    current_time = time.time()
-    
-    # Clean expired entries (reuse existing TTL logic)
-    for r_id_key in list(raw_llm_outputs_cache.keys()): 
-        entry = raw_llm_outputs_cache.get(r_id_key)
-        if entry and (current_time - entry['timestamp'] > CACHE_TTL_SECONDS):
-            try:
-                del raw_llm_outputs_cache[r_id_key]
-                logger.info(f"Expired request_id entry '{r_id_key}' from cache. Cache size: {len(raw_llm_outputs_cache)}")
-            except KeyError:
-                logger.warning(f"Failed to remove expired request_id entry '{r_id_key}', key not found during TTL cleanup.")
-    
-    entry = raw_llm_outputs_cache.get(request_id)
-    if entry and 'insights' in entry:
-        logger.debug(f"Retrieved {len(entry['insights'])} insights for request_id '{request_id}'")
-        return entry['insights']
-    
+    insights = raw_llm_outputs_cache.get_insights(request_id)
+    if insights:
+        logger.debug(f"Retrieved {len(insights)} insights for request_id '{request_id}'")
+        return insights
+
     logger.debug(f"No insights found for request_id '{request_id}'")
     return {}
+
+def wait_for_insights(request_id: str, timeout: float, step_id: int = None, min_count: int = 1):
+    """Wait until a step's insight (or min_count insights) is stored for request_id; returns the insights"""
+    if not request_id:
+        return {}
+    return raw_llm_outputs_cache.wait_for_insights(request_id, timeout, step_id=step_id, min_count=min_count)
 # --- END: Insight Cache --- 
\ No newline at end of file
@@ -0,0 +1,447 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+import anthropic
+import httpx
+import openai
+from config import (
+    LLM_RETRY_POLICIES, RETRY_MAX_RETRY_AFTER_SECONDS,
+    CIRCUIT_BREAKER_ENABLED, CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_OPEN_SECONDS
+)
+from utils.rate_limiter import AdmissionTimeout
+from utils.metrics import llm_errors, llm_retries
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorClass:
+    """How a failed LLM call should be treated by the retry policy, circuit breaker and rate limiter"""
+
+    def __init__(self, name, retryable, trips_circuit=False, overload=False):
+        self.name = name
+        self.retryable = retryable
+        self.trips_circuit = trips_circuit  # counts as evidence the provider is down
+        self.overload = overload  # provider is shedding load; the rate limiter backs off
+
+    def __repr__(self):
+        return f"ErrorClass({self.name})"
+
+
+RATE_LIMITED = ErrorClass('rate_limited', retryable=True, overload=True)
+OVERLOADED = ErrorClass('overloaded', retryable=True, trips_circuit=True, overload=True)
+SERVER_ERROR = ErrorClass('server_error', retryable=True, trips_circuit=True)
+TIMEOUT = ErrorClass('timeout', retryable=True, trips_circuit=True)
+CONNECTION = ErrorClass('connection', retryable=True, trips_circuit=True)
+CONFLICT = ErrorClass('conflict', retryable=True)
+CLIENT_ERROR = ErrorClass('client_error', retryable=False)
+ADMISSION_TIMEOUT = ErrorClass('admission_timeout', retryable=False)
+CIRCUIT_OPEN = ErrorClass('circuit_open', retryable=False)
+UNKNOWN = ErrorClass('unknown', retryable=False)
+
+# Error types carried in Anthropic error bodies, including errors sent mid-stream on a 200 response
+_BODY_ERROR_TYPES = {
+    'rate_limit_error': RATE_LIMITED,
+    'overloaded_error': OVERLOADED,
+    'api_error': SERVER_ERROR,
+    'timeout_error': TIMEOUT,
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} circuit breaker is open (provider failing); next probe in {retry_in:.1f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class AttemptDeadlineExceeded(TimeoutError):
+    """Raised when a single attempt runs past its deadline"""
+
+
+def _body_error_type(e):
+    body = getattr(e, 'body', None)
+    if isinstance(body, dict):
+        error = body.get('error', body)
+        if isinstance(error, dict):
+            return error.get('type')
+    return None
+
+
+def classify_error(e: Exception) -> ErrorClass:
+    """
+    Classify an LLM call failure by SDK exception type and status code.
+
+    Args:
+        e: Exception raised by an Anthropic/OpenAI SDK call, the rate limiter or the retry policy
+
+    Returns:
+        The matching ErrorClass; anything unrecognized is UNKNOWN and not retried
+    """
+    if isinstance(e, CircuitOpenError):
+        return CIRCUIT_OPEN
+    if isinstance(e, AdmissionTimeout):
+        return ADMISSION_TIMEOUT
+
+    body_class = _BODY_ERROR_TYPES.get(_body_error_type(e))
+    if body_class:
+        return body_class
+
+    if isinstance(e, (anthropic.APIStatusError, openai.APIStatusError)):
+        status_code = e.status_code
+        if status_code == 429:
+            return RATE_LIMITED
+        if status_code in (503, 529):
+            return OVERLOADED
+        if status_code == 408:
+            return TIMEOUT
+        if status_code == 409:
+            return CONFLICT
+        if status_code >= 500:
+            return SERVER_ERROR
+        return CLIENT_ERROR
+
+    if isinstance(e, (anthropic.APITimeoutError, openai.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return TIMEOUT
+    if isinstance(e, (anthropic.APIConnectionError, openai.APIConnectionError, httpx.TransportError, ConnectionError)):
+        return CONNECTION
+    return UNKNOWN
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """Server-requested wait from retry-after-ms / retry-after response headers, if any"""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive provider-side failures
+    (overloaded, 5xx, timeouts, connection errors) open the circuit: calls then
+    fail immediately with CircuitOpenError for CIRCUIT_BREAKER_OPEN_SECONDS.
+    After that one probe call is let through (half-open); its success closes
+    the circuit, its failure opens it again. Client errors and 429s never
+    count towards opening it, though a probe answered with one closes it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, provider, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD, open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS):
+        self.provider = provider
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.lock = threading.Lock()
+        self.stats = {'opened': 0, 'rejected': 0, 'failures': 0, 'successes': 0}
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probe_started_at = None
+        self.stats['opened'] += 1
+        logger.warning(f"Circuit breaker for {self.provider} opened after {self.consecutive_failures} consecutive failures; failing fast for {self.open_seconds:.0f}s")
+
+    def retry_in(self) -> float:
+        """Seconds until the circuit lets a probe through; 0 when calls are allowed now"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError"""
+        now = time.monotonic()
+        with self.lock:
+            if self.state == self.OPEN and now >= self.opened_at + self.open_seconds:
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit breaker for {self.provider} half-open; sending a probe call")
+            if self.state == self.HALF_OPEN:
+                # A probe that never reported back (e.g. a cancelled task) must not wedge the circuit
+                if self.probe_started_at is None or now - self.probe_started_at >= self.open_seconds:
+                    self.probe_started_at = now
+                    return
+                retry_in = self.probe_started_at + self.open_seconds - now
+            elif self.state == self.OPEN:
+                retry_in = self.opened_at + self.open_seconds - now
+            else:
+                return
+            self.stats['rejected'] += 1
+        raise CircuitOpenError(self.provider, retry_in)
+
+    def record_success(self):
+        with self.lock:
+            self.stats['successes'] += 1
+            self.consecutive_failures = 0
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker for {self.provider} closed; provider recovered")
+            self.state = self.CLOSED
+            self.probe_started_at = None
+
+    def record_failure(self, error_class: ErrorClass):
+        with self.lock:
+            if not error_class.trips_circuit:
+                # The provider answered, so a half-open probe has shown it is reachable again
+                if self.state == self.HALF_OPEN:
+                    logger.info(f"Circuit breaker for {self.provider} closed; provider answered the probe ({error_class.name})")
+                    self.state = self.CLOSED
+                    self.consecutive_failures = 0
+                    self.probe_started_at = None
+                return
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._open(now)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self.consecutive_failures
+        stats['retry_in'] = round(self.retry_in(), 1)
+        return stats
+
+
+class _DisabledCircuitBreaker:
+    """Stand-in used when circuit breaking is disabled"""
+
+    def retry_in(self):
+        return 0.0
+
+    def before_call(self):
+        pass
+
+    def record_success(self):
+        pass
+
+    def record_failure(self, error_class):
+        pass
+
+
+class RetryPolicy:
+    """
+    Retry budget for one kind of LLM call.
+
+    Backoff uses decorrelated jitter (each delay is drawn from
+    [base_delay, 3 x previous delay], capped at max_delay) so callers that
+    failed together do not retry together. A server-provided retry-after is
+    honored as the minimum delay. Each attempt gets at most attempt_timeout
+    seconds and all attempts together at most total_timeout; a retry that
+    could not start before the total deadline is not attempted.
+    """
+
+    def __init__(self, name, max_attempts=3, base_delay=1.0, max_delay=20.0, attempt_timeout=120.0, total_timeout=300.0):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max(max_delay, base_delay)
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+
+    def begin(self, breaker=None, max_attempts=None):
+        """
+        Start the retry bookkeeping for one logical call.
+
+        Args:
+            breaker: Circuit breaker of the provider being called (see get_circuit_breaker)
+            max_attempts: Optional override of the policy's attempt count
+
+        Returns:
+            A RetryState driving the caller's attempt loop
+        """
+        return RetryState(self, breaker or _disabled_breaker, max_attempts or self.max_attempts)
+
+
+class RetryState:
+    """
+    Attempt loop state of one logical call. Typical use:
+
+        retry = policy.begin(get_circuit_breaker('anthropic'))
+        while True:
+            try:
+                retry.start_attempt()
+                response = call(timeout=retry.attempt_timeout())
+                retry.succeeded()
+                break
+            except Exception as e:
+                delay = retry.failed(e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+    """
+
+    def __init__(self, policy, breaker, max_attempts):
+        self.policy = policy
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.attempt = 0  # attempts started so far
+        self.started = time.monotonic()
+        self.deadline = self.started + policy.total_timeout
+        self.previous_delay = policy.base_delay
+        self.last_error_class = None
+        self.attempt_deadline = None
+        self.attempt_started = None  # wall clock start of the current attempt, for its trace span
+        self.sent_at = None  # when the current attempt's request was sent (after rate limiter admission)
+
+    def remaining(self) -> float:
+        """Seconds left before the total deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def start_attempt(self):
+        """Check the circuit breaker (raising CircuitOpenError) and count the next attempt"""
+        self.breaker.before_call()
+        self.attempt += 1
+        self.attempt_deadline = None
+        self.attempt_started = time.time()
+        self.sent_at = None
+
+    def attempt_timeout(self) -> float:
+        """
+        Start the current attempt's clock, once the call is about to be sent.
+
+        Returns:
+            The attempt's timeout in seconds (per-attempt limit, bounded by the total deadline)
+        """
+        timeout = max(1.0, min(self.policy.attempt_timeout, self.remaining()))
+        self.attempt_deadline = time.monotonic() + timeout
+        self.sent_at = time.time()
+        return timeout
+
+    def check_attempt_deadline(self):
+        """Raise AttemptDeadlineExceeded when the current attempt has run out of time (for streamed responses)"""
+        if self.attempt_deadline is not None and time.monotonic() > self.attempt_deadline:
+            raise AttemptDeadlineExceeded(f"{self.policy.name} attempt {self.attempt} exceeded its {self.policy.attempt_timeout:.0f}s deadline")
+
+    def succeeded(self):
+        self.breaker.record_success()
+        self._trace_attempt()
+
+    def _trace_attempt(self, error_class: Optional[ErrorClass] = None, e: Optional[Exception] = None, delay: Optional[float] = None):
+        """Record the finished attempt as a span of the active trace"""
+        if self.attempt_started is None:
+            return
+        attributes = {'policy': self.policy.name, 'attempt': self.attempt}
+        if self.sent_at is not None:
+            attributes['admission_wait_ms'] = round((self.sent_at - self.attempt_started) * 1000, 3)
+        if error_class is not None:
+            attributes['error_class'] = error_class.name
+            attributes['retry_in_seconds'] = round(delay, 3) if delay is not None else None
+        tracing.record_span('llm.attempt', self.attempt_started,
+                            status='error' if e is not None else 'ok',
+                            error=f"{type(e).__name__}: {e}" if e is not None else None,
+                            **attributes)
+        self.attempt_started = None
+
+    def failed(self, e: Exception) -> Optional[float]:
+        """
+        Record a failed attempt and decide whether to retry.
+
+        Args:
+            e: The exception the attempt raised
+
+        Returns:
+            Seconds to wait before the next attempt, or None when the error should be raised
+        """
+        error_class = classify_error(e)
+        self.last_error_class = error_class
+        llm_errors.inc(policy=self.policy.name, error_class=error_class.name)
+        if error_class is not CIRCUIT_OPEN and error_class is not ADMISSION_TIMEOUT:
+            self.breaker.record_failure(error_class)
+
+        delay = self._retry_delay(e, error_class)
+        if delay is not None:
+            llm_retries.inc(policy=self.policy.name, error_class=error_class.name)
+        self._trace_attempt(error_class, e, delay)
+        return delay
+
+    def _retry_delay(self, e: Exception, error_class: ErrorClass) -> Optional[float]:
+        if not error_class.retryable or self.attempt >= self.max_attempts:
+            return None
+
+        delay = min(self.policy.max_delay, random.uniform(self.policy.base_delay, self.previous_delay * 3))
+        self.previous_delay = delay
+        retry_after = retry_after_seconds(e)
+        if retry_after is not None:
+            if retry_after > RETRY_MAX_RETRY_AFTER_SECONDS:
+                logger.warning(f"{self.policy.name}: server asked to retry after {retry_after:.0f}s, giving up")
+                return None
+            delay = max(delay, retry_after)
+        # An open circuit rejects the retry anyway, so wait for its probe window
+        delay = max(delay, self.breaker.retry_in())
+
+        if delay >= self.remaining():
+            logger.warning(f"{self.policy.name}: retry in {delay:.1f}s would pass the {self.policy.total_timeout:.0f}s deadline, giving up")
+            return None
+        return delay
+
+
+# Policies by call type, configured from LLM_RETRY_POLICIES
+retry_policies: Dict[str, RetryPolicy] = {
+    name: RetryPolicy(name, **settings) for name, settings in LLM_RETRY_POLICIES.items()
+}
+
+def get_retry_policy(name: str) -> RetryPolicy:
+    """Get the configured retry policy for 'claude', 'insight' or 'perplexity'"""
+    return retry_policies[name]
+
+
+# Global registry, one breaker per provider
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+_disabled_breaker = _DisabledCircuitBreaker()
+
+def get_circuit_breaker(provider: str):
+    """Get or create the circuit breaker for a provider"""
+    if not CIRCUIT_BREAKER_ENABLED:
+        return _disabled_breaker
+    breaker = circuit_breakers.get(provider)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = circuit_breakers.get(provider)
+            if breaker is None:
+                breaker = CircuitBreaker(provider)
+                circuit_breakers[provider] = breaker
+    return breaker
+
+def get_circuit_breaker_stats() -> Dict[str, Any]:
+    """State and counters of every provider's circuit breaker"""
+    with _circuit_breakers_lock:
+        breakers = dict(circuit_breakers)
+    return {provider: breaker.get_stats() for provider, breaker in breakers.items()}
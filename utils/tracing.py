@@ -0,0 +1,368 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from config import TRACING_ENABLED, TRACE_SINK_PATH, TRACE_MAX_TRACES, TRACE_MAX_SPANS_PER_TRACE
+
+logger = logging.getLogger(__name__)
+
+# Span active in the current thread or asyncio task. asyncio tasks inherit it
+# when created; threads do not, so hand-offs go through bind_context().
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    One timed operation within a request's trace.
+
+    The trace id is the pipeline's request_id, so traces line up with log
+    lines and reporting rows. Use as a context manager to make the span the
+    parent of spans started inside it; exceptions leaving the block mark it
+    as failed.
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end_time = None
+        self.status = 'ok'
+        self.error = None
+        self.thread = threading.current_thread().name
+        self._token = None
+
+    def set(self, **attributes):
+        """Add or overwrite attributes (step, model, tokens, attempt, ...)"""
+        self.attributes.update(attributes)
+        return self
+
+    def record_error(self, e: BaseException):
+        self.fail(f"{type(e).__name__}: {e}")
+
+    def fail(self, message: str):
+        """Mark the span failed, e.g. for errors reported as result dicts rather than raised"""
+        self.status = 'error'
+        self.error = message
+
+    def end(self, end_time: Optional[float] = None):
+        """Finish the span and hand it to the trace store; later calls are ignored"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time or time.time()
+        get_trace_store().add(self.to_record())
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'end': self.end_time,
+            'duration_ms': round((self.end_time - self.start) * 1000, 3),
+            'thread': self.thread,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stand-in when tracing is disabled or there is no trace to attach to"""
+
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        return self
+
+    def record_error(self, e):
+        pass
+
+    def fail(self, message):
+        pass
+
+    def end(self, end_time=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+def current_span():
+    """The active span, or a no-op span outside any trace"""
+    return _current_span.get() or _noop_span
+
+
+def set_attributes(**attributes):
+    """Add attributes to the active span, if any"""
+    current_span().set(**attributes)
+
+
+def start_span(name: str, trace_id: Optional[str] = None, parent=None, **attributes):
+    """
+    Create a span; enter it with `with` to make it the active parent.
+
+    Args:
+        name: Operation name, e.g. 'step' or 'llm.anthropic'
+        trace_id: Starts a new trace (root span) with this id, normally the request_id
+        parent: Explicit parent span (e.g. captured before a thread hand-off);
+            defaults to the active span
+        **attributes: Initial span attributes
+
+    Returns:
+        A Span, or a no-op span when tracing is disabled or there is no trace
+    """
+    if not TRACING_ENABLED:
+        return _noop_span
+    if trace_id is None:
+        parent = parent if parent is not None else _current_span.get()
+        if parent is None or parent.trace_id is None:
+            return _noop_span
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    return Span(name, trace_id, None, attributes)
+
+
+def record_span(name: str, start: float, end: Optional[float] = None, parent=None, status: str = 'ok', error: Optional[str] = None, **attributes):
+    """
+    Record an already finished operation, e.g. work timed on another thread.
+
+    Args:
+        name: Operation name
+        start: Start time (time.time())
+        end: End time; defaults to now
+        parent: Parent span; defaults to the active span. Nothing is recorded without one.
+        status: 'ok' or 'error'
+        error: Error description for failed operations
+        **attributes: Span attributes
+    """
+    span = start_span(name, parent=parent, **attributes)
+    if span is _noop_span:
+        return
+    span.start = start
+    span.status = status
+    span.error = error
+    span.end(end)
+
+
+def traced(name: str, **attributes):
+    """Decorator running a sync or async function inside a child span of the active trace"""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name, **attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bind_context(fn):
+    """
+    Bind fn to the caller's context (and so its active span) for running on another thread.
+
+    Returns:
+        Callable that runs fn in a copy of the current context
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+
+class TraceStore:
+    """
+    Finished spans of recent traces, kept in memory for the waterfall view and
+    appended to a JSONL sink by a background writer so request threads never
+    wait on file I/O.
+    """
+
+    def __init__(self, sink_path: str = TRACE_SINK_PATH, max_traces: int = TRACE_MAX_TRACES,
+                 max_spans_per_trace: int = TRACE_MAX_SPANS_PER_TRACE):
+        self.sink_path = sink_path
+        self.max_traces = max(1, max_traces)
+        self.max_spans_per_trace = max_spans_per_trace
+        self.traces = OrderedDict()
+        self.lock = threading.Lock()
+        self.sink_queue = queue.SimpleQueue()
+        self.stats = {'spans': 0, 'dropped_spans': 0, 'evicted_traces': 0, 'sink_errors': 0}
+        self._writer = None
+        if self.sink_path:
+            directory = os.path.dirname(self.sink_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = threading.Thread(target=self._write_sink, name="trace-sink-writer", daemon=True)
+            self._writer.start()
+
+    def add(self, record: Dict[str, Any]):
+        with self.lock:
+            spans = self.traces.get(record['trace_id'])
+            if spans is None:
+                spans = self.traces[record['trace_id']] = []
+                while len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+                    self.stats['evicted_traces'] += 1
+            if len(spans) >= self.max_spans_per_trace:
+                self.stats['dropped_spans'] += 1
+                return
+            spans.append(record)
+            self.stats['spans'] += 1
+        if self._writer:
+            self.sink_queue.put(record)
+
+    def _write_sink(self):
+        while True:
+            records = [self.sink_queue.get()]
+            while True:
+                try:
+                    records.append(self.sink_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.sink_path, 'a', encoding='utf-8') as sink:
+                    sink.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+            except Exception as e:
+                with self.lock:
+                    self.stats['sink_errors'] += 1
+                logger.error(f"Writing {len(records)} spans to trace sink {self.sink_path} failed: {e}")
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of a trace from memory, falling back to the JSONL sink for older traces"""
+        with self.lock:
+            spans = list(self.traces.get(trace_id, []))
+        if spans or not self.sink_path or not os.path.exists(self.sink_path):
+            return spans
+        needle = json.dumps(trace_id)
+        with open(self.sink_path, encoding='utf-8') as sink:
+            for line in sink:
+                if needle in line:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('trace_id') == trace_id:
+                        spans.append(record)
+        return spans
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['traces'] = len(self.traces)
+        stats['enabled'] = TRACING_ENABLED
+        stats['sink_path'] = self.sink_path or None
+        return stats
+
+
+def build_waterfall(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Arrange a trace's spans as a waterfall.
+
+    Returns:
+        Dict with the trace's duration, its spans in depth-first start order
+        (each with depth and offset_ms from the trace start) and the critical
+        path: from each root, the child that finished last, recursively
+    """
+    if not spans:
+        return {'duration_ms': 0, 'spans': [], 'critical_path': []}
+    by_id = {span['span_id']: span for span in spans}
+    children = {}
+    roots = []
+    for span in sorted(spans, key=lambda s: s['start']):
+        parent_id = span.get('parent_span_id')
+        if parent_id in by_id:
+            children.setdefault(parent_id, []).append(span)
+        else:
+            roots.append(span)
+
+    trace_start = min(span['start'] for span in spans)
+    trace_end = max(span['end'] for span in spans)
+    ordered = []
+
+    def visit(span, depth):
+        ordered.append(dict(span, depth=depth, offset_ms=round((span['start'] - trace_start) * 1000, 3)))
+        for child in children.get(span['span_id'], []):
+            visit(child, depth + 1)
+
+    for root in roots:
+        visit(root, 0)
+
+    critical_path = []
+    span = max(roots, key=lambda s: s['end'])
+    while span is not None:
+        critical_path.append({'name': span['name'], 'span_id': span['span_id'], 'duration_ms': span['duration_ms'],
+                              'step': span['attributes'].get('step')})
+        span = max(children.get(span['span_id'], []), key=lambda s: s['end'], default=None)
+
+    return {
+        'duration_ms': round((trace_end - trace_start) * 1000, 3),
+        'spans': ordered,
+        'critical_path': critical_path
+    }
+
+
+def render_waterfall_text(waterfall: Dict[str, Any], width: int = 60) -> str:
+    """Plain-text waterfall: one bar per span, scaled to the trace duration"""
+    total = waterfall['duration_ms'] or 1
+    lines = []
+    for span in waterfall['spans']:
+        begin = int(span['offset_ms'] / total * width)
+        length = max(1, int(span['duration_ms'] / total * width))
+        bar = ' ' * begin + '█' * min(length, width - begin if width > begin else 1)
+        label = '  ' * span['depth'] + span['name']
+        step = span['attributes'].get('step')
+        if step is not None:
+            label += f" [step {step}]"
+        if span['status'] != 'ok':
+            label += ' !'
+        lines.append(f"{label[:40]:<40} |{bar:<{width}}| {span['duration_ms']:>10.1f}ms")
+    return '\n'.join(lines) + '\n'
+
+
+# Global instance
+trace_store = None
+_trace_store_lock = threading.Lock()
+
+def get_trace_store() -> TraceStore:
+    """Get or create the trace store"""
+    global trace_store
+    if trace_store is None:
+        with _trace_store_lock:
+            if trace_store is None:
+                trace_store = TraceStore()
+    return trace_store